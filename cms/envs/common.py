@@ -308,6 +308,8 @@ MIDDLEWARE_CLASSES = (
     # 'django.middleware.locale.LocaleMiddleware',
     'django_locale.middleware.LocaleMiddleware',
 
+    # Must come before TransactionMiddleware, so that it runs callbacks after the commit.
+    'util.middleware.AfterCommitMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     # needs to run after locale middleware (or anything that modifies the request context)
     'edxmako.middleware.MakoMiddleware',
@@ -351,6 +353,12 @@ XBLOCK_SELECT_FUNCTION = prefer_xmodules
 ############################ Modulestore Configuration ################################
 MODULESTORE_BRANCH = 'draft-preferred'
 
+# Cache the course assets that are too large for memcached on the local disk,
+# e.g. {'DIRECTORY': '/tmp/static_content_cache', 'MAX_SIZE': 10 * 1024 ** 3},
+# optionally with a 'MAX_FILE_SIZE' (a quarter of MAX_SIZE by default).
+# The cache is disabled if this is None.
+STATIC_CONTENT_DISK_CACHE = None
+
 MODULESTORE = {
     'default': {
         'ENGINE': 'xmodule.modulestore.mixed.MixedModuleStore',
@@ -375,6 +383,7 @@ MODULESTORE = {
                         'default_class': 'xmodule.hidden_module.HiddenDescriptor',
                         'fs_root': DATA_DIR,
                         'render_template': 'edxmako.shortcuts.render_to_string',
+                        'persist_metadata_inheritance': True,
                     }
                 }
             ]
@@ -382,6 +391,14 @@ MODULESTORE = {
     }
 }
 
+# Maximum sizes, in bytes, of the in-process LRU caches kept in front of the
+# django caches for immutable course data.  A cache is disabled if it isn't
+# listed here.
+PROCESS_LOCAL_CACHE_MAX_SIZES = {
+    # Compressed split modulestore structures
+    'course_structure_cache': 64 * 1024 * 1024,
+}
+
 ############################ DJANGO_BUILTINS ################################
 # Change DEBUG/TEMPLATE_DEBUG in your environment settings files, not here
 DEBUG = False
@@ -171,6 +171,10 @@ CACHES = {
     },
 }
 
+# Tests count the cache and modulestore queries they make, so don't keep
+# anything cached between them.
+PROCESS_LOCAL_CACHE_MAX_SIZES = {}
+
 # Add external_auth to Installed apps for testing
 INSTALLED_APPS += ('external_auth', )
 
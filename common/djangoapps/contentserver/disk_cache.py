@@ -0,0 +1,261 @@
+"""
+A size-bounded cache of course assets on the local disk.
+
+Assets too large to be kept in memcached are copied from GridFS to a file of
+the cache while they are first served in full, and then streamed from that
+file, so that the requests of a video or PDF viewer seeking through an asset
+don't each go back to Mongo. The metadata of those assets is still kept in
+memcached, as a `DiskCachedContent`, which is how they are found again, and
+how they are invalidated when Studio deletes or replaces them.
+
+The files are named after the location and the digest of their asset, so a
+replaced asset never reads the file of its previous version, and the least
+recently used files are deleted when the cache grows beyond its size. Each
+file is first written under a temporary name, which is created exclusively,
+so only one request of a server copies a given asset at a time.
+
+The cache is configured by the STATIC_CONTENT_DISK_CACHE setting, and is
+disabled if it is None.
+"""
+
+import errno
+import hashlib
+import logging
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+
+from xmodule.contentstore.content import StaticContent, STREAM_DATA_CHUNK_SIZE
+
+
+log = logging.getLogger(__name__)
+
+# Prefix of the files being written, which aren't part of the cache yet.
+TEMP_FILE_PREFIX = "tmp"
+
+# Seconds after which a file being written that wasn't written to is deemed to
+# have been left behind by a dead process, and is deleted.
+TEMP_FILE_MAX_AGE = 10 * 60
+
+
+class DiskCachedContent(StaticContent):
+    """
+    An asset whose data is stored in the file `path` of an `AssetDiskCache`.
+    """
+    def __init__(self, content, path):
+        super(DiskCachedContent, self).__init__(
+            content.location, content.name, content.content_type, None,
+            last_modified_at=content.last_modified_at, thumbnail_location=content.thumbnail_location,
+            import_path=content.import_path, length=content.length, locked=content.locked,
+            content_digest=content.content_digest
+        )
+        self.path = path
+
+    def is_cached(self):
+        """
+        Returns whether the file of this asset is in the cache of this server,
+        marking it as recently used if it is.
+
+        The file may have been evicted, or this content may have been cached
+        in memcached by another server.
+        """
+        try:
+            os.utime(self.path, None)
+        except OSError:
+            return False
+        return True
+
+    @property
+    def data(self):
+        with open(self.path, 'rb') as data_file:
+            return data_file.read()
+
+    def stream_data(self):
+        return FileWrapper(open(self.path, 'rb'), STREAM_DATA_CHUNK_SIZE)
+
+    def stream_data_in_range(self, first_byte, last_byte):
+        """
+        Stream the data between first_byte and last_byte (included)
+        """
+        with open(self.path, 'rb') as data_file:
+            data_file.seek(first_byte)
+            remaining = last_byte - first_byte + 1
+            while remaining > 0:
+                chunk = data_file.read(min(remaining, STREAM_DATA_CHUNK_SIZE))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                yield chunk
+
+
+class AssetDiskCache(object):
+    """
+    Stores assets in `directory`, deleting the least recently used ones when
+    their total size exceeds `max_size` bytes.
+
+    Assets larger than `max_file_size` bytes aren't cached.
+    """
+    def __init__(self, directory, max_size, max_file_size=None):
+        self.directory = directory
+        self.max_size = max_size
+        self.max_file_size = max_file_size if max_file_size is not None else max_size / 4
+
+    def path(self, location, content_digest):
+        """
+        Returns the path of the file of the asset at `location` with the digest
+        `content_digest`.
+        """
+        key = u"{}:{}".format(location, content_digest).encode('utf-8')
+        return os.path.join(self.directory, hashlib.sha1(key).hexdigest())
+
+    def can_cache(self, content):
+        """
+        Returns whether `content` can be stored in the cache.
+        """
+        return (
+            content.content_digest is not None and
+            content.length is not None and
+            content.length <= self.max_file_size
+        )
+
+    def stream_and_add(self, content, on_added=None):
+        """
+        Returns an iterator over the data of the StaticContentStream `content`
+        which also copies it to the cache, or None if it can't be cached or is
+        already being copied by another request.
+
+        Once the data has been entirely read, `on_added` is called with the
+        cached asset, as a `DiskCachedContent`. If the iterator isn't read to
+        the end, or the copy fails, the asset isn't cached.
+        """
+        if not self.can_cache(content):
+            return None
+
+        path = self.path(content.location, content.content_digest)
+        temp_path = os.path.join(self.directory, TEMP_FILE_PREFIX + os.path.basename(path))
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            temp_fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0666)
+        except OSError as error:
+            if error.errno != errno.EEXIST:
+                log.exception(u"Couldn't store asset %s in the disk cache", content.location)
+            return None
+        return self._stream_and_add(content, os.fdopen(temp_fd, 'wb'), temp_path, path, on_added)
+
+    def _stream_and_add(self, content, temp_file, temp_path, path, on_added):
+        """
+        Yields the data of `content`, writing it to `temp_file`, which is
+        moved to `path` once it is complete, so that other requests never read
+        a partial file.
+        """
+        written = 0
+        added = False
+        try:
+            for chunk in content.stream_data():
+                if temp_file is not None:
+                    try:
+                        temp_file.write(chunk)
+                        written += len(chunk)
+                    except (IOError, OSError):
+                        log.exception(u"Couldn't store asset %s in the disk cache", content.location)
+                        temp_file.close()
+                        temp_file = None
+                yield chunk
+
+            if temp_file is not None and written == content.length:
+                try:
+                    temp_file.close()
+                    os.rename(temp_path, path)
+                    added = True
+                except (IOError, OSError):
+                    log.exception(u"Couldn't store asset %s in the disk cache", content.location)
+                if added:
+                    self.evict()
+                    if on_added is not None:
+                        on_added(DiskCachedContent(content, path))
+        finally:
+            content.close()
+            if temp_file is not None:
+                temp_file.close()
+            if not added:
+                try:
+                    os.remove(temp_path)
+                except OSError:
+                    pass
+
+    def add(self, content):
+        """
+        Copies the data of the StaticContentStream `content` to the cache, and
+        returns it as a `DiskCachedContent`, or None if it couldn't be cached.
+        """
+        added = []
+        data = self.stream_and_add(content, added.append)
+        if data is None:
+            return None
+        for __ in data:
+            pass
+        return added[0] if added else None
+
+    def evict(self):
+        """
+        Deletes the least recently used files until the cache fits in its size.
+
+        The files being written count towards the size of the cache, but are
+        only deleted once they haven't been written to for TEMP_FILE_MAX_AGE.
+        """
+        files = []
+        total_size = 0
+        now = time.time()
+        for name in os.listdir(self.directory):
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                # Evicted by another process
+                continue
+            if name.startswith(TEMP_FILE_PREFIX):
+                if now - stat.st_mtime > TEMP_FILE_MAX_AGE:
+                    # Left behind by a process that died while writing it
+                    try:
+                        os.remove(os.path.join(self.directory, name))
+                    except OSError:
+                        pass
+                else:
+                    total_size += stat.st_size
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+            total_size += stat.st_size
+
+        files.sort()
+        for __, size, name in files:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """
+        Deletes all the files of the cache.
+        """
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+def get_disk_cache():
+    """
+    Returns the `AssetDiskCache` configured by the STATIC_CONTENT_DISK_CACHE
+    setting, or None if it is disabled.
+    """
+    config = getattr(settings, 'STATIC_CONTENT_DISK_CACHE', None)
+    if not config:
+        return None
+    return AssetDiskCache(
+        config['DIRECTORY'],
+        config['MAX_SIZE'],
+        max_file_size=config.get('MAX_FILE_SIZE'),
+    )
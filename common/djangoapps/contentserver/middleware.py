@@ -2,7 +2,9 @@
 Middleware to serve assets.
 """
 
+from itertools import chain
 import logging
+from uuid import uuid4
 
 from django.http import (
     HttpResponse, HttpResponseNotModified, HttpResponseForbidden
@@ -15,6 +17,7 @@ from xmodule.modulestore import InvalidLocationError
 from opaque_keys import InvalidKeyError
 from opaque_keys.edx.locator import AssetLocator
 from cache_toolbox.core import get_cached_content, set_cached_content
+from contentserver.disk_cache import DiskCachedContent, get_disk_cache
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.exceptions import NotFoundError
 
@@ -43,6 +46,11 @@ class StaticContentServer(object):
 
             # first look in our cache so we don't have to round-trip to the DB
             content = get_cached_content(loc)
+            if isinstance(content, DiskCachedContent) and not content.is_cached():
+                # The data of the asset isn't on this server's disk (anymore)
+                content = None
+            # The disk cache to copy the asset to while it is served, if any
+            disk_cache = None
             if content is None:
                 # nope, not in cache, let's fetch from DB
                 try:
@@ -59,6 +67,10 @@ class StaticContentServer(object):
                         # since we've queried as a stream, let's read in the stream into memory to set in cache
                         content = content.copy_to_in_mem()
                         set_cached_content(content)
+                    else:
+                        # larger assets are streamed from the local disk cache instead, once
+                        # they have been copied there while they were served in full
+                        disk_cache = get_disk_cache()
             else:
                 # NOP here, but we may wish to add a "cache-hit" counter in the future
                 pass
@@ -81,25 +93,43 @@ class StaticContentServer(object):
             # timestamp, so we can simply compare the strings
             last_modified_at_str = content.last_modified_at.strftime("%a, %d-%b-%Y %H:%M:%S GMT")
 
+            # The digest of the content, when known, identifies its version
+            content_digest = getattr(content, 'content_digest', None)
+            etag = u'"{}"'.format(content_digest) if content_digest else None
+
             # see if the client has cached this content, if so then compare the
-            # timestamps, if they are the same then just return a 304 (Not Modified)
-            if 'HTTP_IF_MODIFIED_SINCE' in request.META:
+            # ETags or timestamps, if they are the same then just return a 304 (Not Modified)
+            if etag and 'HTTP_IF_NONE_MATCH' in request.META:
+                if_none_match = [value.strip() for value in request.META['HTTP_IF_NONE_MATCH'].split(',')]
+                if etag in if_none_match or '*' in if_none_match:
+                    response = HttpResponseNotModified()
+                    response['ETag'] = etag
+                    return response
+            elif 'HTTP_IF_MODIFIED_SINCE' in request.META:
                 if_modified_since = request.META['HTTP_IF_MODIFIED_SINCE']
                 if if_modified_since == last_modified_at_str:
                     return HttpResponseNotModified()
 
+            def stream_data():
+                """
+                Streams the whole content, copying it to the disk cache if needed.
+                """
+                data = None
+                if disk_cache is not None:
+                    data = disk_cache.stream_and_add(content, set_cached_content)
+                return data if data is not None else content.stream_data()
+
             # *** File streaming within a byte range ***
             # If a Range is provided, parse Range attribute of the request
             # Add Content-Range in the response if Range is structurally correct
             # Request -> Range attribute structure: "Range: bytes=first-[last]"
             # Response -> Content-Range attribute structure: "Content-Range: bytes first-last/totalLength"
             # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.35
+            # The Range is ignored if an If-Range header names another version of the content.
+            # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.27
             response = None
-            if request.META.get('HTTP_RANGE'):
-                # Data from cache (StaticContent) has no easy byte management, so we use the DB instead (StaticContentStream)
-                if type(content) == StaticContent:
-                    content = AssetManager.find(loc, as_stream=True)
-
+            if_range = request.META.get('HTTP_IF_RANGE')
+            if request.META.get('HTTP_RANGE') and (not if_range or if_range in (etag, last_modified_at_str)):
                 header_value = request.META['HTTP_RANGE']
                 try:
                     unit, ranges = parse_range_header(header_value, content.length)
@@ -112,39 +142,51 @@ class StaticContentServer(object):
                     if unit != 'bytes':
                         # Only accept ranges in bytes
                         log.warning(u"Unknown unit in Range header: %s for content: %s", header_value, unicode(loc))
-                    elif len(ranges) > 1:
-                        # According to Http/1.1 spec content for multiple ranges should be sent as a multipart message.
-                        # http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.16
-                        # But we send back the full content.
-                        log.warning(
-                            u"More than 1 ranges in Range header: %s for content: %s", header_value, unicode(loc)
-                        )
                     else:
-                        first, last = ranges[0]
-
-                        if 0 <= first <= last < content.length:
-                            # If the byte range is satisfiable
-                            response = HttpResponse(content.stream_data_in_range(first, last))
+                        # Unsatisfiable ranges are ignored, unless all of them are
+                        ranges = coalesce_ranges(
+                            (first, last) for first, last in ranges if 0 <= first <= last < content.length
+                        )
+                        if not ranges:
+                            log.warning(
+                                u"Cannot satisfy ranges in Range header: %s for content: %s", header_value, unicode(loc)
+                            )
+                            response = HttpResponse(status=416)  # Requested Range Not Satisfiable
+                            response['Content-Range'] = 'bytes */{length}'.format(length=content.length)
+                            return response
+                        elif len(ranges) == 1:
+                            first, last = ranges[0]
+                            if first == 0 and last == content.length - 1:
+                                response = HttpResponse(stream_data())
+                            else:
+                                response = HttpResponse(content.stream_data_in_range(first, last))
                             response['Content-Range'] = 'bytes {first}-{last}/{length}'.format(
                                 first=first, last=last, length=content.length
                             )
                             response['Content-Length'] = str(last - first + 1)
+                            response['Content-Type'] = content.content_type
                             response.status_code = 206  # Partial Content
                         else:
-                            log.warning(
-                                u"Cannot satisfy ranges in Range header: %s for content: %s", header_value, unicode(loc)
-                            )
-                            return HttpResponse(status=416)  # Requested Range Not Satisfiable
+                            # According to Http/1.1 spec content for multiple ranges should be sent as a multipart
+                            # message. http://www.w3.org/Protocols/rfc2616/rfc2616-sec14.html#sec14.16
+                            boundary = uuid4().hex
+                            parts = multipart_byteranges(content, ranges, boundary)
+                            response = HttpResponse(chain.from_iterable(part for part, __ in parts))
+                            response['Content-Length'] = str(sum(length for __, length in parts))
+                            response['Content-Type'] = 'multipart/byteranges; boundary={}'.format(boundary)
+                            response.status_code = 206  # Partial Content
 
             # If Range header is absent or syntactically invalid return a full content response.
             if response is None:
-                response = HttpResponse(content.stream_data())
+                response = HttpResponse(stream_data())
                 response['Content-Length'] = content.length
+                response['Content-Type'] = content.content_type
 
             # "Accept-Ranges: bytes" tells the user that only "bytes" ranges are allowed
             response['Accept-Ranges'] = 'bytes'
-            response['Content-Type'] = content.content_type
             response['Last-Modified'] = last_modified_at_str
+            if etag:
+                response['ETag'] = etag
 
             return response
 
@@ -190,3 +232,41 @@ def parse_range_header(header_value, content_length):
         raise ValueError('Invalid syntax')
 
     return unit, ranges
+
+
+def coalesce_ranges(ranges):
+    """
+    Returns the sorted list of the (first, last) byte `ranges`, with the
+    overlapping and adjacent ones merged.
+    """
+    coalesced = []
+    for first, last in sorted(ranges):
+        if coalesced and first <= coalesced[-1][1] + 1:
+            coalesced[-1] = (coalesced[-1][0], max(last, coalesced[-1][1]))
+        else:
+            coalesced.append((first, last))
+    return coalesced
+
+
+def multipart_byteranges(content, ranges, boundary):
+    """
+    Returns the parts of a multipart/byteranges body sending the byte `ranges`
+    of `content`, separated by `boundary`, as a list of (iterator, length)
+    tuples whose iterators stream the parts.
+    """
+    parts = []
+    for first, last in ranges:
+        part_header = (
+            '--{boundary}\r\n'
+            'Content-Type: {content_type}\r\n'
+            'Content-Range: bytes {first}-{last}/{length}\r\n'
+            '\r\n'
+        ).format(
+            boundary=boundary, content_type=content.content_type, first=first, last=last, length=content.length
+        ).encode('utf-8')
+        parts.append((iter([part_header]), len(part_header)))
+        parts.append((content.stream_data_in_range(first, last), last - first + 1))
+        parts.append((iter(['\r\n']), 2))
+    end = '--{boundary}--\r\n'.format(boundary=boundary)
+    parts.append((iter([end]), len(end)))
+    return parts
@@ -4,19 +4,27 @@ Tests for StaticContentServer
 import copy
 import ddt
 import logging
+import os
+import shutil
+import tempfile
 import unittest
+from cStringIO import StringIO
 from uuid import uuid4
 
 from django.conf import settings
 from django.test.client import Client
 from django.test.utils import override_settings
+from mock import patch
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
 
+from xmodule.contentstore.content import StaticContent, StaticContentStream
 from xmodule.contentstore.django import contentstore
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from xmodule.modulestore import ModuleStoreEnum
 from xmodule.modulestore.xml_importer import import_course_from_xml
 
+from contentserver.disk_cache import AssetDiskCache, TEMP_FILE_PREFIX
 from contentserver.middleware import parse_range_header
 from student.models import CourseEnrollment
 
@@ -146,7 +154,7 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
 
     def test_range_request_multiple_ranges(self):
         """
-        Test that multiple ranges in request outputs the full content.
+        Test that multiple ranges in request outputs a multipart message of the ranges.
         """
         first_byte = self.length_unlocked / 4
         last_byte = self.length_unlocked / 2
@@ -154,8 +162,50 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
             first=first_byte, last=last_byte)
         )
 
-        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
         self.assertNotIn('Content-Range', resp)
+        self.assertTrue(resp['Content-Type'].startswith('multipart/byteranges; boundary='))
+        self.assertEqual(resp['Content-Length'], str(len(resp.content)))
+        for first, last in [(first_byte, last_byte), (self.length_unlocked - 100, self.length_unlocked - 1)]:
+            self.assertIn('Content-Range: bytes {first}-{last}/{length}'.format(
+                first=first, last=last, length=self.length_unlocked
+            ), resp.content)
+
+    def test_range_request_overlapping_ranges(self):
+        """
+        Test that overlapping ranges are merged into one.
+        """
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=10-20, 0-15')
+
+        self.assertEqual(resp.status_code, 206)  # HTTP_206_PARTIAL_CONTENT
+        self.assertEqual(resp['Content-Range'], 'bytes 0-20/{length}'.format(length=self.length_unlocked))
+        self.assertEqual(resp['Content-Length'], '21')
+
+    def test_etag(self):
+        """
+        Test that assets are sent with an ETag, which makes their requests conditional.
+        """
+        resp = self.client.get(self.url_unlocked)
+        etag = resp['ETag']
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp['ETag'], etag)
+
+        resp = self.client.get(self.url_unlocked, HTTP_IF_NONE_MATCH='"other"')
+        self.assertEqual(resp.status_code, 200)
+
+    def test_if_range(self):
+        """
+        Test that the Range is only applied if If-Range names the current version of the asset.
+        """
+        etag = self.client.get(self.url_unlocked)['ETag']
+
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=etag)
+        self.assertEqual(resp.status_code, 206)
+
+        resp = self.client.get(self.url_unlocked, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"other"')
+        self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp['Content-Length'], str(self.length_unlocked))
 
     @ddt.data(
@@ -193,6 +243,163 @@ class ContentStoreToyCourseTest(ModuleStoreTestCase):
         self.assertEqual(resp.status_code, 416)
 
 
+@override_settings(CONTENTSTORE=TEST_DATA_CONTENTSTORE)
+class DiskCacheTest(ModuleStoreTestCase):
+    """
+    Tests serving assets too large for memcached from the disk cache.
+    """
+
+    def setUp(self):
+        super(DiskCacheTest, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        disk_cache_settings = override_settings(STATIC_CONTENT_DISK_CACHE={
+            'DIRECTORY': self.cache_dir,
+            'MAX_SIZE': 4 * 1024 * 1024,
+        })
+        disk_cache_settings.enable()
+        self.addCleanup(disk_cache_settings.disable)
+
+        self.client = Client()
+        self.data = os.urandom(1024 * 1024 + 1)
+        course_key = SlashSeparatedCourseKey('edX', uuid4().hex, 'run')
+        self.asset = course_key.make_asset_key('asset', 'large.bin')
+        self.url = unicode(self.asset)
+        contentstore().save(StaticContent(self.asset, 'large.bin', 'application/octet-stream', self.data))
+
+    def test_assets_are_cached_on_disk(self):
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.content, self.data)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+        with patch('contentserver.middleware.AssetManager.find') as mock_find:
+            resp = self.client.get(self.url, HTTP_RANGE='bytes=100-199')
+            self.assertEqual(resp.status_code, 206)
+            self.assertEqual(resp.content, self.data[100:200])
+
+            resp = self.client.get(self.url)
+            self.assertEqual(resp.content, self.data)
+        self.assertFalse(mock_find.called)
+
+    def test_evicted_assets_are_fetched_again(self):
+        self.client.get(self.url)
+        for name in os.listdir(self.cache_dir):
+            os.remove(os.path.join(self.cache_dir, name))
+
+        # Partial responses are served from GridFS without copying the asset.
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.content, self.data[-10:])
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+        resp = self.client.get(self.url, HTTP_RANGE='bytes=0-')
+        self.assertEqual(resp.status_code, 206)
+        self.assertEqual(resp.content, self.data)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 1)
+
+    def test_locked_assets_arent_copied_for_unauthorized_users(self):
+        contentstore().set_attr(self.asset, 'locked', True)
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.status_code, 403)
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_assets_being_copied_are_served_from_gridfs(self):
+        disk_cache = AssetDiskCache(self.cache_dir, 4 * 1024 * 1024)
+        content = contentstore().find(self.asset, as_stream=True)
+        # Another request is copying the asset.
+        data = disk_cache.stream_and_add(content)
+        next(data)
+
+        resp = self.client.get(self.url)
+        self.assertEqual(resp.content, self.data)
+        self.assertEqual([name.startswith(TEMP_FILE_PREFIX) for name in os.listdir(self.cache_dir)], [True])
+        data.close()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+
+class AssetDiskCacheTest(unittest.TestCase):
+    """
+    Tests for the AssetDiskCache.
+    """
+
+    def setUp(self):
+        super(AssetDiskCacheTest, self).setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        self.disk_cache = AssetDiskCache(self.cache_dir, 250, max_file_size=200)
+        self.course_key = SlashSeparatedCourseKey('edX', 'disk_cache', 'run')
+
+    def stream_content(self, name, data, content_digest='digest'):
+        """
+        Returns a StaticContentStream of `data`.
+        """
+        return StaticContentStream(
+            self.course_key.make_asset_key('asset', name), name, 'application/octet-stream', StringIO(data),
+            length=len(data), content_digest=content_digest
+        )
+
+    def test_add(self):
+        content = self.disk_cache.add(self.stream_content('a', 'abcdefghij'))
+
+        self.assertTrue(content.is_cached())
+        self.assertEqual(''.join(content.stream_data()), 'abcdefghij')
+        self.assertEqual(''.join(content.stream_data_in_range(2, 4)), 'cde')
+        self.assertEqual(content.data, 'abcdefghij')
+
+    def test_files_are_keyed_by_digest(self):
+        first = self.disk_cache.add(self.stream_content('a', 'first', content_digest='1'))
+        second = self.disk_cache.add(self.stream_content('a', 'second', content_digest='2'))
+
+        self.assertNotEqual(first.path, second.path)
+        self.assertEqual(first.data, 'first')
+        self.assertEqual(second.data, 'second')
+
+    def test_large_files_arent_cached(self):
+        self.assertIsNone(self.disk_cache.add(self.stream_content('a', 'x' * 201)))
+        self.assertIsNone(self.disk_cache.add(self.stream_content('a', 'x', content_digest=None)))
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_partially_read_assets_arent_cached(self):
+        data = self.disk_cache.stream_and_add(self.stream_content('a', 'x' * 100))
+        next(data)
+        self.assertIsNone(self.disk_cache.stream_and_add(self.stream_content('a', 'x' * 100)))
+        data.close()
+        self.assertEqual(os.listdir(self.cache_dir), [])
+
+    def test_files_being_written_count_towards_size(self):
+        temp_path = os.path.join(self.cache_dir, TEMP_FILE_PREFIX + 'being_written')
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write('x' * 100)
+        first = self.disk_cache.add(self.stream_content('a', 'x' * 100))
+        os.utime(first.path, (0, 0))
+        second = self.disk_cache.add(self.stream_content('b', 'x' * 100))
+        self.assertFalse(first.is_cached())
+        self.assertTrue(second.is_cached())
+        self.assertTrue(os.path.exists(temp_path))
+
+    def test_abandoned_temp_files_are_deleted(self):
+        temp_path = os.path.join(self.cache_dir, TEMP_FILE_PREFIX + 'abandoned')
+        with open(temp_path, 'wb') as temp_file:
+            temp_file.write('x' * 200)
+        os.utime(temp_path, (0, 0))
+        content = self.disk_cache.add(self.stream_content('a', 'x' * 100))
+        self.assertTrue(content.is_cached())
+        self.assertFalse(os.path.exists(temp_path))
+
+    def test_least_recently_used_files_are_evicted(self):
+        first = self.disk_cache.add(self.stream_content('a', 'x' * 100))
+        second = self.disk_cache.add(self.stream_content('b', 'x' * 100))
+        # Make sure that the first file is the least recently used one
+        os.utime(first.path, (0, 0))
+        self.assertTrue(second.is_cached())
+
+        third = self.disk_cache.add(self.stream_content('c', 'x' * 100))
+        self.assertFalse(first.is_cached())
+        self.assertTrue(second.is_cached())
+        self.assertTrue(third.is_cached())
+
+
 @ddt.ddt
 class ParseRangeHeaderTestCase(unittest.TestCase):
     """
@@ -137,18 +137,20 @@ def make_static_urls_absolute(request, html):
     )
 
 
-def replace_static_urls(text, data_directory=None, course_id=None, static_asset_path=''):
+def _static_url_replacer(data_directory, course_id, static_asset_path):
     """
-    Replace /static/$stuff urls either with their correct url as generated by collectstatic,
-    (/static/$md5_hashed_stuff) or by the course-specific content static url
-    /static/$course_data_dir/$stuff, or, if course_namespace is not None, by the
-    correct url in the contentstore (/c4x/.. or /asset-loc:..)
-
-    text: The source text to do the substitution in
-    data_directory: The directory in which course data is stored
-    course_id: The course identifier used to distinguish static content for this course in studio
-    static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
+    Returns the function replacing a single url matched by process_static_urls,
+    as described by replace_static_urls.
     """
+    modulestore_type = []
+
+    def get_modulestore_type():
+        """
+        Returns the type of the modulestore of the course, looked up once.
+        """
+        if not modulestore_type:
+            modulestore_type.append(modulestore().get_modulestore_type(course_id))
+        return modulestore_type[0]
 
     def replace_static_url(original, prefix, quote, rest):
         """
@@ -162,9 +164,7 @@ def replace_static_urls(text, data_directory=None, course_id=None, static_asset_
         if settings.DEBUG and finders.find(rest, True):
             return original
         # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) \
-                and course_id \
-                and modulestore().get_modulestore_type(course_id) != ModuleStoreEnum.Type.xml:
+        elif (not static_asset_path) and course_id and get_modulestore_type() != ModuleStoreEnum.Type.xml:
             # first look in the static file pipeline and see if we are trying to reference
             # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
 
@@ -202,4 +202,79 @@ def replace_static_urls(text, data_directory=None, course_id=None, static_asset_
 
         return "".join([quote, url, quote])
 
-    return process_static_urls(text, replace_static_url, data_dir=static_asset_path or data_directory)
+    return replace_static_url
+
+
+def replace_static_urls(text, data_directory=None, course_id=None, static_asset_path=''):
+    """
+    Replace /static/$stuff urls either with their correct url as generated by collectstatic,
+    (/static/$md5_hashed_stuff) or by the course-specific content static url
+    /static/$course_data_dir/$stuff, or, if course_namespace is not None, by the
+    correct url in the contentstore (/c4x/.. or /asset-loc:..)
+
+    text: The source text to do the substitution in
+    data_directory: The directory in which course data is stored
+    course_id: The course identifier used to distinguish static content for this course in studio
+    static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
+    """
+    return process_static_urls(
+        text,
+        _static_url_replacer(data_directory, course_id, static_asset_path),
+        data_dir=static_asset_path or data_directory
+    )
+
+
+# The compiled regexes of replace_urls, by static url and data directory.
+_URLS_REGEX_CACHE = {}
+
+
+def _urls_regex(data_dir):
+    """
+    Returns the compiled regex matching the urls replaced by replace_urls, in
+    quotes and not within `data_dir`.
+    """
+    key = (settings.STATIC_URL, data_dir)
+    if key not in _URLS_REGEX_CACHE:
+        _URLS_REGEX_CACHE[key] = re.compile(ur"""
+            (?x)                                            # flags=re.VERBOSE
+            (?P<quote>\\?['"])                              # the opening quotes
+            (?:
+                (?P<static_prefix>(?:{static_url}|/static/)(?!{data_dir}))
+                |(?P<course_prefix>/course/)
+                |(?P<jump_to_id_prefix>/jump_to_id/)
+            )
+            (?P<rest>.*?)                                   # everything else in the url
+            (?P=quote)                                      # the first matching closing quote
+            """.format(static_url=settings.STATIC_URL, data_dir=data_dir))
+    return _URLS_REGEX_CACHE[key]
+
+
+def replace_urls(text, course_id, jump_to_id_base_url, data_directory=None, static_asset_path=''):
+    """
+    Replace the /static/, /course/ and /jump_to_id/ urls of `text` in a single
+    pass, as replace_static_urls, replace_course_urls and
+    replace_jump_to_id_urls do one after the other.
+
+    text: The source text to do the substitution in
+    course_id: The course_id in which this rewrite happens
+    jump_to_id_base_url: The base of the jump_to_id urls (see replace_jump_to_id_urls)
+    data_directory: The directory in which course data is stored
+    static_asset_path: Path for static assets, which overrides data_directory and course_namespace, if nonempty
+    """
+    replace_static_url = _static_url_replacer(data_directory, course_id, static_asset_path)
+    course_url_prefix = '/courses/' + course_id.to_deprecated_string() + '/'
+
+    def replace_url(match):
+        """
+        Replace a single matched url.
+        """
+        quote = match.group('quote')
+        rest = match.group('rest')
+        if match.group('static_prefix') is not None:
+            return replace_static_url(match.group(0), match.group('static_prefix'), quote, rest)
+        elif match.group('course_prefix') is not None:
+            return "".join([quote, course_url_prefix, rest, quote])
+        else:
+            return "".join([quote, jump_to_id_base_url + rest, quote])
+
+    return _urls_regex(static_asset_path or data_directory).sub(replace_url, text)
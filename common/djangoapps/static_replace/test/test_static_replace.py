@@ -4,6 +4,8 @@ from nose.tools import assert_equals, assert_true, assert_false  # pylint: disab
 from static_replace import (
     replace_static_urls,
     replace_course_urls,
+    replace_jump_to_id_urls,
+    replace_urls,
     _url_replace_regex,
     process_static_urls,
     make_static_urls_absolute
@@ -143,6 +145,45 @@ def test_static_url_with_query(mock_modulestore, mock_storage):
     assert_equals(post_text, replace_static_urls(pre_text, DATA_DIRECTORY, COURSE_KEY))
 
 
+@patch('static_replace.staticfiles_storage', autospec=True)
+@patch('static_replace.modulestore', autospec=True)
+def test_replace_urls(mock_modulestore, mock_storage):
+    """
+    Make sure that replace_urls replaces all the urls in a single pass, as the
+    replace_*_urls functions do one after the other.
+    """
+    mock_storage.exists.return_value = False
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+    jump_to_id_base_url = '/courses/org/course/run/jump_to_id/'
+
+    text = (
+        '<img src="/static/file.png"/><a href="/course/chapter">Chapter</a>'
+        '<a href=\'/jump_to_id/vertical\'>Vertical</a><img src="/static/foo.png?raw"/>'
+        '<a href="/static/data_dir/file.png">File</a><p>/static/not_quoted.png</p>'
+    )
+    for data_directory, static_asset_path in [(DATA_DIRECTORY, ''), (None, ''), (DATA_DIRECTORY, 'assets')]:
+        expected = replace_jump_to_id_urls(
+            replace_course_urls(
+                replace_static_urls(text, data_directory, COURSE_KEY, static_asset_path=static_asset_path),
+                COURSE_KEY
+            ),
+            COURSE_KEY,
+            jump_to_id_base_url
+        )
+        assert_equals(
+            expected,
+            replace_urls(
+                text, COURSE_KEY, jump_to_id_base_url,
+                data_directory=data_directory, static_asset_path=static_asset_path
+            )
+        )
+
+    # The type of the modulestore is only looked up once per call.
+    mock_modulestore.reset_mock()
+    replace_urls(text + text, COURSE_KEY, jump_to_id_base_url, data_directory=DATA_DIRECTORY)
+    assert_equals(mock_modulestore.return_value.get_modulestore_type.call_count, 1)
+
+
 def test_regex():
     yes = ('"/static/foo.png"',
            '"/static/foo.png"',
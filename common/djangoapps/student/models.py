@@ -41,6 +41,7 @@ import dogstats_wrapper as dog_stats_api
 from eventtracking import tracker
 from opaque_keys.edx.keys import CourseKey
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
+import request_cache
 from simple_history.models import HistoricalRecords
 from south.modelsinspector import add_introspection_rules
 from track import contexts
@@ -51,6 +52,7 @@ from course_modes.models import CourseMode
 import lms.lib.comment_client as cc
 from openedx.core.djangoapps.commerce.utils import ecommerce_api_client, ECOMMERCE_DATE_FORMAT
 from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from util.db import run_after_commit
 from util.model_utils import emit_field_changed_events, get_changed_fields_dict
 from util.query import use_read_replica_if_available
 from util.milestones_helpers import is_entrance_exams_enabled
@@ -906,6 +908,12 @@ class CourseEnrollment(models.Model):
     # cache key format e.g enrollment.<username>.<course_key>.mode = 'honor'
     COURSE_ENROLLMENT_CACHE_KEY = u"enrollment.{}.{}.mode"
 
+    # cache key of the enrollments of a user (see `_enrollment_snapshot`),
+    # e.g enrollment.<user_id>.snapshot = {u'edx/demox/demo': ('honor', True)}
+    ENROLLMENT_SNAPSHOT_CACHE_KEY = u"enrollment.{}.snapshot"
+    ENROLLMENT_SNAPSHOT_CACHE_TIMEOUT = 15 * 60
+    ENROLLMENT_SNAPSHOT_REQUEST_CACHE = u"student.enrollment_snapshots"
+
     class Meta(object):
         unique_together = (('user', 'course_id'),)
         ordering = ('user', 'course_id')
@@ -1278,11 +1286,7 @@ class CourseEnrollment(models.Model):
         if not user.is_authenticated():
             return False
 
-        try:
-            record = CourseEnrollment.objects.get(user=user, course_id=course_key)
-            return record.is_active
-        except cls.DoesNotExist:
-            return False
+        return bool(cls.enrollment_mode_for_user(user, course_key)[1])
 
     @classmethod
     def is_enrolled_by_partial(cls, user, course_id_partial):
@@ -1302,15 +1306,11 @@ class CourseEnrollment(models.Model):
         assert isinstance(course_id_partial, CourseKey)
         assert not course_id_partial.run  # None or empty string
         course_key = SlashSeparatedCourseKey(course_id_partial.org, course_id_partial.course, '')
-        querystring = unicode(course_key.to_deprecated_string())
-        try:
-            return CourseEnrollment.objects.filter(
-                user=user,
-                course_id__startswith=querystring,
-                is_active=1
-            ).exists()
-        except cls.DoesNotExist:
-            return False
+        querystring = unicode(course_key.to_deprecated_string()).lower()
+        return any(
+            course_id.startswith(querystring) and is_active
+            for course_id, (__, is_active) in cls._enrollment_snapshot(user).iteritems()
+        )
 
     @classmethod
     def enrollment_mode_for_user(cls, user, course_id):
@@ -1324,11 +1324,101 @@ class CourseEnrollment(models.Model):
             and is_active is whether the enrollment is active.
         Returns (None, None) if the courseenrollment record does not exist.
         """
-        try:
-            record = CourseEnrollment.objects.get(user=user, course_id=course_id)
-            return (record.mode, record.is_active)
-        except cls.DoesNotExist:
-            return (None, None)
+        return cls._enrollment_snapshot(user).get(unicode(course_id).lower(), (None, None))
+
+    @classmethod
+    def bulk_enrollment_modes(cls, user_course_pairs):
+        """
+        Returns the enrollment modes of many users in many courses with one
+        query, as a dict mapping each (user id, course key) of
+        `user_course_pairs` to the (mode, is_active) that
+        `enrollment_mode_for_user` would return for them.
+
+        `user_course_pairs` is an iterable of (User, CourseKey) tuples.
+        """
+        pairs = set((user.id, course_key) for user, course_key in user_course_pairs)
+        modes = dict.fromkeys(pairs, (None, None))
+        user_ids = set(user_id for user_id, __ in pairs if user_id is not None)
+        course_keys = set(course_key for __, course_key in pairs)
+        if not user_ids:
+            return modes
+
+        enrollments = CourseEnrollment.objects.filter(
+            user_id__in=user_ids,
+            course_id__in=course_keys,
+        ).values_list('user_id', 'course_id', 'mode', 'is_active')
+        for user_id, course_id, mode, is_active in enrollments:
+            if (user_id, course_id) in modes:
+                modes[(user_id, course_id)] = (mode, is_active)
+        return modes
+
+    @classmethod
+    def _enrollment_snapshot(cls, user):
+        """
+        Returns the (mode, is_active) of all the enrollments of `user`, in a
+        dict keyed by the lowercased unicode of their course ids, since MySQL
+        compares course ids case-insensitively.
+
+        The snapshot is read with one query. If the ENABLE_ENROLLMENT_CACHE
+        feature is on, it is kept in the request cache for the rest of the
+        request and in the default cache. Both copies are invalidated whenever
+        an enrollment of the user is saved or deleted (see
+        `invalidate_enrollment_snapshot`).
+        """
+        user_id = getattr(user, 'id', None)
+        if user_id is None:
+            return {}
+
+        # Outside of requests, e.g. in Celery tasks, nothing clears the
+        # request cache, so it isn't used.
+        snapshots = cls._snapshot_request_cache()
+        if snapshots is not None and user_id in snapshots:
+            return snapshots[user_id]
+
+        use_cache = settings.FEATURES.get('ENABLE_ENROLLMENT_CACHE', False)
+        cache_key = cls.ENROLLMENT_SNAPSHOT_CACHE_KEY.format(user_id)
+        snapshot = cache.get(cache_key) if use_cache else None
+        if snapshot is None:
+            snapshot = {
+                unicode(course_id).lower(): (mode, is_active)
+                for course_id, mode, is_active in CourseEnrollment.objects.filter(
+                    user_id=user_id
+                ).values_list('course_id', 'mode', 'is_active')
+            }
+            if use_cache:
+                cache.set(cache_key, snapshot, cls.ENROLLMENT_SNAPSHOT_CACHE_TIMEOUT)
+
+        if snapshots is not None:
+            snapshots[user_id] = snapshot
+        return snapshot
+
+    @classmethod
+    def _snapshot_request_cache(cls):
+        """
+        Returns the request cache of the enrollment snapshots, or None if no
+        request is being handled or the ENABLE_ENROLLMENT_CACHE feature is off.
+        """
+        if not settings.FEATURES.get('ENABLE_ENROLLMENT_CACHE', False):
+            return None
+        if request_cache.get_request() is None:
+            return None
+        return request_cache.get_cache(cls.ENROLLMENT_SNAPSHOT_REQUEST_CACHE)
+
+    @classmethod
+    def invalidate_enrollment_snapshot(cls, user_id):
+        """
+        Forgets the cached enrollment snapshot of the user `user_id`.
+
+        The shared copy is deleted again once the current transaction commits,
+        since a concurrent request may cache the snapshot it read before the
+        commit in the meantime.
+        """
+        cache_key = cls.ENROLLMENT_SNAPSHOT_CACHE_KEY.format(user_id)
+        cache.delete(cache_key)
+        run_after_commit(cache.delete, cache_key)
+        snapshots = cls._snapshot_request_cache()
+        if snapshots is not None:
+            snapshots.pop(user_id, None)
 
     @classmethod
     def enrollments_for_user(cls, user):
@@ -1477,6 +1567,7 @@ def invalidate_enrollment_mode_cache(sender, instance, **kwargs):  # pylint: dis
         unicode(instance.course_id)
     )
     cache.delete(cache_key)
+    CourseEnrollment.invalidate_enrollment_snapshot(instance.user_id)
 
 
 class ManualEnrollmentAudit(models.Model):
@@ -18,6 +18,7 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase
 from django.test.client import Client
 
+from request_cache.middleware import RequestCache, REQUEST_CACHE
 from student.models import (
     anonymous_id_for_user, user_by_anonymous_id, CourseEnrollment,
     unique_id_for_user, LinkedInAddToProfileConfiguration
@@ -29,6 +30,9 @@ from student.views import (
     _get_course_programs
 )
 from student.tests.factories import UserFactory, CourseModeFactory
+from util.db import (
+    defer_after_commit_callbacks, discard_after_commit_callbacks, run_after_commit_callbacks
+)
 from util.testing import EventTestMixin
 from util.model_utils import USER_SETTINGS_CHANGED_EVENT_NAME
 from xmodule.modulestore.tests.factories import CourseFactory, check_mongo_calls
@@ -768,6 +772,115 @@ class EnrollInCourseTest(EnrollmentEventTestMixin, TestCase):
         self.assert_enrollment_mode_change_event_was_emitted(user, course_id, "honor")
 
 
+@patch.dict(settings.FEATURES, {'ENABLE_ENROLLMENT_CACHE': True})
+class EnrollmentLookupCacheTest(TestCase):
+    """Tests the caching of the enrollments looked up by CourseEnrollment."""
+
+    def setUp(self):
+        super(EnrollmentLookupCacheTest, self).setUp()
+        self.user = UserFactory.create()
+        self.course_id = SlashSeparatedCourseKey("edX", "Test101", "2013")
+        self.other_course_id = SlashSeparatedCourseKey("edX", "Test102", "2013")
+        CourseEnrollment.enroll(self.user, self.course_id, "verified")
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def start_request(self):
+        """Pretend that a request is being handled, so that the request cache is used."""
+        RequestCache.clear_request_cache()
+        REQUEST_CACHE.request = Mock()
+        self.addCleanup(RequestCache.clear_request_cache)
+
+    def test_lookups_share_a_query_in_a_request(self):
+        self.start_request()
+        with self.assertNumQueries(1):
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+            self.assertFalse(CourseEnrollment.is_enrolled(self.user, self.other_course_id))
+            self.assertTrue(CourseEnrollment.is_enrolled_by_partial(
+                self.user, SlashSeparatedCourseKey("edX", "Test101", None)
+            ))
+            self.assertEqual(CourseEnrollment.enrollment_mode_for_user(self.user, self.course_id), ("verified", True))
+            self.assertEqual(CourseEnrollment.enrollment_mode_for_user(self.user, self.other_course_id), (None, None))
+
+    def test_course_ids_are_case_insensitive(self):
+        self.start_request()
+        course_id = SlashSeparatedCourseKey("EDX", "test101", "2013")
+        self.assertTrue(CourseEnrollment.is_enrolled(self.user, course_id))
+        self.assertTrue(CourseEnrollment.is_enrolled_by_partial(
+            self.user, SlashSeparatedCourseKey("EDX", "test101", None)
+        ))
+        self.assertEqual(CourseEnrollment.enrollment_mode_for_user(self.user, course_id), ("verified", True))
+
+    def test_lookups_arent_cached_outside_requests(self):
+        with self.assertNumQueries(2):
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+            cache.clear()
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ENROLLMENT_CACHE': False})
+    def test_lookups_arent_cached_when_disabled(self):
+        self.start_request()
+        with self.assertNumQueries(2):
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+
+    def test_enrollment_changes_invalidate_the_request_cache(self):
+        self.start_request()
+        self.assertFalse(CourseEnrollment.is_enrolled(self.user, self.other_course_id))
+
+        CourseEnrollment.enroll(self.user, self.other_course_id)
+        self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.other_course_id))
+
+        CourseEnrollment.unenroll(self.user, self.course_id)
+        self.assertFalse(CourseEnrollment.is_enrolled(self.user, self.course_id))
+        self.assertEqual(CourseEnrollment.enrollment_mode_for_user(self.user, self.course_id), ("verified", False))
+
+    def test_shared_cache(self):
+        self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+        with self.assertNumQueries(0):
+            self.assertTrue(CourseEnrollment.is_enrolled(self.user, self.course_id))
+
+        CourseEnrollment.unenroll(self.user, self.course_id)
+        self.assertFalse(CourseEnrollment.is_enrolled(self.user, self.course_id))
+
+    def test_shared_cache_is_invalidated_after_commit(self):
+        defer_after_commit_callbacks()
+        self.addCleanup(discard_after_commit_callbacks)
+        CourseEnrollment.unenroll(self.user, self.course_id)
+
+        # A concurrent request caches the snapshot it read before the commit.
+        cache.set(
+            CourseEnrollment.ENROLLMENT_SNAPSHOT_CACHE_KEY.format(self.user.id),
+            {unicode(self.course_id).lower(): ("verified", True)},
+        )
+        run_after_commit_callbacks()
+        self.assertFalse(CourseEnrollment.is_enrolled(self.user, self.course_id))
+
+    def test_anonymous_user(self):
+        self.start_request()
+        with self.assertNumQueries(0):
+            self.assertFalse(CourseEnrollment.is_enrolled(AnonymousUser(), self.course_id))
+            self.assertEqual(CourseEnrollment.enrollment_mode_for_user(AnonymousUser(), self.course_id), (None, None))
+
+    def test_bulk_enrollment_modes(self):
+        other_user = UserFactory.create()
+        CourseEnrollment.enroll(other_user, self.other_course_id, "audit")
+        CourseEnrollment.unenroll(other_user, self.other_course_id)
+
+        with self.assertNumQueries(1):
+            modes = CourseEnrollment.bulk_enrollment_modes([
+                (self.user, self.course_id),
+                (self.user, self.other_course_id),
+                (other_user, self.other_course_id),
+            ])
+        self.assertEqual(modes, {
+            (self.user.id, self.course_id): ("verified", True),
+            (self.user.id, self.other_course_id): (None, None),
+            (other_user.id, self.other_course_id): ("audit", False),
+        })
+
+
 @unittest.skipUnless(settings.ROOT_URLCONF == 'lms.urls', 'Test only valid in lms')
 class ChangeEnrollmentViewTest(ModuleStoreTestCase):
     """Tests the student.views.change_enrollment view"""
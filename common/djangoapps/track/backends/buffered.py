@@ -0,0 +1,269 @@
+"""
+Event tracker backend that buffers events in memory and sends them to
+another backend in batches from a background thread, so that slow
+backends don't add to the latency of the request emitting the event.
+
+It can wrap any other backend configured in TRACKING_BACKENDS::
+
+  TRACKING_BACKENDS = {
+      'mongo': {
+          'ENGINE': 'track.backends.buffered.BufferedBackend',
+          'OPTIONS': {
+              'backend': {
+                  'ENGINE': 'track.backends.mongodb.MongoBackend',
+                  'OPTIONS': {
+                      'database': 'track',
+                  }
+              },
+              'max_queue_size': 10000,
+              'batch_size': 100,
+              'flush_interval': 1.0,
+              'overflow': 'drop_newest',
+          }
+      }
+  }
+
+"""
+
+from __future__ import absolute_import
+
+import atexit
+import logging
+import os
+import threading
+import time
+from Queue import Queue, Empty, Full
+
+from django.db import connections
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger(__name__)
+
+
+# What to do with an event when the queue is full.
+DROP_NEWEST = 'drop_newest'
+DROP_OLDEST = 'drop_oldest'
+BLOCK = 'block'
+OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK)
+
+# Tells the flush thread to send what is left in the queue and exit.
+_STOP = object()
+
+
+class BufferedBackend(BaseBackend):
+    """
+    Event tracker backend that enqueues events in a bounded in-process
+    queue and sends them to the wrapped backend in batches, using the
+    wrapped backend's send_many.
+
+    Events still in the queue are sent when the process exits.
+
+    If a batch can't be sent, its events are sent one by one with the
+    wrapped backend's send instead, so that one bad event doesn't lose
+    the whole batch.
+    """
+
+    def __init__(
+            self,
+            backend,
+            max_queue_size=10000,
+            batch_size=100,
+            flush_interval=1.0,
+            overflow=DROP_NEWEST,
+            block_timeout=0.1,
+            **kwargs
+    ):
+        """
+        :Parameters:
+
+          - `backend`: configuration of the wrapped backend, as a dict
+            with the same `ENGINE` and `OPTIONS` keys used in
+            TRACKING_BACKENDS
+          - `max_queue_size`: maximum number of events waiting to be sent
+          - `batch_size`: maximum number of events sent in one batch
+          - `flush_interval`: maximum number of seconds an event waits
+            for its batch to fill up before being sent
+          - `overflow`: what to do with a new event when the queue is
+            full; one of 'drop_newest', 'drop_oldest' or 'block'
+          - `block_timeout`: number of seconds the 'block' policy waits
+            for room in the queue before dropping the event
+
+        """
+        super(BufferedBackend, self).__init__(**kwargs)
+
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError('Invalid overflow policy {}'.format(overflow))
+
+        # Imported here since the tracker instantiates this backend
+        # while it is being imported.
+        from track.tracker import _instantiate_backend_from_name  # pylint: disable=protected-access
+        self.backend = _instantiate_backend_from_name(backend['ENGINE'], backend.get('OPTIONS', {}))
+
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+
+        self._metric_tags = [u'backend:{}'.format(type(self.backend).__name__)]
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+
+        atexit.register(self.close)
+
+    def send(self, event):
+        """Enqueue the event to be sent by the flush thread."""
+        queue = self._get_queue()
+        try:
+            if self.overflow == BLOCK:
+                queue.put(event, timeout=self.block_timeout)
+            else:
+                queue.put_nowait(event)
+            return
+        except Full:
+            pass
+
+        if self.overflow == DROP_OLDEST:
+            try:
+                queue.get_nowait()
+                queue.put_nowait(event)
+            except (Empty, Full):
+                pass
+
+        self._increment('track.buffered.dropped')
+
+    def close(self, timeout=5.0):
+        """
+        Sends the events left in the queue and stops the flush thread,
+        waiting at most `timeout` seconds for it to finish.
+        """
+        with self._lock:
+            queue, thread = self._queue, self._thread
+            self._pid = self._queue = self._thread = None
+
+        if queue is None or thread is None or not thread.is_alive():
+            return
+
+        deadline = time.time() + timeout
+        try:
+            queue.put(_STOP, timeout=timeout)
+        except Full:
+            log.warning('Timed out flushing %d tracking events to %r', queue.qsize(), self.backend)
+            return
+
+        thread.join(max(deadline - time.time(), 0))
+
+    def _get_queue(self):
+        """
+        Returns the queue of the current process, starting its flush
+        thread if need be.
+
+        Threads don't survive a fork, so a forked worker process gets
+        its own queue and thread instead of reusing the parent's.
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            with self._lock:
+                if self._pid != pid:
+                    self._queue = Queue(self.max_queue_size)
+                    self._thread = threading.Thread(
+                        target=self._run,
+                        args=(self._queue,),
+                        name='track-buffered-backend',
+                    )
+                    self._thread.daemon = True
+                    self._thread.start()
+                    self._pid = pid
+        return self._queue
+
+    def _run(self, queue):
+        """
+        Body of the flush thread: collects events from the queue into
+        batches of up to `batch_size` events, sending each batch once
+        it is full or its first event has waited `flush_interval`
+        seconds.
+        """
+        stopping = False
+        while not stopping:
+            event = queue.get()
+            if event is _STOP:
+                break
+
+            batch = [event]
+            deadline = time.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.time()
+                try:
+                    event = queue.get(timeout=remaining) if remaining > 0 else queue.get_nowait()
+                except Empty:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            self._send_batch(batch)
+
+        # Send whatever was enqueued after the stop marker.
+        batch = []
+        while True:
+            try:
+                event = queue.get_nowait()
+            except Empty:
+                break
+            if event is not _STOP:
+                batch.append(event)
+            if len(batch) >= self.batch_size:
+                self._send_batch(batch)
+                batch = []
+        if batch:
+            self._send_batch(batch)
+
+    def _send_batch(self, batch):
+        """
+        Sends a batch of events to the wrapped backend, one by one if
+        the batch fails.
+
+        The database connections of the flush thread are closed after
+        each batch, since they would otherwise be left idle between
+        batches until the database server times them out.
+        """
+        try:
+            with dog_stats_api.timer('track.buffered.send_many', tags=self._metric_tags):
+                self.backend.send_many(batch)
+        except Exception:  # pylint: disable=broad-except
+            log.exception('Error sending a batch of %d events to %r, sending them one by one', len(batch), self.backend)
+            self._send_one_by_one(batch)
+        else:
+            self._increment('track.buffered.sent', len(batch))
+        finally:
+            self._close_db_connections()
+
+    def _send_one_by_one(self, batch):
+        """Sends each event of a batch that failed to the wrapped backend."""
+        for event in batch:
+            try:
+                self.backend.send(event)
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Error sending an event to %r', self.backend)
+                self._increment('track.buffered.failed')
+            else:
+                self._increment('track.buffered.sent')
+
+    @staticmethod
+    def _close_db_connections():
+        """Closes the database connections of the current thread."""
+        for connection in connections.all():
+            try:
+                connection.close()
+            except Exception:  # pylint: disable=broad-except
+                log.exception('Error closing the %r database connection of the tracking flush thread', connection.alias)
+
+    def _increment(self, metric, value=1):
+        """Increments the given counter, tagged with the wrapped backend."""
+        dog_stats_api.increment(metric, value, tags=self._metric_tags)
@@ -75,9 +75,32 @@ class DjangoBackend(BaseBackend):
         self.name = name
 
     def send(self, event):
-        field_values = {x: event.get(x, '') for x in LOGFIELDS}
-        tldat = TrackingLog(**field_values)
+        tldat = self._build_tracking_log(event)
         try:
             tldat.save(using=self.name)
         except Exception as e:  # pylint: disable=broad-except
             log.exception(e)
+
+    def send_many(self, events):
+        """
+        Save the events with a single bulk insert, or one by one if the
+        bulk insert fails.
+        """
+        if not events:
+            return
+        try:
+            TrackingLog.objects.using(self.name).bulk_create(
+                [self._build_tracking_log(event) for event in events]
+            )
+        except Exception as e:  # pylint: disable=broad-except
+            # The bulk insert is a single statement, so none of the events
+            # were saved; save the valid ones on their own.
+            log.exception(e)
+            for event in events:
+                self.send(event)
+
+    @staticmethod
+    def _build_tracking_log(event):
+        """Returns an unsaved TrackingLog for the given event."""
+        field_values = {x: event.get(x, '') for x in LOGFIELDS}
+        return TrackingLog(**field_values)
@@ -97,3 +97,22 @@ class MongoBackend(BaseBackend):
             # during the next event.
             msg = 'Error inserting to MongoDB event tracker backend'
             log.exception(msg)
+
+    def send_many(self, events):
+        """
+        Insert the events in to the Mongo collection in one batch, or one
+        by one if one of them can't be encoded
+        """
+        if not events:
+            return
+        try:
+            self.collection.insert(events, manipulate=False, continue_on_error=True)
+        except BSONError:
+            # The batch is encoded before being sent, so none of the events
+            # were inserted; insert the valid ones on their own.
+            log.exception('Error encoding batch for MongoDB event tracker backend')
+            for event in events:
+                self.send(event)
+        except PyMongoError:
+            msg = 'Error inserting batch to MongoDB event tracker backend'
+            log.exception(msg)
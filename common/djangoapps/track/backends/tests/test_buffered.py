@@ -0,0 +1,136 @@
+from __future__ import absolute_import
+
+import threading
+
+from django.test import TestCase
+from mock import patch
+
+from track.backends import BaseBackend
+from track.backends.buffered import BufferedBackend
+
+
+class RecordingBackend(BaseBackend):
+    """Backend that records the batches it is sent."""
+    def __init__(self, **options):
+        super(RecordingBackend, self).__init__(**options)
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def send(self, event):
+        self.send_many([event])
+
+    def send_many(self, events):
+        self.release.wait()
+        self.batches.append(list(events))
+
+    @property
+    def events(self):
+        return [event for batch in self.batches for event in batch]
+
+
+class FailingBatchBackend(RecordingBackend):
+    """Backend whose batches fail, and which fails to send some events."""
+    def send(self, event):
+        if event.get('fail'):
+            raise ValueError('Cannot send event')
+        self.batches.append([event])
+
+    def send_many(self, events):
+        raise ValueError('Cannot send batch')
+
+
+class TestBufferedBackend(TestCase):
+    def _create_backend(self, **options):
+        backend = BufferedBackend(
+            backend={'ENGINE': 'track.backends.tests.test_buffered.RecordingBackend'},
+            **options
+        )
+        self.addCleanup(backend.close)
+        return backend
+
+    def test_events_are_sent_in_batches(self):
+        backend = self._create_backend(batch_size=3, flush_interval=10)
+        events = [{'test': i} for i in xrange(7)]
+        for event in events:
+            backend.send(event)
+
+        backend.close()
+
+        self.assertEqual(backend.backend.events, events)
+        self.assertTrue(all(len(batch) <= 3 for batch in backend.backend.batches))
+        self.assertEqual(len(backend.backend.batches[0]), 3)
+
+    def test_partial_batch_sent_after_interval(self):
+        backend = self._create_backend(batch_size=100, flush_interval=0.01)
+        backend.send({'test': 1})
+
+        for _ in xrange(100):
+            if backend.backend.batches:
+                break
+            threading.Event().wait(0.01)
+
+        self.assertEqual(backend.backend.batches, [[{'test': 1}]])
+
+    def _fill_while_blocked(self, **options):
+        """
+        Sends four events to a backend with room for two of them while
+        the flush thread is stuck sending the first one.
+        """
+        backend = self._create_backend(max_queue_size=2, batch_size=1, flush_interval=0, **options)
+        backend.backend.release.clear()
+        backend.send({'test': 0})
+        # Wait for the flush thread to pick up the first event.
+        for _ in xrange(100):
+            if backend._queue.empty():  # pylint: disable=protected-access
+                break
+            threading.Event().wait(0.01)
+        for i in xrange(1, 4):
+            backend.send({'test': i})
+        backend.backend.release.set()
+        backend.close()
+        return backend.backend.events
+
+    def test_drop_newest(self):
+        self.assertEqual(self._fill_while_blocked(overflow='drop_newest'), [{'test': i} for i in (0, 1, 2)])
+
+    def test_drop_oldest(self):
+        self.assertEqual(self._fill_while_blocked(overflow='drop_oldest'), [{'test': i} for i in (0, 2, 3)])
+
+    def test_block(self):
+        self.assertEqual(
+            self._fill_while_blocked(overflow='block', block_timeout=0.01),
+            [{'test': i} for i in (0, 1, 2)]
+        )
+
+    def test_invalid_overflow_policy(self):
+        with self.assertRaises(ValueError):
+            self._create_backend(overflow='bogus')
+
+    def test_close_without_events(self):
+        backend = self._create_backend()
+        backend.close()
+        self.assertEqual(backend.backend.batches, [])
+
+    def test_failed_batch_is_sent_one_by_one(self):
+        backend = BufferedBackend(
+            backend={'ENGINE': 'track.backends.tests.test_buffered.FailingBatchBackend'},
+            batch_size=3,
+            flush_interval=10,
+        )
+        self.addCleanup(backend.close)
+        events = [{'test': 1}, {'test': 2, 'fail': True}, {'test': 3}]
+        for event in events:
+            backend.send(event)
+
+        backend.close()
+
+        self.assertEqual(backend.backend.events, [events[0], events[2]])
+
+    def test_db_connections_are_closed_after_each_batch(self):
+        backend = self._create_backend(batch_size=1, flush_interval=0)
+        with patch.object(BufferedBackend, '_close_db_connections') as mock_close:
+            backend.send({'test': 1})
+            backend.send({'test': 2})
+            backend.close()
+        self.assertEqual(mock_close.call_count, 2)
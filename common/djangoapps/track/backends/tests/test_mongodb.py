@@ -1,6 +1,7 @@
 from __future__ import absolute_import
 
-from mock import patch
+from bson.errors import InvalidDocument
+from mock import call, patch
 
 from django.test import TestCase
 
@@ -37,3 +38,29 @@ class TestMongoBackend(TestCase):
 
         self.assertEqual(events[0], first_argument(calls[0]))
         self.assertEqual(events[1], first_argument(calls[1]))
+
+    def test_mongo_backend_send_many(self):
+        events = [{'test': 1}, {'test': 2}]
+
+        self.backend.send_many(events)
+
+        # Check that the events were inserted in a single batch
+        self.backend.collection.insert.assert_called_once_with(events, manipulate=False, continue_on_error=True)
+
+    def test_mongo_backend_send_many_invalid_event(self):
+        events = [{'test': 1}, {'test': object()}, {'test': 3}]
+
+        def insert(doc_or_docs, **kwargs):  # pylint: disable=unused-argument
+            """Fails to encode the batch and the invalid event."""
+            if isinstance(doc_or_docs, list) or doc_or_docs is events[1]:
+                raise InvalidDocument('Cannot encode object')
+
+        self.backend.collection.insert.side_effect = insert
+        self.backend.send_many(events)
+
+        # Check that the events were inserted one by one once the batch failed
+        self.assertEqual(
+            self.backend.collection.insert.mock_calls,
+            [call(events, manipulate=False, continue_on_error=True)] +
+            [call(event, manipulate=False) for event in events]
+        )
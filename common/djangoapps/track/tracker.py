@@ -16,6 +16,9 @@ below::
       }
   }
 
+Slow backends can be wrapped in track.backends.buffered.BufferedBackend
+so that their events are sent in batches outside of the request.
+
 """
 
 import inspect
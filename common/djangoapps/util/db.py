@@ -3,6 +3,7 @@ Utility functions related to databases.
 """
 from functools import wraps
 import random
+import threading
 
 from django.db import connection, transaction
 
@@ -10,6 +11,88 @@ from django.db import connection, transaction
 MYSQL_MAX_INT = (2 ** 31) - 1
 
 
+class _AfterCommitCallbacks(threading.local):
+    """
+    The callbacks deferred by the current thread until its transaction commits.
+    """
+    def __init__(self):
+        super(_AfterCommitCallbacks, self).__init__()
+        self.deferring = False
+        self.callbacks = []
+        # The lists of items of the deferred `add_to_after_commit_batch`
+        # callbacks, by function.
+        self.batches = {}
+
+
+_AFTER_COMMIT_CALLBACKS = _AfterCommitCallbacks()
+
+
+def defer_after_commit_callbacks():
+    """
+    Defer the callbacks passed to `run_after_commit` in this thread until
+    `run_after_commit_callbacks` or `discard_after_commit_callbacks` is
+    called, which must happen once the current transaction ends.
+
+    This is done for each request by `util.middleware.AfterCommitMiddleware`.
+    """
+    _AFTER_COMMIT_CALLBACKS.deferring = True
+    _AFTER_COMMIT_CALLBACKS.callbacks = []
+    _AFTER_COMMIT_CALLBACKS.batches = {}
+
+
+def run_after_commit(func, *args, **kwargs):
+    """
+    Call `func` with the given arguments once the current transaction is
+    committed, or right away if the callbacks of this thread aren't deferred.
+
+    Returns True if the call was deferred.
+    """
+    if _AFTER_COMMIT_CALLBACKS.deferring:
+        _AFTER_COMMIT_CALLBACKS.callbacks.append((func, args, kwargs))
+        return True
+    func(*args, **kwargs)
+    return False
+
+
+def add_to_after_commit_batch(func, item):
+    """
+    Add `item` to the list that `func` is called with once the current
+    transaction is committed, so that `func` is called once with all the items
+    added during the transaction.
+
+    Returns False, without calling `func`, if the callbacks of this thread
+    aren't deferred, so that the caller can handle `item` right away.
+    """
+    if not _AFTER_COMMIT_CALLBACKS.deferring:
+        return False
+    batch = _AFTER_COMMIT_CALLBACKS.batches.get(func)
+    if batch is None:
+        batch = _AFTER_COMMIT_CALLBACKS.batches[func] = []
+        _AFTER_COMMIT_CALLBACKS.callbacks.append((func, (batch,), {}))
+    batch.append(item)
+    return True
+
+
+def run_after_commit_callbacks():
+    """
+    Call the deferred callbacks, in the order they were deferred, and stop
+    deferring them.
+    """
+    callbacks = _AFTER_COMMIT_CALLBACKS.callbacks
+    discard_after_commit_callbacks()
+    for func, args, kwargs in callbacks:
+        func(*args, **kwargs)
+
+
+def discard_after_commit_callbacks():
+    """
+    Drop the deferred callbacks, and stop deferring them.
+    """
+    _AFTER_COMMIT_CALLBACKS.deferring = False
+    _AFTER_COMMIT_CALLBACKS.callbacks = []
+    _AFTER_COMMIT_CALLBACKS.batches = {}
+
+
 def commit_on_success_with_read_committed(func):  # pylint: disable=invalid-name
     """
     Decorator which executes the decorated function inside a transaction with isolation level set to READ COMMITTED.
@@ -0,0 +1,25 @@
+"""
+Middleware for the util app
+"""
+from util.db import defer_after_commit_callbacks, discard_after_commit_callbacks, run_after_commit_callbacks
+
+
+class AfterCommitMiddleware(object):
+    """
+    Defer the callbacks passed to `util.db.run_after_commit` during each
+    request until the request's transaction is committed, and drop them if it
+    is rolled back.
+
+    This must come before TransactionMiddleware, so that the callbacks are run
+    after the commit.
+    """
+    def process_request(self, _request):
+        defer_after_commit_callbacks()
+
+    def process_response(self, _request, response):
+        run_after_commit_callbacks()
+        return response
+
+    def process_exception(self, _request, _exception):
+        # The transaction middleware rolls back the request's changes.
+        discard_after_commit_callbacks()
@@ -10,7 +10,15 @@ from django.db import connection, IntegrityError
 from django.db.transaction import commit_on_success, TransactionManagementError
 from django.test import TestCase, TransactionTestCase
 
-from util.db import commit_on_success_with_read_committed, generate_int_id
+from util.db import (
+    add_to_after_commit_batch,
+    commit_on_success_with_read_committed,
+    defer_after_commit_callbacks,
+    discard_after_commit_callbacks,
+    generate_int_id,
+    run_after_commit,
+    run_after_commit_callbacks,
+)
 
 
 @ddt.ddt
@@ -127,3 +135,61 @@ class GenerateIntIdTestCase(TestCase):
         for i in range(times):
             int_id = generate_int_id(minimum, maximum, used_ids)
             self.assertIn(int_id, list(set(range(minimum, maximum + 1)) - used_ids))
+
+
+class RunAfterCommitTestCase(unittest.TestCase):
+    """
+    Tests for run_after_commit and add_to_after_commit_batch.
+    """
+    def setUp(self):
+        super(RunAfterCommitTestCase, self).setUp()
+        self.calls = []
+        self.addCleanup(discard_after_commit_callbacks)
+
+    def record(self, items):
+        """Records a call with the given batch of items."""
+        self.calls.append(items)
+
+    def test_not_deferred(self):
+        self.assertFalse(run_after_commit(self.calls.append, 1))
+        self.assertEqual(self.calls, [1])
+
+    def test_deferred(self):
+        defer_after_commit_callbacks()
+        self.assertTrue(run_after_commit(self.calls.append, 1))
+        self.assertTrue(run_after_commit(self.calls.append, 2))
+        self.assertEqual(self.calls, [])
+        run_after_commit_callbacks()
+        self.assertEqual(self.calls, [1, 2])
+        # Callbacks aren't deferred anymore.
+        self.assertFalse(run_after_commit(self.calls.append, 3))
+        self.assertEqual(self.calls, [1, 2, 3])
+
+    def test_discarded(self):
+        defer_after_commit_callbacks()
+        run_after_commit(self.calls.append, 1)
+        discard_after_commit_callbacks()
+        run_after_commit_callbacks()
+        self.assertEqual(self.calls, [])
+
+    def test_batch_not_deferred(self):
+        self.assertFalse(add_to_after_commit_batch(self.record, 1))
+        self.assertEqual(self.calls, [])
+
+    def test_batch_deferred(self):
+        defer_after_commit_callbacks()
+        run_after_commit(self.calls.append, 1)
+        self.assertTrue(add_to_after_commit_batch(self.record, 2))
+        self.assertTrue(add_to_after_commit_batch(self.record, 3))
+        run_after_commit(self.calls.append, 4)
+        run_after_commit_callbacks()
+        self.assertEqual(self.calls, [1, [2, 3], 4])
+
+    def test_batch_discarded(self):
+        defer_after_commit_callbacks()
+        add_to_after_commit_batch(self.record, 1)
+        discard_after_commit_callbacks()
+        defer_after_commit_callbacks()
+        add_to_after_commit_batch(self.record, 2)
+        run_after_commit_callbacks()
+        self.assertEqual(self.calls, [[2]])
@@ -1,12 +1,16 @@
 """
 Parser and evaluator for FormulaResponse and NumericalResponse
 
-Uses pyparsing to parse. Main function as of now is evaluator().
+Uses pyparsing to parse. Main functions as of now are evaluator() and
+compile_expression().
 """
 
 import math
 import operator
 import numbers
+import threading
+from collections import OrderedDict
+
 import numpy
 import scipy.constants
 import functions
@@ -73,6 +77,10 @@ SUFFIXES = {
 }
 
 
+# The number of parsed expressions kept by `compile_expression`.
+COMPILED_EXPRESSION_CACHE_SIZE = 1024
+
+
 class UndefinedVariable(Exception):
     """
     Indicate when a student inputs a variable which was not expected.
@@ -115,6 +123,14 @@ def eval_number(parse_result):
     return super_float("".join(parse_result))
 
 
+def is_value(token):
+    """
+    Return whether the token is a (previously calculated) number, or an array
+    of numbers when evaluating many samples at once, rather than a string.
+    """
+    return isinstance(token, (numbers.Number, numpy.ndarray))
+
+
 def eval_atom(parse_result):
     """
     Return the value wrapped by the atom.
@@ -122,7 +138,7 @@ def eval_atom(parse_result):
     In the case of parenthesis, ignore them.
     """
     # Find first number in the list
-    result = next(k for k in parse_result if isinstance(k, numbers.Number))
+    result = next(k for k in parse_result if is_value(k))
     return result
 
 
@@ -136,7 +152,7 @@ def eval_power(parse_result):
     # `reduce` will go from left to right; reverse the list.
     parse_result = reversed(
         [k for k in parse_result
-         if isinstance(k, numbers.Number)]  # Ignore the '^' marks.
+         if is_value(k)]  # Ignore the '^' marks.
     )
     # Having reversed it, raise `b` to the power of `a`.
     power = reduce(lambda a, b: b ** a, parse_result)
@@ -155,10 +171,11 @@ def eval_parallel(parse_result):
     """
     if len(parse_result) == 1:
         return parse_result[0]
-    if 0 in parse_result:
+    # Arrays can't be compared with `in`; their zeros make the division fail instead.
+    if not any(isinstance(e, numpy.ndarray) for e in parse_result) and 0 in parse_result:
         return float('nan')
     reciprocals = [1. / e for e in parse_result
-                   if isinstance(e, numbers.Number)]
+                   if is_value(e)]
     return 1. / sum(reciprocals)
 
 
@@ -173,12 +190,12 @@ def eval_sum(parse_result):
     total = 0.0
     current_op = operator.add
     for token in parse_result:
-        if token == '+':
+        if is_value(token):
+            total = current_op(total, token)
+        elif token == '+':
             current_op = operator.add
         elif token == '-':
             current_op = operator.sub
-        else:
-            total = current_op(total, token)
     return total
 
 
@@ -191,12 +208,12 @@ def eval_product(parse_result):
     prod = 1.0
     current_op = operator.mul
     for token in parse_result:
-        if token == '*':
+        if is_value(token):
+            prod = current_op(prod, token)
+        elif token == '*':
             current_op = operator.mul
         elif token == '/':
             current_op = operator.truediv
-        else:
-            prod = current_op(prod, token)
     return prod
 
 
@@ -223,39 +240,148 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     -Variables are passed as a dictionary from string to value. They must be
      python numbers.
     -Unary functions are passed as a dictionary from string to function.
+
+    The parsed expression is reused by later calls; see `compile_expression`.
     """
-    # No need to go further.
-    if math_expr.strip() == "":
-        return float('nan')
+    return compile_expression(math_expr, case_sensitive).evaluate(variables, functions)
 
-    # Parse the tree.
-    math_interpreter = ParseAugmenter(math_expr, case_sensitive)
-    math_interpreter.parse_algebra()
 
-    # Get our variables together.
-    all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
+_COMPILED_EXPRESSIONS = OrderedDict()
+_COMPILED_EXPRESSIONS_LOCK = threading.Lock()
 
-    # ...and check them
-    math_interpreter.check_variables(all_variables, all_functions)
 
-    # Create a recursion to evaluate the tree.
-    if case_sensitive:
-        casify = lambda x: x
-    else:
-        casify = lambda x: x.lower()  # Lowercase for case insens.
-
-    evaluate_actions = {
-        'number': eval_number,
-        'variable': lambda x: all_variables[casify(x[0])],
-        'function': lambda x: all_functions[casify(x[0])](x[1]),
-        'atom': eval_atom,
-        'power': eval_power,
-        'parallel': eval_parallel,
-        'product': eval_product,
-        'sum': eval_sum
-    }
-
-    return math_interpreter.reduce_tree(evaluate_actions)
+def compile_expression(math_expr, case_sensitive=False):
+    """
+    Return a `CompiledExpression` for the given math expression string.
+
+    The most recently used `COMPILED_EXPRESSION_CACHE_SIZE` compiled
+    expressions are cached, so that e.g. an instructor's answer is only
+    parsed once however many students' answers it's compared to.
+    """
+    key = (math_expr, bool(case_sensitive))
+    with _COMPILED_EXPRESSIONS_LOCK:
+        compiled = _COMPILED_EXPRESSIONS.pop(key, None)
+        if compiled is not None:
+            # Reinsert it as the most recently used.
+            _COMPILED_EXPRESSIONS[key] = compiled
+            return compiled
+
+    # Parse outside of the lock; expressions which fail to parse aren't cached.
+    compiled = CompiledExpression(math_expr, case_sensitive)
+
+    with _COMPILED_EXPRESSIONS_LOCK:
+        _COMPILED_EXPRESSIONS[key] = compiled
+        while len(_COMPILED_EXPRESSIONS) > COMPILED_EXPRESSION_CACHE_SIZE:
+            _COMPILED_EXPRESSIONS.popitem(last=False)
+    return compiled
+
+
+class CompiledExpression(object):
+    """
+    A math expression which is parsed once, and can then be evaluated many
+    times: either for one set of variables at a time, or for many samples of
+    the variables at once.
+    """
+    def __init__(self, math_expr, case_sensitive=False):
+        """
+        Parse the math expression string.
+        """
+        self.math_expr = math_expr
+        self.case_sensitive = case_sensitive
+        self.math_interpreter = None
+
+        # An empty expression evaluates to NaN; there's nothing to parse.
+        if math_expr.strip() != "":
+            self.math_interpreter = ParseAugmenter(math_expr, case_sensitive)
+            self.math_interpreter.parse_algebra()
+
+    def _evaluate_actions(self, variables, functions, vectorize=False):
+        """
+        Return the actions for `reduce_tree` that evaluate the expression with
+        the given variables and functions, after checking that they're defined.
+
+        If `vectorize` is True, functions which aren't numpy ufuncs are
+        wrapped to be applied to each element of an array argument.
+        """
+        # Get our variables together.
+        all_variables, all_functions = add_defaults(variables, functions, self.case_sensitive)
+
+        # ...and check them
+        self.math_interpreter.check_variables(all_variables, all_functions)
+
+        # Create a recursion to evaluate the tree.
+        if self.case_sensitive:
+            casify = lambda x: x
+        else:
+            casify = lambda x: x.lower()  # Lowercase for case insens.
+
+        def eval_function(parse_result):
+            """
+            Apply the function to its argument.
+            """
+            function = all_functions[casify(parse_result[0])]
+            if vectorize and not isinstance(function, numpy.ufunc):
+                function = numpy.vectorize(function)
+            return function(parse_result[1])
+
+        return {
+            'number': eval_number,
+            'variable': lambda x: all_variables[casify(x[0])],
+            'function': eval_function,
+            'atom': eval_atom,
+            'power': eval_power,
+            'parallel': eval_parallel,
+            'product': eval_product,
+            'sum': eval_sum
+        }
+
+    def evaluate(self, variables, functions):
+        """
+        Evaluate the expression with the given variables and functions, as
+        `evaluator` does.
+        """
+        # No need to go further.
+        if self.math_interpreter is None:
+            return float('nan')
+
+        return self.math_interpreter.reduce_tree(self._evaluate_actions(variables, functions))
+
+    def evaluate_samples(self, samples, functions):
+        """
+        Evaluate the expression for each of the variable dictionaries in
+        `samples`, and return a list of the results.
+
+        All the samples are evaluated in one pass over numpy arrays of their
+        variables' values. If that fails (e.g. because one of them divides by
+        zero), the samples are evaluated one at a time instead, so that the
+        results and errors are exactly those of `evaluate`.
+        """
+        if self.math_interpreter is None:
+            return [float('nan')] * len(samples)
+        if not samples:
+            return []
+
+        try:
+            variables = {}
+            for name in samples[0]:
+                values = numpy.array([sample[name] for sample in samples])
+                if not numpy.issubdtype(values.dtype, numpy.inexact):
+                    # Avoid the wraparound of fixed size integers.
+                    values = values.astype(float)
+                variables[name] = values
+
+            # Make numpy raise where python numbers would, rather than warn.
+            with numpy.errstate(divide='raise', over='raise', invalid='raise', under='ignore'):
+                result = self.math_interpreter.reduce_tree(
+                    self._evaluate_actions(variables, functions, vectorize=True)
+                )
+        except Exception:  # pylint: disable=broad-except
+            return [self.evaluate(sample, functions) for sample in samples]
+
+        if numpy.ndim(result) == 0:
+            # None of the variables were used.
+            return [result] * len(samples)
+        return list(result)
 
 
 class ParseAugmenter(object):
@@ -5,6 +5,7 @@ Unit tests for calc.py
 import unittest
 import numpy
 import calc
+from mock import patch
 from pyparsing import ParseException
 
 # numpy's default behavior when it evaluates a function outside its domain
@@ -559,3 +560,80 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+
+class CompiledExpressionTest(unittest.TestCase):
+    """
+    Run tests for calc.compile_expression and calc.CompiledExpression
+    """
+    def test_compiled_expressions_are_cached(self):
+        """
+        The same expression is only parsed once per case sensitivity
+        """
+        compiled = calc.compile_expression('x^2 + 1')
+        self.assertIs(compiled, calc.compile_expression('x^2 + 1'))
+        self.assertIsNot(compiled, calc.compile_expression('x^2 + 1', case_sensitive=True))
+        self.assertEqual(compiled.evaluate({'x': 3.0}, {}), 10.0)
+
+    def test_cache_size(self):
+        """
+        Only the most recently used expressions are kept
+        """
+        with patch('calc.calc.COMPILED_EXPRESSION_CACHE_SIZE', 2):
+            first = calc.compile_expression('1+1')
+            calc.compile_expression('1+2')
+            # Use the first again, so the second is the least recently used.
+            self.assertIs(first, calc.compile_expression('1+1'))
+            calc.compile_expression('1+3')
+            self.assertIs(first, calc.compile_expression('1+1'))
+            self.assertEqual(len(calc.calc._COMPILED_EXPRESSIONS), 2)  # pylint: disable=protected-access
+
+    def test_parse_errors_are_not_cached(self):
+        """
+        Expressions which can't be parsed raise every time
+        """
+        for __ in range(2):
+            with self.assertRaises(ParseException):
+                calc.compile_expression('1+')
+
+    def test_evaluate_samples(self):
+        """
+        Evaluating many samples at once matches evaluating them one at a time
+        """
+        samples = [{'x': x, 'y': y} for x, y in zip(numpy.linspace(0.5, 3, 10), numpy.linspace(-2.5, 7, 10))]
+        functions = {'f': lambda x: x * 2}
+        for expression in ['x^2 + y', 'sin(x)*e^y', 'x||y', '-x/y + 2k', 'f(x) + fact(3)', 'sqrt(x) + j', '7']:
+            compiled = calc.compile_expression(expression)
+            expected = [compiled.evaluate(sample, functions) for sample in samples]
+            with patch.object(compiled, 'evaluate') as mock_evaluate:
+                results = compiled.evaluate_samples(samples, functions)
+                # All the samples were evaluated at once.
+                self.assertFalse(mock_evaluate.called)
+            self.assertEqual(len(results), len(samples))
+            for result, expected_result in zip(results, expected):
+                self.assertAlmostEqual(result, expected_result, delta=1e-9, msg=expression)
+
+    def test_evaluate_samples_errors(self):
+        """
+        Errors for any sample are the same as when evaluating them one at a time
+        """
+        samples = [{'x': 1.0}, {'x': 0.0}]
+        with self.assertRaises(ZeroDivisionError):
+            calc.compile_expression('1/x').evaluate_samples(samples, {})
+        with self.assertRaisesRegexp(ValueError, 'factorial'):
+            calc.compile_expression('fact(x - 1)').evaluate_samples(samples, {})
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'y'):
+            calc.compile_expression('x + y').evaluate_samples(samples, {})
+
+        # Zeros in parallel make that sample NaN
+        results = calc.compile_expression('x||1').evaluate_samples(samples, {})
+        self.assertEqual(results[0], 0.5)
+        self.assertTrue(numpy.isnan(results[1]))
+
+    def test_evaluate_samples_empty_expression(self):
+        """
+        An empty expression evaluates to NaN for every sample
+        """
+        results = calc.compile_expression('').evaluate_samples([{'x': 1.0}, {'x': 2.0}], {})
+        self.assertEqual(len(results), 2)
+        self.assertTrue(all(numpy.isnan(result) for result in results))
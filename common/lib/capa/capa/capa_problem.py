@@ -13,11 +13,13 @@ Main module which shows problems (of "capa" type).
 This is used by capa_module.
 """
 
+from collections import OrderedDict
 from copy import deepcopy
 from datetime import datetime
 import logging
 import os.path
 import re
+import threading
 
 from lxml import etree
 from pytz import UTC
@@ -58,6 +60,12 @@ html_problem_semantics = [
 
 log = logging.getLogger(__name__)
 
+# How many preprocessed problem trees to keep in memory, see LoncapaProblem._parse_problem_text
+PARSED_PROBLEM_CACHE_SIZE = 256
+
+_PARSED_PROBLEMS = OrderedDict()
+_PARSED_PROBLEMS_LOCK = threading.Lock()
+
 #-----------------------------------------------------------------------------
 # main class for this module
 
@@ -115,7 +123,7 @@ class LoncapaProblem(object):
     Main class for capa Problems.
     """
     def __init__(self, problem_text, id, capa_system, capa_module,  # pylint: disable=redefined-builtin
-                 state=None, seed=None):
+                 state=None, seed=None, minimal_init=False):
         """
         Initializes capa Problem.
 
@@ -133,6 +141,9 @@ class LoncapaProblem(object):
                 - `done` (bool) indicates whether or not this problem is considered done
                 - `input_state` (dict) maps input_id to a dictionary that holds the state for that input
             seed (int): random number generator seed.
+            minimal_init (bool): whether to only initialize the problem's responses
+                enough to compute its max score.  The problem's scripts aren't run,
+                and the problem can't be rendered or graded.
 
         """
 
@@ -161,22 +172,24 @@ class LoncapaProblem(object):
         problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
         self.problem_text = problem_text
 
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
-
-        self.make_xml_compatible(self.tree)
+        # parse problem XML file into an element tree, handle any
+        # <include file="foo"> tags, and add ID's to its responses and inputs
+        self.tree, responses = self._parse_problem_text(problem_text)
 
-        # handle any <include file="foo"> tags
-        self._process_includes()
+        if minimal_init:
+            self.context = {}
+        else:
+            # construct script processor context (eg for customresponse problems)
+            self.context = self._extract_context(self.tree)
 
-        # construct script processor context (eg for customresponse problems)
-        self.context = self._extract_context(self.tree)
+        # Create the dict (self.responders) of Response instances for each question
+        # in the problem, and add ID's to its solutions.  This may perform some
+        # in-place transformations of the XML tree. The dict has keys = xml subtree
+        # of Response, values = Response instance
+        self._preprocess_problem(self.tree, responses, minimal_init)
 
-        # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
-        # transformations.  This also creates the dict (self.responders) of Response
-        # instances for each question in the problem. The dict has keys = xml subtree of
-        # Response, values = Response instance
-        self._preprocess_problem(self.tree)
+        if minimal_init:
+            return
 
         if not self.student_answers:  # True when student_answers is an empty dict
             self.set_initial_display()
@@ -195,6 +208,55 @@ class LoncapaProblem(object):
 
         self.extracted_tree = self._extract_html(self.tree)
 
+    def _parse_problem_text(self, problem_text):
+        """
+        Returns a new XML tree of the problem, with its includes processed, its
+        XML made compatible and the IDs of its responses and inputs assigned,
+        along with the list of its responses, each paired with the list of its
+        entries (see `_assign_ids`).
+
+        This doesn't depend on the seed or on the student, so the trees of the
+        most recently used problems are cached, along with the positions of
+        their responses and inputs.  Each new LoncapaProblem of the same
+        problem id and text only gets a copy of the cached tree, and finds its
+        responses and inputs by position.  Trees with includes aren't cached,
+        since the included files can change without the problem text changing.
+        """
+        cache_key = (self.problem_id, problem_text)
+        with _PARSED_PROBLEMS_LOCK:
+            cached = _PARSED_PROBLEMS.pop(cache_key, None)
+            if cached is not None:
+                # Reinsert it as the most recently used.
+                _PARSED_PROBLEMS[cache_key] = cached
+        if cached is not None:
+            cached_tree, positions = cached
+            tree = deepcopy(cached_tree)
+            elements = list(tree.iter())
+            return tree, [
+                (elements[response_position], [elements[position] for position in inputfield_positions])
+                for response_position, inputfield_positions in positions
+            ]
+
+        self.tree = etree.XML(problem_text)
+        self.make_xml_compatible(self.tree)
+        has_includes = self.tree.find('.//include') is not None
+        if has_includes:
+            self._process_includes()
+        responses = self._assign_ids(self.tree)
+        if has_includes:
+            return self.tree, responses
+
+        element_positions = {element: position for position, element in enumerate(self.tree.iter())}
+        positions = [
+            (element_positions[response], [element_positions[entry] for entry in inputfields])
+            for response, inputfields in responses
+        ]
+        with _PARSED_PROBLEMS_LOCK:
+            _PARSED_PROBLEMS[cache_key] = (deepcopy(self.tree), positions)
+            while len(_PARSED_PROBLEMS) > PARSED_PROBLEM_CACHE_SIZE:
+                _PARSED_PROBLEMS.popitem(last=False)
+        return self.tree, responses
+
     def make_xml_compatible(self, tree):
         """
         Adjust tree xml in-place for compatibility before creating
@@ -824,19 +886,16 @@ class LoncapaProblem(object):
 
         return tree
 
-    def _preprocess_problem(self, tree):  # private
+    def _assign_ids(self, tree):  # private
         """
         Assign IDs to all the responses
         Assign sub-IDs to all entries (textline, schematic, etc.)
-        Annoted correctness and value
         In-place transformation
 
-        Also create capa Response instances for each responsetype and save as self.responders
-
-        Obtain all responder answers and save as self.responder_answers dict (key = response)
+        Returns the list of the responses, each paired with the list of its entries.
         """
+        responses = []
         response_id = 1
-        self.responders = {}
         for response in tree.xpath('//' + "|//".join(responsetypes.registry.registered_tags())):
             response_id_str = self.problem_id + "_" + str(response_id)
             # create and save ID for this response
@@ -857,12 +916,31 @@ class LoncapaProblem(object):
                 entry.attrib['id'] = "%s_%i_%i" % (self.problem_id, response_id, answer_id)
                 answer_id = answer_id + 1
 
+            responses.append((response, inputfields))
+
+        return responses
+
+    def _preprocess_problem(self, tree, responses, minimal_init=False):  # private
+        """
+        Create capa Response instances for each of the `responses` of `tree`
+        returned by `_assign_ids` and save as self.responders
+
+        Obtain all responder answers and save as self.responder_answers dict (key = response),
+        unless minimal_init is set
+        """
+        self.responders = {}
+        for response, inputfields in responses:
             # instantiate capa Response
             responsetype_cls = responsetypes.registry.get_class_for_tag(response.tag)
-            responder = responsetype_cls(response, inputfields, self.context, self.capa_system, self.capa_module)
+            responder = responsetype_cls(
+                response, inputfields, self.context, self.capa_system, self.capa_module, minimal_init
+            )
             # save in list in self
             self.responders[response] = responder
 
+        if minimal_init:
+            return
+
         # get responder answers (do this only once, since there may be a performance cost,
         # eg with externalresponse)
         self.responder_answers = {}
@@ -0,0 +1,352 @@
+"""
+A pool of long-lived Python workers for capa's safe_exec.
+
+Starting a sandboxed Python process and importing numpy and friends in it
+costs far more than running most problem code, so instead of using a new
+process for each execution, safe_exec can dispatch to a pool of workers
+that have already done so.  Each worker forks a child for each execution
+(see pool_worker.py), which applies codejail's resource limits to that
+execution only, and is replaced after `max_runs_per_worker` executions.
+
+The workers are sandboxed the same way as codejail's processes, and the
+children that run the code can't fork.  Each worker kills the children that
+outlive codejail's REALTIME limit, and a worker that doesn't answer shortly
+after that is killed and replaced, so that hung code can't hold a web
+request.  A pool of plain, unsandboxed workers can also be used for code
+that is allowed to run unsafely, which is also handy for benchmarking
+without AppArmor.
+
+The pools are disabled until `configure` is called with a non-zero size.
+"""
+
+import base64
+import json
+import logging
+import os
+import select
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from codejail import jail_code
+from codejail.safe_exec import json_safe, SafeExecException
+from dogapi import dog_stats_api
+
+
+log = logging.getLogger(__name__)
+
+
+WORKER_PY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pool_worker.py")
+
+with open(WORKER_PY_FILE) as _worker_py_file:
+    WORKER_PY = _worker_py_file.read()
+
+# How many seconds past the REALTIME limit of an execution its worker is
+# given to answer before it is killed.
+WORKER_TIMEOUT_GRACE = 5
+
+# The number of bytes read from a worker at once.
+READ_SIZE = 65536
+
+
+class SandboxWorkerError(Exception):
+    """
+    A pool worker couldn't be started or stopped answering.
+    """
+    pass
+
+
+class SandboxWorker(object):
+    """
+    A running pool worker process.
+    """
+    def __init__(self, cmdline, env=None, preload_modules=()):
+        self.runs = 0
+        self._buffer = ""
+        self.tmpdir = tempfile.mkdtemp(prefix="codejail-pool-")
+        # The worker may be running as the sandbox user, who needs to be
+        # able to create the directories of its executions in here.
+        os.chmod(self.tmpdir, 0777)
+
+        with open(os.devnull, "w") as devnull:
+            self.process = subprocess.Popen(
+                cmdline + ["-c", WORKER_PY] + list(preload_modules),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=devnull,
+                cwd=self.tmpdir,
+                env=env,
+                close_fds=True,
+            )
+        try:
+            ready = self._read_line()
+        except (IOError, OSError):
+            ready = None
+        if ready != "ready\n":
+            self.close()
+            raise SandboxWorkerError("Couldn't start a safe_exec pool worker")
+
+    def _read_line(self, timeout=None):
+        """
+        Reads a line from the worker, or returns None if it doesn't write
+        one within `timeout` seconds (if set) or it exits.
+        """
+        deadline = time.time() + timeout if timeout is not None else None
+        fd = self.process.stdout.fileno()
+        while "\n" not in self._buffer:
+            remaining = None if deadline is None else max(0, deadline - time.time())
+            readable, _, _ = select.select([fd], [], [], remaining)
+            if not readable:
+                return None
+            chunk = os.read(fd, READ_SIZE)
+            if not chunk:
+                return None
+            self._buffer += chunk
+        line, self._buffer = self._buffer.split("\n", 1)
+        return line + "\n"
+
+    def execute(self, request, timeout=None):
+        """
+        Sends `request` to the worker and returns its response.
+
+        The worker is killed if it doesn't answer within `timeout` seconds.
+        """
+        self.runs += 1
+        try:
+            self.process.stdin.write(json.dumps(request) + "\n")
+            self.process.stdin.flush()
+            response = self._read_line(timeout)
+        except (IOError, OSError):
+            response = None
+        if not response:
+            self.kill()
+            raise SandboxWorkerError("The safe_exec pool worker died or timed out")
+        return json.loads(response)
+
+    def kill(self):
+        """
+        Kills the worker.
+        """
+        try:
+            self.process.kill()
+        except OSError:
+            pass
+
+    def close(self):
+        """
+        Stops the worker and removes its files.
+        """
+        try:
+            self.process.stdin.close()
+        except (IOError, OSError):
+            self.kill()
+        self.process.wait()
+        self.process.stdout.close()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+class SandboxPool(object):
+    """
+    Runs code in up to `size` pool workers, each of which is replaced after
+    `max_runs_per_worker` executions.
+
+    Workers are created in the process that uses the pool, so that a pool
+    configured before a server forks its worker processes isn't shared
+    between them.
+    """
+    def __init__(self, name, size, max_runs_per_worker=100, unsafe=False, preload_modules=()):
+        self.name = name
+        self.size = size
+        self.max_runs_per_worker = max_runs_per_worker
+        self.unsafe = unsafe
+        self.preload_modules = preload_modules
+        self._metric_tags = [u"pool:{}".format(name)]
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._idle = []
+        self._slots = None
+
+    def _cmdline(self):
+        """
+        Returns the command line and environment of a worker process.
+        """
+        if self.unsafe:
+            return [sys.executable, "-B"], None
+
+        command = jail_code.COMMANDS["python"]
+        cmdline = []
+        if command["user"]:
+            cmdline.extend(["sudo", "-u", command["user"]])
+        cmdline.extend(command["cmdline_start"])
+        return cmdline, {}
+
+    def _limits(self):
+        """
+        Returns the resource limits of one execution.
+
+        The code run in a sandboxed worker can't fork: its children could
+        outlive the execution, and see the requests of later ones.
+        """
+        if self.unsafe:
+            return {}
+        limits = dict(jail_code.LIMITS)
+        limits["NPROC"] = 0
+        return limits
+
+    def _spawn(self):
+        """
+        Starts a new worker.
+        """
+        cmdline, env = self._cmdline()
+        with dog_stats_api.timer("capa.safe_exec.pool.spawn_time", tags=self._metric_tags):
+            return SandboxWorker(cmdline, env, self.preload_modules)
+
+    def _check_process(self):
+        """
+        Forgets the workers of the parent process after a fork, and starts
+        the workers of this process.
+        """
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid == pid:
+                return
+            self._idle = []
+            self._slots = threading.BoundedSemaphore(self.size)
+            self._pid = pid
+            for __ in xrange(self.size):
+                try:
+                    self._idle.append(self._spawn())
+                except SandboxWorkerError:
+                    log.exception("Couldn't pre-start the workers of safe_exec pool %s", self.name)
+                    break
+
+    def _acquire(self):
+        """
+        Returns an idle worker, starting one if need be.
+        """
+        self._slots.acquire()
+        try:
+            with self._lock:
+                if self._idle:
+                    return self._idle.pop()
+            return self._spawn()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _release(self, worker, healthy=True):
+        """
+        Puts a worker back in the pool, or stops it if it is broken or has
+        run too many times.
+        """
+        try:
+            if healthy and worker.runs < self.max_runs_per_worker:
+                with self._lock:
+                    self._idle.append(worker)
+            else:
+                if healthy:
+                    dog_stats_api.increment("capa.safe_exec.pool.recycled", tags=self._metric_tags)
+                worker.close()
+        finally:
+            self._slots.release()
+
+    def execute(self, code, globals_dict, python_path=None, extra_files=None, slug=None):
+        """
+        Executes `code` in a pool worker, with the same arguments and results
+        as codejail's safe_exec.
+
+        Paths in `python_path` must be names of `extra_files`.
+        """
+        self._check_process()
+
+        request = {
+            "code": code,
+            "globals": json_safe(globals_dict),
+            "python_path": python_path or [],
+            "extra_files": [
+                (filename, base64.b64encode(contents)) for filename, contents in extra_files or ()
+            ],
+            "limits": self._limits(),
+        }
+        realtime = request["limits"].get("REALTIME")
+        timeout = realtime + WORKER_TIMEOUT_GRACE if realtime else None
+
+        worker = self._acquire()
+        try:
+            with dog_stats_api.timer("capa.safe_exec.pool.exec_time", tags=self._metric_tags):
+                response = worker.execute(request, timeout=timeout)
+        except SandboxWorkerError:
+            self._release(worker, healthy=False)
+            log.exception("safe_exec pool %s failed running %s", self.name, slug)
+            raise SafeExecException("Couldn't execute jailed code: the worker died")
+        self._release(worker)
+
+        if "error" in response:
+            raise SafeExecException("Couldn't execute jailed code: {}".format(response["error"]))
+        globals_dict.update(response["globals"])
+
+    def close(self):
+        """
+        Stops the idle workers.
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.close()
+
+
+_POOL_OPTIONS = {}
+_POOLS = {}
+
+
+def configure(size=0, max_runs_per_worker=100, unsafe=False):
+    """
+    Configures the safe_exec pools.
+
+    `size` is the number of workers of each pool; 0 disables the pools.
+
+    `max_runs_per_worker` is the number of executions after which a worker
+    is replaced.
+
+    If `unsafe` is true, code that is allowed to run unsafely is run in a
+    pool of unsandboxed workers instead of in the web process.
+    """
+    for pool in _POOLS.values():
+        pool.close()
+    _POOLS.clear()
+    _POOL_OPTIONS.clear()
+    _POOL_OPTIONS.update(size=size, max_runs_per_worker=max_runs_per_worker, unsafe=unsafe)
+
+
+def get_pool(unsafely=False, preload_modules=()):
+    """
+    Returns the pool to run code in, or None if the code shouldn't be run in
+    a pool.
+
+    `preload_modules` are the names of the modules that the workers of a
+    new pool import before they are used.
+    """
+    if not _POOL_OPTIONS.get("size"):
+        return None
+    if unsafely:
+        if not _POOL_OPTIONS["unsafe"]:
+            return None
+    elif not jail_code.is_configured("python"):
+        return None
+
+    name = "unsafe" if unsafely else "jailed"
+    if name not in _POOLS:
+        _POOLS[name] = SandboxPool(
+            name,
+            _POOL_OPTIONS["size"],
+            max_runs_per_worker=_POOL_OPTIONS["max_runs_per_worker"],
+            unsafe=unsafely,
+            preload_modules=preload_modules,
+        )
+    return _POOLS[name]
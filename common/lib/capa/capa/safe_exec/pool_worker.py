@@ -0,0 +1,180 @@
+"""
+A long-lived worker for capa.safe_exec.pool.
+
+This file isn't imported: its source is run by the (possibly sandboxed)
+Python interpreter of each pool worker, with the names of the modules to
+preload as arguments.
+
+The worker preloads the modules, then reads one JSON request per line
+from stdin.  Each request is executed in a child forked for it, so that
+executions can't see each other's state, and so that the resource limits
+apply to one execution only.  The response is written as one JSON line
+to stdout.
+
+The child can't fork processes of its own if the request limits NPROC, and
+can't read from or write to the streams of the worker.  The worker kills
+the child once it has run for the REALTIME limit, since an alarm set in the
+child could be cancelled by the code it runs.
+"""
+
+import base64
+import json
+import os
+import resource
+import select
+import shutil
+import signal
+import sys
+import time
+import traceback
+from cStringIO import StringIO
+
+
+for _module_name in sys.argv[1:]:
+    try:
+        __import__(_module_name)
+    except Exception:  # pylint: disable=broad-except
+        pass
+
+
+BAD_KEYS = ("__builtins__",)
+OK_TYPES = (type(None), int, long, float, str, unicode, list, tuple, dict)
+
+RLIMITS = {
+    "CPU": resource.RLIMIT_CPU,
+    "VMEM": resource.RLIMIT_AS,
+    "FSIZE": resource.RLIMIT_FSIZE,
+    "NPROC": resource.RLIMIT_NPROC,
+}
+
+# The number of bytes read from a child at once.
+READ_SIZE = 65536
+
+
+def jsonable(value):
+    """Can `value` be sent back as JSON?"""
+    if not isinstance(value, OK_TYPES):
+        return False
+    try:
+        json.dumps(value)
+    except Exception:  # pylint: disable=broad-except
+        return False
+    return True
+
+
+def set_limits(limits):
+    """
+    Apply the resource limits of one execution to this process.
+
+    REALTIME is enforced by the worker, see `wait_for_child`.  NPROC is
+    applied even if it is 0, which is how forking is forbidden.
+    """
+    for name, value in limits.items():
+        if name not in RLIMITS or (not value and name != "NPROC"):
+            continue
+        resource.setrlimit(RLIMITS[name], (value, value))
+
+
+def execute(request, workdir):
+    """Run the code of `request` in `workdir` and return the response."""
+    set_limits(request.get("limits") or {})
+
+    os.mkdir(workdir)
+    os.chdir(workdir)
+    for filename, contents in request.get("extra_files") or ():
+        with open(filename, "wb") as extra_file:
+            extra_file.write(base64.b64decode(contents))
+    for path in reversed(request.get("python_path") or ()):
+        sys.path.insert(0, os.path.abspath(path))
+
+    # Whatever the code prints mustn't end up in the response stream.
+    sys.stdout = StringIO()
+
+    g_dict = request["globals"]
+    try:
+        exec compile(request["code"], "jailed_code", "exec") in g_dict  # pylint: disable=exec-used
+    except BaseException:  # pylint: disable=broad-except
+        return {"error": traceback.format_exc()}
+
+    return {"globals": dict((k, v) for k, v in g_dict.iteritems() if k not in BAD_KEYS and jsonable(v))}
+
+
+def wait_for_child(pid, read_fd, realtime):
+    """
+    Read the response of the child `pid` from `read_fd`, killing the child
+    if it hasn't answered after `realtime` seconds (if set), and return it.
+    """
+    deadline = time.time() + realtime if realtime else None
+    chunks = []
+    while True:
+        timeout = None if deadline is None else max(0, deadline - time.time())
+        readable, _, _ = select.select([read_fd], [], [], timeout)
+        if not readable:
+            break
+        chunk = os.read(read_fd, READ_SIZE)
+        if not chunk:
+            break
+        chunks.append(chunk)
+
+    # The child has answered, closed its end of the pipe or run out of
+    # time: either way it mustn't keep running.
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    return "".join(chunks)
+
+
+def run(request, workdir):
+    """Fork a child to run `request`, and return its response."""
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        try:
+            # The code mustn't read the requests sent to the worker, nor
+            # write to its responses.
+            devnull = os.open(os.devnull, os.O_RDWR)
+            os.dup2(devnull, 0)
+            os.dup2(devnull, 1)
+            os.close(devnull)
+            try:
+                response = execute(request, workdir)
+            except BaseException:  # pylint: disable=broad-except
+                response = {"error": traceback.format_exc()}
+            with os.fdopen(write_fd, "wb") as result:
+                result.write(json.dumps(response))
+        finally:
+            os._exit(0)  # pylint: disable=protected-access
+
+    os.close(write_fd)
+    try:
+        data = wait_for_child(pid, read_fd, (request.get("limits") or {}).get("REALTIME"))
+    finally:
+        os.close(read_fd)
+    _, status = os.waitpid(pid, 0)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    try:
+        return json.loads(data)
+    except ValueError:
+        # No response, or only part of one.
+        return {"error": "Jailed code was killed (status {})".format(status)}
+
+
+def main():
+    """Serve requests until stdin is closed."""
+    stdout = sys.stdout
+    stdout.write("ready\n")
+    stdout.flush()
+
+    count = 0
+    for line in iter(sys.stdin.readline, ""):
+        count += 1
+        response = run(json.loads(line), os.path.abspath("run{}".format(count)))
+        stdout.write(json.dumps(response) + "\n")
+        stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
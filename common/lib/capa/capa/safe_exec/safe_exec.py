@@ -4,6 +4,7 @@ from codejail.safe_exec import safe_exec as codejail_safe_exec
 from codejail.safe_exec import not_safe_exec as codejail_not_safe_exec
 from codejail.safe_exec import json_safe, SafeExecException
 from . import lazymod
+from . import pool
 from dogapi import dog_stats_api
 
 import hashlib
@@ -46,6 +47,9 @@ for name, modname in ASSUMED_IMPORTS:
 
 LAZY_IMPORTS = "".join(LAZY_IMPORTS)
 
+# Pool workers import these up front, so that LAZY_IMPORTS find them loaded.
+PRELOAD_MODULES = [modname for _, modname in ASSUMED_IMPORTS]
+
 
 def update_hash(hasher, obj):
     """
@@ -115,6 +119,10 @@ def safe_exec(
         update_hash(md5er, safe_globals)
         key = "safe_exec.%r.%s" % (random_seed, md5er.hexdigest())
         cached = cache.get(key)
+        dog_stats_api.increment(
+            'capa.safe_exec.cache',
+            tags=['result:{}'.format('miss' if cached is None else 'hit')],
+        )
         if cached is not None:
             # We have a cached result.  The result is a pair: the exception
             # message, if any, else None; and the resulting globals dictionary.
@@ -127,8 +135,13 @@ def safe_exec(
     # Create the complete code we'll run.
     code_prolog = CODE_PROLOG % random_seed
 
-    # Decide which code executor to use.
-    if unsafely:
+    # Decide which code executor to use.  The pool workers only have the
+    # extra files in their sandbox, so other paths need codejail.
+    exec_pool = pool.get_pool(unsafely, PRELOAD_MODULES)
+    extra_file_names = set(name for name, _ in extra_files or ())
+    if exec_pool and all(path in extra_file_names for path in python_path or ()):
+        exec_fn = exec_pool.execute
+    elif unsafely:
         exec_fn = codejail_not_safe_exec
     else:
         exec_fn = codejail_safe_exec
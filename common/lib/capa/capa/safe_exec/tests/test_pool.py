@@ -0,0 +1,138 @@
+"""Test the safe_exec worker pool."""
+
+import os
+import sys
+import time
+import unittest
+import zipfile
+from cStringIO import StringIO
+
+from codejail.safe_exec import SafeExecException
+
+from capa.safe_exec import pool, safe_exec
+
+
+class TestSandboxPool(unittest.TestCase):
+    """Test running code in a pool of unsandboxed workers."""
+
+    def setUp(self):
+        super(TestSandboxPool, self).setUp()
+        self.pool = pool.SandboxPool("test", 2, max_runs_per_worker=3, unsafe=True)
+        self.addCleanup(self.pool.close)
+
+    def test_set_values(self):
+        g = {'b': 2}
+        self.pool.execute("a = 17 + b", g)
+        self.assertEqual(g, {'a': 19, 'b': 2})
+
+    def test_only_json_values_are_returned(self):
+        g = {}
+        self.pool.execute("import math\na = math.pi\nf = lambda: 1", g)
+        self.assertEqual(set(g), {'a'})
+
+    def test_raising_exceptions(self):
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.execute("1/0", {})
+        self.assertIn("ZeroDivisionError", cm.exception.message)
+
+    def test_killed_code(self):
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.execute("import os\nos._exit(3)", {})
+        self.assertIn("killed", cm.exception.message)
+
+        # The worker survives its child.
+        g = {}
+        self.pool.execute("a = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_printing_doesnt_break_the_worker(self):
+        g = {}
+        self.pool.execute("print 'hello'\nimport os\nos.write(1, 'world\\n')\na = 1", g)
+        self.assertEqual(g['a'], 1)
+
+    def test_executions_are_isolated(self):
+        g = {}
+        code = "import math\nhad_value = hasattr(math, 'value')\nmath.value = 1"
+        for __ in xrange(4):
+            self.pool.execute(code, g)
+            self.assertFalse(g['had_value'])
+
+    def test_extra_files(self):
+        zip_lib = StringIO()
+        with zipfile.ZipFile(zip_lib, "w") as zip_file:
+            zip_file.writestr("constant.py", "THE_CONST = 23\n")
+        g = {}
+        self.pool.execute(
+            "import constant\na = constant.THE_CONST",
+            g,
+            python_path=["python_lib.zip"],
+            extra_files=[("python_lib.zip", zip_lib.getvalue())],
+        )
+        self.assertEqual(g['a'], 23)
+
+    def test_code_cant_read_requests(self):
+        g = {}
+        self.pool.execute("import sys\nline = sys.stdin.readline()", g)
+        self.assertEqual(g['line'], "")
+
+    def test_realtime_limit(self):
+        self.pool._limits = lambda: {"REALTIME": 1}  # pylint: disable=protected-access
+        # The alarm of the child can't save it from the worker.
+        start = time.time()
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.execute("import signal, time\nsignal.alarm(0)\ntime.sleep(30)", {})
+        self.assertIn("killed", cm.exception.message)
+        self.assertLess(time.time() - start, 10)
+
+    @unittest.skipIf(os.getuid() == 0, "NPROC doesn't limit root")
+    def test_forking_is_limited(self):
+        self.pool._limits = lambda: {"NPROC": 0}  # pylint: disable=protected-access
+        with self.assertRaises(SafeExecException) as cm:
+            self.pool.execute("import os\nos.fork()", {})
+        self.assertIn("OSError", cm.exception.message)
+
+    def test_hung_worker_is_killed(self):
+        worker = pool.SandboxWorker([sys.executable, "-B"])
+        self.addCleanup(worker.close)
+        # Without a REALTIME limit the worker waits for the code, but the
+        # web process doesn't.
+        start = time.time()
+        with self.assertRaises(pool.SandboxWorkerError):
+            worker.execute({"code": "import time\ntime.sleep(30)", "globals": {}}, timeout=1)
+        self.assertLess(time.time() - start, 10)
+        self.assertIsNotNone(worker.process.wait())
+
+    def test_workers_are_recycled(self):
+        pids = set()
+        for __ in xrange(10):
+            g = {}
+            self.pool.execute("import os\npid = os.getppid()", g)
+            pids.add(g['pid'])
+        # 10 runs, with at most 3 runs per worker.
+        self.assertGreaterEqual(len(pids), 4)
+
+
+class TestSafeExecPool(unittest.TestCase):
+    """Test that safe_exec dispatches to the pool when it is configured."""
+
+    def setUp(self):
+        super(TestSafeExecPool, self).setUp()
+        pool.configure(size=1, unsafe=True)
+        self.addCleanup(pool.configure)
+
+    def test_unsafe_code_runs_in_pool(self):
+        g = {}
+        safe_exec("import os\npid = os.getppid()\na = int(math.pi)\nb = 1/2", g, unsafely=True)
+        self.assertEqual(g['a'], 3)
+        self.assertEqual(g['b'], 0.5)
+        self.assertNotEqual(g['pid'], os.getpid())
+
+    def test_random_seeding(self):
+        g1, g2 = {}, {}
+        safe_exec("r = random.randint(0, 999)", g1, random_seed=17, unsafely=True)
+        safe_exec("r = random.randint(0, 999)", g2, random_seed=17, unsafely=True)
+        self.assertEqual(g1['r'], g2['r'])
+
+    def test_pool_disabled(self):
+        pool.configure()
+        self.assertIsNone(pool.get_pool(unsafely=True))
@@ -0,0 +1,116 @@
+"""
+Tests for the parsed problem cache of LoncapaProblem.
+"""
+import textwrap
+import unittest
+
+from lxml import etree
+
+from capa import capa_problem
+from capa.capa_problem import LoncapaProblem
+from capa.tests import mock_capa_module, new_loncapa_problem, test_capa_system
+from capa.tests.response_xml_factory import StringResponseXMLFactory
+
+
+class ParsedProblemCacheTest(unittest.TestCase):
+    """
+    Tests that problem trees are parsed once, and copied for each problem.
+    """
+    def setUp(self):
+        super(ParsedProblemCacheTest, self).setUp()
+        capa_problem._PARSED_PROBLEMS.clear()  # pylint: disable=protected-access
+        self.addCleanup(capa_problem._PARSED_PROBLEMS.clear)  # pylint: disable=protected-access
+
+    def _inputfield_ids(self, problem):
+        """
+        Returns the ids of the responders of `problem`, each paired with the ids of their inputs.
+        """
+        return sorted(
+            (responder.id, responder.answer_ids)
+            for response, responder in problem.responders.items()
+        )
+
+    def test_tree_is_cached(self):
+        xml = StringResponseXMLFactory().build_xml(answer="Michigan")
+        problem = new_loncapa_problem(xml)
+        self.assertEqual(len(capa_problem._PARSED_PROBLEMS), 1)  # pylint: disable=protected-access
+
+        other_problem = new_loncapa_problem(xml)
+        self.assertEqual(len(capa_problem._PARSED_PROBLEMS), 1)  # pylint: disable=protected-access
+        self.assertIsNot(problem.tree, other_problem.tree)
+        self.assertEqual(other_problem.get_question_answers(), problem.get_question_answers())
+
+    def test_cached_problem_is_preprocessed_the_same(self):
+        xml = textwrap.dedent("""
+            <problem>
+            <stringresponse answer="Michigan">
+                <textline/>
+                <solution><p>Michigan</p></solution>
+            </stringresponse>
+            <multiplechoiceresponse>
+                <choicegroup type="MultipleChoice" shuffle="true">
+                    <choice correct="false">Ohio</choice>
+                    <choice correct="true">Michigan</choice>
+                </choicegroup>
+            </multiplechoiceresponse>
+            <solution><p>Explanation</p></solution>
+            </problem>
+        """)
+        problem = new_loncapa_problem(xml)
+        other_problem = new_loncapa_problem(xml)
+
+        self.assertEqual(etree.tostring(other_problem.tree), etree.tostring(problem.tree))
+        self.assertEqual(other_problem.get_question_answers(), problem.get_question_answers())
+        self.assertEqual(self._inputfield_ids(other_problem), [
+            ('1_1', ['1_2_1', '1_2_2']),
+            ('1_2', ['1_3_1']),
+        ])
+        self.assertEqual(self._inputfield_ids(problem), self._inputfield_ids(other_problem))
+        for response in other_problem.responders:
+            self.assertIs(response.getroottree().getroot(), other_problem.tree)
+
+    def test_problem_ids_arent_shared(self):
+        xml = StringResponseXMLFactory().build_xml(answer="Michigan")
+        new_loncapa_problem(xml)
+        other_problem = LoncapaProblem(
+            xml, id='2', seed=723, capa_system=test_capa_system(), capa_module=mock_capa_module()
+        )
+        self.assertEqual(other_problem.get_question_answers().keys(), ['2_2_1'])
+
+    def test_cached_tree_isnt_modified(self):
+        xml = StringResponseXMLFactory().build_xml(answer="Michigan")
+        problem = new_loncapa_problem(xml)
+        problem.tree.find('.//stringresponse').set('answer', 'Ohio')
+
+        self.assertEqual(new_loncapa_problem(xml).get_question_answers().values(), ['Michigan'])
+
+    def test_problems_are_seeded_separately(self):
+        xml = textwrap.dedent("""
+            <problem>
+            <script type="loncapa/python">
+            value = random.randint(0, 10 ** 9)
+            </script>
+            <customresponse cfn="test_custom">
+                <textline/>
+            </customresponse>
+            </problem>
+        """)
+        problem = new_loncapa_problem(xml, seed=1)
+        other_problem = new_loncapa_problem(xml, seed=2)
+
+        self.assertNotEqual(problem.context['value'], other_problem.context['value'])
+
+    def test_includes_arent_cached(self):
+        xml = textwrap.dedent("""
+            <problem>
+            <include file="test_include_cache.xml"/>
+            </problem>
+        """)
+        capa_system = test_capa_system()
+        capa_system.filestore.setcontents('test_include_cache.xml', '<p>First</p>')
+        self.addCleanup(capa_system.filestore.remove, 'test_include_cache.xml')
+        self.assertEqual(new_loncapa_problem(xml, capa_system).tree.find('.//p').text, 'First')
+
+        capa_system.filestore.setcontents('test_include_cache.xml', '<p>Second</p>')
+        self.assertEqual(new_loncapa_problem(xml, capa_system).tree.find('.//p').text, 'Second')
+        self.assertEqual(len(capa_problem._PARSED_PROBLEMS), 0)  # pylint: disable=protected-access
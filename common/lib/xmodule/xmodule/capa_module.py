@@ -10,6 +10,7 @@ from pkg_resources import resource_string
 import dogstats_wrapper as dog_stats_api
 from .capa_base import CapaMixin, CapaFields, ComplexEncoder
 from capa import responsetypes
+from capa.capa_problem import LoncapaProblem, LoncapaSystem
 from .progress import Progress
 from xmodule.util.misc import escape_html_characters
 from xmodule.x_module import XModule, module_attr, DEPRECATION_VSCOMPAT_EVENT
@@ -191,6 +192,37 @@ class CapaDescriptor(CapaFields, RawDescriptor):
         registered_tags = responsetypes.registry.registered_tags()
         return set([node.tag for node in tree.iter() if node.tag in registered_tags])
 
+    def max_score_from_definition(self):
+        """
+        Return the problem's max score, computed from its definition alone, without
+        binding it to a student or running the problem's scripts.
+        """
+        capa_system = LoncapaSystem(
+            ajax_url=None,
+            anonymous_student_id=None,
+            cache=None,
+            can_execute_unsafe_code=None,
+            get_python_lib_zip=None,
+            DEBUG=None,
+            filestore=self.runtime.resources_fs,
+            i18n=None,
+            node_path=None,
+            render_template=None,
+            seed=None,
+            STATIC_URL=None,
+            xqueue=None,
+            matlab_api_key=None,
+        )
+        lcp = LoncapaProblem(
+            problem_text=self.data,
+            id=self.location.html_id(),
+            capa_system=capa_system,
+            capa_module=self,
+            seed=1,
+            minimal_init=True,
+        )
+        return lcp.get_max_score()
+
     def index_dictionary(self):
         """
         Return dictionary prepared with module content and type for indexing.
@@ -38,6 +38,8 @@ from xblock.exceptions import InvalidScopeError
 from xblock.fields import Scope, ScopeIds, Reference, ReferenceList, ReferenceValueDict
 from xblock.runtime import KvsFieldData
 
+from openedx.core.lib.cache_utils import get_single_flight
+
 from xmodule.assetstore import AssetMetadata, CourseAssetsFromStorage
 from xmodule.error_module import ErrorDescriptor
 from xmodule.errortracker import null_error_tracker, exc_info_to_str
@@ -545,9 +547,12 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
                  user_service=None,
                  signal_handler=None,
                  retry_wait_time=0.1,
+                 persist_metadata_inheritance=False,
                  **kwargs):
         """
         :param doc_store_config: must have a host, db, and collection entries. Other common entries: port, tz_aware.
+        :param persist_metadata_inheritance: whether to store each course's computed metadata inheritance
+            tree in the database, so that it's only recomputed when the course's containers change.
         """
 
         super(MongoModuleStore, self).__init__(contentstore=contentstore, **kwargs)
@@ -576,6 +581,9 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             )
             self.collection = self.database[collection]
 
+            # Collection which stores the precomputed metadata inheritance tree of each course.
+            self.inheritance_collection = self.database[collection + '.inheritance']
+
             # Collection which stores asset metadata.
             if asset_collection is None:
                 asset_collection = self.DEFAULT_ASSET_COLLECTION_NAME
@@ -604,6 +612,7 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
 
         self._course_run_cache = {}
         self.signal_handler = signal_handler
+        self.persist_metadata_inheritance = persist_metadata_inheritance
 
     def close_connections(self):
         """
@@ -782,12 +791,25 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
                 )
 
         if not tree:
-            # if not in subsystem, or we are on force refresh, then we have to compute
-            tree = self._compute_metadata_inheritance_tree(course_id)
-
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
-            if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(unicode(course_id), tree)
+            # if not in subsystem, then load the persisted tree (if any), unless
+            # we are on force refresh, in which case we have to compute
+            if force_refresh:
+                tree = self._compute_and_cache_metadata_inheritance_tree(course_id)
+            elif self.metadata_inheritance_cache_subsystem is None:
+                tree = self._load_and_cache_metadata_inheritance_tree(course_id)
+            else:
+                # only compute the tree in one process at a time, so that a cache miss on
+                # a popular course doesn't make every concurrent request query the whole course
+                tree = get_single_flight(
+                    'metadata_inheritance',
+                    self.metadata_inheritance_cache_subsystem,
+                    u'lock.{}'.format(course_id),
+                    get_cached=lambda: self.metadata_inheritance_cache_subsystem.get(unicode(course_id)),
+                    compute=lambda: (
+                        self.metadata_inheritance_cache_subsystem.get(unicode(course_id)) or
+                        self._load_and_cache_metadata_inheritance_tree(course_id)
+                    ),
+                )
 
         # now populate a request_cache, if available. NOTE, we are outside of the
         # scope of the above if: statement so that after a memcache hit, it'll get
@@ -801,6 +823,82 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
 
         return tree
 
+    def _compute_and_cache_metadata_inheritance_tree(self, course_id):
+        """
+        Compute the metadata inheritance tree for the course, and write it out
+        to the caching subsystem (e.g. memcached), if available.
+        """
+        tree = self._compute_metadata_inheritance_tree(course_id)
+        self._persist_metadata_inheritance_tree(course_id, tree)
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(unicode(course_id), tree)
+        return tree
+
+    def _load_and_cache_metadata_inheritance_tree(self, course_id):
+        """
+        Load the metadata inheritance tree that was persisted for the course the last time
+        it was computed, and write it out to the caching subsystem (e.g. memcached), if
+        available. The tree is only computed if it was never persisted.
+        """
+        tree = self._get_persisted_metadata_inheritance_tree(course_id)
+        if tree is None:
+            return self._compute_and_cache_metadata_inheritance_tree(course_id)
+        if self.metadata_inheritance_cache_subsystem is not None:
+            self.metadata_inheritance_cache_subsystem.set(unicode(course_id), tree)
+        return tree
+
+    def _metadata_inheritance_record_id(self, course_id, branch_setting=None):
+        """
+        Return the id of the persisted metadata inheritance tree for the course and
+        branch setting (by default, the current one), since the tree computed with
+        drafts differs from the published one.
+        """
+        return u'{}@{}'.format(course_id, branch_setting or self.get_branch_setting())
+
+    @autoretry_read()
+    def _get_persisted_metadata_inheritance_tree(self, course_id):
+        """
+        Return the persisted metadata inheritance tree for the course and the current
+        branch setting, or None if there isn't one.
+        """
+        if not self.persist_metadata_inheritance:
+            return None
+        record = self.inheritance_collection.find_one({'_id': self._metadata_inheritance_record_id(course_id)})
+        if record is None:
+            return None
+        # The tree is stored as a list of pairs, since its locations aren't valid mongo keys
+        return dict(record['tree'])
+
+    def _persist_metadata_inheritance_tree(self, course_id, tree):
+        """
+        Store the computed metadata inheritance tree for the course and the current
+        branch setting, replacing any previously persisted tree.
+        """
+        if not self.persist_metadata_inheritance:
+            return
+        record_id = self._metadata_inheritance_record_id(course_id)
+        try:
+            self.inheritance_collection.update(
+                {'_id': record_id},
+                {'_id': record_id, 'tree': tree.items()},
+                upsert=True,
+            )
+        except pymongo.errors.DocumentTooLarge:
+            # Fall back to computing the tree whenever it isn't cached.
+            log.warning(u"Metadata inheritance tree for %s is too large to persist", course_id)
+            self._delete_persisted_metadata_inheritance_tree(course_id)
+
+    def _delete_persisted_metadata_inheritance_tree(self, course_id):
+        """
+        Remove the persisted metadata inheritance trees of the course, for all
+        branch settings.
+        """
+        if self.persist_metadata_inheritance:
+            self.inheritance_collection.remove({'_id': {'$in': [
+                self._metadata_inheritance_record_id(course_id, branch_setting)
+                for branch_setting in (ModuleStoreEnum.Branch.draft_preferred, ModuleStoreEnum.Branch.published_only)
+            ]}})
+
     def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None):
         """
         Refresh the cached metadata inheritance tree for the org/course combination
@@ -811,6 +909,9 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
         """
         course_id = course_id.for_branch(None)
         if not self._is_in_bulk_operation(course_id):
+            # the trees persisted for the other branch setting are stale too; they're
+            # recomputed the next time they're needed
+            self._delete_persisted_metadata_inheritance_tree(self.fill_in_run(course_id))
             # below is done for side effects when runtime is None
             cached_metadata = self._get_cached_metadata_inheritance_tree(course_id, force_refresh=True)
             if runtime:
@@ -1480,8 +1581,11 @@ class MongoModuleStore(ModuleStoreDraftAndPublished, ModuleStoreWriteBase, Mongo
             # update the edit info of the instantiated xblock
             xblock._edit_info = payload['edit_info']
 
-            # recompute (and update) the metadata inheritance tree which is cached
-            self.refresh_cached_metadata_inheritance_tree(xblock.scope_ids.usage_id.course_key, xblock.runtime)
+            # recompute (and update) the metadata inheritance tree which is cached. The tree only
+            # depends on the metadata and children of blocks that can have children, so it doesn't
+            # need to be recomputed after edits of other blocks if it's persisted.
+            if not self.persist_metadata_inheritance or xblock.scope_ids.block_type in BLOCK_TYPES_WITH_CHILDREN:
+                self.refresh_cached_metadata_inheritance_tree(xblock.scope_ids.usage_id.course_key, xblock.runtime)
             # fire signal that we've written to DB
         except ItemNotFoundError:
             if not allow_not_found:
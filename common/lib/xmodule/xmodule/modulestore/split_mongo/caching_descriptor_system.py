@@ -11,7 +11,7 @@ from xmodule.library_tools import LibraryToolsService
 from xmodule.mako_module import MakoDescriptorSystem
 from xmodule.error_module import ErrorDescriptor
 from xmodule.errortracker import exc_info_to_str
-from xmodule.modulestore import BlockData
+from xmodule.modulestore import BlockData, ModuleStoreEnum
 from xmodule.modulestore.edit_info import EditInfoRuntimeMixin
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.modulestore.inheritance import inheriting_field_data, InheritanceMixin
@@ -90,6 +90,21 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
                 parent_map[child] = block_key
         return parent_map
 
+    @lazy
+    def _inherited_settings_map(self):
+        """
+        The precomputed inherited settings of the blocks in the structure, or None if inheritance
+        should be computed by walking up the ancestors of each block.
+
+        Only published structures use the precomputed settings, since blocks in other branches
+        may be edited in place, which must be reflected in their already-loaded descendants.
+        """
+        if InheritanceMixin not in self.modulestore.xblock_mixins:
+            return None
+        if self.course_entry.course_key.branch != ModuleStoreEnum.BranchName.published:
+            return None
+        return self.modulestore.get_inherited_settings_map(self.course_entry.course_key, self.course_entry.structure)
+
     @contract(usage_key="BlockUsageLocator | BlockKey", course_entry_override="CourseEnvelope | None")
     def _load_item(self, usage_key, course_entry_override=None, **kwargs):
         """
@@ -217,7 +232,10 @@ class CachingDescriptorSystem(MakoDescriptorSystem, EditInfoRuntimeMixin):
             field_decorator=kwargs.get('field_decorator')
         )
 
-        if InheritanceMixin in self.modulestore.xblock_mixins:
+        if self._inherited_settings_map is not None:
+            kvs.inherited_settings = self._inherited_settings_map.get(block_key, {})
+            field_data = KvsFieldData(kvs)
+        elif InheritanceMixin in self.modulestore.xblock_mixins:
             field_data = inheriting_field_data(kvs)
         else:
             field_data = KvsFieldData(kvs)
@@ -24,6 +24,7 @@ import dogstats_wrapper as dog_stats_api
 
 from contracts import check, new_contract
 from mongodb_proxy import autoretry_read, MongoProxy
+from openedx.core.lib.cache_utils import get_process_local_cache
 from xmodule.exceptions import HeartbeatFailure
 from xmodule.modulestore import BlockData
 from xmodule.modulestore.split_mongo import BlockKey
@@ -218,14 +219,20 @@ class CourseStructureCache(object):
     Wrapper around django cache object to cache course structure objects.
     The course structures are pickled and compressed when cached.
 
+    Since structures are immutable, their compressed data is also kept in
+    a process-local LRU cache in front of the django cache, which saves
+    a network round trip for the structures used most often.
+
     If the 'course_structure_cache' doesn't exist, then don't do anything for
     for set and get.
     """
     def __init__(self):
         self.cache = None
+        self.local_cache = None
         if DJANGO_AVAILABLE:
             try:
                 self.cache = get_cache('course_structure_cache')
+                self.local_cache = get_process_local_cache('course_structure_cache')
             except InvalidCacheBackendError:
                 pass
 
@@ -235,7 +242,13 @@ class CourseStructureCache(object):
             return None
 
         with TIMER.timer("CourseStructureCache.get", course_context) as tagger:
-            compressed_pickled_data = self.cache.get(key)
+            compressed_pickled_data = self.local_cache.get(key)
+            tagger.tag(from_local_cache=str(compressed_pickled_data is not None).lower())
+
+            if compressed_pickled_data is None:
+                compressed_pickled_data = self.cache.get(key)
+                if compressed_pickled_data is not None:
+                    self.local_cache.set(key, compressed_pickled_data)
             tagger.tag(from_cache=str(compressed_pickled_data is not None).lower())
 
             if compressed_pickled_data is None:
@@ -265,6 +278,7 @@ class CourseStructureCache(object):
 
             # Stuctures are immutable, so we set a timeout of "never"
             self.cache.set(key, compressed_pickled_data, None)
+            self.local_cache.set(key, compressed_pickled_data)
 
 
 class MongoConnection(object):
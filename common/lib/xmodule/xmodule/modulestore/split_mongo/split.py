@@ -80,8 +80,9 @@ from xmodule.modulestore import (
 
 from ..exceptions import ItemNotFoundError
 from .caching_descriptor_system import CachingDescriptorSystem
-from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, DuplicateKeyError
+from xmodule.modulestore.split_mongo.mongo_connection import MongoConnection, DuplicateKeyError, CourseStructureCache
 from xmodule.modulestore.split_mongo import BlockKey, CourseEnvelope
+from xmodule.modulestore.split_mongo.structure_index import StructureIndexCache
 from xmodule.error_module import ErrorDescriptor
 from collections import defaultdict
 from types import NoneType
@@ -636,6 +637,8 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
     # It won't recompute the value on operations such as update_course_index (e.g., to revert to a prev
     # version) but those functions will have an optional arg for setting these.
     SEARCH_TARGET_DICT = ['wiki_slug']
+    # The number of structures whose StructureIndex is kept by the process.
+    STRUCTURE_INDEX_CACHE_SIZE = 32
 
     def __init__(self, contentstore, doc_store_config, fs_root, render_template,
                  default_class=None,
@@ -674,6 +677,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             self.services["request_cache"] = self.request_cache
 
         self.signal_handler = signal_handler
+        self.structure_index_cache = StructureIndexCache(self.STRUCTURE_INDEX_CACHE_SIZE)
 
     def close_connections(self):
         """
@@ -694,6 +698,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         """
         # drop the assets
         super(SplitMongoModuleStore, self)._drop_database()
+        self.structure_index_cache.clear()
 
         connection = self.db.connection
         connection.drop_database(self.db.name)
@@ -1085,7 +1090,8 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             return []
 
         course = self._lookup_course(course_locator)
-        items = []
+        blocks = course.structure['blocks']
+        index = self._get_structure_index(course_locator, course.structure)
         qualifiers = qualifiers.copy() if qualifiers else {}  # copy the qualifiers (destructively manipulated here)
 
         def _block_matches_all(block_data):
@@ -1109,8 +1115,9 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             # odd case where we don't search just confirm
             block_name = qualifiers.pop('name')
             block_ids = []
-            for block_id, block in course.structure['blocks'].iteritems():
-                if block_name == block_id.id and _block_matches_all(block):
+            candidates = blocks.iterkeys() if index is None else index.get_blocks_with_id(block_name)
+            for block_id in candidates:
+                if block_name == block_id.id and _block_matches_all(blocks[block_id]):
                     block_ids.append(block_id)
 
             return self._load_items(course, block_ids, **kwargs)
@@ -1121,15 +1128,29 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         # don't expect caller to know that children are in fields
         if 'children' in qualifiers:
             settings['children'] = qualifiers.pop('children')
-        for block_id, value in course.structure['blocks'].iteritems():
-            if _block_matches_all(value):
-                items.append(block_id)
+
+        # only test the blocks which the indexed criteria don't rule out
+        candidates = None if index is None else index.find_candidates(qualifiers, settings)
+        if candidates is None:
+            candidates = blocks.iterkeys()
+        items = [block_id for block_id in candidates if _block_matches_all(blocks[block_id])]
 
         if len(items) > 0:
             return self._load_items(course, items, depth=0, **kwargs)
         else:
             return []
 
+    def _get_structure_index(self, course_key, structure):
+        """
+        Returns the StructureIndex of the given structure, or None if it is
+        a new structure of the active bulk operation on course_key, which may
+        still be changed.
+        """
+        bulk_write_record = self._get_bulk_ops_record(course_key)
+        if bulk_write_record.active and structure['_id'] not in bulk_write_record.structures_in_db:
+            return None
+        return self.structure_index_cache.get(structure)
+
     def has_path_to_root(self, block_key, course):
         """
         Check recursively if an xblock has a path to the course root
@@ -1140,7 +1161,7 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         :return Bool: whether or not component has path to the root
         """
 
-        xblock_parents = self._get_parents_from_structure(block_key, course.structure)
+        xblock_parents = self._get_parents_from_structure(block_key, course.structure, course.course_key)
         if len(xblock_parents) == 0 and block_key.type in ["course", "library"]:
             # Found, xblock has the path to the root
             return True
@@ -1160,7 +1181,9 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
             raise ItemNotFoundError(locator)
 
         course = self._lookup_course(locator.course_key)
-        all_parent_ids = self._get_parents_from_structure(BlockKey.from_usage_key(locator), course.structure)
+        all_parent_ids = self._get_parents_from_structure(
+            BlockKey.from_usage_key(locator), course.structure, course.course_key
+        )
 
         # Check and verify the found parent_ids are not orphans; Remove parent which has no valid path
         # to the course root
@@ -2505,7 +2528,38 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
 
         self._emit_course_deleted_signal(course_key)
 
-    @contract(block_map="dict(BlockKey: dict)", block_key=BlockKey)
+    def get_inherited_settings_map(self, course_key, structure):
+        """
+        Return a dict mapping the key of each block in the structure to the inheritable
+        settings it inherits from its ancestors, as computed by inherit_settings.
+
+        Since structures are immutable once persisted, the map is computed once per structure
+        and cached alongside it in the course structure cache. Returns None for structures which
+        haven't been persisted yet, since they may still change.
+        """
+        bulk_write_record = self._get_bulk_ops_record(course_key)
+        if bulk_write_record.active and structure['_id'] not in bulk_write_record.structures_in_db:
+            return None
+
+        cache = CourseStructureCache()
+        cache_key = u'inherited_settings.{}'.format(structure['_id'])
+        inherited_settings_map = cache.get(cache_key, course_key)
+        if inherited_settings_map is None:
+            inherited_settings_map = {}
+            block_map = structure['blocks']
+            child_keys = set(
+                BlockKey(*child)
+                for block_data in block_map.itervalues()
+                for child in block_data.fields.get('children', [])
+            )
+            # start from the root of every tree in the structure, including orphaned ones
+            for block_key in block_map:
+                if block_key not in child_keys:
+                    self.inherit_settings(block_map, block_key, inherited_settings_map)
+            cache.set(cache_key, inherited_settings_map, course_key)
+        return inherited_settings_map
+
+    @contract(block_map="dict(BlockKey: BlockData)", block_key=BlockKey)
     def inherit_settings(
         self, block_map, block_key, inherited_settings_map, inheriting_settings=None, inherited_from=None
     ):
@@ -2956,11 +3010,19 @@ class SplitMongoModuleStore(SplitBulkWriteMixin, ModuleStoreWriteBase):
         }
 
     @contract(block_key=BlockKey)
-    def _get_parents_from_structure(self, block_key, structure):
+    def _get_parents_from_structure(self, block_key, structure, course_key=None):
         """
         Given a structure, find block_key's parent in that structure. Note returns
         the encoded format for parent
+
+        If the structure was looked up for course_key, its index is used rather
+        than searching all its blocks.
         """
+        if course_key is not None:
+            index = self._get_structure_index(course_key, structure)
+            if index is not None:
+                return index.get_parents(block_key)
+
         return [
             parent_block_key
             for parent_block_key, value in structure['blocks'].iteritems()
@@ -117,9 +117,12 @@ class SplitMongoKVS(InheritanceKeyValueStore):
 
     def default(self, key):
         """
-        Check to see if the default should be from the template's defaults (if any)
-        rather than the global default or inheritance.
+        Check to see if the default should be from the precomputed inherited settings
+        (if any) or the template's defaults (if any) rather than the global default or
+        inheritance.
         """
+        if key.field_name in self.inherited_settings:
+            return self.inherited_settings[key.field_name]
         if self._defaults and key.field_name in self._defaults:
             return self._defaults[key.field_name]
         # If not, try inheriting from a parent, then use the XBlock type's normal default value:
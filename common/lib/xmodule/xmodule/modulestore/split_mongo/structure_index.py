@@ -0,0 +1,152 @@
+"""
+Secondary indexes of the blocks of split modulestore structures.
+
+get_items used to test every block of a structure against its qualifiers,
+which is costly on large courses for the queries that are made on every
+request, such as finding the discussion modules or the timed exams of a
+course. A `StructureIndex` lists the blocks of a structure by type, by
+block id, by parent and by whether some settings are set, so that only the
+blocks that can match a query are tested.
+
+Saved structures are never modified, so the index of a structure is built
+once per process and kept, by structure id, in a `StructureIndexCache`.
+"""
+import re
+import threading
+from collections import OrderedDict
+
+from xmodule.modulestore.split_mongo import BlockKey
+
+
+class StructureIndex(object):
+    """
+    Indexes of the blocks of a structure.
+    """
+    # The settings fields that are indexed by whether they're set on a block.
+    INDEXED_SETTINGS = ('discussion_id', 'group_access', 'is_entrance_exam', 'is_time_limited')
+
+    def __init__(self, structure):
+        by_type = {}
+        by_id = {}
+        parents = {}
+        with_setting = {field_name: [] for field_name in self.INDEXED_SETTINGS}
+        for block_key, block_data in structure['blocks'].iteritems():
+            by_type.setdefault(block_key.type, []).append(block_key)
+            by_id.setdefault(block_key.id, []).append(block_key)
+            for child_key in set(block_data.fields.get('children', [])):
+                parents.setdefault(child_key, []).append(block_key)
+            for field_name in self.INDEXED_SETTINGS:
+                if field_name in block_data.fields:
+                    with_setting[field_name].append(block_key)
+
+        self.by_type = by_type
+        self.by_id = by_id
+        self.parents = parents
+        self.with_setting = with_setting
+
+    def get_parents(self, block_key):
+        """
+        Returns the keys of the blocks whose children include the given block.
+        """
+        return list(self.parents.get(block_key, []))
+
+    def get_blocks_with_id(self, block_id):
+        """
+        Returns the keys of the blocks with the given block id, of any type.
+        """
+        return list(self.by_id.get(block_id, []))
+
+    def find_candidates(self, qualifiers, settings):
+        """
+        Returns the keys of the blocks which may match the given get_items
+        qualifiers (with the category given as ``block_type``) and settings,
+        or None if no indexed criteria narrow them down.
+
+        The candidates must still be tested against all the criteria.
+        """
+        indexed_matches = sorted(self._indexed_matches(qualifiers, settings), key=len)
+        if not indexed_matches:
+            return None
+        candidates = indexed_matches[0]
+        for keys in indexed_matches[1:]:
+            keys = set(keys)
+            candidates = [block_key for block_key in candidates if block_key in keys]
+        return list(candidates)
+
+    def _indexed_matches(self, qualifiers, settings):
+        """
+        Yields, for each of the indexed criteria, the keys of the blocks
+        which may match it.
+        """
+        if 'block_type' in qualifiers:
+            block_types = _exact_values(qualifiers['block_type'])
+            if block_types is not None:
+                yield [
+                    block_key
+                    for block_type in block_types
+                    for block_key in self.by_type.get(block_type, [])
+                ]
+
+        for field_name, criteria in settings.iteritems():
+            if field_name == 'children':
+                if isinstance(criteria, BlockKey):
+                    yield self.parents.get(criteria, [])
+            elif field_name in self.with_setting:
+                # Only the criteria {'$exists': False} matches blocks on
+                # which the field isn't set.
+                if not (isinstance(criteria, dict) and '$exists' in criteria and not criteria['$exists']):
+                    yield self.with_setting[field_name]
+
+
+def _exact_values(criteria):
+    """
+    Returns the values that the given get_items criteria only matches by
+    equality, or None if it isn't such a criteria.
+    """
+    if isinstance(criteria, dict):
+        if criteria.keys() == ['$in']:
+            values = [_exact_values(value) for value in criteria['$in']]
+            if None not in values:
+                return [value for value_list in values for value in value_list]
+        return None
+    if isinstance(criteria, (list, re._pattern_type)) or callable(criteria):  # pylint: disable=protected-access
+        return None
+    return [criteria]
+
+
+class StructureIndexCache(object):
+    """
+    Keeps the indexes of the `max_size` most recently used structures,
+    shared by all threads of the process.
+    """
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, structure):
+        """
+        Returns the `StructureIndex` of the given structure, which must have
+        been saved, building it if it isn't cached.
+        """
+        structure_id = structure['_id']
+        with self._lock:
+            index = self._indexes.pop(structure_id, None)
+            if index is not None:
+                # Move the entry to the most recently used end.
+                self._indexes[structure_id] = index
+                return index
+
+        index = StructureIndex(structure)
+        with self._lock:
+            self._indexes[structure_id] = index
+            while len(self._indexes) > self.max_size:
+                self._indexes.popitem(last=False)
+        return index
+
+    def clear(self):
+        """
+        Removes all the indexes from the cache.
+        """
+        with self._lock:
+            self._indexes.clear()
@@ -758,6 +758,61 @@ class TestMongoModuleStore(TestMongoModuleStoreBase):
         # Clean up the data so we don't break other tests which apparently expect a particular state
         self.draft_store.delete_course(course.id, self.dummy_user)
 
+    def test_persisted_metadata_inheritance_tree(self):  # pylint: disable=protected-access
+        """
+        Test that the metadata inheritance tree is persisted when it's computed, and
+        loaded instead of recomputed when it isn't cached.
+        """
+        store = DraftModuleStore(
+            self.content_store,
+            {'host': HOST, 'db': DB, 'port': PORT, 'collection': COLLECTION},
+            FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS,
+            branch_setting_func=lambda: ModuleStoreEnum.Branch.draft_preferred,
+            xblock_mixins=(EditInfoMixin, InheritanceMixin, LocationMixin, XModuleMixin),
+            persist_metadata_inheritance=True,
+        )
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        store.refresh_cached_metadata_inheritance_tree(course_key)
+        tree = store._compute_metadata_inheritance_tree(course_key)
+        self.assertTrue(tree)
+
+        with patch.object(store, '_compute_metadata_inheritance_tree') as mock_compute:
+            self.assertEqual(store._get_cached_metadata_inheritance_tree(course_key), tree)
+            self.assertFalse(mock_compute.called)
+
+    def test_persisted_metadata_inheritance_tree_per_branch(self):  # pylint: disable=protected-access
+        """
+        Test that the metadata inheritance trees of the draft-preferred and published-only
+        branch settings are persisted separately, and that recomputing one of them
+        discards the other.
+        """
+        branch_setting = [ModuleStoreEnum.Branch.draft_preferred]
+        store = DraftModuleStore(
+            self.content_store,
+            {'host': HOST, 'db': DB, 'port': PORT, 'collection': COLLECTION},
+            FS_ROOT, RENDER_TEMPLATE,
+            default_class=DEFAULT_CLASS,
+            branch_setting_func=lambda: branch_setting[0],
+            xblock_mixins=(EditInfoMixin, InheritanceMixin, LocationMixin, XModuleMixin),
+            persist_metadata_inheritance=True,
+        )
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        store.refresh_cached_metadata_inheritance_tree(course_key)
+        draft_tree = store._get_persisted_metadata_inheritance_tree(course_key)
+        self.assertTrue(draft_tree)
+
+        branch_setting[0] = ModuleStoreEnum.Branch.published_only
+        self.assertIsNone(store._get_persisted_metadata_inheritance_tree(course_key))
+        published_tree = store._load_and_cache_metadata_inheritance_tree(course_key)
+        self.assertEqual(store._get_persisted_metadata_inheritance_tree(course_key), published_tree)
+
+        branch_setting[0] = ModuleStoreEnum.Branch.draft_preferred
+        self.assertEqual(store._get_persisted_metadata_inheritance_tree(course_key), draft_tree)
+        store.refresh_cached_metadata_inheritance_tree(course_key)
+        branch_setting[0] = ModuleStoreEnum.Branch.published_only
+        self.assertIsNone(store._get_persisted_metadata_inheritance_tree(course_key))
+
     def test_make_course_usage_key(self):
         """Test that we get back the appropriate usage key for the root of a course key."""
         course_key = CourseLocator(org="edX", course="101", run="2015")
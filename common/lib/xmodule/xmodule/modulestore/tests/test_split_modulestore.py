@@ -16,6 +16,7 @@ from nose.plugins.attrib import attr
 from django.core.cache import get_cache, InvalidCacheBackendError
 
 from openedx.core.lib import tempdir
+from openedx.core.lib.cache_utils import ProcessLocalLRUCache
 from xblock.fields import Reference, ReferenceList, ReferenceValueDict
 from xmodule.course_module import CourseDescriptor
 from xmodule.modulestore import ModuleStoreEnum
@@ -965,6 +966,25 @@ class TestCourseStructureCache(SplitModuleTest):
         # now make sure that you get the same structure
         self.assertEqual(cached_structure, not_cached_structure)
 
+    @patch('xmodule.modulestore.split_mongo.mongo_connection.get_process_local_cache')
+    @patch('xmodule.modulestore.split_mongo.mongo_connection.get_cache')
+    def test_course_structure_local_cache(self, mock_get_cache, mock_get_process_local_cache):
+        mock_get_cache.return_value = self.cache
+        local_cache = ProcessLocalLRUCache('course_structure_cache', 10 * 1024 * 1024)
+        mock_get_process_local_cache.return_value = local_cache
+
+        with check_mongo_calls(1):
+            not_cached_structure = self._get_structure(self.new_course)
+        self.assertEqual(len(local_cache), 1)
+
+        # the structure is still found in the process-local cache
+        # once the django cache no longer has it
+        self.cache.clear()
+        with check_mongo_calls(0):
+            cached_structure = self._get_structure(self.new_course)
+
+        self.assertEqual(cached_structure, not_cached_structure)
+
     @patch('xmodule.modulestore.split_mongo.mongo_connection.get_cache')
     def test_course_structure_cache_no_cache_configured(self, mock_get_cache):
         mock_get_cache.side_effect = InvalidCacheBackendError
@@ -1209,6 +1229,45 @@ class SplitModuleItemTests(SplitModuleTest):
         matches = modulestore().get_items(locator, settings={'group_access': {'$exists': False}})
         self.assertEqual(len(matches), 6)
 
+    def test_get_items_indexed(self):
+        """
+        get_items with the criteria found in the structure index
+        """
+        locator = CourseLocator(org='testx', course='GreekHero', run="run", branch=BRANCH_NAME_DRAFT)
+        matches = modulestore().get_items(locator, qualifiers={'category': {'$in': ['chapter', 'course']}})
+        self.assertEqual(len(matches), 4)
+        matches = modulestore().get_items(locator, qualifiers={'category': re.compile(r'^chap')})
+        self.assertEqual(len(matches), 3)
+        matches = modulestore().get_items(
+            locator, qualifiers={'category': 'problem'}, settings={'group_access': {'$exists': True}}
+        )
+        self.assertEqual([match.location.block_id for match in matches], ['problem32'])
+        matches = modulestore().get_items(
+            locator, qualifiers={'category': 'problem'}, settings={'group_access': {'$exists': False}}
+        )
+        self.assertEqual(len(matches), 2)
+        matches = modulestore().get_items(locator, qualifiers={'children': BlockKey('chapter', 'chapter1')})
+        self.assertEqual([match.location.block_id for match in matches], ['head12345'])
+        matches = modulestore().get_items(locator, qualifiers={'name': 'chapter2'})
+        self.assertEqual([match.location.block_type for match in matches], ['chapter'])
+
+    def test_get_items_in_bulk_operation(self):
+        """
+        get_items finds the blocks created by the active bulk operation, whose
+        structure isn't indexed until it's saved.
+        """
+        locator = CourseLocator(org='testx', course='GreekHero', run="run", branch=BRANCH_NAME_DRAFT)
+        self.assertEqual(len(modulestore().get_items(locator, qualifiers={'category': 'chapter'})), 3)
+        with modulestore().bulk_operations(locator):
+            modulestore().create_child(
+                'testbot', locator.make_usage_key('course', 'head12345'), 'chapter', block_id='chapter4'
+            )
+            matches = modulestore().get_items(locator, qualifiers={'category': 'chapter'})
+            self.assertEqual(len(matches), 4)
+            parent = modulestore().get_parent_location(locator.make_usage_key('chapter', 'chapter4'))
+            self.assertEqual(parent.block_id, 'head12345')
+        self.assertEqual(len(modulestore().get_items(locator, qualifiers={'category': 'chapter'})), 4)
+
     def test_get_parents(self):
         '''
         get_parent_location(locator): BlockUsageLocator
@@ -1972,6 +2031,27 @@ class TestInheritance(SplitModuleTest):
         # overridden
         self.assertEqual(node.graceperiod, datetime.timedelta(hours=4))
 
+    @patch('xmodule.tabs.CourseTab.from_json', side_effect=mock_tab_from_json)
+    def test_published_inheritance(self, _from_json):
+        """
+        Published blocks inherit the settings precomputed for their structure
+        """
+        source_course = CourseLocator(org='testx', course='GreekHero', run="run", branch=BRANCH_NAME_DRAFT)
+        dest_course = source_course.for_branch(BRANCH_NAME_PUBLISHED)
+        head = source_course.make_usage_key('course', "head12345")
+        modulestore().copy(self.user_id, source_course, dest_course, [head], None)
+
+        with patch.object(
+            modulestore(), 'get_inherited_settings_map', wraps=modulestore().get_inherited_settings_map
+        ) as mock_get_inherited_settings_map:
+            node = modulestore().get_item(BlockUsageLocator(dest_course, 'problem', 'problem3_2'))
+            # inherited
+            self.assertEqual(node.graceperiod, datetime.timedelta(hours=2))
+            node = modulestore().get_item(BlockUsageLocator(dest_course, 'problem', 'problem1'))
+            # overridden
+            self.assertEqual(node.graceperiod, datetime.timedelta(hours=4))
+            self.assertTrue(mock_get_inherited_settings_map.called)
+
     def test_inheritance_not_saved(self):
         """
         Was saving inherited settings with updated blocks causing inheritance to be sticky
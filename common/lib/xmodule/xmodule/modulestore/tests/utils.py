@@ -216,6 +216,32 @@ class MemoryCache(object):
         """
         self._data[key] = value
 
+    def add(self, key, value, timeout=None):  # pylint: disable=unused-argument
+        """
+        Set a key in the cache, unless it has been set previously.
+
+        Args:
+            key: The key to add.
+            value: The value to set the key to.
+            timeout: Ignored.
+
+        Returns:
+            Whether the key was set.
+        """
+        if key in self._data:
+            return False
+        self._data[key] = value
+        return True
+
+    def delete(self, key):
+        """
+        Delete a key from the cache.
+
+        Args:
+            key: The key to delete.
+        """
+        self._data.pop(key, None)
+
 
 class MongoContentstoreBuilder(object):
     """
@@ -28,7 +28,7 @@ from opaque_keys.edx.locations import Location
 from xblock.field_data import DictFieldData
 from xblock.fields import ScopeIds
 
-from . import get_test_system
+from . import get_test_system, get_test_descriptor_system
 from pytz import UTC
 from capa.correctmap import CorrectMap
 from ..capa_base_constants import RANDOMIZATION
@@ -2148,6 +2148,32 @@ class CapaDescriptorTest(unittest.TestCase):
             }
         )
 
+    def test_max_score_from_definition(self):
+        xml = textwrap.dedent("""
+            <problem>
+                <script type="loncapa/python">
+            raise Exception("The problem's scripts should not be run.")
+                </script>
+                <optionresponse>
+                  <optioninput options="('India','Spain')" correct="India"></optioninput>
+                </optionresponse>
+                <choiceresponse>
+                  <checkboxgroup>
+                    <choice correct="true">Urdu</choice>
+                    <choice correct="false">Finnish</choice>
+                  </checkboxgroup>
+                </choiceresponse>
+                <customresponse cfn="check_func">
+                  <textline points="3"/>
+                  <textline points="2"/>
+                </customresponse>
+            </problem>
+        """)
+        location = Location('edX', 'capa_test', '2012_Fall', 'problem', 'SampleProblem')
+        descriptor = CapaDescriptor(get_test_descriptor_system(), scope_ids=ScopeIds(None, None, location, location))
+        descriptor.data = xml
+        self.assertEquals(descriptor.max_score_from_definition(), 7)
+
     def test_solutions_not_indexed(self):
         xml = textwrap.dedent("""
             <problem>
@@ -12,6 +12,9 @@ file and check it in at the same time as your model changes. To do that,
 
 """
 import logging
+import re
+import string
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models, transaction
@@ -231,6 +234,84 @@ class CourseEmailTemplate(models.Model):
         return CourseEmailTemplate._render(self.html_template, htmltext, context)
 
 
+class CourseEmailRenderer(object):
+    """
+    Renders a course email for each of its recipients.
+
+    The templates are formatted once, with the `context` shared by all the
+    recipients and placeholders standing in for the values of the recipient
+    fields (name, email and user_id), which are then replaced by the values of
+    each recipient.  The messages are the same as the ones rendered by
+    `CourseEmailTemplate`, which is used instead for templates that format the
+    recipient fields in a way that placeholders can't stand in for.
+    """
+    RECIPIENT_FIELDS = ('name', 'email', 'user_id')
+
+    def __init__(self, template, plaintext, htmltext, context):
+        self.template = template
+        self.plaintext = plaintext
+        self.htmltext = htmltext
+        self.context = context
+        self.placeholders = {field: u'\ue000{}\ue001'.format(field) for field in self.RECIPIENT_FIELDS}
+        self.formatted_plain_template = self._format(template.plain_template)
+        self.formatted_html_template = self._format(template.html_template)
+
+    def _format(self, format_string):
+        """
+        Formats `format_string` with the placeholders of the recipient fields,
+        or returns None if it can't be.
+        """
+        try:
+            for literal_text, field_name, format_spec, conversion in string.Formatter().parse(format_string):
+                if u'\ue000' in literal_text:
+                    return None
+                if field_name is None:
+                    continue
+                # Only fields formatted as plain strings can be replaced later on.
+                field = re.split(r'[.[]', field_name, 1)[0]
+                if field in self.RECIPIENT_FIELDS and (field != field_name or format_spec or conversion):
+                    return None
+                if '{' in format_spec:
+                    return None
+            context = dict(self.context)
+            context.update(self.placeholders)
+            return format_string.format(**context)
+        except Exception:  # pylint: disable=broad-except
+            # Let the error be raised when rendering the messages.
+            return None
+
+    def _render(self, formatted_template, format_string, message_body, context):
+        """
+        Renders `message_body` for the recipient of `context` into the
+        `formatted_template` formatted from `format_string`.
+        """
+        if formatted_template is None:
+            return CourseEmailTemplate._render(format_string, message_body, context)  # pylint: disable=protected-access
+
+        if 'user_id' in context and 'course_id' in context:
+            message_body = substitute_keywords_with_data(message_body, context)
+
+        result = formatted_template
+        for field, placeholder in self.placeholders.iteritems():
+            result = result.replace(placeholder, u'{}'.format(context[field]))
+
+        message_body_tag = COURSE_EMAIL_MESSAGE_BODY_TAG.format()
+        result = result.replace(message_body_tag, message_body, 1)
+        return wrap_message(result)
+
+    def render(self, recipient_context):
+        """
+        Returns the plain text and HTML messages of the recipient whose name,
+        email and user_id are given by `recipient_context`.
+        """
+        context = dict(self.context)
+        context.update(recipient_context)
+        return (
+            self._render(self.formatted_plain_template, self.template.plain_template, self.plaintext, context),
+            self._render(self.formatted_html_template, self.template.html_template, self.htmltext, context),
+        )
+
+
 class CourseAuthorization(models.Model):
     """
     Enable the course email feature on a course-by-course basis.
@@ -0,0 +1,107 @@
+"""
+Rate limiting of the emails sent by the bulk email subtasks.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+log = logging.getLogger('edx.celery.task')
+
+RATE_CACHE_KEY = 'bulk_email.send_rate'
+SENT_CACHE_KEY = 'bulk_email.send_rate.sent'
+SECOND_CACHE_KEY = 'bulk_email.send_rate.second.{}'
+
+# How long a reduced rate is remembered for, after which emails are sent at the
+# maximum rate again.
+RATE_CACHE_TIMEOUT = 60 * 60
+
+# How long the count of the emails sent in a second is kept, which is longer
+# than the second so that workers whose clock is late don't start it over.
+SECOND_CACHE_TIMEOUT = 10
+
+
+class SendRateLimiter(object):
+    """
+    Limits the rate at which emails are sent by the subtasks of all workers
+    to at most `max_rate` emails per second.
+
+    This is a token bucket holding a second's worth of emails, which is kept
+    in the cache so that it is shared by all workers: each email takes a token
+    by incrementing the count of the emails sent during the current second,
+    and waits for the next second if none are left.
+
+    The rate adapts to the throttling of the email service: it is halved each
+    time an email is throttled, and is then increased by one email per second
+    for each second's worth of emails sent without being throttled, back up
+    to `max_rate`.
+    """
+    def __init__(self, max_rate, min_rate=1):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+
+    @property
+    def rate(self):
+        """
+        The number of emails that can currently be sent per second.
+        """
+        rate = cache.get(RATE_CACHE_KEY)
+        if rate is None:
+            return self.max_rate
+        return max(self.min_rate, min(rate, self.max_rate))
+
+    def acquire(self):
+        """
+        Waits until an email can be sent.
+        """
+        while True:
+            now = time.time()
+            second = int(now)
+            key = SECOND_CACHE_KEY.format(second)
+            cache.add(key, 0, SECOND_CACHE_TIMEOUT)
+            try:
+                sent = cache.incr(key)
+            except ValueError:
+                # The count was evicted from the cache right after being added.
+                return
+            if sent <= self.rate:
+                return
+            time.sleep(second + 1 - now)
+
+    def sent(self):
+        """
+        Records that an email was sent without being throttled.
+        """
+        rate = self.rate
+        if rate >= self.max_rate:
+            return
+        cache.add(SENT_CACHE_KEY, 0, RATE_CACHE_TIMEOUT)
+        try:
+            sent = cache.incr(SENT_CACHE_KEY)
+        except ValueError:
+            return
+        if sent >= rate:
+            cache.set(SENT_CACHE_KEY, 0, RATE_CACHE_TIMEOUT)
+            cache.set(RATE_CACHE_KEY, rate + 1, RATE_CACHE_TIMEOUT)
+
+    def throttled(self):
+        """
+        Records that an email was throttled by the email service.
+        """
+        rate = max(self.min_rate, self.rate // 2)
+        log.warning("BulkEmail ==> Sending was throttled, reducing the rate to %s emails per second", rate)
+        cache.set(SENT_CACHE_KEY, 0, RATE_CACHE_TIMEOUT)
+        cache.set(RATE_CACHE_KEY, rate, RATE_CACHE_TIMEOUT)
+
+
+def get_send_rate_limiter():
+    """
+    Returns the `SendRateLimiter` configured by the
+    BULK_EMAIL_MAX_SENDS_PER_SECOND setting, or None if the sending rate
+    isn't limited.
+    """
+    max_rate = getattr(settings, 'BULK_EMAIL_MAX_SENDS_PER_SECOND', None)
+    if not max_rate:
+        return None
+    return SendRateLimiter(max_rate)
@@ -8,7 +8,9 @@ import random
 import json
 from time import sleep
 from collections import Counter
+from functools import partial
 import logging
+from multiprocessing.pool import ThreadPool
 
 import dogstats_wrapper as dog_stats_api
 from smtplib import SMTPServerDisconnected, SMTPDataError, SMTPConnectError, SMTPException
@@ -35,10 +37,11 @@ from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.urlresolvers import reverse
 
 from bulk_email.models import (
-    CourseEmail, Optout,
+    CourseEmail, CourseEmailRenderer, Optout,
     SEND_TO_MYSELF, SEND_TO_ALL, TO_OPTIONS,
     SEND_TO_STAFF,
 )
+from bulk_email.rate_limit import get_send_rate_limiter
 from courseware.courses import get_course, course_image_url
 from student.roles import CourseStaffRole, CourseInstructorRole
 from instructor_task.models import InstructorTask
@@ -94,6 +97,10 @@ BULK_EMAIL_FAILURE_ERRORS = (
     SMTPException,
 )
 
+# Number of times an email throttled by the email service is resent, at the
+# reduced rate, before the entire task is retried.
+MAX_THROTTLED_RESENDS = 3
+
 
 def _get_recipient_querysets(user_id, to_option, course_id):
     """
@@ -484,51 +491,54 @@ def _send_course_email(entry_id, email_id, to_list, global_email_context, subtas
 
     # use the CourseEmailTemplate that was associated with the CourseEmail
     course_email_template = course_email.get_template()
+    rate_limiter = get_send_rate_limiter()
+    connections = []
+    pool = None
     try:
-        connection = get_connection()
-        connection.open()
-
-        # Define context values to use in all course emails:
-        email_context = {'name': '', 'email': ''}
-        email_context.update(global_email_context)
+        # Each email of a batch is sent over its own connection.
+        for __ in range(max(1, settings.BULK_EMAIL_CONNECTIONS_PER_TASK)):
+            connection = get_connection()
+            connection.open()
+            connections.append(connection)
+        if len(connections) > 1:
+            pool = ThreadPool(len(connections))
+
+        # Define context values to use in all course emails, and render the
+        # templates with them once for all the recipients:
+        email_context = dict(global_email_context)
+        email_context['course_id'] = course_email.course_id
+        renderer = CourseEmailRenderer(
+            course_email_template, course_email.text_message, course_email.html_message, email_context
+        )
 
         while to_list:
-            # Update context with user-specific values from the user at the end of the list.
-            # At the end of processing this user, they will be popped off of the to_list.
+            # Send to a batch of users from the end of the list, one per connection.
+            # At the end of processing these users, they will be removed from the to_list.
             # That way, the to_list will always contain the recipients remaining to be emailed.
             # This is convenient for retries, which will need to send to those who haven't
             # yet been emailed, but not send to those who have already been sent to.
-            recipient_num += 1
-            current_recipient = to_list[-1]
-            email = current_recipient['email']
-            email_context['email'] = email
-            email_context['name'] = current_recipient['profile__name']
-            email_context['user_id'] = current_recipient['pk']
-            email_context['course_id'] = course_email.course_id
-
-            # Construct message content using templates and context:
-            plaintext_msg = course_email_template.render_plaintext(course_email.text_message, email_context)
-            html_msg = course_email_template.render_htmltext(course_email.html_message, email_context)
-
-            # Create email:
-            email_msg = EmailMultiAlternatives(
-                course_email.subject,
-                plaintext_msg,
-                from_addr,
-                [email],
-                connection=connection
-            )
-            email_msg.attach_alternative(html_msg, 'text/html')
-
-            # Throttle if we have gotten the rate limiter.  This is not very high-tech,
-            # but if a task has been retried for rate-limiting reasons, then we sleep
-            # for a period of time between all emails within this task.  Choice of
-            # the value depends on the number of workers that might be sending email in
-            # parallel, and what the SES throttle rate is.
-            if subtask_status.retried_nomax > 0:
-                sleep(settings.BULK_EMAIL_RETRY_DELAY_BETWEEN_SENDS)
+            batch = []
+            for current_recipient, connection in zip(reversed(to_list), connections):
+                recipient_num += 1
+                email = current_recipient['email']
+
+                # Construct message content using templates and user-specific values:
+                plaintext_msg, html_msg = renderer.render({
+                    'email': email,
+                    'name': current_recipient['profile__name'],
+                    'user_id': current_recipient['pk'],
+                })
+
+                # Create email:
+                email_msg = EmailMultiAlternatives(
+                    course_email.subject,
+                    plaintext_msg,
+                    from_addr,
+                    [email],
+                    connection=connection
+                )
+                email_msg.attach_alternative(html_msg, 'text/html')
 
-            try:
                 log.info(
                     "BulkEmail ==> Task: %s, SubTask: %s, EmailId: %s, Recipient num: %s/%s, \
                     Recipient name: %s, Email address: %s",
@@ -540,82 +550,115 @@ def _send_course_email(entry_id, email_id, to_list, global_email_context, subtas
                     current_recipient['profile__name'],
                     email
                 )
-                with dog_stats_api.timer('course_email.single_send.time.overall', tags=[_statsd_tag(course_title)]):
-                    connection.send_messages([email_msg])
-
-            except SMTPDataError as exc:
-                # According to SMTP spec, we'll retry error codes in the 4xx range.  5xx range indicates hard failure.
-                total_recipients_failed += 1
-                log.error(
-                    "BulkEmail ==> Status: Failed(SMTPDataError), Task: %s, SubTask: %s, EmailId: %s, \
-                    Recipient num: %s/%s, Email address: %s",
-                    parent_task_id,
-                    task_id,
-                    email_id,
-                    recipient_num,
-                    total_recipients,
-                    email
-                )
-                if exc.smtp_code >= 400 and exc.smtp_code < 500:
-                    # This will cause the outer handler to catch the exception and retry the entire task.
-                    raise exc
-                else:
+                batch.append((recipient_num, current_recipient, email_msg))
+
+            # Throttle if we have gotten the rate limiter and the sending rate
+            # isn't limited otherwise.  This is not very high-tech, but if a task
+            # has been retried for rate-limiting reasons, then we sleep for a period
+            # of time between all emails within this task.  Choice of the value
+            # depends on the number of workers that might be sending email in
+            # parallel, and what the SES throttle rate is.  The emails of a batch
+            # are sent at once, so the batch waits for all of them.
+            if rate_limiter is None and subtask_status.retried_nomax > 0:
+                sleep(settings.BULK_EMAIL_RETRY_DELAY_BETWEEN_SENDS * len(batch))
+
+            send = partial(_send_message, course_title=course_title, rate_limiter=rate_limiter)
+            if pool is not None:
+                exceptions = pool.map(send, [email_msg for __, __, email_msg in batch])
+            else:
+                exceptions = [send(email_msg) for __, __, email_msg in batch]
+
+            # The exception causing the entire task to be retried, once the
+            # outcome of the other emails of the batch has been recorded.
+            retry_exception = None
+            remaining = []
+            for (num, current_recipient, __), exc in zip(batch, exceptions):
+                email = current_recipient['email']
+                if exc is None:
+                    total_recipients_successful += 1
+                    log.info(
+                        "BulkEmail ==> Status: Success, Task: %s, SubTask: %s, EmailId: %s, \
+                        Recipient num: %s/%s, Email address: %s,",
+                        parent_task_id,
+                        task_id,
+                        email_id,
+                        num,
+                        total_recipients,
+                        email
+                    )
+                    dog_stats_api.increment('course_email.sent', tags=[_statsd_tag(course_title)])
+                    if settings.BULK_EMAIL_LOG_SENT_EMAILS:
+                        log.info('Email with id %s sent to %s', email_id, email)
+                    else:
+                        log.debug('Email with id %s sent to %s', email_id, email)
+                    subtask_status.increment(succeeded=1)
+
+                elif isinstance(exc, SMTPDataError):
+                    # According to SMTP spec, we'll retry error codes in the 4xx range.  5xx range
+                    # indicates hard failure.
+                    total_recipients_failed += 1
+                    log.error(
+                        "BulkEmail ==> Status: Failed(SMTPDataError), Task: %s, SubTask: %s, EmailId: %s, \
+                        Recipient num: %s/%s, Email address: %s",
+                        parent_task_id,
+                        task_id,
+                        email_id,
+                        num,
+                        total_recipients,
+                        email
+                    )
+                    if exc.smtp_code >= 400 and exc.smtp_code < 500:
+                        # This will cause the outer handler to catch the exception and retry the entire task.
+                        retry_exception = retry_exception or exc
+                        remaining.append(current_recipient)
+                        continue
+                    else:
+                        # This will fall through and not retry the message.
+                        log.warning(
+                            'BulkEmail ==> Task: %s, SubTask: %s, EmailId: %s, Recipient num: %s/%s, \
+                            Email not delivered to %s due to error %s',
+                            parent_task_id,
+                            task_id,
+                            email_id,
+                            num,
+                            total_recipients,
+                            email,
+                            exc.smtp_error
+                        )
+                        dog_stats_api.increment('course_email.error', tags=[_statsd_tag(course_title)])
+                        subtask_status.increment(failed=1)
+
+                elif isinstance(exc, SINGLE_EMAIL_FAILURE_ERRORS):
                     # This will fall through and not retry the message.
-                    log.warning(
-                        'BulkEmail ==> Task: %s, SubTask: %s, EmailId: %s, Recipient num: %s/%s, \
-                        Email not delivered to %s due to error %s',
+                    total_recipients_failed += 1
+                    log.error(
+                        "BulkEmail ==> Status: Failed(SINGLE_EMAIL_FAILURE_ERRORS), Task: %s, SubTask: %s, \
+                        EmailId: %s, Recipient num: %s/%s, Email address: %s, Exception: %s",
                         parent_task_id,
                         task_id,
                         email_id,
-                        recipient_num,
+                        num,
                         total_recipients,
                         email,
-                        exc.smtp_error
+                        exc
                     )
                     dog_stats_api.increment('course_email.error', tags=[_statsd_tag(course_title)])
                     subtask_status.increment(failed=1)
 
-            except SINGLE_EMAIL_FAILURE_ERRORS as exc:
-                # This will fall through and not retry the message.
-                total_recipients_failed += 1
-                log.error(
-                    "BulkEmail ==> Status: Failed(SINGLE_EMAIL_FAILURE_ERRORS), Task: %s, SubTask: %s, \
-                    EmailId: %s, Recipient num: %s/%s, Email address: %s, Exception: %s",
-                    parent_task_id,
-                    task_id,
-                    email_id,
-                    recipient_num,
-                    total_recipients,
-                    email,
-                    exc
-                )
-                dog_stats_api.increment('course_email.error', tags=[_statsd_tag(course_title)])
-                subtask_status.increment(failed=1)
-
-            else:
-                total_recipients_successful += 1
-                log.info(
-                    "BulkEmail ==> Status: Success, Task: %s, SubTask: %s, EmailId: %s, \
-                    Recipient num: %s/%s, Email address: %s,",
-                    parent_task_id,
-                    task_id,
-                    email_id,
-                    recipient_num,
-                    total_recipients,
-                    email
-                )
-                dog_stats_api.increment('course_email.sent', tags=[_statsd_tag(course_title)])
-                if settings.BULK_EMAIL_LOG_SENT_EMAILS:
-                    log.info('Email with id %s sent to %s', email_id, email)
                 else:
-                    log.debug('Email with id %s sent to %s', email_id, email)
-                subtask_status.increment(succeeded=1)
+                    # This will cause the outer handler to catch the exception and retry the entire task.
+                    retry_exception = retry_exception or exc
+                    remaining.append(current_recipient)
+                    continue
 
-            # Pop the user that was emailed off the end of the list only once they have
+                recipients_info[email] += 1
+
+            # Remove the users that were emailed from the end of the list only once they have
             # successfully been processed.  (That way, if there were a failure that
             # needed to be retried, the user is still on the list.)
-            recipients_info[email] += 1
-            to_list.pop()
+            to_list[len(to_list) - len(batch):] = reversed(remaining)
+            if retry_exception is not None:
+                raise retry_exception
 
         log.info(
             "BulkEmail ==> Task: %s, SubTask: %s, EmailId: %s, Total Successful Recipients: %s/%s, \
@@ -696,7 +739,50 @@ def _send_course_email(entry_id, email_id, to_list, global_email_context, subtas
         return subtask_status, None
     finally:
         # Clean up at the end.
-        connection.close()
+        if pool is not None:
+            pool.terminate()
+        for connection in connections:
+            connection.close()
+
+
+def _is_throttling_error(exc):
+    """
+    Returns whether `exc` indicates that email is being sent too quickly.
+    """
+    if isinstance(exc, SMTPDataError):
+        return exc.smtp_code >= 400 and exc.smtp_code < 500
+    return isinstance(exc, SESMaxSendingRateExceededError)
+
+
+def _send_message(email_msg, course_title, rate_limiter):
+    """
+    Sends `email_msg` over its connection.
+
+    If the sending rate is limited by `rate_limiter`, waits until the email can
+    be sent, and resends it after a while if it is throttled, up to
+    MAX_THROTTLED_RESENDS times.
+
+    Returns the exception raised by the last attempt to send the email, or None
+    if it was sent.
+    """
+    resends = 0
+    while True:
+        if rate_limiter is not None:
+            rate_limiter.acquire()
+        try:
+            with dog_stats_api.timer('course_email.single_send.time.overall', tags=[_statsd_tag(course_title)]):
+                email_msg.connection.send_messages([email_msg])
+        except Exception as exc:  # pylint: disable=broad-except
+            if rate_limiter is None or not _is_throttling_error(exc):
+                return exc
+            rate_limiter.throttled()
+            if resends >= MAX_THROTTLED_RESENDS:
+                return exc
+            resends += 1
+        else:
+            if rate_limiter is not None:
+                rate_limiter.sent()
+            return None
 
 
 def _get_current_task():
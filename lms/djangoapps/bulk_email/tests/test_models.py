@@ -10,7 +10,9 @@ from student.tests.factories import UserFactory
 from mock import patch, Mock
 from nose.plugins.attrib import attr
 
-from bulk_email.models import CourseEmail, SEND_TO_STAFF, CourseEmailTemplate, CourseAuthorization
+from bulk_email.models import (
+    CourseEmail, SEND_TO_STAFF, CourseEmailTemplate, CourseEmailRenderer, CourseAuthorization
+)
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
 
 
@@ -139,6 +141,41 @@ class CourseEmailTemplateTest(TestCase):
         context = self._get_sample_plain_context()
         template.render_plaintext("My new plain text.", context)
 
+    def _assert_renderer_matches_template(self, template, plaintext, htmltext):
+        """
+        Assert that a CourseEmailRenderer renders the same messages as the template.
+        """
+        context = self._get_sample_html_context()
+        del context['email']
+        context['course_id'] = SlashSeparatedCourseKey('abc', '123', 'doremi')
+        renderer = CourseEmailRenderer(template, plaintext, htmltext, context)
+        for name, email in [(u'Robot', 'robot@example.com'), (u'Rôbot {name}', u'rôbot@example.com')]:
+            user = UserFactory.create()
+            recipient_context = {'name': name, 'email': email, 'user_id': user.id}
+            full_context = dict(context, **recipient_context)
+            self.assertEquals(
+                renderer.render(recipient_context),
+                (template.render_plaintext(plaintext, full_context), template.render_htmltext(htmltext, full_context))
+            )
+
+    def test_renderer(self):
+        self._assert_renderer_matches_template(
+            CourseEmailTemplate.get_template(),
+            u"Dear %%USER_FULLNAME%%, ({}) your id is %%USER_ID%%.",
+            u"<p>Welcome to %%COURSE_DISPLAY_NAME%%, %%USER_FULLNAME%%</p>" + u"x" * 2000,
+        )
+
+    def test_renderer_branded_template(self):
+        self._assert_renderer_matches_template(
+            CourseEmailTemplate.get_template(name="branded.template"), u"Plain text.", u"<p>HTML text.</p>"
+        )
+
+    def test_renderer_formatted_recipient_fields(self):
+        template = CourseEmailTemplate.get_template()
+        template.plain_template = u"{name!r} {email:>30} {user_id:05d} {{message_body}}"
+        template.html_template = u"{name[0]} {email!r} {{message_body}}"
+        self._assert_renderer_matches_template(template, u"Plain text.", u"<p>HTML text.</p>")
+
 
 @attr('shard_1')
 class CourseAuthorizationTest(TestCase):
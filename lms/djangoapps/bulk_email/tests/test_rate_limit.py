@@ -0,0 +1,63 @@
+"""
+Unit tests for the rate limiting of bulk emails.
+"""
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
+from nose.plugins.attrib import attr
+
+from bulk_email.rate_limit import SendRateLimiter, get_send_rate_limiter
+
+
+@attr('shard_1')
+class SendRateLimiterTest(TestCase):
+    """
+    Test the SendRateLimiter.
+    """
+    def setUp(self):
+        super(SendRateLimiterTest, self).setUp()
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.limiter = SendRateLimiter(10)
+
+    @patch('bulk_email.rate_limit.time')
+    def test_acquire(self, mock_time):
+        mock_time.time.return_value = 1000.25
+        for __ in range(10):
+            self.limiter.acquire()
+        self.assertFalse(mock_time.sleep.called)
+
+        # The eleventh email of the second waits for the next one.
+        def sleep(seconds):
+            """Move on to the next second."""
+            mock_time.time.return_value += seconds
+        mock_time.sleep.side_effect = sleep
+        self.limiter.acquire()
+        mock_time.sleep.assert_called_once_with(0.75)
+
+    def test_throttled(self):
+        self.assertEquals(self.limiter.rate, 10)
+        self.limiter.throttled()
+        self.assertEquals(self.limiter.rate, 5)
+        # The reduced rate is shared by all the limiters.
+        self.assertEquals(SendRateLimiter(10).rate, 5)
+        for __ in range(3):
+            self.limiter.throttled()
+        self.assertEquals(self.limiter.rate, 1)
+
+    def test_rate_increases_while_not_throttled(self):
+        self.limiter.throttled()
+        for __ in range(4):
+            self.limiter.sent()
+        self.assertEquals(self.limiter.rate, 5)
+        self.limiter.sent()
+        self.assertEquals(self.limiter.rate, 6)
+        for __ in range(100):
+            self.limiter.sent()
+        self.assertEquals(self.limiter.rate, 10)
+
+    def test_get_send_rate_limiter(self):
+        self.assertIsNone(get_send_rate_limiter())
+        with override_settings(BULK_EMAIL_MAX_SENDS_PER_SECOND=14):
+            self.assertEquals(get_send_rate_limiter().max_rate, 14)
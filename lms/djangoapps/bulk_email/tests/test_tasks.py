@@ -28,7 +28,9 @@ from boto.exception import AWSConnectionError
 from celery.states import SUCCESS, FAILURE  # pylint: disable=no-name-in-module, import-error
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.management import call_command
+from django.test.utils import override_settings
 
 from xmodule.modulestore.tests.factories import CourseFactory
 
@@ -387,6 +389,73 @@ class TestBulkEmailInstructorTask(InstructorTaskCourseTestCase):
             SESMaxSendingRateExceededError(455, "Throttling: Sending rate exceeded")
         )
 
+    @override_settings(BULK_EMAIL_CONNECTIONS_PER_TASK=4)
+    def test_successful_concurrently(self):
+        num_emails = settings.BULK_EMAIL_EMAILS_PER_TASK
+        # We also send email to the instructor:
+        self._create_students(num_emails - 1)
+        with patch('bulk_email.tasks.get_connection', autospec=True) as get_conn:
+            get_conn.return_value.send_messages.side_effect = cycle([None])
+            self._test_run_with_task(send_bulk_course_email, 'emailed', num_emails, num_emails)
+        self.assertEquals(get_conn.call_count, 4)
+        self.assertEquals(get_conn.return_value.send_messages.call_count, num_emails)
+
+    @override_settings(BULK_EMAIL_CONNECTIONS_PER_TASK=4)
+    def test_email_address_failures_concurrently(self):
+        self._test_email_address_failures(SESAddressBlacklistedError(554, "Email address is blacklisted"))
+
+    @override_settings(BULK_EMAIL_CONNECTIONS_PER_TASK=4)
+    def test_retry_after_limited_retry_error_concurrently(self):
+        num_emails = 10
+        # We also send email to the instructor:
+        self._create_students(num_emails - 1)
+        with patch('bulk_email.tasks.get_connection', autospec=True) as get_conn:
+            # The first batch of emails is sent but for one, which is sent again on retry.
+            get_conn.return_value.send_messages.side_effect = chain(
+                [None, SMTPServerDisconnected(425, "Disconnecting")], repeat(None)
+            )
+            self._test_run_with_task(
+                send_bulk_course_email, 'emailed', num_emails, num_emails, retried_withmax=1
+            )
+        self.assertEquals(get_conn.return_value.send_messages.call_count, num_emails + 1)
+
+    @override_settings(BULK_EMAIL_CONNECTIONS_PER_TASK=4)
+    def test_retry_after_throttling_error_concurrently(self):
+        num_emails = 8
+        # We also send email to the instructor:
+        self._create_students(num_emails - 1)
+        with patch('bulk_email.tasks.get_connection', autospec=True) as get_conn:
+            # The first batch of emails is throttled, and sent again on retry.
+            get_conn.return_value.send_messages.side_effect = chain(
+                repeat(SMTPDataError(455, "Throttling: Sending rate exceeded"), 4), repeat(None)
+            )
+            with patch('bulk_email.tasks.sleep') as mock_sleep:
+                self._test_run_with_task(
+                    send_bulk_course_email, 'emailed', num_emails, num_emails, retried_nomax=1
+                )
+        # The retried task waits before each of its two batches of four emails.
+        self.assertEquals(mock_sleep.call_count, 2)
+        mock_sleep.assert_called_with(settings.BULK_EMAIL_RETRY_DELAY_BETWEEN_SENDS * 4)
+
+    def _test_throttling_with_rate_limit(self, exception):
+        """Test that throttled emails are resent at a reduced rate, without retrying the task."""
+        cache.clear()
+        num_emails = 8
+        # We also send email to the instructor:
+        self._create_students(num_emails - 1)
+        with patch('bulk_email.tasks.get_connection', autospec=True) as get_conn:
+            # Each email is throttled once before being sent.
+            get_conn.return_value.send_messages.side_effect = cycle([exception, None])
+            with override_settings(BULK_EMAIL_MAX_SENDS_PER_SECOND=100000):
+                self._test_run_with_task(send_bulk_course_email, 'emailed', num_emails, num_emails)
+        self.assertEquals(get_conn.return_value.send_messages.call_count, 2 * num_emails)
+
+    def test_smtp_throttling_with_rate_limit(self):
+        self._test_throttling_with_rate_limit(SMTPDataError(455, "Throttling: Sending rate exceeded"))
+
+    def test_ses_throttling_with_rate_limit(self):
+        self._test_throttling_with_rate_limit(SESMaxSendingRateExceededError(455, "Throttling: Sending rate exceeded"))
+
     def _test_immediate_failure(self, exception):
         """Test that celery can hit a maximum number of retries."""
         # Doesn't really matter how many recipients, since we expect
@@ -0,0 +1,107 @@
+"""
+Max Scores Transformer implementation.
+"""
+import logging
+
+from django.conf import settings
+
+from openedx.core.lib.block_cache.transformer import BlockStructureTransformer
+
+
+log = logging.getLogger(__name__)
+
+
+class MaxScoresTransformer(BlockStructureTransformer):
+    """
+    A transformer that collects the max score of each scorable block
+    whose max score can be computed from its definition alone (see
+    CapaDescriptor.max_score_from_definition), so that grading doesn't
+    need to bind the block to a student just to learn its max score.
+
+    The collected max scores are only valid for the version of the
+    course that they were collected from, which is identified by the
+    course's subtree_edited_on.
+
+    Max scores are only collected while the ENABLE_MAX_SCORE_INDEX
+    feature is on, since computing them parses every problem of the
+    course.
+
+    This transformer doesn't remove or change any blocks.
+    """
+    VERSION = 2
+    MAX_SCORE = 'max_score'
+    SUBTREE_EDITED_ON = 'subtree_edited_on'
+    COLLECTED = 'collected'
+
+    @classmethod
+    def name(cls):
+        """
+        Unique identifier for the transformer's class;
+        same identifier used in setup.py.
+        """
+        return "max_scores"
+
+    @classmethod
+    def collect(cls, block_structure):
+        """
+        Collects the max scores of the scorable blocks in the block
+        structure, along with the course version they're valid for.
+        """
+        if not settings.FEATURES.get('ENABLE_MAX_SCORE_INDEX', False):
+            return
+
+        root_xblock = block_structure.get_xblock(block_structure.root_block_usage_key)
+        block_structure.set_transformer_data(
+            cls, cls.SUBTREE_EDITED_ON, getattr(root_xblock, 'subtree_edited_on', None)
+        )
+
+        for block_key in block_structure.topological_traversal():
+            xblock = block_structure.get_xblock(block_key)
+            # Blocks that always recalculate their grades are always
+            # bound to the student while grading.
+            if not getattr(xblock, 'has_score', False) or getattr(xblock, 'always_recalculate_grades', False):
+                continue
+
+            max_score_from_definition = getattr(xblock, 'max_score_from_definition', None)
+            if max_score_from_definition is None:
+                continue
+
+            try:
+                max_score = max_score_from_definition()
+            except Exception:  # pylint: disable=broad-except
+                # Leave it to grading to report problems that fail to load.
+                log.exception('Failed to compute the max score of %s', block_key)
+                continue
+
+            if max_score is not None:
+                block_structure.set_transformer_block_field(block_key, cls, cls.MAX_SCORE, max_score)
+
+        block_structure.set_transformer_data(cls, cls.COLLECTED, True)
+
+    def transform(self, usage_info, block_structure):
+        """
+        No-op, since the collected max scores are read with
+        get_max_scores.
+        """
+        pass
+
+    @classmethod
+    def get_max_scores(cls, block_structure, subtree_edited_on):
+        """
+        Returns a dict mapping the location strings of the blocks in the
+        given block structure to their collected max scores, or None if
+        the max scores weren't collected, or were collected from another
+        version of the course than the one with the given
+        subtree_edited_on.
+        """
+        if not block_structure.get_transformer_data(cls, cls.COLLECTED, False):
+            return None
+        if block_structure.get_transformer_data(cls, cls.SUBTREE_EDITED_ON) != subtree_edited_on:
+            return None
+
+        max_scores = {}
+        for block_key in block_structure:
+            max_score = block_structure.get_transformer_block_field(block_key, cls, cls.MAX_SCORE)
+            if max_score is not None:
+                max_scores[unicode(block_key)] = max_score
+        return max_scores
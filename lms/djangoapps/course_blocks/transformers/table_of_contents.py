@@ -0,0 +1,118 @@
+"""
+Table of Contents Transformer implementation.
+"""
+from openedx.core.lib.block_cache.transformer import BlockStructureTransformer
+
+
+class TableOfContentsTransformer(BlockStructureTransformer):
+    """
+    A transformer that collects the fields of the chapters and sections
+    of a course that are shown in its table of contents, so that the
+    courseware accordion can be built without binding the course, its
+    chapters and its sections to the user.
+
+    The collected fields are the same for every user, and are only valid
+    for the version of the course that they were collected from, which is
+    identified by the course's subtree_edited_on. Filtering the table of
+    contents for a user is left to the access transformers that run along
+    with this one, and to the caller.
+
+    This transformer doesn't remove or change any blocks.
+    """
+    VERSION = 1
+    TOC_FIELDS = 'toc_fields'
+    SUBTREE_EDITED_ON = 'subtree_edited_on'
+
+    @classmethod
+    def name(cls):
+        """
+        Unique identifier for the transformer's class;
+        same identifier used in setup.py.
+        """
+        return "table_of_contents"
+
+    @classmethod
+    def collect(cls, block_structure):
+        """
+        Collects the table of contents fields of the children (chapters)
+        and grandchildren (sections) of the root block, along with the
+        course version they're valid for.
+        """
+        root_block_usage_key = block_structure.root_block_usage_key
+        root_xblock = block_structure.get_xblock(root_block_usage_key)
+        block_structure.set_transformer_data(
+            cls, cls.SUBTREE_EDITED_ON, getattr(root_xblock, 'subtree_edited_on', None)
+        )
+
+        for chapter_key in block_structure.get_children(root_block_usage_key):
+            cls._collect_toc_fields(block_structure, chapter_key)
+            for section_key in block_structure.get_children(chapter_key):
+                cls._collect_toc_fields(block_structure, section_key)
+
+    @classmethod
+    def _collect_toc_fields(cls, block_structure, block_key):
+        """
+        Collects the table of contents fields of the block with the given
+        block_key.
+        """
+        xblock = block_structure.get_xblock(block_key)
+        block_structure.set_transformer_block_field(block_key, cls, cls.TOC_FIELDS, {
+            'display_name': xblock.display_name_with_default,
+            'url_name': xblock.url_name,
+            'hide_from_toc': getattr(xblock, 'hide_from_toc', False),
+            'format': getattr(xblock, 'format', None),
+            'due': getattr(xblock, 'due', None),
+            'graded': getattr(xblock, 'graded', False),
+            'is_time_limited': getattr(xblock, 'is_time_limited', False),
+        })
+
+    def transform(self, usage_info, block_structure):
+        """
+        No-op, since the collected fields are read with get_toc.
+        """
+        pass
+
+    @classmethod
+    def get_toc(cls, block_structure, subtree_edited_on):
+        """
+        Returns the chapters remaining in the given block structure, in
+        course order, or None if their fields weren't collected from the
+        course version with the given subtree_edited_on.
+
+        Each chapter is a dict of its collected fields, along with its
+        'usage_key' and its 'sections', which is the list of the dicts of
+        the fields and 'usage_key' of its remaining sections.
+        """
+        if block_structure.get_transformer_data(cls, cls.SUBTREE_EDITED_ON) != subtree_edited_on:
+            return None
+
+        root_block_usage_key = block_structure.root_block_usage_key
+        if not block_structure.has_block(root_block_usage_key):
+            return []
+
+        chapters = []
+        for chapter_key in block_structure.get_children(root_block_usage_key):
+            chapter = cls._get_toc_fields(block_structure, chapter_key)
+            if chapter is None:
+                continue
+            chapter['sections'] = [
+                section for section in (
+                    cls._get_toc_fields(block_structure, section_key)
+                    for section_key in block_structure.get_children(chapter_key)
+                )
+                if section is not None
+            ]
+            chapters.append(chapter)
+        return chapters
+
+    @classmethod
+    def _get_toc_fields(cls, block_structure, block_key):
+        """
+        Returns a copy of the table of contents fields collected for the
+        block with the given block_key, along with its 'usage_key', or None
+        if they weren't collected.
+        """
+        toc_fields = block_structure.get_transformer_block_field(block_key, cls, cls.TOC_FIELDS)
+        if toc_fields is None:
+            return None
+        return dict(toc_fields, usage_key=block_key)
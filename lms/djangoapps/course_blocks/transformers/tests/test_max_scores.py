@@ -0,0 +1,67 @@
+"""
+Tests for MaxScoresTransformer.
+"""
+from mock import patch
+
+from capa.tests.response_xml_factory import OptionResponseXMLFactory
+from xmodule.modulestore.django import modulestore
+
+from ...api import clear_course_from_cache, get_course_blocks
+from ..max_scores import MaxScoresTransformer
+from .test_helpers import CourseStructureTestCase
+
+
+class MaxScoresTransformerTestCase(CourseStructureTestCase):
+    """
+    MaxScoresTransformer Test
+    """
+    def setUp(self):
+        super(MaxScoresTransformerTestCase, self).setUp()
+        patcher = patch.dict('django.conf.settings.FEATURES', {'ENABLE_MAX_SCORE_INDEX': True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        problem_xml = OptionResponseXMLFactory().build_xml(
+            question_text='The correct answer is Correct',
+            num_inputs=2,
+            options=['Correct', 'Incorrect'],
+            correct_option='Correct',
+        )
+        self.blocks = self.build_course([
+            {
+                '#type': 'course',
+                '#ref': 'course',
+                '#children': [
+                    {
+                        '#type': 'chapter',
+                        '#ref': 'chapter',
+                        '#children': [
+                            {'#type': 'problem', '#ref': 'problem', 'data': problem_xml},
+                            {'#type': 'html', '#ref': 'html'},
+                        ],
+                    },
+                ],
+            },
+        ])
+        self.course = modulestore().get_course(self.blocks['course'].id)
+        self.block_structure = self.get_block_structure()
+
+    def get_block_structure(self):
+        """
+        Returns the course's block structure, collecting it if needed.
+        """
+        return get_course_blocks(self.user, self.blocks['course'].location, transformers=[MaxScoresTransformer()])
+
+    def test_max_scores(self):
+        max_scores = MaxScoresTransformer.get_max_scores(self.block_structure, self.course.subtree_edited_on)
+        self.assertEqual(max_scores, {unicode(self.blocks['problem'].location): 2})
+
+    def test_different_course_version(self):
+        self.assertIsNone(MaxScoresTransformer.get_max_scores(self.block_structure, None))
+
+    def test_not_collected_without_feature(self):
+        clear_course_from_cache(self.course.id)
+        with patch.dict('django.conf.settings.FEATURES', {'ENABLE_MAX_SCORE_INDEX': False}):
+            with patch('xmodule.capa_module.CapaDescriptor.max_score_from_definition') as mock_max_score:
+                block_structure = self.get_block_structure()
+        self.assertFalse(mock_max_score.called)
+        self.assertIsNone(MaxScoresTransformer.get_max_scores(block_structure, self.course.subtree_edited_on))
@@ -0,0 +1,63 @@
+"""
+Tests for TableOfContentsTransformer.
+"""
+from xmodule.modulestore.django import modulestore
+
+from ...api import get_course_blocks
+from ..table_of_contents import TableOfContentsTransformer
+from .test_helpers import CourseStructureTestCase
+
+
+class TableOfContentsTransformerTestCase(CourseStructureTestCase):
+    """
+    TableOfContentsTransformer Test
+    """
+    def setUp(self):
+        super(TableOfContentsTransformerTestCase, self).setUp()
+        self.blocks = self.build_course([
+            {
+                '#type': 'course',
+                '#ref': 'course',
+                '#children': [
+                    {
+                        '#type': 'chapter',
+                        '#ref': 'chapter',
+                        'display_name': 'Week 1',
+                        '#children': [
+                            {
+                                '#type': 'sequential',
+                                '#ref': 'sequential',
+                                'format': 'Homework',
+                                'graded': True,
+                                '#children': [{'#type': 'html', '#ref': 'html'}],
+                            },
+                        ],
+                    },
+                ],
+            },
+        ])
+        self.course = modulestore().get_course(self.blocks['course'].id)
+        self.block_structure = get_course_blocks(
+            self.user,
+            self.blocks['course'].location,
+            transformers=[TableOfContentsTransformer()],
+        )
+
+    def test_get_toc(self):
+        chapters = TableOfContentsTransformer.get_toc(self.block_structure, self.course.subtree_edited_on)
+        self.assertEqual(len(chapters), 1)
+        chapter = chapters[0]
+        self.assertEqual(chapter['usage_key'], self.blocks['chapter'].location)
+        self.assertEqual(chapter['display_name'], u'Week 1')
+        self.assertEqual(chapter['url_name'], self.blocks['chapter'].location.name)
+        self.assertFalse(chapter['hide_from_toc'])
+
+        self.assertEqual(len(chapter['sections']), 1)
+        section = chapter['sections'][0]
+        self.assertEqual(section['usage_key'], self.blocks['sequential'].location)
+        self.assertEqual(section['format'], u'Homework')
+        self.assertTrue(section['graded'])
+        self.assertFalse(section['is_time_limited'])
+
+    def test_different_course_version(self):
+        self.assertIsNone(TableOfContentsTransformer.get_toc(self.block_structure, None))
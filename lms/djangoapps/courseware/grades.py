@@ -1,7 +1,10 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 from collections import defaultdict
+from datetime import datetime
 from functools import partial
+import hashlib
+import itertools
 import json
 import random
 import logging
@@ -11,20 +14,28 @@ from django.conf import settings
 from django.db import transaction
 from django.test.client import RequestFactory
 from django.core.cache import cache
+from pytz import UTC
 
 import dogstats_wrapper as dog_stats_api
 
 from courseware import courses
 from courseware.access import has_access
-from courseware.model_data import FieldDataCache, ScoresClient
-from student.models import anonymous_id_for_user
+from courseware.model_data import (
+    descendant_descriptors_for_caching,
+    FieldDataCache,
+    prefetch_student_modules,
+    ScoresClient,
+)
+from student.models import anonymous_id_for_user, AnonymousUserId
 from util.module_utils import yield_dynamic_descriptor_descendants
 from xmodule import graders
 from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
-from .models import StudentModule
+from .models import PersistentSubsectionGrade, StudentModule
 from .module_render import get_module_for_descriptor
+from lms.djangoapps.course_blocks.api import get_course_blocks
+from lms.djangoapps.course_blocks.transformers.max_scores import MaxScoresTransformer
 from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import CourseKey
 from openedx.core.djangoapps.signals.signals import GRADES_UPDATED
@@ -32,6 +43,9 @@ from openedx.core.djangoapps.signals.signals import GRADES_UPDATED
 
 log = logging.getLogger("edx.courseware")
 
+# The number of students whose data iterate_grades_for fetches at once
+GRADING_BATCH_SIZE = 500
+
 
 class MaxScoresCache(object):
     """
@@ -43,9 +57,18 @@ class MaxScoresCache(object):
     issued a score -- say a problem two students have only seen mentioned in
     their progress pages and never interacted with -- should be worth the same
     number of points for everyone.
+
+    Max scores that were precomputed from the problem definitions when the
+    course was published (see MaxScoresTransformer) take precedence over the
+    remote cache, since they don't need to be learned by grading anyone.
     """
-    def __init__(self, cache_prefix):
+    # How long precomputed max scores that are missing or stale are ignored
+    # before the course's block structure is checked for them again
+    STALE_PRECOMPUTED_MAX_SCORES_TIMEOUT = 5 * 60
+
+    def __init__(self, cache_prefix, precomputed_max_scores=None):
         self.cache_prefix = cache_prefix
+        self._precomputed_max_scores = precomputed_max_scores or {}
         self._max_scores_cache = {}
         self._max_scores_updates = {}
 
@@ -65,12 +88,50 @@ class MaxScoresCache(object):
             cache_key = u"{}".format(course.id)
         else:
             cache_key = u"{}.{}".format(course.id, course.subtree_edited_on.isoformat())
-        return cls(cache_key)
+
+        precomputed_max_scores = None
+        if settings.FEATURES.get('ENABLE_MAX_SCORE_INDEX'):
+            precomputed_max_scores = cls._get_precomputed_max_scores(course, cache_key)
+        return cls(cache_key, precomputed_max_scores)
+
+    @classmethod
+    def _get_precomputed_max_scores(cls, course, cache_key):
+        """
+        Returns the max scores precomputed for the given course's current
+        version, which `cache_key` identifies.
+
+        The precomputed max scores are collected into the course's block
+        structure, which is rebuilt the first time it's requested after each
+        publish, and are then kept in django's cache for that version of the
+        course. If the cached block structure was collected from a different
+        version of the course, or before the max scores were collected, it's
+        left alone: the max scores are marked as stale for a few minutes, and
+        meanwhile they're learned by grading, as without precomputation.
+        """
+        precomputed_cache_key = u"grades.PrecomputedMaxScores.{}".format(cache_key)
+        max_scores = cache.get(precomputed_cache_key)
+        if max_scores is not None:
+            return max_scores
+
+        course_usage_key = modulestore().make_course_usage_key(course.id)
+        try:
+            block_structure = get_course_blocks(None, course_usage_key, transformers=[MaxScoresTransformer()])
+            max_scores = MaxScoresTransformer.get_max_scores(block_structure, course.subtree_edited_on)
+        except Exception:  # pylint: disable=broad-except
+            log.exception(u"Failed to load the precomputed max scores of %s", course.id)
+
+        if max_scores is None:
+            cache.set(precomputed_cache_key, {}, cls.STALE_PRECOMPUTED_MAX_SCORES_TIMEOUT)
+            return None
+        cache.set(precomputed_cache_key, max_scores)
+        return max_scores
 
     def fetch_from_remote(self, locations):
         """
-        Populate the local cache with values from django's cache
+        Populate the local cache with values from django's cache, skipping
+        the locations whose max scores were precomputed.
         """
+        locations = [loc for loc in locations if unicode(loc) not in self._precomputed_max_scores]
         remote_dict = cache.get_many([self._remote_cache_key(loc) for loc in locations])
         self._max_scores_cache = {
             self._local_cache_key(remote_key): value
@@ -120,7 +181,9 @@ class MaxScoresCache(object):
         Retrieve a max score from the cache
         """
         loc_str = unicode(location)
-        max_score = self._max_scores_updates.get(loc_str)
+        max_score = self._precomputed_max_scores.get(loc_str)
+        if max_score is None:
+            max_score = self._max_scores_updates.get(loc_str)
         if max_score is None:
             max_score = self._max_scores_cache.get(loc_str)
 
@@ -202,6 +265,48 @@ def field_data_cache_for_grading(course, user):
     )
 
 
+def course_grading_version(course):
+    """
+    Return a string identifying the content and grading policy of `course`.
+
+    Persisted subsection grades are stamped with this value; any change to
+    the published course or to its grading policy yields a new version, which
+    makes previously persisted grades stale.
+    """
+    policy_hash = hashlib.md5(json.dumps(course.grading_policy, sort_keys=True)).hexdigest()
+    if course.subtree_edited_on is None:
+        # check for subtree_edited_on because old XML courses doesn't have this attribute
+        return policy_hash
+    return u"{}.{}".format(course.subtree_edited_on.isoformat(), policy_hash)
+
+
+def _can_persist_section_grade(course, section, now):
+    """
+    Return whether the grade of `section`, a graded section of the course's
+    grading context, only depends on the student's scores and on the course
+    version, so that it can be persisted.
+
+    It doesn't if the section has blocks that are always regraded, blocks that
+    haven't started yet (which become visible without a new course version),
+    or blocks whose children are chosen per student.
+    """
+    if any(descriptor.always_recalculate_grades for descriptor in section['xmoduledescriptors']):
+        return False
+
+    def possibly_scored(usage_key):
+        """Can this XBlock type have a score or children?"""
+        return usage_key.block_type in course.block_types_affecting_grading
+
+    descriptors = [section['section_descriptor']]
+    while descriptors:
+        descriptor = descriptors.pop()
+        start = getattr(descriptor, 'start', None)
+        if (start is not None and start > now) or descriptor.has_dynamic_children():
+            return False
+        descriptors.extend(descriptor.get_children(usage_key_filter=possibly_scored))
+    return True
+
+
 def answer_distributions(course_key):
     """
     Given a course_key, return answer distributions in the form of a dictionary
@@ -296,14 +401,17 @@ def answer_distributions(course_key):
 
 
 @transaction.commit_manually
-def grade(student, request, course, keep_raw_scores=False, field_data_cache=None, scores_client=None):
+def grade(student, request, course, keep_raw_scores=False, field_data_cache=None, scores_client=None,
+          max_scores_cache=None):
     """
     Wraps "_grade" with the manual_transaction context manager just in case
     there are unanticipated errors.
     Send a signal to update the minimum grade requirement status.
     """
     with manual_transaction():
-        grade_summary = _grade(student, request, course, keep_raw_scores, field_data_cache, scores_client)
+        grade_summary = _grade(
+            student, request, course, keep_raw_scores, field_data_cache, scores_client, max_scores_cache
+        )
         responses = GRADES_UPDATED.send_robust(
             sender=None,
             username=student.username,
@@ -318,7 +426,7 @@ def grade(student, request, course, keep_raw_scores=False, field_data_cache=None
         return grade_summary
 
 
-def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_client):
+def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_client, max_scores_cache=None):
     """
     Unwrapped version of "grade"
 
@@ -337,31 +445,60 @@ def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_c
     - keep_raw_scores : if True, then value for key 'raw_scores' contains scores
       for every graded module
 
+    If a `max_scores_cache` is passed in, it is shared with the caller, who is
+    then responsible for pushing its updates to the remote cache.
+
     More information on the format is in the docstring for CourseGrader.
     """
-    if field_data_cache is None:
-        with manual_transaction():
-            field_data_cache = field_data_cache_for_grading(course, student)
-    if scores_client is None:
-        scores_client = ScoresClient.from_field_data_cache(field_data_cache)
+    grading_context = course.grading_context
 
-    # Dict of item_ids -> (earned, possible) point tuples. This *only* grabs
-    # scores that were registered with the submissions API, which for the moment
-    # means only openassessment (edx-ora2)
-    # We need to import this here to avoid a circular dependency of the form:
-    # XBlock --> submissions --> Django Rest Framework error strings -->
-    # Django translation --> ... --> courseware --> submissions
-    from submissions import api as sub_api  # installed from the edx-submissions repository
-    submissions_scores = sub_api.get_scores(course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id))
-    max_scores_cache = MaxScoresCache.create_for_course(course)
+    # Subsection grades persisted by earlier calls, keyed by subsection
+    # location. Raw scores aren't persisted, so they always need a full pass.
+    # Neither are grades in courses with user partitions, since the blocks a
+    # student is graded on then depend on the student's groups.
+    persisted_grades = {}
+    grades_to_persist = {}
+    course_version = None
+    if settings.FEATURES.get('ENABLE_PERSISTENT_GRADES') and not keep_raw_scores and not course.user_partitions:
+        # The generation must be read before the scores, so that grades
+        # computed while they are invalidated aren't kept.
+        grading_generation = PersistentSubsectionGrade.current_generation(student.id, course.id)
+        course_version = course_grading_version(course)
+        persisted_grades = PersistentSubsectionGrade.read_grades(student.id, course.id, course_version)
+        now = datetime.now(UTC)
+
+    submissions_scores = None
+    owns_max_scores_cache = max_scores_cache is None
+    if any(
+            section['section_descriptor'].location not in persisted_grades
+            for sections in grading_context['graded_sections'].itervalues()
+            for section in sections
+    ):
+        if field_data_cache is None:
+            with manual_transaction():
+                field_data_cache = field_data_cache_for_grading(course, student)
+        if scores_client is None:
+            scores_client = ScoresClient.from_field_data_cache(field_data_cache)
 
-    # For the moment, we have to get scorable_locations from field_data_cache
-    # and not from scores_client, because scores_client is ignorant of things
-    # in the submissions API. As a further refactoring step, submissions should
-    # be hidden behind the ScoresClient.
-    max_scores_cache.fetch_from_remote(field_data_cache.scorable_locations)
+        # Dict of item_ids -> (earned, possible) point tuples. This *only* grabs
+        # scores that were registered with the submissions API, which for the moment
+        # means only openassessment (edx-ora2)
+        # We need to import this here to avoid a circular dependency of the form:
+        # XBlock --> submissions --> Django Rest Framework error strings -->
+        # Django translation --> ... --> courseware --> submissions
+        from submissions import api as sub_api  # installed from the edx-submissions repository
+        submissions_scores = sub_api.get_scores(
+            course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id)
+        )
+        if owns_max_scores_cache:
+            max_scores_cache = MaxScoresCache.create_for_course(course)
+
+            # For the moment, we have to get scorable_locations from field_data_cache
+            # and not from scores_client, because scores_client is ignorant of things
+            # in the submissions API. As a further refactoring step, submissions should
+            # be hidden behind the ScoresClient.
+            max_scores_cache.fetch_from_remote(field_data_cache.scorable_locations)
 
-    grading_context = course.grading_context
     raw_scores = []
 
     totaled_scores = {}
@@ -373,6 +510,13 @@ def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_c
             section_descriptor = section['section_descriptor']
             section_name = section_descriptor.display_name_with_default
 
+            if section_descriptor.location in persisted_grades:
+                earned, possible = persisted_grades[section_descriptor.location]
+                graded_total = Score(earned, possible, True, section_name, None)
+                if graded_total.possible > 0:
+                    format_scores.append(graded_total)
+                continue
+
             # some problems have state that is updated independently of interaction
             # with the LMS, so they need to always be scored. (E.g. foldit.,
             # combinedopenended)
@@ -452,6 +596,9 @@ def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_c
             else:
                 graded_total = Score(0.0, 1.0, True, section_name, None)
 
+            if course_version is not None and _can_persist_section_grade(course, section, now):
+                grades_to_persist[section_descriptor.location] = (graded_total.earned, graded_total.possible)
+
             #Add the graded total to totaled_scores
             if graded_total.possible > 0:
                 format_scores.append(graded_total)
@@ -463,6 +610,11 @@ def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_c
 
         totaled_scores[section_format] = format_scores
 
+    if grades_to_persist:
+        PersistentSubsectionGrade.save_grades(
+            student.id, course.id, course_version, grading_generation, grades_to_persist
+        )
+
     # Grading policy might be overriden by a CCX, need to reset it
     course.set_grading_policy(course.grading_policy)
     grade_summary = course.grader.grade(totaled_scores, generate_random_scores=settings.GENERATE_PROFILE_SCORES)
@@ -479,7 +631,8 @@ def _grade(student, request, course, keep_raw_scores, field_data_cache, scores_c
         # so grader can be double-checked
         grade_summary['raw_scores'] = raw_scores
 
-    max_scores_cache.push_to_remote()
+    if owns_max_scores_cache and max_scores_cache is not None:
+        max_scores_cache.push_to_remote()
 
     return grade_summary
 
@@ -758,7 +911,7 @@ def manual_transaction():
         transaction.commit()
 
 
-def iterate_grades_for(course_or_id, students, keep_raw_scores=False):
+def iterate_grades_for(course_or_id, students, keep_raw_scores=False, batch_size=GRADING_BATCH_SIZE):
     """Given a course_id and an iterable of students (User), yield a tuple of:
 
     (student, gradeset, err_msg) for every student enrolled in the course.
@@ -775,12 +928,60 @@ def iterate_grades_for(course_or_id, students, keep_raw_scores=False):
     - grade_breakdown : A breakdown of the major components that
         make up the final grade. (For display)
     - raw_scores: contains scores for every graded module
+
+    Students are graded in batches of `batch_size` (see `iterate_grades_for_batch`).
     """
     if isinstance(course_or_id, (basestring, CourseKey)):
         course = courses.get_course_by_id(course_or_id)
     else:
         course = course_or_id
 
+    grading_descriptors = None
+    students = iter(students)
+    while True:
+        batch = list(itertools.islice(students, batch_size))
+        if not batch:
+            break
+        if grading_descriptors is None:
+            # Walk the course only once, and only if there is anyone to grade.
+            grading_descriptors = descendant_descriptors_for_caching(
+                course,
+                descriptor_filter=partial(descriptor_affects_grading, course.block_types_affecting_grading),
+            )
+        for result in iterate_grades_for_batch(course, batch, keep_raw_scores, grading_descriptors):
+            yield result
+
+
+def iterate_grades_for_batch(course, students, keep_raw_scores=False, grading_descriptors=None):
+    """
+    Grade a batch of `students` (a list of Users) in `course`, yielding the
+    same (student, gradeset, err_msg) tuples as `iterate_grades_for`.
+
+    Rather than having every student fetch its own data, the state and scores
+    of the whole batch are read from StudentModule with a handful of queries,
+    anonymous user ids are looked up in bulk, and the max scores cache is
+    fetched from and pushed to the remote cache once for the batch.
+
+    `grading_descriptors` may be passed in to share one traversal of the
+    course tree across several batches.
+    """
+    if grading_descriptors is None:
+        grading_descriptors = descendant_descriptors_for_caching(
+            course,
+            descriptor_filter=partial(descriptor_affects_grading, course.block_types_affecting_grading),
+        )
+    scorable_locations = [descriptor.location for descriptor in grading_descriptors if descriptor.has_score]
+
+    student_modules = prefetch_student_modules(
+        course.id,
+        [student.id for student in students],
+        course.block_types_affecting_grading,
+    )
+    prefetch_anonymous_ids(course.id, students)
+
+    max_scores_cache = MaxScoresCache.create_for_course(course)
+    max_scores_cache.fetch_from_remote(scorable_locations)
+
     for student in students:
         with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=[u'action:{}'.format(course.id)]):
             try:
@@ -790,7 +991,21 @@ def iterate_grades_for(course_or_id, students, keep_raw_scores=False):
                 # It's not pretty, but untangling that is currently beyond the
                 # scope of this feature.
                 request.session = {}
-                gradeset = grade(student, request, course, keep_raw_scores)
+                field_data_cache = FieldDataCache.cache_for_prefetched_descriptors(
+                    course.id, student, grading_descriptors, student_modules[student.id]
+                )
+                scores_client = ScoresClient.from_student_modules(
+                    course.id, student.id, student_modules[student.id], scorable_locations
+                )
+                gradeset = grade(
+                    student,
+                    request,
+                    course,
+                    keep_raw_scores,
+                    field_data_cache=field_data_cache,
+                    scores_client=scores_client,
+                    max_scores_cache=max_scores_cache,
+                )
                 yield student, gradeset, ""
             except Exception as exc:  # pylint: disable=broad-except
                 # Keep marching on even if this student couldn't be graded for
@@ -804,6 +1019,27 @@ def iterate_grades_for(course_or_id, students, keep_raw_scores=False):
                 )
                 yield student, {}, exc.message
 
+    max_scores_cache.push_to_remote()
+
+
+def prefetch_anonymous_ids(course_key, students):
+    """
+    Load the stored anonymous ids of `students` for the course with a single
+    query, and cache them on the user objects the way `anonymous_id_for_user`
+    does. Students without a stored id are left for `anonymous_id_for_user`
+    to create.
+    """
+    students_by_id = {student.id: student for student in students}
+    anonymous_ids = AnonymousUserId.objects.filter(
+        user_id__in=students_by_id.keys(),
+        course_id=course_key,
+    ).values_list('user_id', 'anonymous_user_id')
+    for user_id, anonymous_user_id in anonymous_ids:
+        student = students_by_id[user_id]
+        if not hasattr(student, '_anonymous_id'):
+            student._anonymous_id = {}  # pylint: disable=protected-access
+        student._anonymous_id[course_key] = anonymous_user_id  # pylint: disable=protected-access
+
 
 def _get_mock_request(student):
     """
@@ -0,0 +1,311 @@
+"""
+A command to measure the cost of grading each student of a course, as the
+number of students enrolled in it grows.
+
+For each enrollment size, fake students are enrolled in the course until it
+has that many, each with a graded StudentModule for every scored block of the
+course. A sample of them is then graded twice: in batches, as
+`iterate_grades_for` does, and one student at a time with `grade`, as
+`iterate_grades_for` did before it graded students in batches. The queries
+and time per student are reported for both, along with the part of them spent
+in the submissions API, which is still called once per student. Grades
+persisted by earlier runs aren't used, so that every grade is computed.
+
+The fake students are created in the database the command runs against, so it
+must only be run against a test database. They are deleted with --cleanup.
+
+"""
+
+from contextlib import contextmanager
+from functools import partial
+from optparse import make_option
+import time
+from uuid import uuid4
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries, transaction
+from django.test.client import RequestFactory
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+from submissions import api as sub_api
+
+from courseware import grades
+from courseware.model_data import descendant_descriptors_for_caching
+from courseware.models import StudentModule, chunks
+from student.models import CourseEnrollment
+from xmodule.modulestore.django import modulestore
+
+
+# The usernames of the fake students start with this, followed by 12 random
+# hex digits, to fit in the 30 characters of a username.
+FAKE_USERNAME_PREFIX = u'grading_benchmark_'
+
+# Number of rows created or deleted by one query.
+WRITE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    """
+    Reports the queries and time it takes to grade each student of a course,
+    with and without batching, for several numbers of enrolled students.
+    """
+
+    args = "<course_id>"
+    help = (
+        "Enrolls fake students in a course, up to each of --sizes, and reports the queries and time per student "
+        "of grading --sample of them with and without batching. Only run it against a test database."
+    )
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--sizes',
+            default='1000,10000,100000',
+            help="Comma-separated numbers of enrolled fake students to measure grading at.",
+        ),
+        make_option(
+            '--sample',
+            type='int',
+            default=500,
+            help="Number of students graded at each size.",
+        ),
+        make_option(
+            '--batch-size',
+            type='int',
+            default=grades.GRADING_BATCH_SIZE,
+            help="Number of students graded in each batch.",
+        ),
+        make_option(
+            '--cleanup',
+            action='store_true',
+            default=False,
+            help="Delete the fake students of all the courses instead.",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            self.stdout.write("Deleted {} fake students\n".format(delete_fake_students()))
+            return
+
+        if len(args) != 1:
+            raise CommandError("A course id is required")
+        try:
+            course_key = CourseKey.from_string(args[0])
+        except InvalidKeyError:
+            raise CommandError("Invalid course id {}".format(args[0]))
+        try:
+            sizes = sorted(int(size) for size in options['sizes'].split(','))
+        except ValueError:
+            raise CommandError("Invalid sizes {}".format(options['sizes']))
+        course = modulestore().get_course(course_key, depth=None)
+        if course is None:
+            raise CommandError("Course {} not found".format(course_key))
+
+        modes = (
+            ('batched', partial(grade_batched, batch_size=options['batch_size'])),
+            ('unbatched', grade_unbatched),
+        )
+        self.stdout.write(
+            "{:>11} {:>9} {:>8} {:>7} {:>9} {:>11} {:>9} {:>6}\n".format(
+                'enrollments', 'mode', 'students', 'queries', 'ms', 'sub_queries', 'sub_ms', 'errors'
+            )
+        )
+        with _without_persistent_grades():
+            for size in sizes:
+                enroll_fake_students(course, size)
+                for mode, grade_students in modes:
+                    # Grade one student first, so that the course blocks and
+                    # max scores are cached, as they are for every student but
+                    # the first.
+                    grade_students(course, list(fake_students(course.id)[:1]))
+                    # Fresh User objects, so that no mode reuses the anonymous
+                    # ids cached on them by another.
+                    students = list(fake_students(course.id)[:options['sample']])
+                    if not students:
+                        continue
+                    costs = measure_grading(course, students, grade_students)
+                    self.stdout.write(
+                        "{:>11} {:>9} {:>8} {:>7.1f} {:>9.1f} {:>11.1f} {:>9.1f} {:>6}\n".format(
+                            size,
+                            mode,
+                            len(students),
+                            costs['queries'] / float(len(students)),
+                            costs['seconds'] * 1000 / len(students),
+                            costs['submissions_queries'] / float(len(students)),
+                            costs['submissions_seconds'] * 1000 / len(students),
+                            costs['errors'],
+                        )
+                    )
+
+
+def fake_students(course_key):
+    """
+    Returns a query of the fake students enrolled in the course, in the order
+    they were created.
+    """
+    return User.objects.filter(
+        username__startswith=FAKE_USERNAME_PREFIX,
+        courseenrollment__course_id=course_key,
+    ).order_by('id')
+
+
+def enroll_fake_students(course, count):
+    """
+    Enroll fake students in `course` until it has `count` of them, each with a
+    graded StudentModule for every scored block of the course.
+    """
+    scored_locations = [
+        descriptor.location
+        for descriptor in descendant_descriptors_for_caching(
+            course,
+            descriptor_filter=partial(grades.descriptor_affects_grading, course.block_types_affecting_grading),
+        )
+        if descriptor.has_score
+    ]
+    enrolled = fake_students(course.id).count()
+    while enrolled < count:
+        usernames = [
+            FAKE_USERNAME_PREFIX + uuid4().hex[:12]
+            for __ in xrange(min(WRITE_BATCH_SIZE, count - enrolled))
+        ]
+        with transaction.commit_on_success():
+            User.objects.bulk_create([
+                User(username=username, email=u'{}@example.com'.format(username), password='!')
+                for username in usernames
+            ])
+            user_ids = list(User.objects.filter(username__in=usernames).values_list('id', flat=True))
+            CourseEnrollment.objects.bulk_create([
+                CourseEnrollment(user_id=user_id, course_id=course.id) for user_id in user_ids
+            ])
+            student_modules = (
+                StudentModule(
+                    student_id=user_id,
+                    course_id=course.id,
+                    module_state_key=location,
+                    module_type=location.block_type,
+                    state='{}',
+                    grade=1,
+                    max_grade=1,
+                )
+                for user_id in user_ids
+                for location in scored_locations
+            )
+            for batch in chunks(student_modules, WRITE_BATCH_SIZE):
+                StudentModule.objects.bulk_create(batch)
+        enrolled += len(usernames)
+
+
+def delete_fake_students():
+    """
+    Delete the fake students, along with their enrollments and state.
+
+    Returns the number of students deleted.
+    """
+    user_ids = User.objects.filter(username__startswith=FAKE_USERNAME_PREFIX).values_list('id', flat=True)
+    deleted = 0
+    for batch in chunks(user_ids, WRITE_BATCH_SIZE):
+        with transaction.commit_on_success():
+            User.objects.filter(id__in=batch).delete()
+        deleted += len(batch)
+    return deleted
+
+
+def grade_batched(course, students, batch_size):
+    """
+    Grade `students` in batches of `batch_size` with `iterate_grades_for`.
+
+    Returns the number of students that couldn't be graded.
+    """
+    return sum(
+        1 for __, __, err_msg in grades.iterate_grades_for(course, students, batch_size=batch_size) if err_msg
+    )
+
+
+def grade_unbatched(course, students):
+    """
+    Grade `students` one at a time with `grade`, as `iterate_grades_for` did
+    before it graded them in batches.
+
+    Returns the number of students that couldn't be graded.
+    """
+    errors = 0
+    for student in students:
+        request = RequestFactory().get('/')
+        request.user = student
+        request.session = {}
+        try:
+            grades.grade(student, request, course)
+        except Exception:  # pylint: disable=broad-except
+            errors += 1
+    return errors
+
+
+def measure_grading(course, students, grade_students):
+    """
+    Grade `students` with the `grade_students` function, and return a dict of
+    the total 'queries' and 'seconds' it took, the 'submissions_queries' and
+    'submissions_seconds' spent in the submissions API, and the number of
+    students that couldn't be graded ('errors').
+    """
+    costs = {'submissions_queries': 0, 'submissions_seconds': 0.0}
+    get_scores = sub_api.get_scores
+
+    def measured_get_scores(*args, **kwargs):
+        """Calls `get_scores`, adding its queries and time to `costs`."""
+        queries, start = _count_queries(), time.time()
+        try:
+            return get_scores(*args, **kwargs)
+        finally:
+            costs['submissions_seconds'] += time.time() - start
+            costs['submissions_queries'] += _count_queries() - queries
+
+    sub_api.get_scores = measured_get_scores
+    try:
+        with _logged_queries():
+            queries, start = _count_queries(), time.time()
+            costs['errors'] = grade_students(course, students)
+            costs['seconds'] = time.time() - start
+            costs['queries'] = _count_queries() - queries
+    finally:
+        sub_api.get_scores = get_scores
+    return costs
+
+
+@contextmanager
+def _without_persistent_grades():
+    """
+    Turn the ENABLE_PERSISTENT_GRADES feature off, so that grades are computed
+    rather than read from the grades persisted by earlier runs.
+    """
+    enabled = settings.FEATURES.get('ENABLE_PERSISTENT_GRADES', False)
+    settings.FEATURES['ENABLE_PERSISTENT_GRADES'] = False
+    try:
+        yield
+    finally:
+        settings.FEATURES['ENABLE_PERSISTENT_GRADES'] = enabled
+
+
+@contextmanager
+def _logged_queries():
+    """
+    Log the queries of all the database connections, even without DEBUG, so
+    that they can be counted with `_count_queries`.
+    """
+    debug_cursors = [(connection, connection.use_debug_cursor) for connection in connections.all()]
+    for connection, __ in debug_cursors:
+        connection.use_debug_cursor = True
+    try:
+        yield
+    finally:
+        for connection, use_debug_cursor in debug_cursors:
+            connection.use_debug_cursor = use_debug_cursor
+        reset_queries()
+
+
+def _count_queries():
+    """
+    Returns the number of queries logged by all the database connections.
+    """
+    return sum(len(connection.queries) for connection in connections.all())
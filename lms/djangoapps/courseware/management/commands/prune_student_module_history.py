@@ -0,0 +1,112 @@
+"""
+A command to delete old rows of the StudentModuleHistory table.
+
+The rows are selected on their created date, and optionally their course, and
+deleted in batches ordered by id, each batch starting after the last id of the
+previous one, so that pruning a large table doesn't hold long locks or slow
+down as it goes.
+
+"""
+
+import logging
+import time
+from optparse import make_option
+
+from dateutil.parser import parse as parse_datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import is_naive, utc
+from opaque_keys import InvalidKeyError
+from opaque_keys.edx.keys import CourseKey
+
+from courseware.models import StudentModuleHistory
+
+
+LOG = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    """
+    Deletes the StudentModuleHistory rows created before a date.
+    """
+
+    help = "Deletes the StudentModuleHistory rows created before --before, optionally only those of --course-id."
+
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--before',
+            help="Delete the rows created before this date, e.g. 2015-01-01.",
+        ),
+        make_option(
+            '--course-id',
+            help="Only delete the rows of this course.",
+        ),
+        make_option(
+            '--batch',
+            type='int',
+            default=1000,
+            help="Batch size, number of rows deleted in a transaction.",
+        ),
+        make_option(
+            '--sleep',
+            type='float',
+            default=0,
+            help="Seconds to sleep between batches.",
+        ),
+        make_option(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help="Don't change the database, just count the rows that would be deleted.",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        if not options['before']:
+            raise CommandError("--before is required")
+        try:
+            before = parse_datetime(options['before'])
+        except ValueError:
+            raise CommandError("Invalid date {}".format(options['before']))
+        if is_naive(before):
+            before = before.replace(tzinfo=utc)
+
+        history = StudentModuleHistory.objects.filter(created__lt=before)
+        if options['course_id']:
+            try:
+                course_key = CourseKey.from_string(options['course_id'])
+            except InvalidKeyError:
+                raise CommandError("Invalid course id {}".format(options['course_id']))
+            history = history.filter(student_module__course_id=course_key)
+
+        if options['dry_run']:
+            self.stdout.write("Would delete {} rows\n".format(history.count()))
+            return
+
+        deleted = prune_history(history, options['batch'], options['sleep'])
+        self.stdout.write("Deleted {} rows\n".format(deleted))
+
+
+def prune_history(history, batch_size, sleep=0):
+    """
+    Delete the StudentModuleHistory rows of the `history` query, `batch_size`
+    rows at a time, sleeping `sleep` seconds between batches.
+
+    Returns the number of rows deleted.
+    """
+    history = history.order_by('id').values_list('id', flat=True)
+    deleted = 0
+    last_id = 0
+    while True:
+        ids = list(history.filter(id__gt=last_id)[:batch_size])
+        if not ids:
+            return deleted
+
+        with transaction.commit_on_success():
+            StudentModuleHistory.objects.filter(id__in=ids).delete()
+        deleted += len(ids)
+        last_id = ids[-1]
+        LOG.info("Deleted %d StudentModuleHistory rows, up to id %d", deleted, last_id)
+
+        if sleep:
+            time.sleep(sleep)
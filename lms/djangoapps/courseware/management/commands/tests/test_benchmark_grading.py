@@ -0,0 +1,54 @@
+"""Test the benchmark_grading management command."""
+
+from StringIO import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from courseware.management.commands.benchmark_grading import FAKE_USERNAME_PREFIX
+from courseware.models import StudentModule
+from student.models import CourseEnrollment
+from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
+
+
+class BenchmarkGradingTest(ModuleStoreTestCase):
+    """Test the benchmark_grading command."""
+
+    def setUp(self):
+        super(BenchmarkGradingTest, self).setUp()
+        self.course = CourseFactory.create(
+            grading_policy={
+                "GRADER": [{"type": "Homework", "min_count": 1, "drop_count": 0, "short_label": "HW", "weight": 1.0}],
+            },
+        )
+        chapter = ItemFactory.create(parent=self.course, category='chapter')
+        section = ItemFactory.create(parent=chapter, category='sequential', graded=True, format='Homework')
+        ItemFactory.create(parent=section, category='problem')
+
+    def test_benchmark(self):
+        out = StringIO()
+        call_command('benchmark_grading', unicode(self.course.id), sizes='3,2', sample=2, stdout=out)
+
+        rows = [line.split() for line in out.getvalue().splitlines()[1:]]
+        self.assertEqual(
+            [(enrollments, mode, students, errors) for enrollments, mode, students, __, __, __, __, errors in rows],
+            [
+                ('2', 'batched', '2', '0'),
+                ('2', 'unbatched', '2', '0'),
+                ('3', 'batched', '2', '0'),
+                ('3', 'unbatched', '2', '0'),
+            ]
+        )
+        fake_students = User.objects.filter(username__startswith=FAKE_USERNAME_PREFIX)
+        self.assertEqual(CourseEnrollment.objects.filter(course_id=self.course.id, user__in=fake_students).count(), 3)
+        self.assertEqual(StudentModule.objects.filter(grade=1, student__in=fake_students).count(), 3)
+
+        call_command('benchmark_grading', cleanup=True, stdout=out)
+        self.assertFalse(fake_students.exists())
+        self.assertFalse(StudentModule.objects.exists())
+
+    def test_invalid_course_id(self):
+        with self.assertRaises(CommandError):
+            call_command('benchmark_grading', 'not a course id')
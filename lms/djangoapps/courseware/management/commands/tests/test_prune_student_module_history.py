@@ -0,0 +1,58 @@
+"""Test the prune_student_module_history management command."""
+
+import dateutil.parser
+import dateutil.tz
+from django.core.management import call_command
+from django.test import TestCase
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
+
+from courseware.models import StudentModuleHistory
+from courseware.tests.factories import StudentModuleFactory
+
+
+def parse_date(sdate):
+    """Parse a string date into a UTC datetime."""
+    return dateutil.parser.parse(sdate).replace(tzinfo=dateutil.tz.gettz('UTC'))
+
+
+class PruneStudentModuleHistoryTest(TestCase):
+    """Test the prune_student_module_history command."""
+
+    def setUp(self):
+        super(PruneStudentModuleHistoryTest, self).setUp()
+        self.course_key = SlashSeparatedCourseKey('edX', 'test', 'course')
+        self.other_course_key = SlashSeparatedCourseKey('edX', 'test', 'other_course')
+        for course_key in (self.course_key, self.other_course_key):
+            # Not a problem, so that saving it doesn't add history of its own.
+            student_module = StudentModuleFactory.create(course_id=course_key, module_type='html')
+            for created in ('2014-06-01', '2014-12-01', '2015-06-01'):
+                StudentModuleHistory.objects.create(student_module=student_module, created=parse_date(created))
+
+    def _remaining(self):
+        """Return the (course id, created date) of the remaining history rows."""
+        return sorted(
+            (entry.student_module.course_id, entry.created)
+            for entry in StudentModuleHistory.objects.select_related('student_module')
+        )
+
+    def test_prune_before_date(self):
+        call_command('prune_student_module_history', before='2015-01-01', batch=3)
+        self.assertEqual(self._remaining(), [
+            (self.course_key, parse_date('2015-06-01')),
+            (self.other_course_key, parse_date('2015-06-01')),
+        ])
+
+    def test_prune_course(self):
+        call_command(
+            'prune_student_module_history', before='2015-01-01', course_id=unicode(self.course_key), batch=1
+        )
+        self.assertEqual(self._remaining(), [
+            (self.course_key, parse_date('2015-06-01')),
+            (self.other_course_key, parse_date('2014-06-01')),
+            (self.other_course_key, parse_date('2014-12-01')),
+            (self.other_course_key, parse_date('2015-06-01')),
+        ])
+
+    def test_dry_run(self):
+        call_command('prune_student_module_history', before='2015-01-01', dry_run=True)
+        self.assertEqual(StudentModuleHistory.objects.count(), 6)
@@ -2,10 +2,15 @@
 Middleware for the courseware app
 """
 
+from django.conf import settings
+from django.db import DatabaseError, transaction
 from django.shortcuts import redirect
 from django.core.urlresolvers import reverse
 
 from courseware.courses import UserNotEnrolled
+from courseware.user_state_client import start_buffering_writes, stop_buffering_writes
+from static_template_view.views import render_500
+from util.db import discard_after_commit_callbacks
 
 
 class RedirectUnenrolledMiddleware(object):
@@ -22,3 +27,41 @@ class RedirectUnenrolledMiddleware(object):
                     args=[course_key.to_deprecated_string()]
                 )
             )
+
+
+class UserStateWriteBufferMiddleware(object):
+    """
+    Buffer the user state stored during each request, and write it at the end
+    of the request, when the ENABLE_USER_STATE_WRITE_BUFFER feature is on.
+
+    Blocks whose state is stored several times in a request, by a sequence page
+    rendering its children or by an XBlock handler, are then written once.
+
+    This must come after TransactionMiddleware, so that the buffered writes are
+    made in the request's transaction.
+    """
+    def process_request(self, _request):
+        if settings.FEATURES.get('ENABLE_USER_STATE_WRITE_BUFFER'):
+            start_buffering_writes()
+
+    def process_response(self, request, response):
+        try:
+            stop_buffering_writes()
+        except DatabaseError:
+            # The view's user state couldn't be written, so none of its changes
+            # are kept. The transaction middleware then has nothing to commit,
+            # and the after-commit callbacks of the request, which send its
+            # history entries, are dropped, as they are when the view fails.
+            transaction.rollback()
+            discard_after_commit_callbacks()
+            return render_500(request)
+        return response
+
+    def process_exception(self, _request, _exception):
+        # The writes are made as they would have been without the buffer; the
+        # transaction middleware decides whether they are kept.
+        try:
+            stop_buffering_writes()
+        except DatabaseError:
+            # Already logged; the transaction middleware rolls back the request.
+            pass
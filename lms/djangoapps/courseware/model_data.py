@@ -350,11 +350,11 @@ class UserStateCache(object):
     """
     Cache for Scope.user_state xblock field data.
     """
-    def __init__(self, user, course_id):
+    def __init__(self, user, course_id, buffer_writes=True):
         self._cache = defaultdict(dict)
         self.course_id = course_id
         self.user = user
-        self._client = DjangoXBlockUserStateClient(self.user)
+        self._client = DjangoXBlockUserStateClient(self.user, buffer_writes=buffer_writes)
 
     def cache_fields(self, fields, xblocks, aside_types):  # pylint: disable=unused-argument
         """
@@ -373,6 +373,26 @@ class UserStateCache(object):
         for user_state in block_field_state:
             self._cache[user_state.block_key] = user_state.state
 
+    def cache_student_modules(self, student_modules):
+        """
+        Load the state stored in already-fetched ``student_modules`` into this
+        cache, with the same semantics as :meth:`cache_fields`.
+
+        Arguments:
+            student_modules (list of :class:`~StudentModule`): The user's StudentModules,
+                as returned by :func:`prefetch_student_modules`.
+        """
+        for student_module in student_modules:
+            # A state of None or {} means that the user has no stored state
+            # (see DjangoXBlockUserStateClient).
+            if student_module.state is None:
+                continue
+            state = json.loads(student_module.state)
+            if state == {}:
+                continue
+            usage_key = student_module.module_state_key.map_into_course(student_module.course_id)
+            self._cache[usage_key] = state
+
     @contract(kvs_key=DjangoKeyValueStore.Key)
     def set(self, kvs_key, value):
         """
@@ -682,6 +702,37 @@ class UserInfoCache(DjangoOrmFieldCache):
         return key.field_name
 
 
+def descendant_descriptors_for_caching(descriptor, depth=None, descriptor_filter=lambda descriptor: True):
+    """
+    Return a list of all descendant descriptors of `descriptor` down to the
+    specified depth that match the descriptor filter. Includes `descriptor`.
+
+    descriptor: The parent to search inside
+    depth: The number of levels to descend, or None for infinite depth
+    descriptor_filter(descriptor): A function that returns True
+        if descriptor should be included in the results
+    """
+    def get_child_descriptors(descriptor, depth):
+        """
+        Recursively collect the matching descriptors below `descriptor`.
+        """
+        if descriptor_filter(descriptor):
+            descriptors = [descriptor]
+        else:
+            descriptors = []
+
+        if depth is None or depth > 0:
+            new_depth = depth - 1 if depth is not None else depth
+
+            for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
+                descriptors.extend(get_child_descriptors(child, new_depth))
+
+        return descriptors
+
+    with modulestore().bulk_operations(descriptor.location.course_key):
+        return get_child_descriptors(descriptor, depth)
+
+
 class FieldDataCache(object):
     """
     A cache of django model objects needed to supply the data
@@ -698,7 +749,9 @@ class FieldDataCache(object):
         descriptors: A list of XModuleDescriptors.
         course_id: The id of the current course
         user: The user for which to cache data
-        select_for_update: Ignored
+        select_for_update: If True, the user's state is written to the database as soon as
+            it is set, even while user state writes are buffered for the request (see
+            courseware.user_state_client.start_buffering_writes)
         asides: The list of aside types to load, or None to prefetch no asides.
         """
         if asides is None:
@@ -714,6 +767,7 @@ class FieldDataCache(object):
             Scope.user_state: UserStateCache(
                 self.user,
                 self.course_id,
+                buffer_writes=not select_for_update,
             ),
             Scope.user_info: UserInfoCache(
                 self.user,
@@ -728,9 +782,12 @@ class FieldDataCache(object):
         self.scorable_locations = set()
         self.add_descriptors_to_cache(descriptors)
 
-    def add_descriptors_to_cache(self, descriptors):
+    def add_descriptors_to_cache(self, descriptors, student_modules=None):
         """
         Add all `descriptors` to this FieldDataCache.
+
+        If `student_modules` is given, it is used as the user's Scope.user_state
+        data instead of querying it from the database.
         """
         if self.user.is_authenticated():
             self.scorable_locations.update(desc.location for desc in descriptors if desc.has_score)
@@ -738,7 +795,10 @@ class FieldDataCache(object):
                 if scope not in self.cache:
                     continue
 
-                self.cache[scope].cache_fields(fields, descriptors, self.asides)
+                if scope == Scope.user_state and student_modules is not None:
+                    self.cache[scope].cache_student_modules(student_modules)
+                else:
+                    self.cache[scope].cache_fields(fields, descriptors, self.asides)
 
     def add_descriptor_descendents(self, descriptor, depth=None, descriptor_filter=lambda descriptor: True):
         """
@@ -751,33 +811,7 @@ class FieldDataCache(object):
             descriptor_filter is a function that accepts a descriptor and return whether the field data
                 should be cached
         """
-
-        def get_child_descriptors(descriptor, depth, descriptor_filter):
-            """
-            Return a list of all child descriptors down to the specified depth
-            that match the descriptor filter. Includes `descriptor`
-
-            descriptor: The parent to search inside
-            depth: The number of levels to descend, or None for infinite depth
-            descriptor_filter(descriptor): A function that returns True
-                if descriptor should be included in the results
-            """
-            if descriptor_filter(descriptor):
-                descriptors = [descriptor]
-            else:
-                descriptors = []
-
-            if depth is None or depth > 0:
-                new_depth = depth - 1 if depth is not None else depth
-
-                for child in descriptor.get_children() + descriptor.get_required_module_descriptors():
-                    descriptors.extend(get_child_descriptors(child, new_depth, descriptor_filter))
-
-            return descriptors
-
-        with modulestore().bulk_operations(descriptor.location.course_key):
-            descriptors = get_child_descriptors(descriptor, depth, descriptor_filter)
-
+        descriptors = descendant_descriptors_for_caching(descriptor, depth, descriptor_filter)
         self.add_descriptors_to_cache(descriptors)
 
     @classmethod
@@ -792,12 +826,26 @@ class FieldDataCache(object):
             the supplied descriptor. If depth is None, load all descendant StudentModules
         descriptor_filter is a function that accepts a descriptor and return whether the field data
             should be cached
-        select_for_update: Ignored
+        select_for_update: Whether to write the user's state as soon as it is set, as described
+            in FieldDataCache
         """
         cache = FieldDataCache([], course_id, user, select_for_update, asides=asides)
         cache.add_descriptor_descendents(descriptor, depth, descriptor_filter)
         return cache
 
+    @classmethod
+    def cache_for_prefetched_descriptors(cls, course_id, user, descriptors, student_modules):
+        """
+        Create a FieldDataCache for `descriptors` (as returned by
+        :func:`descendant_descriptors_for_caching`) whose Scope.user_state data
+        comes from `student_modules` (as returned by
+        :func:`prefetch_student_modules`), so that many users' caches can be
+        built from a single traversal of the course and a single query.
+        """
+        cache = FieldDataCache([], course_id, user)
+        cache.add_descriptors_to_cache(descriptors, student_modules=student_modules)
+        return cache
+
     def _fields_to_cache(self, descriptors):
         """
         Returns a map of scopes to fields in that scope that should be cached
@@ -990,6 +1038,43 @@ class ScoresClient(object):
         client.fetch_scores(fd_cache.scorable_locations)
         return client
 
+    @classmethod
+    def from_student_modules(cls, course_key, user_id, student_modules, locations):
+        """
+        Create a ScoresClient for `locations` from the user's already-fetched
+        `student_modules` (as returned by :func:`prefetch_student_modules`).
+        """
+        client = cls(course_key, user_id)
+        locations = set(locations)
+        for student_module in student_modules:
+            location = student_module.module_state_key.map_into_course(course_key)
+            if location in locations:
+                client._locations_to_scores[location] = cls.Score(  # pylint: disable=protected-access
+                    student_module.grade, student_module.max_grade
+                )
+        client._has_fetched = True  # pylint: disable=protected-access
+        return client
+
+
+@donottrack(StudentModule)
+def prefetch_student_modules(course_key, user_ids, block_types):
+    """
+    Fetch the StudentModules of many users in a course with a single query
+    (chunked on user id), limited to blocks of `block_types`.
+
+    Returns a dict mapping each of `user_ids` to a list of its StudentModules.
+    """
+    student_modules = {user_id: [] for user_id in user_ids}
+    query = StudentModule.objects.chunked_filter(
+        'student_id__in',
+        user_ids,
+        course_id=course_key,
+        module_type__in=list(block_types),
+    )
+    for student_module in query:
+        student_modules[student_module.student_id].append(student_module)  # pylint: disable=no-member
+    return student_modules
+
 
 # @contract(user_id=int, usage_key=UsageKey, score="number|None", max_score="number|None")
 @donottrack(StudentModule)
@@ -14,16 +14,20 @@ ASSUMPTIONS: modules have unique IDs, even across different module_types
 """
 import logging
 import itertools
+from uuid import uuid4
 
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.core.cache import cache
+from django.db import IntegrityError, models
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver, Signal
 
 from model_utils.models import TimeStampedModel
+from opaque_keys.edx.keys import CourseKey, UsageKey
 from student.models import user_by_anonymous_id
 from submissions.models import score_set, score_reset
+from util.db import add_to_after_commit_batch, run_after_commit
 
 from openedx.core.djangoapps.call_stack_manager import CallStackManager, CallStackMixin
 from xmodule_django.models import CourseKeyField, LocationKeyField, BlockTypeKeyField  # pylint: disable=import-error
@@ -182,8 +186,26 @@ class StudentModuleHistory(CallStackMixin, models.Model):
         Checks the instance's module_type, and creates & saves a
         StudentModuleHistory entry if the module_type is one that
         we save.
+
+        When the ENABLE_ASYNC_STUDENT_MODULE_HISTORY feature is on, the entries
+        of the StudentModules saved during a request are instead sent to be
+        inserted by a Celery task once the request's transaction is committed
+        (see `send_student_module_history`).
         """
         if instance.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
+            if settings.FEATURES.get('ENABLE_ASYNC_STUDENT_MODULE_HISTORY'):
+                entry = {
+                    'student_module_id': instance.id,
+                    'version': None,
+                    'created': instance.modified.isoformat(),
+                    'state': instance.state,
+                    'grade': instance.grade,
+                    'max_grade': instance.max_grade,
+                }
+                # Outside of requests, the entry is inserted right away.
+                if add_to_after_commit_batch(send_student_module_history, entry):
+                    return
+
             history_entry = StudentModuleHistory(student_module=instance,
                                                  version=None,
                                                  created=instance.modified,
@@ -193,6 +215,27 @@ class StudentModuleHistory(CallStackMixin, models.Model):
             history_entry.save()
 
 
+def send_student_module_history(entries):
+    """
+    Send the StudentModuleHistory entries of a request to be inserted by a
+    Celery task. This is called once the StudentModules they belong to are
+    committed, since the entries are inserted by another process.
+
+    If the task can't be sent, e.g. because the broker is unavailable, the
+    entries are inserted right away instead.
+    """
+    # Imported here, since the tasks import these models.
+    from courseware.tasks import write_student_module_history
+    try:
+        write_student_module_history.apply_async(
+            args=(entries,),
+            routing_key=settings.STUDENT_MODULE_HISTORY_ROUTING_KEY,
+        )
+    except Exception:  # pylint: disable=broad-except
+        log.exception(u"Failed to send %d StudentModuleHistory entries, inserting them now", len(entries))
+        write_student_module_history(entries)
+
+
 class XBlockFieldBase(models.Model):
     """
     Base class for all XBlock field storage.
@@ -310,6 +353,183 @@ class StudentFieldOverride(TimeStampedModel):
     value = models.TextField(default='null')
 
 
+class PersistentSubsectionGrade(TimeStampedModel):
+    """
+    A student's graded total for a single subsection of a course.
+
+    Rows are written by `courseware.grades` whenever a subsection is graded,
+    and are deleted whenever one of the student's scores inside that
+    subsection changes, so that a later call to `grade()` only has to
+    recompute the subsections that actually changed.
+
+    `course_version` identifies the course content and grading policy that
+    the row was computed against. Rows with a different version are treated
+    as missing and get recomputed (and overwritten) the next time the student
+    is graded.
+
+    Grades computed while the student's grades were invalidated are not kept:
+    every invalidation changes the student's grading generation (kept in the
+    cache), and grades are only kept if the generation read before computing
+    them is still current once they are saved.
+    """
+    objects = ChunkingManager()
+
+    # How long a grading generation is kept in the cache; grades are only
+    # saved if the generation is still cached once they're computed.
+    GENERATION_TIMEOUT = 60 * 60 * 24
+
+    class Meta(object):
+        unique_together = (('user', 'course_id', 'usage_key'),)
+
+    user = models.ForeignKey(User, db_index=True)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+
+    # The usage key of the subsection (sequential) this grade is for
+    usage_key = LocationKeyField(max_length=255)
+
+    course_version = models.CharField(max_length=255)
+    earned = models.FloatField()
+    possible = models.FloatField()
+
+    @classmethod
+    def read_grades(cls, user_id, course_key, course_version):
+        """
+        Return a dict mapping subsection usage keys to `(earned, possible)`
+        tuples for every persisted grade of the user that was computed against
+        `course_version`.
+        """
+        grades = cls.objects.filter(
+            user_id=user_id,
+            course_id=course_key,
+            course_version=course_version,
+        ).values_list('usage_key', 'earned', 'possible')
+        return {
+            usage_key.map_into_course(course_key): (earned, possible)
+            for usage_key, earned, possible in grades
+        }
+
+    @classmethod
+    def _generation_cache_key(cls, user_id, course_key):
+        """
+        Return the cache key of the grading generation of the user in the course.
+        """
+        return u'persistent-grades-generation.{}.{}'.format(user_id, course_key)
+
+    @classmethod
+    def current_generation(cls, user_id, course_key):
+        """
+        Return the grading generation of the user in the course, which changes
+        whenever the user's persisted grades are invalidated, or None if the
+        cache can't keep it.
+
+        It must be read before the scores that are graded.
+        """
+        key = cls._generation_cache_key(user_id, course_key)
+        generation = cache.get(key)
+        if generation is None:
+            cache.add(key, uuid4().hex, cls.GENERATION_TIMEOUT)
+            generation = cache.get(key)
+        return generation
+
+    @classmethod
+    def save_grades(cls, user_id, course_key, course_version, generation, grades):
+        """
+        Create or overwrite the persisted grades of the user for the
+        subsections of `grades`, a dict mapping subsection usage keys to
+        `(earned, possible)` tuples, which were computed in the grading
+        `generation`.
+
+        If the user's grades were invalidated since then, the grades are
+        deleted again, since they may have been computed from stale scores.
+        """
+        if generation is None or not grades:
+            return
+        for usage_key, (earned, possible) in grades.iteritems():
+            cls.save_grade(user_id, course_key, usage_key, course_version, earned, possible)
+        # An invalidation changes the generation before deleting the grades,
+        # so either it deletes the grades saved above or it is seen here.
+        if cache.get(cls._generation_cache_key(user_id, course_key)) != generation:
+            cls.objects.filter(user_id=user_id, course_id=course_key, usage_key__in=grades.keys()).delete()
+
+    @classmethod
+    def save_grade(cls, user_id, course_key, usage_key, course_version, earned, possible):
+        """
+        Create or overwrite the persisted grade of the user for a subsection.
+
+        Callers grading from the student's scores should use `save_grades`,
+        which doesn't keep grades computed during an invalidation.
+        """
+        updated = cls.objects.filter(
+            user_id=user_id,
+            course_id=course_key,
+            usage_key=usage_key,
+        ).update(course_version=course_version, earned=earned, possible=possible)
+        if not updated:
+            try:
+                cls.objects.create(
+                    user_id=user_id,
+                    course_id=course_key,
+                    usage_key=usage_key,
+                    course_version=course_version,
+                    earned=earned,
+                    possible=possible,
+                )
+            except IntegrityError:
+                # A concurrent request graded the same subsection first; its
+                # value is as good as ours.
+                pass
+
+    @classmethod
+    def invalidate(cls, user_id, course_key, usage_key):
+        """
+        Delete the persisted grades of the user for every subsection that
+        contains `usage_key`, and change the user's grading generation.
+
+        If the block's ancestors can't be found in the modulestore (e.g. it
+        was deleted from the course), all of the user's persisted grades for
+        the course are deleted instead.
+
+        When called in a request's transaction, this is done again once it is
+        committed, since grades computed concurrently before then are computed
+        from the scores it replaces.
+        """
+        # Imported here to keep the modulestore out of model import time.
+        from xmodule.modulestore.django import modulestore
+        from xmodule.modulestore.exceptions import ItemNotFoundError
+
+        ancestors = []
+        location = usage_key
+        try:
+            while location is not None:
+                ancestors.append(location)
+                location = modulestore().get_parent_location(location)
+        except ItemNotFoundError:
+            ancestors = []
+        usage_keys = ancestors if len(ancestors) > 1 else None
+
+        if run_after_commit(cls._delete_grades, user_id, course_key, usage_keys):
+            # Grading later in the current transaction sees the new scores.
+            cls._delete_grades(user_id, course_key, usage_keys)
+
+    @classmethod
+    def _delete_grades(cls, user_id, course_key, usage_keys=None):
+        """
+        Change the grading generation of the user in the course, then delete
+        the user's persisted grades for the subsections of `usage_keys`, or for
+        every subsection if it is None.
+        """
+        cache.set(cls._generation_cache_key(user_id, course_key), uuid4().hex, cls.GENERATION_TIMEOUT)
+        grades = cls.objects.filter(user_id=user_id, course_id=course_key)
+        if usage_keys is not None:
+            grades = grades.filter(usage_key__in=usage_keys)
+        grades.delete()
+
+    def __unicode__(self):
+        return u"[PersistentSubsectionGrade] {}: {} ({}) = {}/{}".format(
+            self.user_id, self.usage_key, self.course_version, self.earned, self.possible  # pylint: disable=no-member
+        )
+
+
 # Signal that indicates that a user's score for a problem has been updated.
 # This signal is generated when a scoring event occurs either within the core
 # platform or in the Submissions module. Note that this signal will be triggered
@@ -406,3 +626,38 @@ def submissions_score_reset_handler(sender, **kwargs):  # pylint: disable=unused
             u"Failed to process score_reset signal from Submissions API. "
             "user: %s, course_id: %s, usage_id: %s", user, course_id, usage_id
         )
+
+
+@receiver(SCORE_CHANGED)
+def invalidate_persistent_subsection_grades(sender, **kwargs):  # pylint: disable=unused-argument
+    """
+    Consume the SCORE_CHANGED signal and delete the persisted grades of the
+    subsections containing the re-scored block, so that they get recomputed
+    the next time the user is graded.
+    """
+    if not settings.FEATURES.get('ENABLE_PERSISTENT_GRADES'):
+        return
+
+    user_id = kwargs.get('user_id', None)
+    course_id = kwargs.get('course_id', None)
+    usage_id = kwargs.get('usage_id', None)
+    if None in (user_id, course_id, usage_id):
+        return
+
+    course_key = CourseKey.from_string(course_id)
+    usage_key = UsageKey.from_string(usage_id).map_into_course(course_key)
+    PersistentSubsectionGrade.invalidate(user_id, course_key, usage_key)
+
+
+@receiver(post_delete, sender=StudentModule)
+def invalidate_persistent_subsection_grades_on_delete(sender, instance, **kwargs):  # pylint: disable=unused-argument
+    """
+    Deleting a StudentModule (e.g. when an instructor deletes a student's
+    state for a problem) removes its score without a SCORE_CHANGED signal, so
+    persisted grades containing the block have to be dropped here as well.
+    """
+    if not settings.FEATURES.get('ENABLE_PERSISTENT_GRADES') or instance.grade is None:
+        return
+
+    usage_key = instance.module_state_key.map_into_course(instance.course_id)
+    PersistentSubsectionGrade.invalidate(instance.student_id, instance.course_id, usage_key)
@@ -30,6 +30,7 @@ from courseware.access import has_access, get_user_role
 from courseware.masquerade import (
     MasqueradingKeyValueStore,
     filter_displayed_blocks,
+    get_course_masquerade,
     is_masquerading_as_specific_student,
     setup_masquerade,
 )
@@ -42,16 +43,23 @@ from courseware.entrance_exams import (
 )
 from edxmako.shortcuts import render_to_string
 from eventtracking import tracker
+from lms.djangoapps.course_blocks.api import get_course_blocks
+from lms.djangoapps.course_blocks.transformers.start_date import StartDateTransformer
+from lms.djangoapps.course_blocks.transformers.table_of_contents import TableOfContentsTransformer
+from lms.djangoapps.course_blocks.transformers.user_partitions import UserPartitionTransformer
+from lms.djangoapps.course_blocks.transformers.visibility import VisibilityTransformer
 from lms.djangoapps.lms_xblock.field_data import LmsFieldData
 from lms.djangoapps.lms_xblock.runtime import LmsModuleSystem, unquote_slashes, quote_slashes
 from lms.djangoapps.lms_xblock.models import XBlockAsidesConfig
 from opaque_keys import InvalidKeyError
 from opaque_keys.edx.keys import UsageKey, CourseKey
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
+from openedx.core.lib.block_cache.exceptions import TransformerException
 from openedx.core.lib.xblock_utils import (
     replace_course_urls,
     replace_jump_to_id_urls,
     replace_static_urls,
+    replace_urls,
     add_staff_markup,
     wrap_xblock,
     request_token as xblock_request_token,
@@ -86,6 +94,17 @@ from .field_overrides import OverrideFieldData
 
 log = logging.getLogger(__name__)
 
+# The transformers of the course blocks that the table of contents is built
+# from. The ContentLibraryTransformer is left out, since library content
+# blocks are never chapters or sections, and transforming them selects
+# their children for the user.
+TOC_TRANSFORMERS = [
+    StartDateTransformer(),
+    UserPartitionTransformer(),
+    VisibilityTransformer(),
+    TableOfContentsTransformer(),
+]
+
 
 if settings.XQUEUE_INTERFACE.get('basic_auth') is not None:
     REQUESTS_AUTH = HTTPBasicAuth(*settings.XQUEUE_INTERFACE['basic_auth'])
@@ -143,8 +162,13 @@ def toc_for_course(user, request, course, active_chapter, active_section, field_
     NOTE: assumes that if we got this far, user has access to course.  Returns
     None if this is not the case.
 
-    field_data_cache must include data from the course module and 2 levels of its descendents
+    field_data_cache must include data from the course module and 2 levels of its descendents,
+    unless the table of contents can be built from the course blocks (see _cached_toc_for_course).
     '''
+    if settings.FEATURES.get('ENABLE_CACHED_TOC'):
+        toc_chapters = _cached_toc_for_course(user, request, course, active_chapter, active_section)
+        if toc_chapters is not None:
+            return toc_chapters
 
     with modulestore().bulk_operations(course.id):
         course_module = get_module_for_descriptor(
@@ -156,12 +180,7 @@ def toc_for_course(user, request, course, active_chapter, active_section, field_
         toc_chapters = list()
         chapters = course_module.get_display_items()
 
-        # See if the course is gated by one or more content milestones
-        required_content = milestones_helpers.get_required_content(course, user)
-
-        # The user may not actually have to complete the entrance exam, if one is required
-        if not user_must_complete_entrance_exam(request, user, course):
-            required_content = [content for content in required_content if not content == course.entrance_exam_id]
+        required_content = _get_required_content(request, user, course)
 
         for chapter in chapters:
             # Only show required content, if there is required content
@@ -192,58 +211,8 @@ def toc_for_course(user, request, course, active_chapter, active_section, field_
                         'graded': section.graded,
                     }
 
-                    #
-                    # Add in rendering context if exam is a timed exam (which includes proctored)
-                    #
-
-                    section_is_time_limited = (
-                        getattr(section, 'is_time_limited', False) and
-                        settings.FEATURES.get('ENABLE_SPECIAL_EXAMS', False)
-                    )
-                    if section_is_time_limited:
-                        # We need to import this here otherwise Lettuce test
-                        # harness fails. When running in 'harvest' mode, the
-                        # test service appears to get into trouble with
-                        # circular references (not sure which as edx_proctoring.api
-                        # doesn't import anything from edx-platform). Odd thing
-                        # is that running: manage.py lms runserver --settings=acceptance
-                        # works just fine, it's really a combination of Lettuce and the
-                        # 'harvest' management command
-                        #
-                        # One idea is that there is some coupling between
-                        # lettuce and the 'terrain' Djangoapps projects in /common
-                        # This would need more investigation
-                        from edx_proctoring.api import get_attempt_status_summary
-
-                        #
-                        # call into edx_proctoring subsystem
-                        # to get relevant proctoring information regarding this
-                        # level of the courseware
-                        #
-                        # This will return None, if (user, course_id, content_id)
-                        # is not applicable
-                        #
-                        timed_exam_attempt_context = None
-                        try:
-                            timed_exam_attempt_context = get_attempt_status_summary(
-                                user.id,
-                                unicode(course.id),
-                                unicode(section.location)
-                            )
-                        except Exception, ex:  # pylint: disable=broad-except
-                            # safety net in case something blows up in edx_proctoring
-                            # as this is just informational descriptions, it is better
-                            # to log and continue (which is safe) than to have it be an
-                            # unhandled exception
-                            log.exception(ex)
-
-                        if timed_exam_attempt_context:
-                            # yes, user has proctoring context about
-                            # this level of the courseware
-                            # so add to the accordion data context
-                            section_context.update({
-                                'proctoring': timed_exam_attempt_context,
-                            })
+                    if getattr(section, 'is_time_limited', False):
+                        _add_timed_exam_context(user, course, section.location, section_context)
 
                     sections.append(section_context)
             toc_chapters.append({
@@ -256,6 +225,141 @@ def toc_for_course(user, request, course, active_chapter, active_section, field_
         return toc_chapters
 
 
+def _cached_toc_for_course(user, request, course, active_chapter, active_section):
+    """
+    Returns the table of contents of toc_for_course, built from the course
+    blocks rather than from the course module and its descendants, or None
+    if it can't be built that way.
+
+    The user-independent fields of the chapters and sections are collected
+    by the TableOfContentsTransformer once per course version, and only
+    the access rules, milestones and timed exam attempts of the user are
+    applied here. The table of contents isn't built from the course blocks
+    when the user is masquerading or the course has field overrides, since
+    the cached fields and access rules don't take those into account.
+    """
+    if get_course_masquerade(user, course.id) is not None or OverrideFieldData.overrides_enabled_for(course):
+        return None
+    if not has_access(user, 'load', course, course.id):
+        return None
+
+    course_usage_key = modulestore().make_course_usage_key(course.id)
+    try:
+        block_structure = get_course_blocks(user, course_usage_key, transformers=TOC_TRANSFORMERS)
+    except TransformerException:
+        # The TableOfContentsTransformer isn't registered.
+        log.exception(u"Failed to load the table of contents of %s", course.id)
+        return None
+    chapters = TableOfContentsTransformer.get_toc(block_structure, course.subtree_edited_on)
+    if chapters is None:
+        # The course blocks were collected from a previous version of the
+        # course. They are cleared when the course is published.
+        return None
+
+    toc_chapters = list()
+    required_content = _get_required_content(request, user, course)
+
+    for chapter in chapters:
+        if chapter['hide_from_toc']:
+            continue
+        # Only show required content, if there is required content
+        if required_content and unicode(chapter['usage_key']) not in required_content:
+            continue
+
+        sections = list()
+        for section in chapter['sections']:
+            if section['hide_from_toc']:
+                continue
+            section_context = {
+                'display_name': section['display_name'],
+                'url_name': section['url_name'],
+                'format': section['format'] if section['format'] is not None else '',
+                'due': section['due'],
+                'active': chapter['url_name'] == active_chapter and section['url_name'] == active_section,
+                'graded': section['graded'],
+            }
+            if section['is_time_limited']:
+                _add_timed_exam_context(user, course, section['usage_key'], section_context)
+            sections.append(section_context)
+
+        toc_chapters.append({
+            'display_name': chapter['display_name'],
+            'display_id': slugify(chapter['display_name']),
+            'url_name': chapter['url_name'],
+            'sections': sections,
+            'active': chapter['url_name'] == active_chapter
+        })
+    return toc_chapters
+
+
+def _get_required_content(request, user, course):
+    """
+    Returns the locations of the chapters that the user is required to
+    complete before the rest of the course is shown, if any.
+    """
+    # See if the course is gated by one or more content milestones
+    required_content = milestones_helpers.get_required_content(course, user)
+
+    # The user may not actually have to complete the entrance exam, if one is required
+    if not user_must_complete_entrance_exam(request, user, course):
+        required_content = [content for content in required_content if not content == course.entrance_exam_id]
+    return required_content
+
+
+def _add_timed_exam_context(user, course, section_location, section_context):
+    """
+    Adds the user's attempt of the timed exam (which includes proctored) at
+    section_location to the rendering context of its section in the table
+    of contents.
+    """
+    if not settings.FEATURES.get('ENABLE_SPECIAL_EXAMS', False):
+        return
+
+    # We need to import this here otherwise Lettuce test
+    # harness fails. When running in 'harvest' mode, the
+    # test service appears to get into trouble with
+    # circular references (not sure which as edx_proctoring.api
+    # doesn't import anything from edx-platform). Odd thing
+    # is that running: manage.py lms runserver --settings=acceptance
+    # works just fine, it's really a combination of Lettuce and the
+    # 'harvest' management command
+    #
+    # One idea is that there is some coupling between
+    # lettuce and the 'terrain' Djangoapps projects in /common
+    # This would need more investigation
+    from edx_proctoring.api import get_attempt_status_summary
+
+    #
+    # call into edx_proctoring subsystem
+    # to get relevant proctoring information regarding this
+    # level of the courseware
+    #
+    # This will return None, if (user, course_id, content_id)
+    # is not applicable
+    #
+    timed_exam_attempt_context = None
+    try:
+        timed_exam_attempt_context = get_attempt_status_summary(
+            user.id,
+            unicode(course.id),
+            unicode(section_location)
+        )
+    except Exception, ex:  # pylint: disable=broad-except
+        # safety net in case something blows up in edx_proctoring
+        # as this is just informational descriptions, it is better
+        # to log and continue (which is safe) than to have it be an
+        # unhandled exception
+        log.exception(ex)
+
+    if timed_exam_attempt_context:
+        # yes, user has proctoring context about
+        # this level of the courseware
+        # so add to the accordion data context
+        section_context.update({
+            'proctoring': timed_exam_attempt_context,
+        })
+
+
 def get_module(user, request, usage_key, field_data_cache,
                position=None, log_if_not_found=True, wrap_xmodule_display=True,
                grade_bucket_type=None, depth=0,
@@ -633,28 +737,42 @@ def get_module_system_for_user(user, student_data,  # TODO  # pylint: disable=to
     # prefix is going to have to be specific to the module, not the directory
     # that the xml was loaded from
 
-    # Rewrite urls beginning in /static to point to course-specific content
-    block_wrappers.append(partial(
-        replace_static_urls,
-        getattr(descriptor, 'data_dir', None),
-        course_id=course_id,
-        static_asset_path=static_asset_path or descriptor.static_asset_path
-    ))
-
-    # Allow URLs of the form '/course/' refer to the root of multicourse directory
-    #   hierarchy of this course
-    block_wrappers.append(partial(replace_course_urls, course_id))
-
-    # this will rewrite intra-courseware links (/jump_to_id/<id>). This format
-    # is an improvement over the /course/... format for studio authored courses,
-    # because it is agnostic to course-hierarchy.
     # NOTE: module_id is empty string here. The 'module_id' will get assigned in the replacement
     # function, we just need to specify something to get the reverse() to work.
-    block_wrappers.append(partial(
-        replace_jump_to_id_urls,
-        course_id,
-        reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''}),
-    ))
+    jump_to_id_base_url = reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''})
+
+    if settings.FEATURES.get('ENABLE_SINGLE_PASS_URL_REWRITING'):
+        # Rewrite the /static, /course and /jump_to_id urls described below in
+        # a single pass, skipping the content of the children of the block,
+        # which has already been rewritten.
+        block_wrappers.append(partial(
+            replace_urls,
+            course_id,
+            jump_to_id_base_url,
+            getattr(descriptor, 'data_dir', None),
+            static_asset_path=static_asset_path or descriptor.static_asset_path
+        ))
+    else:
+        # Rewrite urls beginning in /static to point to course-specific content
+        block_wrappers.append(partial(
+            replace_static_urls,
+            getattr(descriptor, 'data_dir', None),
+            course_id=course_id,
+            static_asset_path=static_asset_path or descriptor.static_asset_path
+        ))
+
+        # Allow URLs of the form '/course/' refer to the root of multicourse directory
+        #   hierarchy of this course
+        block_wrappers.append(partial(replace_course_urls, course_id))
+
+        # this will rewrite intra-courseware links (/jump_to_id/<id>). This format
+        # is an improvement over the /course/... format for studio authored courses,
+        # because it is agnostic to course-hierarchy.
+        block_wrappers.append(partial(
+            replace_jump_to_id_urls,
+            course_id,
+            jump_to_id_base_url,
+        ))
 
     if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF'):
         if is_masquerading_as_specific_student(user, course_id):
@@ -720,7 +838,7 @@ def get_module_system_for_user(user, student_data,  # TODO  # pylint: disable=to
         replace_jump_to_id_urls=partial(
             static_replace.replace_jump_to_id_urls,
             course_id=course_id,
-            jump_to_id_base_url=reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''})
+            jump_to_id_base_url=jump_to_id_base_url
         ),
         node_path=settings.NODE_PATH,
         publish=publish,
@@ -0,0 +1,50 @@
+"""
+Asynchronous tasks for the courseware app.
+"""
+
+import logging
+
+from celery import task
+from dateutil.parser import parse as parse_datetime
+
+from courseware.models import StudentModule, StudentModuleHistory, chunks
+
+
+log = logging.getLogger(__name__)
+
+# Number of StudentModuleHistory entries inserted by one query.
+HISTORY_INSERT_BATCH_SIZE = 500
+
+
+@task  # pylint: disable=not-callable
+def write_student_module_history(entries):
+    """
+    Insert the StudentModuleHistory `entries` of a request (see
+    `courseware.models.send_student_module_history`).
+
+    Each entry is a dict of the fields of a StudentModuleHistory, with its
+    `created` datetime in ISO 8601 format. Entries of StudentModules that
+    have been deleted since are dropped.
+    """
+    existing_ids = set()
+    for student_module_ids in chunks(set(entry['student_module_id'] for entry in entries), HISTORY_INSERT_BATCH_SIZE):
+        existing_ids.update(
+            StudentModule.objects.filter(id__in=student_module_ids).values_list('id', flat=True)
+        )
+
+    history_entries = []
+    for entry in entries:
+        if entry['student_module_id'] not in existing_ids:
+            log.warning(u"Dropping history of deleted StudentModule %s", entry['student_module_id'])
+            continue
+        history_entries.append(StudentModuleHistory(
+            student_module_id=entry['student_module_id'],
+            version=entry['version'],
+            created=parse_datetime(entry['created']),
+            state=entry['state'],
+            grade=entry['grade'],
+            max_grade=entry['max_grade'],
+        ))
+
+    for batch in chunks(history_entries, HISTORY_INSERT_BATCH_SIZE):
+        StudentModuleHistory.objects.bulk_create(batch)
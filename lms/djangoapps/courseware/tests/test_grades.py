@@ -1,6 +1,8 @@
 """
 Test grade calculation.
 """
+from datetime import datetime, timedelta
+
 from django.http import Http404
 from django.test import TestCase
 from django.test.client import RequestFactory
@@ -9,15 +11,30 @@ from mock import patch, MagicMock
 from nose.plugins.attrib import attr
 from opaque_keys.edx.locations import SlashSeparatedCourseKey
 from opaque_keys.edx.locator import CourseLocator, BlockUsageLocator
-
-from courseware.grades import field_data_cache_for_grading, grade, iterate_grades_for, MaxScoresCache, ProgressSummary
+from pytz import UTC
+
+from capa.tests.response_xml_factory import OptionResponseXMLFactory
+from courseware.grades import (
+    course_grading_version,
+    field_data_cache_for_grading,
+    grade,
+    iterate_grades_for,
+    MaxScoresCache,
+    ProgressSummary,
+)
+from courseware.models import PersistentSubsectionGrade, SCORE_CHANGED
+from courseware.tests.factories import StudentModuleFactory
+from lms.djangoapps.course_blocks.api import get_course_blocks
 from student.tests.factories import UserFactory
 from student.models import CourseEnrollment
+from util.db import defer_after_commit_callbacks, discard_after_commit_callbacks, run_after_commit_callbacks
+from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
+from xmodule.partitions.partitions import Group, UserPartition
 
 
-def _grade_with_errors(student, request, course, keep_raw_scores=False):
+def _grade_with_errors(student, request, course, keep_raw_scores=False, **kwargs):
     """This fake grade method will throw exceptions for student3 and
     student4, but allow any other students to go through normal grading.
 
@@ -28,7 +45,7 @@ def _grade_with_errors(student, request, course, keep_raw_scores=False):
     if student.username in ['student3', 'student4']:
         raise Exception("I don't like {}".format(student.username))
 
-    return grade(student, request, course, keep_raw_scores=keep_raw_scores)
+    return grade(student, request, course, keep_raw_scores=keep_raw_scores, **kwargs)
 
 
 @attr('shard_1')
@@ -111,7 +128,61 @@ class TestGradeIteration(ModuleStoreTestCase):
         self.assertTrue(all_gradesets[student2])
         self.assertTrue(all_gradesets[student5])
 
+    def test_batched_grades_match_individual_grades(self):
+        """Grading students in batches gives the same grade summaries as
+        grading each of them on their own with grade()."""
+        course = self._create_graded_course()
+
+        unbatched = []
+        for student in self.students:
+            request = RequestFactory().get('/')
+            request.user = student
+            request.session = {}
+            unbatched.append((student, grade(student, request, course, keep_raw_scores=True), ""))
+
+        for batch_size in (1, 2, len(self.students)):
+            batched = list(iterate_grades_for(course, self.students, keep_raw_scores=True, batch_size=batch_size))
+            self.assertEqual(batched, unbatched)
+        self.assertEqual(
+            [gradeset['grade'] for __, gradeset, __ in unbatched],
+            [None, 'B', 'A', None, 'B'],
+        )
+
     ################################# Helpers #################################
+    def _create_graded_course(self):
+        """Create a course with one graded homework of two problems, which
+        the students have answered to different extents, and return it."""
+        course = CourseFactory.create()
+        course.grading_policy = {
+            "GRADER": [{"type": "Homework", "min_count": 1, "drop_count": 0, "short_label": "HW", "weight": 1.0}],
+            "GRADE_CUTOFFS": {"A": 0.75, "B": 0.25},
+        }
+        self.update_course(course, self.user.id)
+        chapter = ItemFactory.create(category='chapter', parent=course)
+        sequential = ItemFactory.create(category='sequential', parent=chapter, graded=True, format='Homework')
+        problem_xml = OptionResponseXMLFactory().build_xml(
+            question_text='The correct answer is Correct',
+            num_inputs=2,
+            options=['Correct', 'Incorrect'],
+            correct_option='Correct',
+        )
+        problems = [ItemFactory.create(category='problem', parent=sequential, data=problem_xml) for __ in range(2)]
+
+        # Student i answered the first i % 3 problems, scoring 1/2 on the
+        # first one and 2/2 on the second one.
+        for index, student in enumerate(self.students):
+            CourseEnrollment.enroll(student, course.id)
+            for problem_grade, problem in enumerate(problems[:index % 3], 1):
+                StudentModuleFactory.create(
+                    student=student,
+                    course_id=course.id,
+                    module_state_key=problem.location,
+                    state='{}',
+                    grade=problem_grade,
+                    max_grade=2,
+                )
+        return modulestore().get_course(course.id)
+
     def _gradesets_and_errors_for(self, course_id, students):
         """Simple helper method to iterate through student grades and give us
         two dictionaries -- one that has all students and their respective
@@ -168,6 +239,125 @@ class TestMaxScoresCache(ModuleStoreTestCase):
         # see cache is populated
         self.assertEqual(max_scores_cache.num_cached_from_remote(), 1)
 
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_MAX_SCORE_INDEX": True})
+    def test_precomputed_max_scores_are_loaded_once(self):
+        with patch('courseware.grades.get_course_blocks', wraps=get_course_blocks) as mock_get_course_blocks:
+            MaxScoresCache.create_for_course(self.course)
+            MaxScoresCache.create_for_course(self.course)
+        self.assertEqual(mock_get_course_blocks.call_count, 1)
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_MAX_SCORE_INDEX": True})
+    def test_stale_precomputed_max_scores(self):
+        with patch('courseware.grades.MaxScoresTransformer.get_max_scores', return_value=None):
+            with patch('lms.djangoapps.course_blocks.api.clear_block_cache') as mock_clear_block_cache:
+                max_scores_cache = MaxScoresCache.create_for_course(self.course)
+        self.assertFalse(mock_clear_block_cache.called)
+
+        # The problems' max scores are learned by grading instead.
+        max_scores_cache.fetch_from_remote(self.locations)
+        self.assertIsNone(max_scores_cache.get(self.locations[0]))
+
+
+@patch.dict("django.conf.settings.FEATURES", {"ENABLE_PERSISTENT_GRADES": True})
+class TestPersistentSubsectionGrades(ModuleStoreTestCase):
+    """
+    Tests for grading with persisted subsection grades.
+    """
+    def setUp(self):
+        super(TestPersistentSubsectionGrades, self).setUp()
+        self.student = UserFactory.create()
+        self.course = CourseFactory.create()
+        chapter = ItemFactory.create(category='chapter', parent=self.course)
+        self.sequential = ItemFactory.create(
+            category='sequential', parent=chapter, graded=True, format='Homework'
+        )
+        vertical = ItemFactory.create(category='vertical', parent=self.sequential)
+        self.problem = ItemFactory.create(category='problem', parent=vertical)
+
+        CourseEnrollment.enroll(self.student, self.course.id)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.student
+        self.request.session = {}
+
+    def _persisted_grades(self):
+        """Return the persisted grades of the student for the current course version."""
+        return PersistentSubsectionGrade.read_grades(
+            self.student.id, self.course.id, course_grading_version(self.course)
+        )
+
+    def test_grade_persists_subsections(self):
+        grade(self.student, self.request, self.course)
+        self.assertIn(self.sequential.location, self._persisted_grades())
+
+    def test_persisted_grades_skip_field_data_cache(self):
+        first_grade = grade(self.student, self.request, self.course)
+        with patch('courseware.grades.field_data_cache_for_grading') as mock_fdc:
+            second_grade = grade(self.student, self.request, self.course)
+        self.assertFalse(mock_fdc.called)
+        self.assertEqual(first_grade['percent'], second_grade['percent'])
+
+    def test_raw_scores_are_never_read_from_persisted_grades(self):
+        grade(self.student, self.request, self.course)
+        with patch('courseware.grades.field_data_cache_for_grading', wraps=field_data_cache_for_grading) as mock_fdc:
+            grade(self.student, self.request, self.course, keep_raw_scores=True)
+        self.assertTrue(mock_fdc.called)
+
+    def test_score_changed_invalidates_subsection(self):
+        grade(self.student, self.request, self.course)
+        SCORE_CHANGED.send(
+            sender=None,
+            points_possible=1,
+            points_earned=1,
+            user_id=self.student.id,
+            course_id=unicode(self.course.id),
+            usage_id=unicode(self.problem.location),
+        )
+        self.assertNotIn(self.sequential.location, self._persisted_grades())
+
+    def test_stale_version_is_ignored(self):
+        grade(self.student, self.request, self.course)
+        PersistentSubsectionGrade.objects.filter(user=self.student).update(course_version='stale')
+        self.assertEqual(self._persisted_grades(), {})
+        grade(self.student, self.request, self.course)
+        self.assertIn(self.sequential.location, self._persisted_grades())
+
+    def test_invalidation_during_grading_discards_grades(self):
+        def invalidate_during_grading(course, student):
+            """Invalidates the student's grades once the generation has been read."""
+            PersistentSubsectionGrade.invalidate(student.id, course.id, self.problem.location)
+            return field_data_cache_for_grading(course, student)
+
+        with patch('courseware.grades.field_data_cache_for_grading', side_effect=invalidate_during_grading):
+            grade(self.student, self.request, self.course)
+        self.assertNotIn(self.sequential.location, self._persisted_grades())
+
+    def test_invalidation_is_repeated_after_commit(self):
+        defer_after_commit_callbacks()
+        try:
+            PersistentSubsectionGrade.invalidate(self.student.id, self.course.id, self.problem.location)
+            # A concurrent request grades from the scores the transaction replaces.
+            grade(self.student, self.request, self.course)
+            self.assertIn(self.sequential.location, self._persisted_grades())
+            run_after_commit_callbacks()
+        finally:
+            discard_after_commit_callbacks()
+        self.assertNotIn(self.sequential.location, self._persisted_grades())
+
+    def test_unstarted_subsection_is_not_persisted(self):
+        self.sequential.start = datetime.now(UTC) + timedelta(days=1)
+        self.sequential = self.store.update_item(self.sequential, self.user.id)
+        self.course = self.store.get_course(self.course.id)
+        grade(self.student, self.request, self.course)
+        self.assertNotIn(self.sequential.location, self._persisted_grades())
+
+    def test_course_with_user_partitions_is_not_persisted(self):
+        self.course.user_partitions = [
+            UserPartition(0, 'first_partition', 'First Partition', [Group(0, 'alpha'), Group(1, 'beta')])
+        ]
+        self.course = self.store.update_item(self.course, self.user.id)
+        grade(self.student, self.request, self.course)
+        self.assertFalse(PersistentSubsectionGrade.objects.filter(user=self.student).exists())
+
 
 class TestFieldDataCacheScorableLocations(ModuleStoreTestCase):
     """
@@ -3,13 +3,19 @@ Tests for courseware middleware
 """
 
 from django.core.urlresolvers import reverse
+from django.db import DatabaseError
+from django.test import TestCase
 from django.test.client import RequestFactory
-from django.http import Http404
+from django.http import Http404, HttpResponse
 from mock import patch
 from nose.plugins.attrib import attr
 
 import courseware.courses as courses
-from courseware.middleware import RedirectUnenrolledMiddleware
+from courseware.middleware import RedirectUnenrolledMiddleware, UserStateWriteBufferMiddleware
+from courseware.models import StudentModule, StudentModuleHistory
+from courseware.tests.factories import StudentModuleFactory, UserFactory
+from courseware.user_state_client import DjangoXBlockUserStateClient
+from util.middleware import AfterCommitMiddleware
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from xmodule.modulestore.tests.factories import CourseFactory
 
@@ -52,3 +58,104 @@ class CoursewareMiddlewareTestCase(ModuleStoreTestCase):
             request, Http404()
         )
         self.assertIsNone(response)
+
+
+@attr('shard_1')
+class UserStateWriteBufferMiddlewareTestCase(ModuleStoreTestCase):
+    """Tests that user state writes are buffered until the end of the request"""
+
+    def setUp(self):
+        super(UserStateWriteBufferMiddlewareTestCase, self).setUp()
+        self.course = CourseFactory.create()
+        self.user = UserFactory.create()
+        self.block_key = self.course.id.make_usage_key('problem', 'block')
+        self.middleware = UserStateWriteBufferMiddleware()
+        self.request = RequestFactory().get("dummy_url")
+        self.addCleanup(self.middleware.process_response, self.request, None)
+
+    def _set_state_in_request(self):
+        """Store some user state between the start of a request and the end of its view."""
+        self.middleware.process_request(self.request)
+        DjangoXBlockUserStateClient(self.user).set_many(self.user.username, {self.block_key: {'a': 1}})
+        return StudentModule.objects.filter(student=self.user).exists()
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_USER_STATE_WRITE_BUFFER": True})
+    def test_writes_at_end_of_request(self):
+        self.assertFalse(self._set_state_in_request())
+        self.middleware.process_response(self.request, None)
+        self.assertTrue(StudentModule.objects.filter(student=self.user).exists())
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_USER_STATE_WRITE_BUFFER": True})
+    def test_writes_on_exception(self):
+        self.assertFalse(self._set_state_in_request())
+        self.middleware.process_exception(self.request, Http404())
+        self.assertTrue(StudentModule.objects.filter(student=self.user).exists())
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_USER_STATE_WRITE_BUFFER": True})
+    def test_write_failure_rolls_back_request(self):
+        self._set_state_in_request()
+        with patch('courseware.user_state_client.StudentModule.objects.select_for_update', side_effect=DatabaseError):
+            with patch('courseware.middleware.transaction.rollback') as mock_rollback:
+                response = self.middleware.process_response(self.request, HttpResponse())
+        self.assertEqual(response.status_code, 500)
+        self.assertTrue(mock_rollback.called)
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_USER_STATE_WRITE_BUFFER": True})
+    def test_write_failure_on_exception(self):
+        self._set_state_in_request()
+        with patch('courseware.user_state_client.StudentModule.objects.select_for_update', side_effect=DatabaseError):
+            self.assertIsNone(self.middleware.process_exception(self.request, Http404()))
+
+    def test_disabled(self):
+        self.assertTrue(self._set_state_in_request())
+
+
+@attr('shard_1')
+class AsyncStudentModuleHistoryTestCase(TestCase):
+    """Tests that StudentModuleHistory entries are inserted after the request is committed"""
+
+    def setUp(self):
+        super(AsyncStudentModuleHistoryTestCase, self).setUp()
+        self.middleware = AfterCommitMiddleware()
+        self.request = RequestFactory().get("dummy_url")
+        self.addCleanup(self.middleware.process_response, self.request, None)
+
+    def _save_problem_state_in_request(self):
+        """Save a problem's state between the start of a request and the end of its view."""
+        self.middleware.process_request(self.request)
+        student_module = StudentModuleFactory.create(module_type='problem', state='{"a": 1}')
+        student_module.state = '{"a": 2}'
+        student_module.save()
+        return StudentModuleHistory.objects.filter(student_module=student_module)
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_ASYNC_STUDENT_MODULE_HISTORY": True})
+    def test_history_inserted_after_request(self):
+        history = self._save_problem_state_in_request()
+        self.assertFalse(history.exists())
+
+        self.middleware.process_response(self.request, None)
+        self.assertEqual([entry.state for entry in history.order_by('id')], ['{"a": 1}', '{"a": 2}'])
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_ASYNC_STUDENT_MODULE_HISTORY": True})
+    def test_history_inserted_when_task_cannot_be_sent(self):
+        history = self._save_problem_state_in_request()
+        with patch('courseware.tasks.write_student_module_history.apply_async', side_effect=IOError):
+            self.middleware.process_response(self.request, None)
+        self.assertEqual([entry.state for entry in history.order_by('id')], ['{"a": 1}', '{"a": 2}'])
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_ASYNC_STUDENT_MODULE_HISTORY": True})
+    def test_history_discarded_on_exception(self):
+        history = self._save_problem_state_in_request()
+        self.middleware.process_exception(self.request, Http404())
+        self.middleware.process_response(self.request, None)
+        self.assertFalse(history.exists())
+
+    @patch.dict("django.conf.settings.FEATURES", {"ENABLE_ASYNC_STUDENT_MODULE_HISTORY": True})
+    def test_history_of_deleted_module_dropped(self):
+        self._save_problem_state_in_request()
+        StudentModule.objects.all().delete()
+        self.middleware.process_response(self.request, None)
+        self.assertFalse(StudentModuleHistory.objects.exists())
+
+    def test_disabled(self):
+        self.assertEqual(self._save_problem_state_in_request().count(), 2)
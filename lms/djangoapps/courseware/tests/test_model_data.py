@@ -6,7 +6,9 @@ from mock import Mock, patch
 from nose.plugins.attrib import attr
 from functools import partial
 
-from courseware.model_data import DjangoKeyValueStore, FieldDataCache, InvalidScopeError
+from courseware.model_data import (
+    DjangoKeyValueStore, FieldDataCache, InvalidScopeError, prefetch_student_modules, ScoresClient
+)
 from courseware.models import StudentModule, XModuleUserStateSummaryField
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
@@ -221,6 +223,36 @@ class TestStudentModuleStorage(OtherUserFailureTestMixin, TestCase):
         self.assertEquals(exception_context.exception.saved_field_names, [])
 
 
+@attr('shard_1')
+class TestPrefetchedStudentModuleStorage(TestCase):
+    """Tests for user_state storage built from prefetched StudentModules"""
+
+    def setUp(self):
+        super(TestPrefetchedStudentModuleStorage, self).setUp()
+        student_module = StudentModuleFactory(state=json.dumps({'a_field': 'a_value'}), grade=1, max_grade=2)
+        self.user = student_module.student
+        self.assertEqual(self.user.id, 1)   # check our assumption hard-coded in the key functions above.
+        self.student_modules = prefetch_student_modules(course_id, [self.user.id], ['problem'])
+
+    def test_field_data_cache_does_not_query_user_state(self):
+        with self.assertNumQueries(0):
+            field_data_cache = FieldDataCache.cache_for_prefetched_descriptors(
+                course_id,
+                self.user,
+                [mock_descriptor([mock_field(Scope.user_state, 'a_field')])],
+                self.student_modules[self.user.id],
+            )
+        kvs = DjangoKeyValueStore(field_data_cache)
+        self.assertEquals('a_value', kvs.get(user_state_key('a_field')))
+
+    def test_scores_client(self):
+        with self.assertNumQueries(0):
+            scores_client = ScoresClient.from_student_modules(
+                course_id, self.user.id, self.student_modules[self.user.id], [location('usage_id')]
+            )
+        self.assertEqual(scores_client.get(location('usage_id')), ScoresClient.Score(1, 2))
+
+
 @attr('shard_1')
 class TestMissingStudentModule(TestCase):
     def setUp(self):
@@ -55,6 +55,7 @@ from openedx.core.djangoapps.credit.api import (
     set_credit_requirements,
     set_credit_requirement_status
 )
+from openedx.core.lib.block_cache.exceptions import TransformerException
 
 from edx_proctoring.api import (
     create_exam,
@@ -700,6 +701,105 @@ class TestTOC(ModuleStoreTestCase):
                 self.assertIn(toc_section, actual)
 
 
+@attr('shard_1')
+@ddt.ddt
+class TestCachedTOC(ModuleStoreTestCase):
+    """
+    Check the Table of Contents for a course, as built from the course blocks.
+    """
+    def setUp(self):
+        super(TestCachedTOC, self).setUp()
+        self.course = CourseFactory.create()
+        self.chapter = ItemFactory.create(parent=self.course, category='chapter', display_name='Week 1')
+        self.section = ItemFactory.create(
+            parent=self.chapter, category='sequential', display_name='Lesson 1', format='Homework', graded=True
+        )
+        ItemFactory.create(parent=self.section, category='html')
+        self.hidden_section = ItemFactory.create(
+            parent=self.chapter, category='sequential', display_name='Hidden', hide_from_toc=True
+        )
+        self.staff_only_chapter = ItemFactory.create(
+            parent=self.course, category='chapter', display_name='Staff only', visible_to_staff_only=True
+        )
+        ItemFactory.create(parent=self.staff_only_chapter, category='sequential')
+        self.course = self.store.get_course(self.course.id, depth=2)
+        self.request = RequestFactory().get('/')
+        self.request.user = UserFactory()
+
+    def _toc_for_course(self, user=None):
+        """
+        Returns the table of contents of the course for the given user, or
+        the user of the request, with the first section active.
+        """
+        user = user or self.request.user
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(self.course.id, user, self.course, depth=2)
+        return render.toc_for_course(
+            user, self.request, self.course, self.chapter.url_name, self.section.url_name, field_data_cache
+        )
+
+    @ddt.data(False, True)
+    def test_same_toc(self, staff):
+        user = GlobalStaffFactory() if staff else self.request.user
+        expected = self._toc_for_course(user)
+        with patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True}):
+            with patch('courseware.module_render.get_module_for_descriptor') as mock_get_module:
+                actual = self._toc_for_course(user)
+        self.assertFalse(mock_get_module.called)
+        self.assertEqual(actual, expected)
+        self.assertEqual(len(actual), 2 if staff else 1)
+        self.assertEqual(actual[0]['sections'], [{
+            'display_name': u'Lesson 1',
+            'url_name': self.section.url_name,
+            'format': u'Homework',
+            'due': None,
+            'active': True,
+            'graded': True,
+        }])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True})
+    def test_cached_toc(self):
+        self._toc_for_course()
+        # The outline of the course is only read from the modulestore once,
+        # and the table of contents doesn't need a FieldDataCache.
+        with check_mongo_calls(0):
+            toc = render.toc_for_course(self.request.user, self.request, self.course, None, None, None)
+        self.assertEqual([chapter['display_name'] for chapter in toc], [u'Week 1'])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True})
+    def test_outdated_course_blocks(self):
+        expected = self._toc_for_course()
+        with patch('courseware.module_render.TableOfContentsTransformer.get_toc', return_value=None):
+            with patch('courseware.module_render.get_module_for_descriptor', wraps=get_module_for_descriptor) as mock:
+                self.assertEqual(self._toc_for_course(), expected)
+        self.assertTrue(mock.called)
+
+        # The outdated course blocks are left in the cache.
+        with check_mongo_calls(0):
+            render.toc_for_course(self.request.user, self.request, self.course, None, None, None)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True})
+    @patch('courseware.module_render.get_course_blocks', Mock(side_effect=TransformerException))
+    def test_unregistered_transformer(self):
+        with patch('courseware.module_render.get_module_for_descriptor', wraps=get_module_for_descriptor) as mock:
+            toc = self._toc_for_course()
+        self.assertTrue(mock.called)
+        self.assertEqual([chapter['display_name'] for chapter in toc], [u'Week 1'])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True})
+    def test_masquerade(self):
+        self.request.user.masquerade_settings = {self.course.id: Mock()}
+        with patch('courseware.module_render.get_course_blocks') as mock_get_course_blocks:
+            self._toc_for_course()
+        self.assertFalse(mock_get_course_blocks.called)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_CACHED_TOC': True})
+    @patch('courseware.module_render.OverrideFieldData.overrides_enabled_for', Mock(return_value=True))
+    def test_field_overrides(self):
+        with patch('courseware.module_render.get_course_blocks') as mock_get_course_blocks:
+            self._toc_for_course()
+        self.assertFalse(mock_get_course_blocks.called)
+
+
 @attr('shard_1')
 @ddt.ddt
 @patch.dict('django.conf.settings.FEATURES', {'ENABLE_SPECIAL_EXAMS': True})
@@ -1170,6 +1270,15 @@ class TestHtmlModifiers(ModuleStoreTestCase):
         )
 
 
+@attr('shard_1')
+@patch.dict(settings.FEATURES, {'ENABLE_SINGLE_PASS_URL_REWRITING': True})
+class TestHtmlModifiersSinglePassRewriting(TestHtmlModifiers):
+    """
+    Tests the modifications to the output of student_view with the urls
+    rewritten in a single pass.
+    """
+
+
 class XBlockWithJsonInitData(XBlock):
     """
     Pure XBlock to use in tests, with JSON init data.
@@ -3,13 +3,21 @@ Black-box tests of the DjangoUserStateClient against the semantics
 defined in edx_user_state_client.
 """
 
+import json
 from collections import defaultdict
-from unittest import skip
 
+from django.db.models.signals import post_save
 from django.test import TestCase
+from opaque_keys.edx.locator import CourseLocator
 
 from edx_user_state_client.tests import UserStateClientTestBase
-from courseware.user_state_client import DjangoXBlockUserStateClient
+from courseware.models import StudentModule, StudentModuleHistory
+from courseware.user_state_client import (
+    DjangoXBlockUserStateClient,
+    flush_buffered_writes,
+    start_buffering_writes,
+    stop_buffering_writes,
+)
 from courseware.tests.factories import UserFactory
 
 
@@ -32,36 +40,118 @@ class TestDjangoUserStateClient(UserStateClientTestBase, TestCase):
         self.client = DjangoXBlockUserStateClient()
         self.users = defaultdict(UserFactory.create)
 
-    # We're skipping these tests because the iter_all_by_block and iter_all_by_course
-    # are not implemented in the DjangoXBlockUserStateClient
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_blocks_deleted_block(self):
-        pass
+    def test_iter_blocks_in_batches(self):
+        for user in range(5):
+            self.set_many(user, {0: {'a': user}})
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_blocks_empty(self):
-        pass
+        # Two full batches, and the last one, which is known to be the end.
+        with self.assertNumQueries(3):
+            states = list(self.client.iter_all_for_block(self._block(0), batch_size=2))
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_blocks_many_users(self):
-        pass
+        self.assertEqual(
+            [(item.username, item.state) for item in states],
+            [(self._user(user), {'a': user}) for user in range(5)]
+        )
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_blocks_single_user(self):
-        pass
+    def test_iter_course_in_batches(self):
+        for user in range(3):
+            self.set_many(user, {0: {'a': user}, 1: {'b': user}})
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_course_deleted_block(self):
-        pass
+        states = list(self.client.iter_all_for_course(self._course(0), batch_size=2))
+        self.assertEqual(len(states), 6)
+        self.assertEqual(
+            set((item.username, item.block_key) for item in states),
+            set((self._user(user), self._block(block)) for user in range(3) for block in range(2))
+        )
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_course_empty(self):
-        pass
 
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_course_single_user(self):
-        pass
-
-    @skip("Not supported by DjangoXBlockUserStateClient")
-    def test_iter_course_many_users(self):
-        pass
+class TestBufferedWrites(TestCase):
+    """
+    Tests of buffering the writes of DjangoXBlockUserStateClient.
+    """
+    def setUp(self):
+        super(TestBufferedWrites, self).setUp()
+        self.user = UserFactory.create()
+        self.client = DjangoXBlockUserStateClient(self.user)
+        self.block_key = CourseLocator('org', 'course', 'run').make_usage_key('problem', 'block')
+        start_buffering_writes()
+        self.addCleanup(stop_buffering_writes)
+
+    def _stored_state(self):
+        """Return the state stored in the database for the test block."""
+        return json.loads(StudentModule.objects.get(student=self.user, module_state_key=self.block_key).state)
+
+    def _set(self, state, client=None):
+        """Store `state` for the test block."""
+        (client or self.client).set_many(self.user.username, {self.block_key: state})
+
+    def test_writes_are_coalesced(self):
+        with self.assertNumQueries(0):
+            self._set({'a': 1})
+            self._set({'b': 2})
+            self._set({'a': 3})
+        self.assertFalse(StudentModule.objects.filter(student=self.user).exists())
+
+        stop_buffering_writes()
+        self.assertEqual(self._stored_state(), {'a': 3, 'b': 2})
+        self.assertEqual(StudentModuleHistory.objects.filter(student_module__student=self.user).count(), 1)
+
+    def test_buffered_fields_are_merged_into_stored_state(self):
+        self._set({'a': 1, 'b': 1})
+        flush_buffered_writes()
+        self._set({'b': 2})
+
+        self.assertEqual(self.client.get(self.user.username, self.block_key).state, {'a': 1, 'b': 2})
+        self.assertEqual(self.client.get(self.user.username, self.block_key, fields=['b']).state, {'b': 2})
+        self.assertEqual(self._stored_state(), {'a': 1, 'b': 1})
+
+        flush_buffered_writes()
+        self.assertEqual(self._stored_state(), {'a': 1, 'b': 2})
+
+    def test_buffered_state_is_copied(self):
+        value = [1]
+        self._set({'a': value})
+        value.append(2)
+        self.client.get(self.user.username, self.block_key).state['a'].append(3)
+
+        flush_buffered_writes()
+        self.assertEqual(self._stored_state(), {'a': [1]})
+
+    def test_delete_flushes_buffered_fields(self):
+        self._set({'a': 1, 'b': 1})
+        self.client.delete(self.user.username, self.block_key, fields=['a'])
+
+        self.assertEqual(self._stored_state(), {'b': 1})
+        self.assertEqual(self.client.get(self.user.username, self.block_key).state, {'b': 1})
+
+    def test_unbuffered_client_writes_immediately(self):
+        self._set({'a': 1, 'b': 1})
+        self._set({'b': 2}, client=DjangoXBlockUserStateClient(self.user, buffer_writes=False))
+
+        self.assertEqual(self._stored_state(), {'a': 1, 'b': 2})
+        stop_buffering_writes()
+        self.assertEqual(self._stored_state(), {'a': 1, 'b': 2})
+
+    def test_writes_are_immediate_without_buffering(self):
+        stop_buffering_writes()
+        self._set({'a': 1})
+        self.assertEqual(self._stored_state(), {'a': 1})
+
+    def test_flush_writes_in_primary_key_order(self):
+        course_key = self.block_key.course_key
+        block_keys = [course_key.make_usage_key('problem', name) for name in ('new', 'second', 'first')]
+        for block_key in reversed(block_keys[1:]):
+            StudentModule.objects.create(student=self.user, course_id=course_key, module_state_key=block_key)
+
+        saved = []
+
+        def record_save(sender, instance, **kwargs):  # pylint: disable=unused-argument
+            """Record the order in which the StudentModules are saved."""
+            saved.append(instance.module_state_key)
+
+        post_save.connect(record_save, sender=StudentModule, weak=False)
+        self.addCleanup(post_save.disconnect, record_save, sender=StudentModule)
+
+        self.client.set_many(self.user.username, {block_key: {'a': 1} for block_key in block_keys})
+        flush_buffered_writes()
+        self.assertEqual(saved, list(reversed(block_keys)))
@@ -1,9 +1,16 @@
 """
 An implementation of :class:`XBlockUserStateClient`, which stores XBlock Scope.user_state
 data in a Django ORM model.
+
+Writes can be buffered for the duration of a request (see :func:`start_buffering_writes`),
+so that a block whose state is stored several times in a request is written only once.
 """
 
+import copy
 import itertools
+import logging
+import threading
+from collections import OrderedDict
 from operator import attrgetter
 from time import time
 
@@ -14,13 +21,93 @@ except ImportError:
 
 import dogstats_wrapper as dog_stats_api
 from django.contrib.auth.models import User
+from django.db import DatabaseError
+from django.utils import timezone
 from xblock.fields import Scope, ScopeBase
 from courseware.models import StudentModule, StudentModuleHistory
 from edx_user_state_client.interface import XBlockUserStateClient, XBlockUserState
+from opaque_keys.edx.keys import CourseKey, UsageKey
 
 from openedx.core.djangoapps.call_stack_manager import donottrack
 
 
+log = logging.getLogger(__name__)
+
+
+class _WriteBuffer(threading.local):
+    """
+    The user state writes buffered by the current thread.
+    """
+    def __init__(self):
+        super(_WriteBuffer, self).__init__()
+        self.active = False
+        # Maps (username, block_key) to the (state, updated) of the fields
+        # stored since the last flush, in the order they were first stored.
+        self.pending = OrderedDict()
+        # Maps usernames to the already-loaded users they belong to.
+        self.users = {}
+
+
+_WRITE_BUFFER = _WriteBuffer()
+
+
+def start_buffering_writes():
+    """
+    Buffer the user state stored by DjangoXBlockUserStateClient in this thread,
+    until :func:`stop_buffering_writes` is called.
+
+    While writes are buffered, storing fields of a block only records them in
+    memory, and all the fields stored for the block are written to its
+    StudentModule in one save when the buffer is flushed. Reads made through
+    DjangoXBlockUserStateClient in the meantime see the buffered fields.
+    """
+    flush_buffered_writes()
+    _WRITE_BUFFER.active = True
+
+
+def stop_buffering_writes():
+    """
+    Write the buffered user state, and stop buffering writes in this thread.
+    """
+    _WRITE_BUFFER.active = False
+    flush_buffered_writes()
+
+
+def flush_buffered_writes(username=None):
+    """
+    Write the user state buffered in this thread, or only that of the user
+    named ``username`` if it is given.
+
+    The StudentModule of each block is selected for update before the buffered
+    fields are merged into its stored state, so that fields stored concurrently
+    by another request aren't lost. Users are written in username order, and
+    the StudentModules of each user in primary key order, so that concurrent
+    flushes lock them in the same order.
+    """
+    if username is None:
+        pending, _WRITE_BUFFER.pending = _WRITE_BUFFER.pending, OrderedDict()
+    else:
+        pending = OrderedDict()
+        for key in [key for key in _WRITE_BUFFER.pending if key[0] == username]:
+            pending[key] = _WRITE_BUFFER.pending.pop(key)
+
+    by_username = OrderedDict()
+    for (block_username, block_key), (state, _updated) in pending.iteritems():
+        by_username.setdefault(block_username, {})[block_key] = state
+
+    error = None
+    for block_username, block_keys_to_state in sorted(by_username.iteritems()):
+        client = DjangoXBlockUserStateClient(_WRITE_BUFFER.users.pop(block_username, None))
+        try:
+            client._write_many(block_username, block_keys_to_state, for_update=True)  # pylint: disable=protected-access
+        except DatabaseError as exc:
+            log.exception("Writing buffered user state failed for %s", block_username)
+            error = error or exc
+
+    if error is not None:
+        raise error
+
+
 class DjangoXBlockUserStateClient(XBlockUserStateClient):
     """
     An interface that uses the Django ORM StudentModule as a backend.
@@ -44,6 +131,9 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
     # Use this sample rate for DataDog events.
     API_DATADOG_SAMPLE_RATE = 0.1
 
+    # The number of rows fetched at a time by iter_all_for_block and iter_all_for_course.
+    ITER_BATCH_SIZE = 1000
+
     class ServiceUnavailable(XBlockUserStateClient.ServiceUnavailable):
         """
         This error is raised if the service backing this client is currently unavailable.
@@ -62,14 +152,18 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
         """
         pass
 
-    def __init__(self, user=None):
+    def __init__(self, user=None, buffer_writes=True):
         """
         Arguments:
             user (:class:`~User`): An already-loaded django user. If this user matches the username
                 supplied to `set_many`, then that will reduce the number of queries made to store
                 the user state.
+            buffer_writes (bool): Whether `set_many` may buffer its writes while buffering is
+                on (see :func:`start_buffering_writes`). If False, they are always written
+                immediately.
         """
         self.user = user
+        self.buffer_writes = buffer_writes
 
     @donottrack(StudentModule, StudentModuleHistory)
     def _get_student_modules(self, username, block_keys):
@@ -142,30 +236,50 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
 
         self._ddog_histogram(evt_time, 'get_many.blks_requested', len(block_keys))
 
+        # The fields buffered for these blocks are overlaid over their stored state.
+        # They are copied, so that changes made by the caller stay out of the buffer.
+        buffered = {
+            block_key: copy.deepcopy(_WRITE_BUFFER.pending[(username, block_key)])
+            for block_key in block_keys
+            if (username, block_key) in _WRITE_BUFFER.pending
+        }
+
         modules = self._get_student_modules(username, block_keys)
         for module, usage_key in modules:
+            buffered_state, buffered_time = buffered.pop(usage_key, (None, None))
+
             if module.state is None:
                 self._ddog_increment(evt_time, 'get_many.empty_state')
-                continue
+                if buffered_state is None:
+                    continue
+                state = {}
+            else:
+                state = json.loads(module.state)
+                state_length += len(module.state)
 
-            state = json.loads(module.state)
-            state_length += len(module.state)
+                self._ddog_histogram(evt_time, 'get_many.block_size', len(module.state))
 
-            self._ddog_histogram(evt_time, 'get_many.block_size', len(module.state))
+            modified = module.modified
+            if buffered_state is not None:
+                state.update(buffered_state)
+                modified = buffered_time
 
             # If the state is the empty dict, then it has been deleted, and so
             # conformant UserStateClients should treat it as if it doesn't exist.
             if state == {}:
                 continue
 
-            if fields is not None:
-                state = {
-                    field: state[field]
-                    for field in fields
-                    if field in state
-                }
             block_count += 1
-            yield XBlockUserState(username, usage_key, state, module.modified, scope)
+            yield XBlockUserState(username, usage_key, self._select_fields(state, fields), modified, scope)
+
+        # Blocks whose state has only been buffered so far.
+        for usage_key, (buffered_state, buffered_time) in buffered.iteritems():
+            if buffered_state == {}:
+                continue
+            block_count += 1
+            yield XBlockUserState(
+                username, usage_key, self._select_fields(buffered_state, fields), buffered_time, scope
+            )
 
         # The rest of this method exists only to submit DataDog events.
         # Remove it once we're no longer interested in the data.
@@ -173,6 +287,19 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
         self._ddog_histogram(evt_time, 'get_many.blks_out', block_count)
         self._ddog_histogram(evt_time, 'get_many.response_time', (finish_time - evt_time) * 1000)
 
+    @staticmethod
+    def _select_fields(state, fields):
+        """
+        Return the fields of ``state`` named in ``fields``, or all of them if ``fields`` is None.
+        """
+        if fields is None:
+            return state
+        return {
+            field: state[field]
+            for field in fields
+            if field in state
+        }
+
     @donottrack(StudentModule, StudentModuleHistory)
     def set_many(self, username, block_keys_to_state, scope=Scope.user_state):
         """
@@ -189,6 +316,47 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
         if scope != Scope.user_state:
             raise ValueError("Only Scope.user_state is supported")
 
+        if not _WRITE_BUFFER.active:
+            self._write_many(username, block_keys_to_state)
+        elif self.buffer_writes:
+            self._buffer_many(username, block_keys_to_state)
+        else:
+            # Write whatever is buffered for the user first, so that it doesn't
+            # overwrite these fields when it is flushed.
+            flush_buffered_writes(username)
+            self._write_many(username, block_keys_to_state)
+
+    def _buffer_many(self, username, block_keys_to_state):
+        """
+        Record the fields in ``block_keys_to_state`` in the write buffer, merged
+        into the fields already buffered for the same blocks.
+        """
+        evt_time = time()
+        updated = timezone.now()
+        for usage_key, state in block_keys_to_state.items():
+            # Store a copy, as it would be read back from the database, so that
+            # values changed by the caller later on aren't written.
+            state = json.loads(json.dumps(state))
+            key = (username, usage_key)
+            if key in _WRITE_BUFFER.pending:
+                buffered_state = _WRITE_BUFFER.pending[key][0]
+                buffered_state.update(state)
+                state = buffered_state
+            _WRITE_BUFFER.pending[key] = (state, updated)
+
+        if self.user is not None and self.user.username == username:
+            _WRITE_BUFFER.users[username] = self.user
+
+        self._ddog_histogram(evt_time, 'set_many.blks_buffered', len(block_keys_to_state))
+
+    def _write_many(self, username, block_keys_to_state, for_update=False):
+        """
+        Write the fields in ``block_keys_to_state`` to the StudentModules of the user
+        named ``username``, as described in :meth:`set_many`.
+
+        If ``for_update`` is true, existing StudentModules are selected for update,
+        all at once and in primary key order, and are then written in that order.
+        """
         # We do a find_or_create for every block (rather than re-using field objects
         # that were queried in get_many) so that if the score has
         # been changed by some other piece of the code, we don't overwrite
@@ -199,9 +367,25 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
             user = User.objects.get(username=username)
 
         evt_time = time()
+        usage_keys = block_keys_to_state.keys()
+        if for_update:
+            student_modules = StudentModule.objects.select_for_update()
+            # Old mongo locations are stored without their course run.
+            locked_ids = {
+                UsageKey.from_string(location).map_into_course(CourseKey.from_string(course_id)): student_module_id
+                for student_module_id, location, course_id in student_modules.filter(
+                    student=user,
+                    module_state_key__in=usage_keys,
+                ).order_by('id').values_list('id', 'module_state_key', 'course_id')
+            }
+            # Blocks without a StudentModule yet are created last.
+            usage_keys.sort(key=lambda usage_key: (locked_ids.get(usage_key, float('inf')), unicode(usage_key)))
+        else:
+            student_modules = StudentModule.objects
 
-        for usage_key, state in block_keys_to_state.items():
-            student_module, created = StudentModule.objects.get_or_create(
+        for usage_key in usage_keys:
+            state = block_keys_to_state[usage_key]
+            student_module, created = student_modules.get_or_create(
                 student=user,
                 course_id=usage_key.course_key,
                 module_state_key=usage_key,
@@ -272,6 +456,9 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
 
         self._ddog_histogram(evt_time, 'delete_many.block_count', len(block_keys))
 
+        # Fields still buffered would come back when they are flushed.
+        flush_buffered_writes(username)
+
         student_modules = self._get_student_modules(username, block_keys)
         for student_module, _ in student_modules:
             if fields is None:
@@ -311,6 +498,8 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
 
         if scope != Scope.user_state:
             raise ValueError("Only Scope.user_state is supported")
+
+        flush_buffered_writes(username)
         student_modules = list(
             student_module
             for student_module, usage_id
@@ -319,9 +508,11 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
         if len(student_modules) == 0:
             raise self.DoesNotExist()
 
+        # History entries may be inserted out of order when they are written
+        # asynchronously, so they are ordered by when they were created.
         history_entries = StudentModuleHistory.objects.prefetch_related('student_module').filter(
             student_module__in=student_modules
-        ).order_by('-id')
+        ).order_by('-created', '-id')
 
         # If no history records exist, raise an error
         if not history_entries:
@@ -346,24 +537,84 @@ class DjangoXBlockUserStateClient(XBlockUserStateClient):
 
             yield XBlockUserState(username, block_key, state, history_entry.created, scope)
 
+    def _iter_student_modules(self, query, batch_size=None):
+        """
+        Yield the :class:`~StudentModule`s matched by ``query``, along with their students,
+        in order of id.
+
+        The rows are fetched ``batch_size`` at a time, each batch starting after the
+        last id of the previous one rather than at an OFFSET, so that every batch is
+        equally cheap to fetch, however far into the query it is, and only one batch
+        is held in memory at a time.
+        """
+        if batch_size is None:
+            batch_size = self.ITER_BATCH_SIZE
+
+        query = query.select_related('student').order_by('id')
+        last_id = None
+        while True:
+            batch_query = query if last_id is None else query.filter(id__gt=last_id)
+            batch = list(batch_query[:batch_size])
+            if not batch:
+                return
+
+            for student_module in batch:
+                yield student_module
+
+            if len(batch) < batch_size:
+                return
+            last_id = batch[-1].id
+
+    def _iter_user_states(self, query, scope, batch_size=None):
+        """
+        Yield an XBlockUserState for each of the :class:`~StudentModule`s matched by ``query``
+        that has stored state.
+        """
+        for student_module in self._iter_student_modules(query, batch_size):
+            if student_module.state is None:
+                continue
+
+            state = json.loads(student_module.state)
+
+            # If the state is the empty dict, then it has been deleted, and so
+            # conformant UserStateClients should treat it as if it doesn't exist.
+            if state == {}:
+                continue
+
+            usage_key = student_module.module_state_key.map_into_course(student_module.course_id)
+            yield XBlockUserState(student_module.student.username, usage_key, state, student_module.modified, scope)
+
     @donottrack(StudentModule, StudentModuleHistory)
     def iter_all_for_block(self, block_key, scope=Scope.user_state, batch_size=None):
         """
-        You get no ordering guarantees. Fetching will happen in batch_size
-        increments. If you're using this method, you should be running in an
-        async task.
+        Yield the stored state of every user for the XBlock identified by ``block_key``.
+
+        The states are yielded in the order they were first stored. Fetching will happen
+        in batch_size increments (``ITER_BATCH_SIZE`` by default). If you're using this
+        method, you should be running in an async task.
         """
         if scope != Scope.user_state:
             raise ValueError("Only Scope.user_state is supported")
-        raise NotImplementedError()
+
+        flush_buffered_writes()
+        query = StudentModule.objects.filter(course_id=block_key.course_key, module_state_key=block_key)
+        return self._iter_user_states(query, scope, batch_size)
 
     @donottrack(StudentModule, StudentModuleHistory)
     def iter_all_for_course(self, course_key, block_type=None, scope=Scope.user_state, batch_size=None):
         """
-        You get no ordering guarantees. Fetching will happen in batch_size
-        increments. If you're using this method, you should be running in an
-        async task.
+        Yield the stored state of every user for every XBlock in the course identified by
+        ``course_key``, or only for the XBlocks of type ``block_type`` if it is given.
+
+        The states are yielded in the order they were first stored. Fetching will happen
+        in batch_size increments (``ITER_BATCH_SIZE`` by default). If you're using this
+        method, you should be running in an async task.
         """
         if scope != Scope.user_state:
             raise ValueError("Only Scope.user_state is supported")
-        raise NotImplementedError()
+
+        flush_buffered_writes()
+        query = StudentModule.objects.filter(course_id=course_key)
+        if block_type is not None:
+            query = query.filter(module_type=block_type)
+        return self._iter_user_states(query, scope, batch_size)
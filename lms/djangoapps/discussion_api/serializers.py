@@ -26,7 +26,7 @@ from django_comment_common.models import (
 from lms.lib.comment_client.comment import Comment
 from lms.lib.comment_client.thread import Thread
 from lms.lib.comment_client.user import User as CommentClientUser
-from lms.lib.comment_client.utils import CommentClientRequestError
+from lms.lib.comment_client.utils import CommentClientRequestError, perform_concurrently
 from openedx.core.djangoapps.course_groups.cohorts import get_cohort_names
 
 
@@ -35,22 +35,31 @@ def get_context(course, request, thread=None):
     Returns a context appropriate for use with ThreadSerializer or
     (if thread is provided) CommentSerializer.
     """
-    # TODO: cache staff_user_ids and ta_user_ids if we need to improve perf
-    staff_user_ids = {
-        user.id
-        for role in Role.objects.filter(
-            name__in=[FORUM_ROLE_ADMINISTRATOR, FORUM_ROLE_MODERATOR],
-            course_id=course.id
-        )
-        for user in role.users.all()
-    }
-    ta_user_ids = {
-        user.id
-        for role in Role.objects.filter(name=FORUM_ROLE_COMMUNITY_TA, course_id=course.id)
-        for user in role.users.all()
-    }
+    def get_role_user_ids():
+        """Returns the ids of the staff and of the TAs of the course."""
+        # TODO: cache staff_user_ids and ta_user_ids if we need to improve perf
+        staff_user_ids = {
+            user.id
+            for role in Role.objects.filter(
+                name__in=[FORUM_ROLE_ADMINISTRATOR, FORUM_ROLE_MODERATOR],
+                course_id=course.id
+            )
+            for user in role.users.all()
+        }
+        ta_user_ids = {
+            user.id
+            for role in Role.objects.filter(name=FORUM_ROLE_COMMUNITY_TA, course_id=course.id)
+            for user in role.users.all()
+        }
+        return staff_user_ids, ta_user_ids
+
     requester = request.user
-    cc_requester = CommentClientUser.from_django_user(requester).retrieve()
+    # The requester is retrieved from the comments service while the roles
+    # are read from the database.
+    (staff_user_ids, ta_user_ids), cc_requester = perform_concurrently(
+        get_role_user_ids,
+        CommentClientUser.from_django_user(requester).retrieve,
+    )
     cc_requester["course_id"] = course.id
     return {
         "course": course,
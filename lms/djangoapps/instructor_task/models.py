@@ -12,13 +12,13 @@ file and check it in at the same time as your model changes. To do that,
 ASSUMPTIONS: modules have unique IDs, even across different module_types
 
 """
-from cStringIO import StringIO
 from gzip import GzipFile
 from uuid import uuid4
 import csv
 import json
 import hashlib
 import os.path
+import tempfile
 import urllib
 
 from boto.s3.connection import S3Connection
@@ -35,6 +35,10 @@ from xmodule_django.models import CourseKeyField
 QUEUING = 'QUEUING'
 PROGRESS = 'PROGRESS'
 
+# Reports are written to a temporary file before being stored. Files up to
+# this size (in bytes) are kept in memory, larger ones are rolled over to disk.
+REPORT_SPOOL_MAX_SIZE = 1024 * 1024
+
 
 class InstructorTask(models.Model):
     """
@@ -193,10 +197,15 @@ class InstructorTask(models.Model):
 class ReportStore(object):
     """
     Simple abstraction layer that can fetch and store CSV files for reports
-    download. Should probably refactor later to create a ReportFile object that
-    can simply be appended to for the sake of memory efficiency, rather than
-    passing in the whole dataset. Doing that for now just because it's simpler.
+    download. `store_rows` consumes the rows it is given lazily and writes them
+    out through a temporary file, so reports can be generated row by row
+    without ever holding the whole dataset in memory.
     """
+    # Files whose names start with this prefix are intermediate results, e.g.
+    # the per-shard parts of a sharded grade report. They are not listed by
+    # `links_for`.
+    PARTIAL_FILE_PREFIX = u'partial_'
+
     @classmethod
     def from_config(cls, config_name):
         """
@@ -218,6 +227,18 @@ class ReportStore(object):
         for row in rows:
             yield [unicode(item).encode('utf-8') for item in row]
 
+    def _get_utf8_decoded_rows(self, csvreader):
+        """
+        Given `csvreader` over utf-8 encoded csv data, yield its rows with the
+        strings decoded to unicode.
+        """
+        for row in csvreader:
+            yield [item.decode('utf-8') for item in row]
+
+    def _is_partial_file(self, filename):
+        """Return whether `filename` names an intermediate, partial file."""
+        return filename.startswith(self.PARTIAL_FILE_PREFIX)
+
 
 class S3ReportStore(ReportStore):
     """
@@ -310,22 +331,73 @@ class S3ReportStore(ReportStore):
             }
         )
 
+    def store_file(self, course_id, filename, temp_file, config=None):
+        """
+        Store the contents of the file object `temp_file` like `store()` does,
+        streaming them to S3 from the start of the file up to its current
+        position rather than reading them into memory first.
+        """
+        key = self.key_for(course_id, filename)
+
+        _config = config if config else {}
+
+        content_type = _config.get('content_type', 'text/csv')
+        content_encoding = _config.get('content_encoding', 'gzip')
+
+        size = temp_file.tell()
+        temp_file.seek(0)
+        key.size = size
+        key.content_encoding = content_encoding
+        key.content_type = content_type
+
+        key.set_contents_from_file(
+            temp_file,
+            headers={
+                "Content-Encoding": content_encoding,
+                "Content-Length": size,
+                "Content-Type": content_type,
+            },
+            size=size,
+        )
+
     def store_rows(self, course_id, filename, rows):
         """
-        Given a `course_id`, `filename`, and `rows` (each row is an iterable of
-        strings), create a buffer that is a gzip'd csv file, and then `store()`
-        that buffer.
+        Given a `course_id`, `filename`, and `rows` (an iterable of rows, each
+        an iterable of strings), write a gzip'd csv file to a temporary file,
+        and then `store_file()` that file. `rows` may be a generator; rows are
+        written out as they are produced.
 
         Even though we store it in gzip format, browsers will transparently
         download and decompress it. Filenames should end in `.csv`, not `.gz`.
         """
-        output_buffer = StringIO()
-        gzip_file = GzipFile(fileobj=output_buffer, mode="wb")
-        csvwriter = csv.writer(gzip_file)
-        csvwriter.writerows(self._get_utf8_encoded_rows(rows))
-        gzip_file.close()
+        with tempfile.SpooledTemporaryFile(max_size=REPORT_SPOOL_MAX_SIZE) as temp_file:
+            gzip_file = GzipFile(fileobj=temp_file, mode="wb")
+            csvwriter = csv.writer(gzip_file)
+            csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+            gzip_file.close()
+
+            self.store_file(course_id, filename, temp_file)
+
+    def iter_rows(self, course_id, filename):
+        """
+        Return an iterator over the rows of the csv file stored for
+        `course_id` as `filename` by `store_rows()`, with its strings decoded
+        to unicode. The file is downloaded to a temporary file first, so it is
+        never held in memory all at once. Raises IOError if there is no such
+        file.
+        """
+        key = self.bucket.get_key(self.key_for(course_id, filename).key)
+        if key is None:
+            raise IOError(u"No report named {} for course {}".format(filename, course_id))
+
+        temp_file = tempfile.TemporaryFile()
+        key.get_contents_to_file(temp_file)
+        temp_file.seek(0)
+        return self._get_utf8_decoded_rows(csv.reader(GzipFile(fileobj=temp_file, mode="rb")))
 
-        self.store(course_id, filename, output_buffer)
+    def delete(self, course_id, filename):
+        """Delete the file stored for `course_id` as `filename`, if any."""
+        self.key_for(course_id, filename).delete()
 
     def links_for(self, course_id):
         """
@@ -336,6 +408,7 @@ class S3ReportStore(ReportStore):
         return [
             (key.key.split("/")[-1], key.generate_url(expires_in=300))
             for key in sorted(self.bucket.list(prefix=course_dir.key), reverse=True, key=lambda k: k.last_modified)
+            if not self._is_partial_file(key.key.split("/")[-1])
         ]
 
 
@@ -393,14 +466,46 @@ class LocalFSReportStore(ReportStore):
 
     def store_rows(self, course_id, filename, rows):
         """
-        Given a course_id, filename, and rows (each row is an iterable of strings),
-        write this data out.
+        Given a course_id, filename, and rows (an iterable of rows, each an
+        iterable of strings), write this data out. `rows` may be a generator;
+        rows are written out as they are produced, to a temporary file that is
+        only moved into place once it is complete.
         """
-        output_buffer = StringIO()
-        csvwriter = csv.writer(output_buffer)
-        csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+        full_path = self.path_to(course_id, filename)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.mkdir(directory)
 
-        self.store(course_id, filename, output_buffer)
+        # The temporary file is named like a partial file so that it isn't
+        # listed by `links_for` while it is being written.
+        temp_file = tempfile.NamedTemporaryFile(dir=directory, prefix=self.PARTIAL_FILE_PREFIX, delete=False)
+        try:
+            with temp_file:
+                # Temporary files are only readable by their owner; give the
+                # report the permissions that `store` would have given it.
+                umask = os.umask(0)
+                os.umask(umask)
+                os.fchmod(temp_file.fileno(), 0o666 & ~umask)
+                csvwriter = csv.writer(temp_file)
+                csvwriter.writerows(self._get_utf8_encoded_rows(rows))
+            os.rename(temp_file.name, full_path)
+        except Exception:
+            os.remove(temp_file.name)
+            raise
+
+    def iter_rows(self, course_id, filename):
+        """
+        Return an iterator over the rows of the csv file stored for
+        `course_id` as `filename` by `store_rows()`, with its strings decoded
+        to unicode. Raises IOError if there is no such file.
+        """
+        return self._get_utf8_decoded_rows(csv.reader(open(self.path_to(course_id, filename), "rb")))
+
+    def delete(self, course_id, filename):
+        """Delete the file stored for `course_id` as `filename`, if any."""
+        full_path = self.path_to(course_id, filename)
+        if os.path.exists(full_path):
+            os.remove(full_path)
 
     def links_for(self, course_id):
         """
@@ -413,7 +518,11 @@ class LocalFSReportStore(ReportStore):
         course_dir = self.path_to(course_id, '')
         if not os.path.exists(course_dir):
             return []
-        files = [(filename, os.path.join(course_dir, filename)) for filename in os.listdir(course_dir)]
+        files = [
+            (filename, os.path.join(course_dir, filename))
+            for filename in os.listdir(course_dir)
+            if not self._is_partial_file(filename)
+        ]
         files.sort(key=lambda (filename, full_path): os.path.getmtime(full_path), reverse=True)
 
         return [
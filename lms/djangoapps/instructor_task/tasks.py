@@ -31,11 +31,14 @@ from instructor_task.tasks_helper import (
     run_main_task,
     BaseInstructorTask,
     perform_module_state_update,
+    perform_bulk_rescore,
     rescore_problem_module_state,
+    rescore_problem_module_states_shard,
     reset_attempts_module_state,
     delete_problem_module_state,
     upload_problem_responses_csv,
     upload_grades_csv,
+    upload_grades_csv_shard,
     upload_problem_grade_report,
     upload_students_csv,
     cohort_students_and_upload,
@@ -69,19 +72,49 @@ def rescore_problem(entry_id, xmodule_instance_args):
 
     `xmodule_instance_args` provides information needed by _get_module_instance_for_task()
     to instantiate an xmodule instance.
+
+    If the ENABLE_BULK_RESCORING feature is on, submissions are rescored in
+    batches, and in parallel shards for problems with many submissions (see
+    `perform_bulk_rescore`).
     """
     # Translators: This is a past-tense verb that is inserted into task progress messages as {action}.
     action_name = ugettext_noop('rescored')
-    update_fcn = partial(rescore_problem_module_state, xmodule_instance_args)
 
     def filter_fcn(modules_to_update):
         """Filter that matches problems which are marked as being done"""
         return modules_to_update.filter(state__contains='"done": true')
 
-    visit_fcn = partial(perform_module_state_update, update_fcn, filter_fcn)
+    if settings.FEATURES.get('ENABLE_BULK_RESCORING'):
+        visit_fcn = partial(perform_bulk_rescore, xmodule_instance_args, filter_fcn)
+    else:
+        update_fcn = partial(rescore_problem_module_state, xmodule_instance_args)
+        visit_fcn = partial(perform_module_state_update, update_fcn, filter_fcn)
     return run_main_task(entry_id, visit_fcn, action_name)
 
 
+@task  # pylint: disable=not-callable
+def rescore_problem_shard(
+        entry_id, xmodule_instance_args, course_id, task_input, student_module_ids, action_name, subtask_status_dict
+):
+    """
+    Rescore one shard of the submissions to a problem, as queued by
+    `rescore_problem` for problems with many submissions.
+    """
+    TASK_LOG.info(
+        u"Task: %s, InstructorTask ID: %s, Task type: %s, Preparing for rescoring shard of %s submissions",
+        subtask_status_dict.get('task_id'), entry_id, action_name, len(student_module_ids)
+    )
+    return rescore_problem_module_states_shard(
+        entry_id,
+        xmodule_instance_args,
+        course_id,
+        task_input,
+        student_module_ids,
+        action_name,
+        subtask_status_dict,
+    )
+
+
 @task(base=BaseInstructorTask)  # pylint: disable=not-callable
 def reset_problem_attempts(entry_id, xmodule_instance_args):
     """Resets problem attempts to zero for a particular problem for all students in a course.
@@ -175,6 +208,32 @@ def calculate_grades_csv(entry_id, xmodule_instance_args):
     return run_main_task(entry_id, task_fn, action_name)
 
 
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=not-callable
+def calculate_grades_csv_shard(
+        entry_id, xmodule_instance_args, course_id, shard_index, student_ids, start_timestamp, action_name,
+        subtask_status_dict
+):
+    """
+    Grade one shard of the students of a course, as queued by
+    `calculate_grades_csv` for large courses, and store the partial results.
+    The last shard to complete merges them into the final report.
+    """
+    TASK_LOG.info(
+        u"Task: %s, InstructorTask ID: %s, Task type: %s, Preparing for grading shard %s",
+        subtask_status_dict.get('task_id'), entry_id, action_name, shard_index
+    )
+    return upload_grades_csv_shard(
+        entry_id,
+        xmodule_instance_args,
+        course_id,
+        shard_index,
+        student_ids,
+        start_timestamp,
+        action_name,
+        subtask_status_dict,
+    )
+
+
 @task(base=BaseInstructorTask, routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=not-callable
 def calculate_problem_grade_report(entry_id, xmodule_instance_args):
     """
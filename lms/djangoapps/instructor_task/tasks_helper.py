@@ -3,13 +3,15 @@ This file contains tasks that are designed to perform background operations on t
 running state of a course.
 
 """
+import calendar
 import json
 import re
+import traceback
 from collections import OrderedDict
 from datetime import datetime
 from django.conf import settings
 from eventtracking import tracker
-from itertools import chain
+from itertools import chain, count, islice
 from time import time
 import unicodecsv
 import logging
@@ -17,6 +19,7 @@ import logging
 from celery import Task, current_task
 from celery.states import SUCCESS, FAILURE
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.storage import DefaultStorage
 from django.db import transaction, reset_queries
 from django.db.models import Q
@@ -45,9 +48,9 @@ from certificates.models import (
 )
 from certificates.api import generate_user_certificates
 from courseware.courses import get_course_by_id, get_problems_in_section
-from courseware.grades import iterate_grades_for
+from courseware.grades import GRADING_BATCH_SIZE, iterate_grades_for, prefetch_anonymous_ids
 from courseware.models import StudentModule
-from courseware.model_data import DjangoKeyValueStore, FieldDataCache
+from courseware.model_data import DjangoKeyValueStore, FieldDataCache, descendant_descriptors_for_caching
 from courseware.module_render import get_module_for_descriptor_internal
 from instructor_analytics.basic import (
     enrolled_students_features,
@@ -57,11 +60,18 @@ from instructor_analytics.basic import (
 )
 from instructor_analytics.csvs import format_dictlist
 from instructor_task.models import ReportStore, InstructorTask, PROGRESS
+from instructor_task.subtasks import (
+    check_subtask_is_valid,
+    queue_subtasks_for_query,
+    SubtaskStatus,
+    SUBTASK_LOCK_EXPIRE,
+    update_subtask_status,
+)
 from lms.djangoapps.lms_xblock.runtime import LmsPartitionService
 from openedx.core.djangoapps.course_groups.cohorts import get_cohort
 from openedx.core.djangoapps.course_groups.models import CourseUserGroup
 from openedx.core.djangoapps.content.course_structures.models import CourseStructure
-from opaque_keys.edx.keys import UsageKey
+from opaque_keys.edx.keys import CourseKey, UsageKey
 from openedx.core.djangoapps.course_groups.cohorts import add_user_to_cohort, is_course_cohorted
 from student.models import CourseEnrollment, CourseAccessRole
 from teams.models import CourseTeamMembership
@@ -330,6 +340,45 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
 
     """
     start_time = time()
+    problems, modules_to_update = _get_modules_to_update(course_id, task_input, filter_fcn)
+
+    task_progress = TaskProgress(action_name, modules_to_update.count(), start_time)
+    task_progress.update_task_state()
+
+    for module_to_update in modules_to_update:
+        task_progress.attempted += 1
+        module_descriptor = problems[unicode(module_to_update.module_state_key)]
+        # There is no try here:  if there's an error, we let it throw, and the task will
+        # be marked as FAILED, with a stack trace.
+        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=[u'action:{name}'.format(name=action_name)]):
+            update_status = update_fcn(module_descriptor, module_to_update)
+            _count_update_status(task_progress, update_status)
+
+    return task_progress.update_task_state()
+
+
+def _count_update_status(task_progress, update_status):
+    """
+    Counts the `update_status` returned by an update function in `task_progress`.
+    """
+    if update_status == UPDATE_STATUS_SUCCEEDED:
+        # If the update_fcn returns true, then it performed some kind of work.
+        # Logging of failures is left to the update_fcn itself.
+        task_progress.succeeded += 1
+    elif update_status == UPDATE_STATUS_FAILED:
+        task_progress.failed += 1
+    elif update_status == UPDATE_STATUS_SKIPPED:
+        task_progress.skipped += 1
+    else:
+        raise UpdateProblemModuleStateError("Unexpected update_status returned: {}".format(update_status))
+
+
+def _get_modules_to_update(course_id, task_input, filter_fcn):
+    """
+    Returns the descriptors of the problems that `task_input` refers to, keyed
+    by usage key string, and the query of the StudentModules of those problems
+    to update, as described in `perform_module_state_update`.
+    """
     usage_keys = []
     problem_url = task_input.get('problem_url')
     entrance_exam_url = task_input.get('entrance_exam_url')
@@ -370,28 +419,7 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
     if filter_fcn is not None:
         modules_to_update = filter_fcn(modules_to_update)
 
-    task_progress = TaskProgress(action_name, modules_to_update.count(), start_time)
-    task_progress.update_task_state()
-
-    for module_to_update in modules_to_update:
-        task_progress.attempted += 1
-        module_descriptor = problems[unicode(module_to_update.module_state_key)]
-        # There is no try here:  if there's an error, we let it throw, and the task will
-        # be marked as FAILED, with a stack trace.
-        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=[u'action:{name}'.format(name=action_name)]):
-            update_status = update_fcn(module_descriptor, module_to_update)
-            if update_status == UPDATE_STATUS_SUCCEEDED:
-                # If the update_fcn returns true, then it performed some kind of work.
-                # Logging of failures is left to the update_fcn itself.
-                task_progress.succeeded += 1
-            elif update_status == UPDATE_STATUS_FAILED:
-                task_progress.failed += 1
-            elif update_status == UPDATE_STATUS_SKIPPED:
-                task_progress.skipped += 1
-            else:
-                raise UpdateProblemModuleStateError("Unexpected update_status returned: {}".format(update_status))
-
-    return task_progress.update_task_state()
+    return problems, modules_to_update
 
 
 def _get_task_id_from_xmodule_args(xmodule_instance_args):
@@ -421,16 +449,19 @@ def _get_track_function_for_task(student, xmodule_instance_args=None, source_pag
 
 
 def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args=None,
-                                  grade_bucket_type=None, course=None):
+                                  grade_bucket_type=None, course=None, field_data_cache=None):
     """
     Fetches a StudentModule instance for a given `course_id`, `student` object, and `module_descriptor`.
 
     `xmodule_instance_args` is used to provide information for creating a track function and an XQueue callback.
     These are passed, along with `grade_bucket_type`, to get_module_for_descriptor_internal, which sidesteps
     the need for a Request object when instantiating an xmodule instance.
+
+    `field_data_cache` may be passed in if the student's data has already been fetched.
     """
     # reconstitute the problem's corresponding XModule:
-    field_data_cache = FieldDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
+    if field_data_cache is None:
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
     student_data = KvsFieldData(DjangoKeyValueStore(field_data_cache))
 
     # get request-related tracking information from args passthrough, and supplement with task-specific
@@ -479,80 +510,282 @@ def rescore_problem_module_state(xmodule_instance_args, module_descriptor, stude
     Returns True if problem was successfully rescored for the given student, and False
     if problem encountered some kind of error in rescoring.
     '''
+    course_id = student_module.course_id
+    with modulestore().bulk_operations(course_id):
+        course = get_course_by_id(course_id)
+        return _rescore_student_module(xmodule_instance_args, module_descriptor, student_module, course)
+
+
+def _rescore_student_module(xmodule_instance_args, module_descriptor, student_module, course, field_data_cache=None):
+    """
+    Rescores `student_module`, as described in `rescore_problem_module_state`,
+    with an already loaded `course` and, optionally, the `field_data_cache` of
+    the student's data.
+    """
     # unpack the StudentModule:
     course_id = student_module.course_id
     student = student_module.student
     usage_key = student_module.module_state_key
 
-    with modulestore().bulk_operations(course_id):
-        course = get_course_by_id(course_id)
-        # TODO: Here is a call site where we could pass in a loaded course.  I
-        # think we certainly need it since grading is happening here, and field
-        # overrides would be important in handling that correctly
-        instance = _get_module_instance_for_task(
-            course_id,
-            student,
-            module_descriptor,
-            xmodule_instance_args,
-            grade_bucket_type='rescore',
-            course=course
-        )
+    instance = _get_module_instance_for_task(
+        course_id,
+        student,
+        module_descriptor,
+        xmodule_instance_args,
+        grade_bucket_type='rescore',
+        course=course,
+        field_data_cache=field_data_cache,
+    )
 
-        if instance is None:
-            # Either permissions just changed, or someone is trying to be clever
-            # and load something they shouldn't have access to.
-            msg = "No module {loc} for student {student}--access denied?".format(
+    if instance is None:
+        # Either permissions just changed, or someone is trying to be clever
+        # and load something they shouldn't have access to.
+        msg = "No module {loc} for student {student}--access denied?".format(
+            loc=usage_key,
+            student=student
+        )
+        TASK_LOG.debug(msg)
+        raise UpdateProblemModuleStateError(msg)
+
+    if not hasattr(instance, 'rescore_problem'):
+        # This should also not happen, since it should be already checked in the caller,
+        # but check here to be sure.
+        msg = "Specified problem does not support rescoring."
+        raise UpdateProblemModuleStateError(msg)
+
+    result = instance.rescore_problem()
+    instance.save()
+    if 'success' not in result:
+        # don't consider these fatal, but false means that the individual call didn't complete:
+        TASK_LOG.warning(
+            u"error processing rescore call for course %(course)s, problem %(loc)s "
+            u"and student %(student)s: unexpected response %(msg)s",
+            dict(
+                msg=result,
+                course=course_id,
                 loc=usage_key,
                 student=student
             )
-            TASK_LOG.debug(msg)
-            raise UpdateProblemModuleStateError(msg)
-
-        if not hasattr(instance, 'rescore_problem'):
-            # This should also not happen, since it should be already checked in the caller,
-            # but check here to be sure.
-            msg = "Specified problem does not support rescoring."
-            raise UpdateProblemModuleStateError(msg)
-
-        result = instance.rescore_problem()
-        instance.save()
-        if 'success' not in result:
-            # don't consider these fatal, but false means that the individual call didn't complete:
-            TASK_LOG.warning(
-                u"error processing rescore call for course %(course)s, problem %(loc)s "
-                u"and student %(student)s: unexpected response %(msg)s",
-                dict(
-                    msg=result,
-                    course=course_id,
-                    loc=usage_key,
-                    student=student
-                )
-            )
-            return UPDATE_STATUS_FAILED
-        elif result['success'] not in ['correct', 'incorrect']:
-            TASK_LOG.warning(
-                u"error processing rescore call for course %(course)s, problem %(loc)s "
-                u"and student %(student)s: %(msg)s",
-                dict(
-                    msg=result['success'],
-                    course=course_id,
-                    loc=usage_key,
-                    student=student
-                )
+        )
+        return UPDATE_STATUS_FAILED
+    elif result['success'] not in ['correct', 'incorrect']:
+        TASK_LOG.warning(
+            u"error processing rescore call for course %(course)s, problem %(loc)s "
+            u"and student %(student)s: %(msg)s",
+            dict(
+                msg=result['success'],
+                course=course_id,
+                loc=usage_key,
+                student=student
             )
-            return UPDATE_STATUS_FAILED
-        else:
-            TASK_LOG.debug(
-                u"successfully processed rescore call for course %(course)s, problem %(loc)s "
-                u"and student %(student)s: %(msg)s",
-                dict(
-                    msg=result['success'],
-                    course=course_id,
-                    loc=usage_key,
-                    student=student
-                )
+        )
+        return UPDATE_STATUS_FAILED
+    else:
+        TASK_LOG.debug(
+            u"successfully processed rescore call for course %(course)s, problem %(loc)s "
+            u"and student %(student)s: %(msg)s",
+            dict(
+                msg=result['success'],
+                course=course_id,
+                loc=usage_key,
+                student=student
             )
-            return UPDATE_STATUS_SUCCEEDED
+        )
+        return UPDATE_STATUS_SUCCEEDED
+
+
+def perform_bulk_rescore(xmodule_instance_args, filter_fcn, entry_id, course_id, task_input, action_name):
+    """
+    Rescores the StudentModules selected as in `perform_module_state_update`,
+    with the same results, but in batches of RESCORE_BATCH_SIZE submissions:
+    the course is loaded once, the students and their anonymous ids are
+    fetched once per batch, each student's problem state is read from the
+    StudentModule that was already fetched instead of being queried again,
+    and each submission is committed as soon as it is rescored.
+
+    If there are more than RESCORE_SUBMISSIONS_PER_SHARD submissions to
+    rescore, they are split into shards that are rescored by parallel
+    subtasks instead (see `rescore_problem_module_states_shard`), and this
+    task only queues them.
+    """
+    start_time = time()
+    problems, modules_to_update = _get_modules_to_update(course_id, task_input, filter_fcn)
+    total_modules = modules_to_update.count()
+
+    if total_modules > settings.RESCORE_SUBMISSIONS_PER_SHARD:
+        TASK_LOG.info(
+            u'InstructorTask ID: %s, Task type: %s, Queuing rescoring of %s submissions in shards of %s',
+            entry_id,
+            action_name,
+            total_modules,
+            settings.RESCORE_SUBMISSIONS_PER_SHARD,
+        )
+        return _queue_rescore_shards(
+            xmodule_instance_args, entry_id, course_id, task_input, modules_to_update, total_modules, action_name
+        )
+
+    task_progress = TaskProgress(action_name, total_modules, start_time)
+    task_progress.update_task_state()
+    for __ in _rescore_in_batches(xmodule_instance_args, course_id, problems, modules_to_update, task_progress):
+        task_progress.update_task_state()
+    return task_progress.update_task_state()
+
+
+def _rescore_in_batches(xmodule_instance_args, course_id, problems, modules_to_update, task_progress):
+    """
+    Rescores the StudentModules of the `modules_to_update` query in batches
+    of RESCORE_BATCH_SIZE, counting the result of each submission in
+    `task_progress` once it is committed, and yields after each batch.
+
+    A submission which was modified since its batch was fetched is re-read
+    before it is rescored, and one which was deleted is skipped.
+    """
+    course = get_course_by_id(course_id)
+    descriptors_to_cache = {
+        location: descendant_descriptors_for_caching(descriptor) for location, descriptor in problems.iteritems()
+    }
+    modules_to_update = modules_to_update.select_related('student').order_by('id')
+    timer_tags = [u'action:{name}'.format(name=task_progress.action_name)]
+    last_id = 0
+
+    with modulestore().bulk_operations(course_id):
+        while True:
+            batch = list(modules_to_update.filter(id__gt=last_id)[:settings.RESCORE_BATCH_SIZE])
+            if not batch:
+                break
+            last_id = batch[-1].id
+            prefetch_anonymous_ids(course_id, [student_module.student for student_module in batch])
+
+            for student_module in batch:
+                # Each submission is rescored in its own transaction, so that
+                # its row is only locked while it is rescored.
+                with transaction.commit_on_success():
+                    student_module = _lock_current_student_module(student_module)
+                    if student_module is None:
+                        update_status = UPDATE_STATUS_SKIPPED
+                    else:
+                        location = unicode(student_module.module_state_key)
+                        field_data_cache = FieldDataCache.cache_for_prefetched_descriptors(
+                            course_id, student_module.student, descriptors_to_cache[location], [student_module]
+                        )
+                        with dog_stats_api.timer('instructor_tasks.module.time.step', tags=timer_tags):
+                            update_status = _rescore_student_module(
+                                xmodule_instance_args, problems[location], student_module, course, field_data_cache
+                            )
+                task_progress.attempted += 1
+                _count_update_status(task_progress, update_status)
+            yield
+
+
+def _lock_current_student_module(student_module):
+    """
+    Locks the row of the prefetched `student_module` until the end of the
+    current transaction, and returns it, re-read from the database if it was
+    modified since it was fetched (e.g. by a new submission of the student),
+    so that rescoring doesn't overwrite the newer state.
+
+    Returns None if the StudentModule was deleted since it was fetched.
+    """
+    modified = list(
+        StudentModule.objects.select_for_update().filter(pk=student_module.pk).values_list('modified', flat=True)
+    )
+    if not modified:
+        return None
+    if modified[0] != student_module.modified:
+        return StudentModule.objects.select_related('student').get(pk=student_module.pk)
+    return student_module
+
+
+def _queue_rescore_shards(
+        xmodule_instance_args, entry_id, course_id, task_input, modules_to_update, total_modules, action_name
+):
+    """
+    Split the StudentModules of `modules_to_update` into shards of
+    RESCORE_SUBMISSIONS_PER_SHARD and queue a `rescore_problem_shard` subtask
+    for each of them.
+
+    Returns the task progress as stored in the InstructorTask object; progress
+    of the shards is aggregated there as they complete.
+    """
+    # Imported here to avoid a circular import; tasks.py imports this module.
+    from instructor_task.tasks import rescore_problem_shard
+
+    entry = InstructorTask.objects.get(pk=entry_id)
+
+    def _create_shard_subtask(student_module_items, initial_subtask_status):
+        """Creates a subtask to rescore the StudentModules in `student_module_items`."""
+        return rescore_problem_shard.subtask(
+            (
+                entry_id,
+                xmodule_instance_args,
+                unicode(course_id),
+                task_input,
+                [item['pk'] for item in student_module_items],
+                action_name,
+                initial_subtask_status.to_dict(),
+            ),
+            task_id=initial_subtask_status.task_id,
+        )
+
+    return queue_subtasks_for_query(
+        entry,
+        action_name,
+        _create_shard_subtask,
+        [modules_to_update.order_by('id')],
+        [],
+        settings.RESCORE_SUBMISSIONS_PER_SHARD,
+        total_modules,
+    )
+
+
+def rescore_problem_module_states_shard(
+        entry_id, xmodule_instance_args, course_id, task_input, student_module_ids, action_name, subtask_status_dict
+):
+    """
+    Rescore one shard of the StudentModules of a sharded rescoring task, as
+    `perform_bulk_rescore` does.
+
+    Progress is recorded in the parent InstructorTask, which completes when
+    the last shard does.
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+    course_key = CourseKey.from_string(course_id)
+
+    # Raises DuplicateTaskException if this shard was already run, which
+    # fails the subtask without touching the parent's progress.
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    task_progress = TaskProgress(action_name, len(student_module_ids), time())
+    try:
+        problems, modules_to_update = _get_modules_to_update(course_key, task_input, None)
+        modules_to_update = modules_to_update.filter(id__in=student_module_ids)
+        for __ in _rescore_in_batches(xmodule_instance_args, course_key, problems, modules_to_update, task_progress):
+            pass
+    except Exception:  # pylint: disable=broad-except
+        # The submission that failed, and those after it, are counted as
+        # failed; the submissions before it were committed.
+        TASK_LOG.exception(
+            u'Task: %s, InstructorTask ID: %s, Task type: %s, Rescoring shard failed',
+            current_task_id,
+            entry_id,
+            action_name,
+        )
+        subtask_status.increment(
+            succeeded=task_progress.succeeded,
+            failed=len(student_module_ids) - task_progress.succeeded - task_progress.skipped,
+            skipped=task_progress.skipped,
+            state=FAILURE,
+        )
+    else:
+        subtask_status.increment(
+            succeeded=task_progress.succeeded,
+            failed=task_progress.failed,
+            skipped=task_progress.skipped,
+            state=SUCCESS,
+        )
+    update_subtask_status(entry_id, current_task_id, subtask_status)
+    return subtask_status.to_dict()
 
 
 @transaction.autocommit
@@ -608,6 +841,8 @@ def upload_csv_to_report_store(rows, csv_name, course_id, timestamp, config_name
                 [row1_colum1, row1_colum2, ...],
                 ...
             ]
+            Any iterable of rows will do; a generator is consumed lazily, so
+            the rows never have to be held in memory all at once.
         csv_name: Name of the resulting CSV
         course_id: ID of the course
     """
@@ -654,7 +889,7 @@ def upload_exec_summary_to_store(data_dict, report_name, course_id, generated_at
     tracker.emit(REPORT_REQUESTED_EVENT_NAME, {"report_type": report_name})
 
 
-def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):  # pylint: disable=too-many-statements
+def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
     """
     For a given `course_id`, generate a grades CSV file for all students that
     are enrolled, and store using a `ReportStore`. Once created, the files can
@@ -663,15 +898,19 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
     buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
     that are visible in ReportStore will be complete ones.
 
+    If the ENABLE_SHARDED_GRADE_REPORTS feature is on and more than
+    GRADES_DOWNLOAD_STUDENTS_PER_SHARD students are enrolled, the students are
+    split into shards that are graded by parallel subtasks instead (see
+    `upload_grades_csv_shard`), and this task only queues them.
+
     As we start to add more CSV downloads, it will probably be worthwhile to
     make a more general CSVDoc class instead of building out the rows like we
     do here.
     """
     start_time = time()
     start_date = datetime.now(UTC)
-    status_interval = 100
     enrolled_students = CourseEnrollment.objects.users_enrolled_in(course_id)
-    task_progress = TaskProgress(action_name, enrolled_students.count(), start_time)
+    total_enrolled_students = enrolled_students.count()
 
     fmt = u'Task: {task_id}, InstructorTask ID: {entry_id}, Course: {course_id}, Input: {task_input}'
     task_info_string = fmt.format(
@@ -682,6 +921,67 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
     )
     TASK_LOG.info(u'%s, Task type: %s, Starting task execution', task_info_string, action_name)
 
+    students_per_shard = settings.GRADES_DOWNLOAD_STUDENTS_PER_SHARD
+    if settings.FEATURES.get('ENABLE_SHARDED_GRADE_REPORTS') and total_enrolled_students > students_per_shard:
+        TASK_LOG.info(
+            u'%s, Task type: %s, Queuing grade calculation for total students: %s in shards of %s',
+            task_info_string,
+            action_name,
+            total_enrolled_students,
+            students_per_shard
+        )
+        return _queue_grades_csv_shards(
+            _xmodule_instance_args,
+            _entry_id,
+            course_id,
+            enrolled_students,
+            total_enrolled_students,
+            start_date,
+            action_name,
+        )
+
+    task_progress = TaskProgress(action_name, total_enrolled_students, start_time)
+    err_rows = [["id", "username", "error_msg"]]
+
+    # Students are graded as the rows are written out, so the report is never
+    # held in memory all at once.
+    upload_csv_to_report_store(
+        _grade_report_rows(
+            course_id, enrolled_students, total_enrolled_students, task_progress, task_info_string, action_name,
+            err_rows
+        ),
+        'grade_report',
+        course_id,
+        start_date
+    )
+
+    # By this point, we've got the rows we're going to stuff into our error CSV.
+    current_step = {'step': 'Uploading CSVs'}
+    task_progress.update_task_state(extra_meta=current_step)
+    TASK_LOG.info(u'%s, Task type: %s, Current step: %s', task_info_string, action_name, current_step)
+
+    # If there are any error rows (don't count the header), write them out as well
+    if len(err_rows) > 1:
+        upload_csv_to_report_store(err_rows, 'grade_report_err', course_id, start_date)
+
+    # One last update before we close out...
+    TASK_LOG.info(u'%s, Task type: %s, Finalizing grade task', task_info_string, action_name)
+    return task_progress.update_task_state(extra_meta=current_step)
+
+
+def _grade_report_rows(  # pylint: disable=too-many-statements
+        course_id, enrolled_students, total_enrolled_students, task_progress, task_info_string, action_name, err_rows
+):
+    """
+    Grade `enrolled_students` and yield the rows of the grades CSV for them,
+    updating `task_progress` along the way. Students are graded lazily, as
+    the rows are consumed.
+
+    A header row is yielded before the first student's row; nothing is
+    yielded if no student could be graded. The students that could not be
+    graded are appended to the list `err_rows` instead.
+    """
+    status_interval = 100
     course = get_course_by_id(course_id)
     course_is_cohorted = is_course_cohorted(course.id)
     teams_enabled = course.teams_enabled
@@ -695,13 +995,10 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
     certificate_whitelist = CertificateWhitelist.objects.filter(course_id=course_id, whitelist=True)
     whitelisted_user_ids = [entry.user_id for entry in certificate_whitelist]
 
-    # Loop over all our students and build our CSV lists in memory
+    # Loop over all our students and yield their CSV rows
     header = None
-    rows = []
-    err_rows = [["id", "username", "error_msg"]]
     current_step = {'step': 'Calculating Grades'}
 
-    total_enrolled_students = enrolled_students.count()
     student_counter = 0
     TASK_LOG.info(
         u'%s, Task type: %s, Current step: %s, Starting grade calculation for total students: %s',
@@ -711,6 +1008,8 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
 
         total_enrolled_students
     )
+    enrollment_modes = {}
+    enrolled_students = _prefetch_enrollment_modes(course_id, enrolled_students, enrollment_modes)
     for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
         # Periodically update task status (this is a cache write)
         if task_progress.attempted % status_interval == 0:
@@ -734,7 +1033,7 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
             task_progress.succeeded += 1
             if not header:
                 header = [section['label'] for section in gradeset[u'section_breakdown']]
-                rows.append(
+                yield (
                     ["id", "email", "username", "grade"] + header + cohorts_header +
                     group_configs_header + teams_header +
                     ['Enrollment Track', 'Verification Status'] + certificate_info_header
@@ -764,7 +1063,7 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
                 except CourseTeamMembership.DoesNotExist:
                     team_name.append('')
 
-            enrollment_mode = CourseEnrollment.enrollment_mode_for_user(student, course_id)[0]
+            enrollment_mode = enrollment_modes[(student.id, course_id)][0]
             verification_status = SoftwareSecurePhotoVerification.verification_status_for_user(
                 student,
                 course_id,
@@ -784,7 +1083,7 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
             # possible for a student to have a 0.0 show up in their row but
             # still have 100% for the course.
             row_percents = [percents.get(label, 0.0) for label in header]
-            rows.append(
+            yield (
                 [student.id, student.email, student.username, gradeset['percent']] +
                 row_percents + cohorts_group_name + group_configs_group_names + team_name +
                 [enrollment_mode] + [verification_status] + certificate_info
@@ -803,21 +1102,221 @@ def upload_grades_csv(_xmodule_instance_args, _entry_id, course_id, _task_input,
         total_enrolled_students
     )
 
-    # By this point, we've got the rows we're going to stuff into our CSV files.
-    current_step = {'step': 'Uploading CSVs'}
-    task_progress.update_task_state(extra_meta=current_step)
-    TASK_LOG.info(u'%s, Task type: %s, Current step: %s', task_info_string, action_name, current_step)
 
-    # Perform the actual upload
-    upload_csv_to_report_store(rows, 'grade_report', course_id, start_date)
+def _prefetch_enrollment_modes(course_id, students, enrollment_modes, batch_size=GRADING_BATCH_SIZE):
+    """
+    Yield the `students`, having looked up the enrollment modes of each batch
+    of `batch_size` of them in `course_id` with one query, and stored them in
+    the `enrollment_modes` dict (see `CourseEnrollment.bulk_enrollment_modes`).
+    """
+    students = iter(students)
+    while True:
+        batch = list(islice(students, batch_size))
+        if not batch:
+            return
+        enrollment_modes.update(CourseEnrollment.bulk_enrollment_modes(
+            (student, course_id) for student in batch
+        ))
+        for student in batch:
+            yield student
+
+
+def _queue_grades_csv_shards(
+        xmodule_instance_args, entry_id, course_id, enrolled_students, total_enrolled_students, start_date, action_name
+):
+    """
+    Split `enrolled_students` into shards of GRADES_DOWNLOAD_STUDENTS_PER_SHARD
+    students and queue an `upload_grades_csv_shard` subtask for each of them.
 
-    # If there are any error rows (don't count the header), write them out as well
-    if len(err_rows) > 1:
-        upload_csv_to_report_store(err_rows, 'grade_report_err', course_id, start_date)
+    Returns the task progress as stored in the InstructorTask object; progress
+    of the shards is aggregated there as they complete.
+    """
+    # Imported here to avoid a circular import; tasks.py imports this module.
+    from instructor_task.tasks import calculate_grades_csv_shard
 
-    # One last update before we close out...
-    TASK_LOG.info(u'%s, Task type: %s, Finalizing grade task', task_info_string, action_name)
-    return task_progress.update_task_state(extra_meta=current_step)
+    entry = InstructorTask.objects.get(pk=entry_id)
+    shard_indexes = count()
+
+    def _create_shard_subtask(student_items, initial_subtask_status):
+        """Creates a subtask to grade the students in `student_items`."""
+        return calculate_grades_csv_shard.subtask(
+            (
+                entry_id,
+                xmodule_instance_args,
+                unicode(course_id),
+                next(shard_indexes),
+                [item['pk'] for item in student_items],
+                calendar.timegm(start_date.utctimetuple()),
+                action_name,
+                initial_subtask_status.to_dict(),
+            ),
+            task_id=initial_subtask_status.task_id,
+            routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+        )
+
+    return queue_subtasks_for_query(
+        entry,
+        action_name,
+        _create_shard_subtask,
+        [enrolled_students.order_by('id')],
+        [],
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_SHARD,
+        total_enrolled_students,
+    )
+
+
+def _grade_report_shard_filename(entry_id, shard_index, csv_name):
+    """
+    Return the name of the partial CSV that shard `shard_index` of the
+    grade report task `entry_id` writes its `csv_name` rows to.
+    """
+    return u"{prefix}{entry_id}_{shard_index:05d}_{csv_name}.csv".format(
+        prefix=ReportStore.PARTIAL_FILE_PREFIX,
+        entry_id=entry_id,
+        shard_index=shard_index,
+        csv_name=csv_name,
+    )
+
+
+def upload_grades_csv_shard(
+        entry_id, xmodule_instance_args, course_id, shard_index, student_ids, start_timestamp, action_name,
+        subtask_status_dict
+):
+    """
+    Grade one shard of the students of a sharded grade report, and store its
+    rows as partial CSVs in the `ReportStore`.
+
+    Progress is recorded in the parent InstructorTask, which stays in
+    PROGRESS once all shards are done until the shard that completes last
+    has merged the partial CSVs of all shards into the final report (see
+    `_merge_grades_csv_shards`).
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+    course_key = CourseKey.from_string(course_id)
+
+    fmt = u'Task: {task_id}, InstructorTask ID: {entry_id}, Course: {course_id}, Shard: {shard_index}'
+    task_info_string = fmt.format(
+        task_id=current_task_id,
+        entry_id=entry_id,
+        course_id=course_id,
+        shard_index=shard_index,
+    )
+
+    # Raises DuplicateTaskException if this shard was already run, which
+    # fails the subtask without touching the parent's progress.
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    try:
+        students = User.objects.filter(id__in=student_ids).order_by('id')
+        task_progress = TaskProgress(action_name, len(student_ids), time())
+        err_rows = [["id", "username", "error_msg"]]
+        rows = _grade_report_rows(
+            course_key, students, len(student_ids), task_progress, task_info_string, action_name, err_rows
+        )
+
+        report_store = ReportStore.from_config('GRADES_DOWNLOAD')
+        # A partial grade report is empty, without even a header row, if no
+        # student in the shard could be graded; the merge skips it.
+        report_store.store_rows(course_key, _grade_report_shard_filename(entry_id, shard_index, 'grade_report'), rows)
+        report_store.store_rows(
+            course_key, _grade_report_shard_filename(entry_id, shard_index, 'grade_report_err'), err_rows
+        )
+    except Exception:  # pylint: disable=broad-except
+        # Record the whole shard as failed rather than retrying it; the merge
+        # skips the shards that have no partial reports.
+        TASK_LOG.exception(u'%s, Task type: %s, Grading shard failed', task_info_string, action_name)
+        subtask_status.increment(failed=len(student_ids), state=FAILURE)
+    else:
+        subtask_status.increment(succeeded=task_progress.succeeded, failed=task_progress.failed, state=SUCCESS)
+    update_subtask_status(entry_id, current_task_id, subtask_status, completed_state=PROGRESS)
+
+    _merge_grades_csv_shards(entry_id, course_key, datetime.fromtimestamp(start_timestamp, UTC))
+    return subtask_status.to_dict()
+
+
+def _merge_grades_csv_shards(entry_id, course_id, start_date):
+    """
+    Once every shard of the grade report task `entry_id` has completed,
+    stream the partial CSVs of all shards into the final grade report (and
+    error report, if there were errors), then delete the partial CSVs.
+
+    The InstructorTask is marked as succeeded once the report is stored, or
+    as failed if the merge fails.
+
+    This is called by each shard as it completes; only the first call made
+    after the last shard has completed does the merge.
+    """
+    entry = InstructorTask.objects.get(pk=entry_id)
+    subtask_dict = json.loads(entry.subtasks)
+    num_shards = subtask_dict['total']
+    if entry.task_state != PROGRESS or subtask_dict['succeeded'] + subtask_dict['failed'] < num_shards:
+        return
+    lock_key = u'grade-report-merge-{}'.format(entry.task_id)
+    if not cache.add(lock_key, 'true', SUBTASK_LOCK_EXPIRE):
+        return
+
+    report_store = ReportStore.from_config('GRADES_DOWNLOAD')
+    filenames = {
+        csv_name: [_grade_report_shard_filename(entry_id, index, csv_name) for index in xrange(num_shards)]
+        for csv_name in ('grade_report', 'grade_report_err')
+    }
+    try:
+        for csv_name in ('grade_report', 'grade_report_err'):
+            header, data_rows = _merged_shard_rows(report_store, course_id, filenames[csv_name])
+            try:
+                first_row = next(data_rows)
+            except StopIteration:
+                # Nothing to report; an error report is only written if there were errors.
+                first_row = None
+            if first_row is not None or csv_name == 'grade_report':
+                rows = chain([header] if header else [], [first_row] if first_row is not None else [], data_rows)
+                upload_csv_to_report_store(rows, csv_name, course_id, start_date)
+    except Exception as exc:  # pylint: disable=broad-except
+        TASK_LOG.exception(u'InstructorTask ID: %s, Course: %s, Merging the grade report failed', entry_id, course_id)
+        InstructorTask.objects.filter(pk=entry_id).update(
+            task_state=FAILURE,
+            task_output=InstructorTask.create_output_for_failure(exc, traceback.format_exc()),
+        )
+        cache.delete(lock_key)
+    else:
+        InstructorTask.objects.filter(pk=entry_id).update(task_state=SUCCESS)
+    finally:
+        for csv_filenames in filenames.values():
+            for filename in csv_filenames:
+                try:
+                    report_store.delete(course_id, filename)
+                except Exception:  # pylint: disable=broad-except
+                    TASK_LOG.exception(u'InstructorTask ID: %s, Could not delete %s', entry_id, filename)
+
+
+def _merged_shard_rows(report_store, course_id, filenames):
+    """
+    Return a tuple `(header, rows)` for the partial CSVs `filenames`, where
+    `header` is the first non-empty header row found and `rows` lazily yields
+    the data rows of all partial CSVs in order.
+
+    The partial CSVs are read one at a time, so only one is open at once.
+    """
+    header = None
+    for filename in filenames:
+        try:
+            header = next(report_store.iter_rows(course_id, filename), None) or None
+        except IOError:
+            continue
+        if header:
+            break
+
+    def _data_rows():
+        """Yield the data rows of every partial CSV, skipping their headers."""
+        for filename in filenames:
+            try:
+                for row in islice(report_store.iter_rows(course_id, filename), 1, None):
+                    yield row
+            except IOError:
+                TASK_LOG.warning(u'Partial grade report %s is missing from the report store', filename)
+
+    return header, _data_rows()
 
 
 def _order_problems(blocks):
@@ -882,16 +1381,12 @@ def upload_problem_responses_csv(_xmodule_instance_args, _entry_id, course_id, t
     current_step = {'step': 'Calculating students answers to problem'}
     task_progress.update_task_state(extra_meta=current_step)
 
-    # Compute result table and format it
+    # Compute result table and format it. The responses are fetched as the
+    # rows are written out.
     problem_location = task_input.get('problem_location')
     student_data = list_problem_responses(course_id, problem_location)
     features = ['username', 'state']
-    header, rows = format_dictlist(student_data, features)
-
-    task_progress.attempted = task_progress.succeeded = len(rows)
-    task_progress.skipped = task_progress.total - task_progress.attempted
-
-    rows.insert(0, header)
+    rows = _problem_responses_rows(student_data, features, task_progress)
 
     current_step = {'step': 'Uploading CSV'}
     task_progress.update_task_state(extra_meta=current_step)
@@ -899,11 +1394,23 @@ def upload_problem_responses_csv(_xmodule_instance_args, _entry_id, course_id, t
     # Perform the upload
     problem_location = re.sub(r'[:/]', '_', problem_location)
     csv_name = 'student_state_from_{}'.format(problem_location)
-    upload_csv_to_report_store(rows, csv_name, course_id, start_date)
+    upload_csv_to_report_store(chain([features], rows), csv_name, course_id, start_date)
 
+    task_progress.skipped = task_progress.total - task_progress.attempted
     return task_progress.update_task_state(extra_meta=current_step)
 
 
+def _problem_responses_rows(student_data, features, task_progress):
+    """
+    Yield the `features` of each of the student responses in `student_data`
+    as a row of the problem responses report, counting them in `task_progress`.
+    """
+    for student_response in student_data:
+        task_progress.attempted += 1
+        task_progress.succeeded += 1
+        yield [student_response[feature] for feature in features]
+
+
 def upload_problem_grade_report(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
     """
     Generate a CSV containing all students' problem grades within a given
@@ -911,7 +1418,6 @@ def upload_problem_grade_report(_xmodule_instance_args, _entry_id, course_id, _t
     """
     start_time = time()
     start_date = datetime.now(UTC)
-    status_interval = 100
     enrolled_students = CourseEnrollment.objects.users_enrolled_in(course_id)
     task_progress = TaskProgress(action_name, enrolled_students.count(), start_time)
 
@@ -930,8 +1436,33 @@ def upload_problem_grade_report(_xmodule_instance_args, _entry_id, course_id, _t
         )
 
     # Just generate the static fields for now.
-    rows = [list(header_row.values()) + ['Final Grade'] + list(chain.from_iterable(problems.values()))]
+    header = list(header_row.values()) + ['Final Grade'] + list(chain.from_iterable(problems.values()))
     error_rows = [list(header_row.values()) + ['error_msg']]
+    rows = _problem_grade_report_rows(course_id, enrolled_students, header_row, problems, task_progress, error_rows)
+
+    # Perform the upload if any students have been successfully graded. Peek
+    # at the first row to find out; the rest are written out as they are
+    # generated.
+    first_row = next(rows, None)
+    if first_row is not None:
+        upload_csv_to_report_store(chain([header, first_row], rows), 'problem_grade_report', course_id, start_date)
+    # If there are any error rows, write them out as well
+    if len(error_rows) > 1:
+        upload_csv_to_report_store(error_rows, 'problem_grade_report_err', course_id, start_date)
+
+    return task_progress.update_task_state(extra_meta={'step': 'Uploading CSV'})
+
+
+def _problem_grade_report_rows(course_id, enrolled_students, header_row, problems, task_progress, error_rows):
+    """
+    Grade `enrolled_students` and yield the rows of the problem grade report
+    for them, updating `task_progress` along the way. Students are graded
+    lazily, as the rows are consumed.
+
+    The students that could not be graded are appended to the list
+    `error_rows` instead.
+    """
+    status_interval = 100
     current_step = {'step': 'Calculating Grades'}
 
     for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students, keep_raw_scores=True):
@@ -962,20 +1493,11 @@ def upload_problem_grade_report(_xmodule_instance_args, _entry_id, course_id, _t
                 # the case that the student does not have access to it (e.g. A/B
                 # test or cohorted courseware).
                 earned_possible_values.append(['N/A', 'N/A'])
-        rows.append(student_fields + [final_grade] + list(chain.from_iterable(earned_possible_values)))
-
         task_progress.succeeded += 1
         if task_progress.attempted % status_interval == 0:
             task_progress.update_task_state(extra_meta=current_step)
 
-    # Perform the upload if any students have been successfully graded
-    if len(rows) > 1:
-        upload_csv_to_report_store(rows, 'problem_grade_report', course_id, start_date)
-    # If there are any error rows, write them out as well
-    if len(error_rows) > 1:
-        upload_csv_to_report_store(error_rows, 'problem_grade_report_err', course_id, start_date)
-
-    return task_progress.update_task_state(extra_meta={'step': 'Uploading CSV'})
+        yield student_fields + [final_grade] + list(chain.from_iterable(earned_possible_values))
 
 
 def upload_students_csv(_xmodule_instance_args, _entry_id, course_id, task_input, action_name):
@@ -1019,9 +1541,9 @@ def upload_enrollment_report(_xmodule_instance_args, _entry_id, course_id, _task
     """
     start_time = time()
     start_date = datetime.now(UTC)
-    status_interval = 100
     students_in_course = CourseEnrollment.objects.enrolled_and_dropped_out_users(course_id)
-    task_progress = TaskProgress(action_name, students_in_course.count(), start_time)
+    total_students = students_in_course.count()
+    task_progress = TaskProgress(action_name, total_students, start_time)
 
     fmt = u'Task: {task_id}, InstructorTask ID: {entry_id}, Course: {course_id}, Input: {task_input}'
     task_info_string = fmt.format(
@@ -1032,12 +1554,34 @@ def upload_enrollment_report(_xmodule_instance_args, _entry_id, course_id, _task
     )
     TASK_LOG.info(u'%s, Task type: %s, Starting task execution', task_info_string, action_name)
 
-    # Loop over all our students and build our CSV lists in memory
-    rows = []
+    # Students' profiles are gathered as the rows are written out, so the
+    # report is never held in memory all at once.
+    rows = _enrollment_report_rows(
+        course_id, students_in_course, total_students, task_progress, task_info_string, action_name
+    )
+    upload_csv_to_report_store(rows, 'enrollment_report', course_id, start_date, config_name='FINANCIAL_REPORTS')
+
+    current_step = {'step': 'Uploading CSVs'}
+    task_progress.update_task_state(extra_meta=current_step)
+    TASK_LOG.info(u'%s, Task type: %s, Current step: %s', task_info_string, action_name, current_step)
+
+    # One last update before we close out...
+    TASK_LOG.info(u'%s, Task type: %s, Finalizing detailed enrollment task', task_info_string, action_name)
+    return task_progress.update_task_state(extra_meta=current_step)
+
+
+def _enrollment_report_rows(
+        course_id, students_in_course, total_students, task_progress, task_info_string, action_name
+):
+    """
+    Yield the rows of the detailed enrollment report for `students_in_course`,
+    starting with a header row, and update `task_progress` along the way.
+    """
+    # Loop over all our students and yield their CSV rows
+    status_interval = 100
     header = None
     current_step = {'step': 'Gathering Profile Information'}
     enrollment_report_provider = PaidCourseEnrollmentReportProvider()
-    total_students = students_in_course.count()
     student_counter = 0
     TASK_LOG.info(
         u'%s, Task type: %s, Current step: %s, generating detailed enrollment report for total students: %s',
@@ -1047,7 +1591,7 @@ def upload_enrollment_report(_xmodule_instance_args, _entry_id, course_id, _task
         total_students
     )
 
-    for student in students_in_course:
+    for student in students_in_course.iterator():
         # Periodically update task status (this is a cache write)
         if task_progress.attempted % status_interval == 0:
             task_progress.update_task_state(extra_meta=current_step)
@@ -1104,10 +1648,10 @@ def upload_enrollment_report(_xmodule_instance_args, _entry_id, course_id, _task
             for header_element in header:
                 # translate header into a localizable display string
                 display_headers.append(enrollment_report_headers.get(header_element, header_element))
-            rows.append(display_headers)
+            yield display_headers
 
-        rows.append(user_data.values() + course_enrollment_data.values() + payment_data.values())
         task_progress.succeeded += 1
+        yield user_data.values() + course_enrollment_data.values() + payment_data.values()
 
     TASK_LOG.info(
         u'%s, Task type: %s, Current step: %s, Detailed enrollment report generated for students: %s/%s',
@@ -1118,18 +1662,6 @@ def upload_enrollment_report(_xmodule_instance_args, _entry_id, course_id, _task
         total_students
     )
 
-    # By this point, we've got the rows we're going to stuff into our CSV files.
-    current_step = {'step': 'Uploading CSVs'}
-    task_progress.update_task_state(extra_meta=current_step)
-    TASK_LOG.info(u'%s, Task type: %s, Current step: %s', task_info_string, action_name, current_step)
-
-    # Perform the actual upload
-    upload_csv_to_report_store(rows, 'enrollment_report', course_id, start_date, config_name='FINANCIAL_REPORTS')
-
-    # One last update before we close out...
-    TASK_LOG.info(u'%s, Task type: %s, Finalizing detailed enrollment task', task_info_string, action_name)
-    return task_progress.update_task_state(extra_meta=current_step)
-
 
 def upload_may_enroll_csv(_xmodule_instance_args, _entry_id, course_id, task_input, action_name):
     """
@@ -11,8 +11,10 @@ from mock import patch
 import textwrap
 
 from celery.states import SUCCESS, FAILURE
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.test.utils import override_settings
 
 from openedx.core.djangoapps.util.testing import TestConditionalContent
 from capa.tests.response_xml_factory import (CodeResponseXMLFactory,
@@ -27,6 +29,7 @@ from instructor_task.api import (submit_rescore_problem_for_all_students,
                                  submit_reset_problem_attempts_for_all_students,
                                  submit_delete_problem_state_for_all_students)
 from instructor_task.models import InstructorTask
+from instructor_task import tasks_helper
 from instructor_task.tasks_helper import upload_grades_csv
 from instructor_task.tests.test_base import (
     InstructorTaskModuleTestCase,
@@ -337,6 +340,72 @@ class TestRescoringTask(TestIntegrationTask):
             self.check_state(username, descriptor, 0, 1, 2)
 
 
+@patch.dict(settings.FEATURES, {'ENABLE_BULK_RESCORING': True})
+@override_settings(RESCORE_BATCH_SIZE=3)
+class TestBulkRescoringTask(TestRescoringTask):
+    """
+    Runs the rescoring scenarios with bulk rescoring, in batches smaller than
+    the number of submissions.
+    """
+
+    @override_settings(RESCORE_SUBMISSIONS_PER_SHARD=2)
+    def test_sharded_rescoring(self):
+        """Run rescore scenario on option problem, in shards of two submissions"""
+        problem_url_name = 'H1P1'
+        self.define_option_problem(problem_url_name)
+        location = InstructorTaskModuleTestCase.problem_location(problem_url_name)
+        descriptor = self.module_store.get_item(location)
+        self.create_student('u5')
+
+        self.submit_student_answer('u1', problem_url_name, [OPTION_1, OPTION_1])
+        self.submit_student_answer('u2', problem_url_name, [OPTION_1, OPTION_2])
+        self.submit_student_answer('u3', problem_url_name, [OPTION_2, OPTION_1])
+        self.submit_student_answer('u4', problem_url_name, [OPTION_2, OPTION_2])
+        self.submit_student_answer('u5', problem_url_name, [OPTION_1, OPTION_1])
+
+        self.redefine_option_problem(problem_url_name)
+        instructor_task = self.submit_rescore_all_student_answers('instructor', problem_url_name)
+
+        instructor_task = InstructorTask.objects.get(id=instructor_task.id)
+        self.assertEqual(instructor_task.task_state, SUCCESS)
+        self.assertEqual(json.loads(instructor_task.subtasks)['total'], 3)
+        self.assertDictContainsSubset(
+            {'attempted': 5, 'succeeded': 5, 'failed': 0}, json.loads(instructor_task.task_output)
+        )
+        self.check_state('u1', descriptor, 0, 2, 1)
+        self.check_state('u2', descriptor, 1, 2, 1)
+        self.check_state('u3', descriptor, 1, 2, 1)
+        self.check_state('u4', descriptor, 2, 2, 1)
+        self.check_state('u5', descriptor, 0, 2, 1)
+
+    def test_submission_during_rescoring(self):
+        """Check that rescoring doesn't overwrite a submission made after its batch was fetched"""
+        problem_url_name = 'H1P1'
+        self.define_option_problem(problem_url_name)
+        location = InstructorTaskModuleTestCase.problem_location(problem_url_name)
+        descriptor = self.module_store.get_item(location)
+        userlist = ['u1', 'u2', 'u3', 'u4']
+        for username in userlist:
+            self.submit_student_answer(username, problem_url_name, [OPTION_1, OPTION_1])
+
+        self.redefine_option_problem(problem_url_name)
+        real_prefetch_anonymous_ids = tasks_helper.prefetch_anonymous_ids
+
+        def submit_during_rescoring(course_id, students):
+            """Submits a new answer for u1 once the first batch has been fetched."""
+            if any(student.username == 'u1' for student in students):
+                self.submit_student_answer('u1', problem_url_name, [OPTION_2, OPTION_2])
+            return real_prefetch_anonymous_ids(course_id, students)
+
+        with patch('instructor_task.tasks_helper.prefetch_anonymous_ids', side_effect=submit_during_rescoring):
+            self.submit_rescore_all_student_answers('instructor', problem_url_name)
+
+        # u1's second submission was rescored rather than overwritten by its first one.
+        self.check_state('u1', descriptor, 2, 2, 2)
+        for username in userlist[1:]:
+            self.check_state(username, descriptor, 0, 2, 1)
+
+
 class TestResetAttemptsTask(TestIntegrationTask):
     """
     Integration-style tests for resetting problem attempts in a background task.
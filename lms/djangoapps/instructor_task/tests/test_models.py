@@ -4,6 +4,8 @@ Tests for instructor_task/models.py.
 
 from cStringIO import StringIO
 import mock
+import os
+import stat
 import time
 from datetime import datetime
 from unittest import TestCase
@@ -20,11 +22,21 @@ class MockKey(object):
     def __init__(self, bucket):
         self.last_modified = datetime.now()
         self.bucket = bucket
+        self.contents = None
 
     def set_contents_from_string(self, contents, headers):  # pylint: disable=unused-argument
         """ Expected method on a Key object. """
+        self.contents = contents
         self.bucket.store_key(self)
 
+    def set_contents_from_file(self, fp, headers, size):  # pylint: disable=unused-argument
+        """ Expected method on a Key object. """
+        self.set_contents_from_string(fp.read(size), headers)
+
+    def get_contents_to_file(self, fp):
+        """ Expected method on a Key object. """
+        fp.write(self.contents)
+
     def generate_url(self, expires_in):  # pylint: disable=unused-argument
         """ Expected method on a Key object. """
         return "http://fake-edx-s3.edx.org/"
@@ -43,6 +55,10 @@ class MockBucket(object):
         """ Expected method on a Bucket object. """
         return self.keys
 
+    def get_key(self, key_name):
+        """ Expected method on a Bucket object. """
+        return next((key for key in reversed(self.keys) if key.key == key_name), None)
+
 
 class MockS3Connection(object):
     """ Mocking a boto S3 Connection """
@@ -84,6 +100,21 @@ class ReportStoreTestMixin(object):
             ['new_file', 'middle_file', 'old_file']
         )
 
+    def test_store_rows_from_generator(self):
+        """
+        Test that ReportStore.store_rows() writes out all the rows of a
+        generator, and that they can be read back with iter_rows().
+        """
+        report_store = self.create_report_store()
+        rows = ([unicode(index), u'ni\xf1o'] for index in range(1000))
+        report_store.store_rows(self.course_id, 'report.csv', rows)
+
+        self.assertEqual(
+            list(report_store.iter_rows(self.course_id, 'report.csv')),
+            [[unicode(index), u'ni\xf1o'] for index in range(1000)]
+        )
+        self.assertEqual([link[0] for link in report_store.links_for(self.course_id)], ['report.csv'])
+
 
 class LocalFSReportStoreTestCase(ReportStoreTestMixin, TestReportMixin, TestCase):
     """
@@ -93,6 +124,20 @@ class LocalFSReportStoreTestCase(ReportStoreTestMixin, TestReportMixin, TestCase
         """ Create and return a LocalFSReportStore. """
         return LocalFSReportStore.from_config(config_name='GRADES_DOWNLOAD')
 
+    def test_store_rows_file_mode(self):
+        """
+        Test that the files written by store_rows() have the same
+        permissions as the files written by store().
+        """
+        report_store = self.create_report_store()
+        report_store.store(self.course_id, 'stored.csv', StringIO('a,b\n'))
+        report_store.store_rows(self.course_id, 'report.csv', [['a', 'b']])
+
+        self.assertEqual(
+            stat.S_IMODE(os.stat(report_store.path_to(self.course_id, 'report.csv')).st_mode),
+            stat.S_IMODE(os.stat(report_store.path_to(self.course_id, 'stored.csv')).st_mode),
+        )
+
 
 @mock.patch('instructor_task.models.S3Connection', new=MockS3Connection)
 @mock.patch('instructor_task.models.Key', new=MockKey)
@@ -8,10 +8,16 @@ Tests that CSV grade report generation works with unicode emails.
 """
 import ddt
 from mock import Mock, patch
+import os
 import tempfile
 import json
+from uuid import uuid4
+
+from celery.states import SUCCESS, FAILURE
 from openedx.core.djangoapps.course_groups import cohorts
 import unicodecsv
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.test.utils import override_settings
 
@@ -32,7 +38,8 @@ from student.models import CourseEnrollment, CourseEnrollmentAllowed, ManualEnro
 from verify_student.tests.factories import SoftwareSecurePhotoVerificationFactory
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from xmodule.partitions.partitions import Group, UserPartition
-from instructor_task.models import ReportStore
+from instructor_task.models import InstructorTask, ReportStore
+from instructor_task.tests.factories import InstructorTaskFactory
 from survey.models import SurveyForm, SurveyAnswer
 from instructor_task.tasks_helper import (
     cohort_students_and_upload,
@@ -111,6 +118,66 @@ class TestInstructorGradeReport(InstructorGradeReportTestCase):
         report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
         self.assertTrue(any('grade_report_err' in item[0] for item in report_store.links_for(self.course.id)))
 
+    @patch.dict(settings.FEATURES, {'ENABLE_SHARDED_GRADE_REPORTS': True})
+    @override_settings(GRADES_DOWNLOAD_STUDENTS_PER_SHARD=2)
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_sharded_grade_report(self, _mock_current_task):
+        """
+        Test that grading a course in shards produces a single report
+        containing every student, and cleans up the partial reports.
+        """
+        students = [self.create_student(u'student{}'.format(i), u'student{}@example.com'.format(i)) for i in range(5)]
+        entry = InstructorTaskFactory.create(
+            task_type='grade_course',
+            course_id=self.course.id,
+            task_id=str(uuid4()),
+        )
+        upload_grades_csv(None, entry.id, self.course.id, None, 'graded')
+
+        entry = InstructorTask.objects.get(pk=entry.id)
+        self.assertEqual(entry.task_state, SUCCESS)
+        self.assertEqual(json.loads(entry.subtasks)['total'], 3)
+        self.assertDictContainsSubset(
+            {'attempted': 5, 'succeeded': 5, 'failed': 0}, json.loads(entry.task_output)
+        )
+
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        links = report_store.links_for(self.course.id)
+        self.assertEqual(len(links), 1)
+        self.assertIn('grade_report', links[0][0])
+        self.assertEqual(
+            len(os.listdir(report_store.path_to(self.course.id, ''))), 1, 'partial reports should be removed'
+        )
+        self.verify_rows_in_csv(
+            [{'id': unicode(student.id), 'username': student.username} for student in students],
+            ignore_other_columns=True,
+        )
+
+    @patch.dict(settings.FEATURES, {'ENABLE_SHARDED_GRADE_REPORTS': True})
+    @override_settings(GRADES_DOWNLOAD_STUDENTS_PER_SHARD=2)
+    @patch('instructor_task.tasks_helper._get_current_task')
+    def test_sharded_grade_report_merge_failure(self, _mock_current_task):
+        """
+        Test that a failure to merge the partial reports fails the task,
+        cleans up the partial reports and releases the merge lock.
+        """
+        for i in range(3):
+            self.create_student(u'student{}'.format(i), u'student{}@example.com'.format(i))
+        entry = InstructorTaskFactory.create(
+            task_type='grade_course',
+            course_id=self.course.id,
+            task_id=str(uuid4()),
+        )
+        with patch('instructor_task.tasks_helper.upload_csv_to_report_store', side_effect=IOError('disk full')):
+            upload_grades_csv(None, entry.id, self.course.id, None, 'graded')
+
+        entry = InstructorTask.objects.get(pk=entry.id)
+        self.assertEqual(entry.task_state, FAILURE)
+        self.assertEqual(json.loads(entry.task_output)['exception'], 'IOError')
+        report_store = ReportStore.from_config(config_name='GRADES_DOWNLOAD')
+        self.assertEqual(report_store.links_for(self.course.id), [])
+        self.assertIsNone(cache.get(u'grade-report-merge-{}'.format(entry.task_id)))
+
     def test_cohort_data_in_grading(self):
         """
         Test that cohort data is included in grades csv if cohort configuration is enabled for course.
@@ -61,6 +61,14 @@ DISCUSSION_SETTINGS = {
     'MAX_COMMENT_DEPTH': 2,
 }
 
+# Connections to the comments service, when ENABLE_COMMENTS_SERVICE_POOL is
+# on: the number of connections kept open by each process, the number of
+# times a request is retried when it can't connect, and the number of
+# requests that may be sent in parallel (see lms.lib.comment_client.utils).
+COMMENTS_SERVICE_POOL_SIZE = 10
+COMMENTS_SERVICE_MAX_RETRIES = 2
+COMMENTS_SERVICE_CONCURRENCY = 4
+
 
 # Features
 FEATURES = {
@@ -402,6 +410,48 @@ FEATURES = {
     # Enable the max score cache to speed up grading
     'ENABLE_MAX_SCORE_CACHE': True,
 
+    # Use the max scores precomputed from problem definitions when the course
+    # blocks are collected, so grading doesn't load problems to learn them
+    'ENABLE_MAX_SCORE_INDEX': False,
+
+    # Persist per-subsection grades and only regrade subsections whose scores
+    # have changed since they were last graded
+    'ENABLE_PERSISTENT_GRADES': False,
+
+    # Grade the students of large courses in parallel shards when generating
+    # grade reports (see GRADES_DOWNLOAD_STUDENTS_PER_SHARD)
+    'ENABLE_SHARDED_GRADE_REPORTS': False,
+
+    # Rescore problems in batches, and in parallel shards for problems with
+    # many submissions (see RESCORE_BATCH_SIZE and RESCORE_SUBMISSIONS_PER_SHARD)
+    'ENABLE_BULK_RESCORING': False,
+
+    # Buffer the XBlock user state stored during a request, and write each
+    # block's state once at the end of the request.
+    'ENABLE_USER_STATE_WRITE_BUFFER': False,
+
+    # Insert the StudentModuleHistory entries of the problem states saved
+    # during a request from a Celery task, after the request is committed.
+    'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': False,
+
+    # Cache the enrollments of each user for the duration of a request and in
+    # the default cache, rather than querying them on every lookup.
+    'ENABLE_ENROLLMENT_CACHE': False,
+
+    # Send the requests to the comments service through a pooled session
+    # that keeps its connections open, and send independent requests in
+    # parallel (see COMMENTS_SERVICE_POOL_SIZE and COMMENTS_SERVICE_CONCURRENCY).
+    'ENABLE_COMMENTS_SERVICE_POOL': False,
+
+    # Rewrite the /static/, /course/ and /jump_to_id/ urls of rendered
+    # XBlocks in a single pass, rather than in one pass for each kind of url
+    # at every level of the course hierarchy.
+    'ENABLE_SINGLE_PASS_URL_REWRITING': False,
+
+    # Build the courseware table of contents from the cached course blocks,
+    # rather than from the course module and its chapters and sections.
+    'ENABLE_CACHED_TOC': False,
+
     # Enable LTI Provider feature.
     'ENABLE_LTI_PROVIDER': False,
 }
@@ -704,6 +754,13 @@ XBLOCK_SELECT_FUNCTION = prefer_xmodules
 
 MODULESTORE_BRANCH = 'published-only'
 CONTENTSTORE = None
+
+# Cache the course assets that are too large for memcached on the local disk,
+# e.g. {'DIRECTORY': '/tmp/static_content_cache', 'MAX_SIZE': 10 * 1024 ** 3},
+# optionally with a 'MAX_FILE_SIZE' (a quarter of MAX_SIZE by default).
+# The cache is disabled if this is None.
+STATIC_CONTENT_DISK_CACHE = None
+
 DOC_STORE_CONFIG = {
     'host': 'localhost',
     'db': 'xmodule',
@@ -736,6 +793,7 @@ MODULESTORE = {
                         'default_class': 'xmodule.hidden_module.HiddenDescriptor',
                         'fs_root': DATA_DIR,
                         'render_template': 'edxmako.shortcuts.render_to_string',
+                        'persist_metadata_inheritance': True,
                     }
                 },
                 {
@@ -751,6 +809,16 @@ MODULESTORE = {
     }
 }
 
+# Maximum sizes, in bytes, of the in-process LRU caches kept in front of the
+# django caches for immutable course data.  A cache is disabled if it isn't
+# listed here.
+PROCESS_LOCAL_CACHE_MAX_SIZES = {
+    # Compressed split modulestore structures
+    'course_structure_cache': 64 * 1024 * 1024,
+    # Serialized course block structures
+    'block_structure_cache': 64 * 1024 * 1024,
+}
+
 #################### Python sandbox ############################################
 
 CODE_JAIL = {
@@ -764,6 +832,18 @@ CODE_JAIL = {
         # How many CPU seconds can jailed code use?
         'CPU': 1,
     },
+
+    # Pool of long-lived Python workers that capa runs code in, instead of
+    # starting a new process for every execution.  See capa.safe_exec.pool.
+    'pool': {
+        # How many workers per web process?  0 means don't use a pool.
+        'size': 0,
+        # How many executions before a worker is replaced?
+        'max_runs_per_worker': 100,
+        # Also run code that is allowed to run unsafely in a pool of
+        # unsandboxed workers, instead of in the web process?
+        'unsafe': False,
+    },
 }
 
 # Some courses are allowed to run unsafe code. This is a list of regexes, one
@@ -1158,7 +1238,11 @@ MIDDLEWARE_CLASSES = (
     # 'django.middleware.locale.LocaleMiddleware',
     'django_locale.middleware.LocaleMiddleware',
 
+    # Must come before TransactionMiddleware, so that it runs callbacks after the commit.
+    'util.middleware.AfterCommitMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
+    # Must come after TransactionMiddleware, so that it writes in the request's transaction.
+    'courseware.middleware.UserStateWriteBufferMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
 
     'django_comment_client.utils.ViewNameMiddleware',
@@ -1769,6 +1853,17 @@ BULK_EMAIL_LOG_SENT_EMAILS = False
 # parallel, and what the SES rate is.
 BULK_EMAIL_RETRY_DELAY_BETWEEN_SENDS = 0.02
 
+# Number of SMTP/SES connections over which each bulk email task sends its
+# emails concurrently.
+BULK_EMAIL_CONNECTIONS_PER_TASK = 1
+
+# Maximum number of bulk emails sent per second by all the workers, which
+# should be the sending rate of the SES account.  The rate is reduced when
+# sending is throttled, and is increased back while it isn't.  When this is
+# set, it replaces the delay of BULK_EMAIL_RETRY_DELAY_BETWEEN_SENDS.  If it is
+# not set, the sending rate isn't limited.
+BULK_EMAIL_MAX_SENDS_PER_SECOND = None
+
 ############################# Email Opt In ####################################
 
 # Minimum age for organization-wide email opt in
@@ -2206,6 +2301,16 @@ BADGR_ISSUER_SLUG = "example-issuer"
 ###################### Grade Downloads ######################
 GRADES_DOWNLOAD_ROUTING_KEY = HIGH_MEM_QUEUE
 
+# Number of students graded by each subtask when ENABLE_SHARDED_GRADE_REPORTS
+# is on. Courses with fewer students are graded by a single task.
+GRADES_DOWNLOAD_STUDENTS_PER_SHARD = 5000
+
+# Number of submissions whose writes are committed together, and number of
+# submissions rescored by each subtask, when ENABLE_BULK_RESCORING is on.
+# Problems with fewer submissions are rescored by a single task.
+RESCORE_BATCH_SIZE = 100
+RESCORE_SUBMISSIONS_PER_SHARD = 5000
+
 GRADES_DOWNLOAD = {
     'STORAGE_TYPE': 'localfs',
     'BUCKET': 'edx-grades',
@@ -2218,6 +2323,11 @@ FINANCIAL_REPORTS = {
     'ROOT_PATH': '/tmp/edx-s3/financial_reports',
 }
 
+###################### Student Module History ######################
+# Queue of the tasks that insert StudentModuleHistory entries when
+# ENABLE_ASYNC_STUDENT_MODULE_HISTORY is on.
+STUDENT_MODULE_HISTORY_ROUTING_KEY = DEFAULT_PRIORITY_QUEUE
+
 
 #### PASSWORD POLICY SETTINGS #####
 PASSWORD_MIN_LENGTH = 8
@@ -229,6 +229,10 @@ CACHES = {
     },
 }
 
+# Tests count the cache and modulestore queries they make, so don't keep
+# anything cached between them.
+PROCESS_LOCAL_CACHE_MAX_SIZES = {}
+
 # Dummy secret key for dev
 SECRET_KEY = '85920908f28904ed733fe576320db18cabd7b6cd'
 
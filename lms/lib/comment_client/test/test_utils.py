@@ -0,0 +1,126 @@
+"""
+Tests for the pooled session and concurrent requests of the comment client.
+"""
+import threading
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils import translation
+from mock import Mock, patch
+
+from lms.lib.comment_client import utils
+
+
+class PooledSessionTestMixin(object):
+    """
+    Forgets the session and thread pool of the comment client after each test.
+    """
+    def setUp(self):
+        super(PooledSessionTestMixin, self).setUp()
+        self.addCleanup(self.reset_pool)
+
+    def reset_pool(self):
+        """Stops the thread pool, so that the next test creates a new one."""
+        if utils._ConnectionPool.threads is not None:  # pylint: disable=protected-access
+            utils._ConnectionPool.threads.terminate()  # pylint: disable=protected-access
+        utils._ConnectionPool._pid = None  # pylint: disable=protected-access
+        utils._ConnectionPool.session = None  # pylint: disable=protected-access
+        utils._ConnectionPool.threads = None  # pylint: disable=protected-access
+
+
+def make_response(data):
+    """Returns a mock response of the comments service with the JSON `data`."""
+    return Mock(status_code=200, text='{}', json=Mock(return_value=data))
+
+
+class PerformRequestTest(PooledSessionTestMixin, TestCase):
+    """
+    Tests that perform_request uses the pooled session when it is enabled.
+    """
+    @patch('requests.Session.request')
+    @patch('requests.request')
+    def test_pooling_disabled(self, mock_request, mock_session_request):
+        mock_request.return_value = make_response({'id': 1})
+        self.assertEqual(utils.perform_request('get', 'http://localhost:4567/api/v1/threads/1'), {'id': 1})
+        self.assertTrue(mock_request.called)
+        self.assertFalse(mock_session_request.called)
+
+    @patch.dict(settings.FEATURES, {'ENABLE_COMMENTS_SERVICE_POOL': True})
+    @patch('requests.Session.request')
+    @patch('requests.request')
+    def test_pooling_enabled(self, mock_request, mock_session_request):
+        mock_session_request.return_value = make_response({'id': 1})
+        self.assertEqual(utils.perform_request('get', 'http://localhost:4567/api/v1/threads/1'), {'id': 1})
+        session = utils._ConnectionPool.session  # pylint: disable=protected-access
+        utils.perform_request('get', 'http://localhost:4567/api/v1/threads/1')
+
+        self.assertFalse(mock_request.called)
+        self.assertEqual(mock_session_request.call_count, 2)
+        self.assertIs(utils._ConnectionPool.session, session)  # pylint: disable=protected-access
+
+    @patch.dict(settings.FEATURES, {'ENABLE_COMMENTS_SERVICE_POOL': True})
+    @patch('requests.Session.request')
+    def test_new_session_after_fork(self, mock_session_request):
+        mock_session_request.return_value = make_response({})
+        utils.perform_request('get', 'http://localhost:4567/api/v1/threads/1')
+        session = utils._ConnectionPool.session  # pylint: disable=protected-access
+
+        with patch('os.getpid', return_value=-1):
+            utils.perform_request('get', 'http://localhost:4567/api/v1/threads/1')
+        self.assertIsNot(utils._ConnectionPool.session, session)  # pylint: disable=protected-access
+
+
+@patch.dict(settings.FEATURES, {'ENABLE_COMMENTS_SERVICE_POOL': True})
+class PerformConcurrentlyTest(PooledSessionTestMixin, TestCase):
+    """
+    Tests for perform_concurrently.
+    """
+    def test_results(self):
+        self.assertEqual(utils.perform_concurrently(lambda: 1, lambda: 2, lambda: 3), [1, 2, 3])
+
+    def test_functions_run_in_parallel(self):
+        # The functions would wait for each other forever if they were run in turn.
+        released = threading.Semaphore(0)
+
+        def wait():
+            """Waits for `release`, in the current thread."""
+            released.acquire()
+            return threading.current_thread()
+
+        def release():
+            """Releases `wait`, in a pool thread."""
+            released.release()
+            return threading.current_thread()
+
+        wait_thread, release_thread = utils.perform_concurrently(wait, release)
+        self.assertIs(wait_thread, threading.current_thread())
+        self.assertIsNot(release_thread, threading.current_thread())
+
+    def test_functions_run_in_turn_when_disabled(self):
+        with patch.dict(settings.FEATURES, {'ENABLE_COMMENTS_SERVICE_POOL': False}):
+            threads = utils.perform_concurrently(threading.current_thread, threading.current_thread)
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_exceptions(self):
+        def fail(message):
+            """Returns a function raising a ValueError with `message`."""
+            def _fail():
+                raise ValueError(message)
+            return _fail
+
+        with self.assertRaisesRegexp(ValueError, 'second'):
+            utils.perform_concurrently(lambda: 1, fail('second'), fail('third'))
+
+    def test_language(self):
+        translation.activate('eo')
+        self.addCleanup(translation.deactivate)
+        self.assertEqual(utils.perform_concurrently(lambda: 1, translation.get_language), [1, 'eo'])
+
+    @override_settings(COMMENTS_SERVICE_CONCURRENCY=1)
+    def test_nested_calls(self):
+        def nested():
+            """Calls perform_concurrently from the only pool thread."""
+            return utils.perform_concurrently(lambda: 1, lambda: 2)
+
+        self.assertEqual(utils.perform_concurrently(lambda: 0, nested, nested), [0, [1, 2], [1, 2]])
@@ -1,15 +1,118 @@
 from contextlib import contextmanager
 import dogstats_wrapper as dog_stats_api
 import logging
+from multiprocessing.pool import ThreadPool
+import os
 import requests
+from requests.adapters import HTTPAdapter
+import threading
 from django.conf import settings
 from time import time
 from uuid import uuid4
+from django.utils import translation
 from django.utils.translation import get_language
 
 log = logging.getLogger(__name__)
 
 
+class _ConnectionPool(object):
+    """
+    The session and thread pool used to talk to the comments service by this
+    process, created lazily, and again in each process forked from it.
+    """
+    _lock = threading.Lock()
+    _pid = None
+    session = None
+    threads = None
+
+    @classmethod
+    def check_process(cls):
+        """
+        Creates the session and thread pool of this process if need be.
+        """
+        pid = os.getpid()
+        if cls._pid == pid:
+            return
+        with cls._lock:
+            if cls._pid == pid:
+                return
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.COMMENTS_SERVICE_POOL_SIZE,
+                max_retries=settings.COMMENTS_SERVICE_MAX_RETRIES,
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            cls.session = session
+            cls.threads = ThreadPool(settings.COMMENTS_SERVICE_CONCURRENCY)
+            cls._pid = pid
+
+
+# Marks the threads of the thread pool while they run a function.
+_POOL_THREAD = threading.local()
+
+
+def _pooling_enabled():
+    """
+    Returns whether requests to the comments service use a pooled session.
+    """
+    return settings.FEATURES.get('ENABLE_COMMENTS_SERVICE_POOL', False)
+
+
+def _send_request(method, url, **kwargs):
+    """
+    Sends a request to the comments service, through the pooled session of
+    this process if pooling is enabled, so that its connections are reused.
+    """
+    if not _pooling_enabled():
+        return requests.request(method, url, **kwargs)
+    _ConnectionPool.check_process()
+    return _ConnectionPool.session.request(method, url, **kwargs)
+
+
+def perform_concurrently(*functions):
+    """
+    Calls the `functions`, which take no arguments and typically each make a
+    request to the comments service, and returns the list of their results.
+
+    If pooling is enabled, all the functions but the first are called in
+    parallel threads, up to COMMENTS_SERVICE_CONCURRENCY at a time, with the
+    language of the current thread; they shouldn't use the database, whose
+    connections are per thread. The first function is called in the current
+    thread meanwhile, and may use it. Otherwise, the functions are called in
+    turn.
+
+    If functions raise exceptions, the exception of the first of them is
+    raised once they have all returned.
+    """
+    # Functions that are already run by the thread pool run theirs in turn,
+    # rather than wait for threads of the pool they may be holding.
+    if not _pooling_enabled() or len(functions) < 2 or getattr(_POOL_THREAD, 'active', False):
+        return [function() for function in functions]
+
+    _ConnectionPool.check_process()
+    language = get_language()
+
+    def _call(function):
+        """Calls `function` in a pool thread, with the language of the request."""
+        translation.activate(language)
+        _POOL_THREAD.active = True
+        try:
+            return function()
+        finally:
+            _POOL_THREAD.active = False
+            translation.deactivate()
+
+    pending = [_ConnectionPool.threads.apply_async(_call, (function,)) for function in functions[1:]]
+    try:
+        first_result = functions[0]()
+    finally:
+        for result in pending:
+            result.wait()
+    return [first_result] + [result.get() for result in pending]
+
+
 def strip_none(dic):
     return dict([(k, v) for k, v in dic.iteritems() if v is not None])
 
@@ -76,7 +179,7 @@ def perform_request(method, url, data_or_params=None, raw=False,
         data = None
         params = merge_dict(data_or_params, request_id_dict)
     with request_timer(request_id, method, url, metric_tags):
-        response = requests.request(
+        response = _send_request(
             method,
             url,
             data=data,
@@ -32,6 +32,8 @@ def run():
 
     add_mimetypes()
 
+    configure_safe_exec_pool()
+
     if settings.FEATURES.get('USE_CUSTOM_THEME', False):
         enable_stanford_theme()
 
@@ -66,6 +68,15 @@ def run():
     xmodule.x_module.descriptor_global_local_resource_url = lms_xblock.runtime.local_resource_url
 
 
+def configure_safe_exec_pool():
+    """
+    Configure the pool of workers that capa's safe_exec runs code in.
+    """
+    from capa.safe_exec import pool
+
+    pool.configure(**settings.CODE_JAIL.get('pool', {}))
+
+
 def add_mimetypes():
     """
     Add extra mimetypes. Used in xblock_resource.
@@ -100,7 +100,7 @@ def course_structure(course_key, block_types=None):
             return data
 
     # If we don't have data stored, generate it and return an error.
-    tasks.update_course_structure.delay(unicode(course_key))
+    tasks.queue_course_structure_update(course_key)
     raise CourseStructureNotAvailableError
 
 
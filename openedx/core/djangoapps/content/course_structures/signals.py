@@ -14,7 +14,7 @@ def listen_for_course_publish(sender, course_key, **kwargs):  # pylint: disable=
     Course Structure application receiver for the course_published signal
     """
     # Import tasks here to avoid a circular import.
-    from .tasks import update_course_structure
+    from .tasks import queue_course_structure_update
 
     # Delete the existing discussion id map cache to avoid inconsistencies
     try:
@@ -24,6 +24,4 @@ def listen_for_course_publish(sender, course_key, **kwargs):  # pylint: disable=
     except CourseStructure.DoesNotExist:
         pass
 
-    # Note: The countdown=0 kwarg is set to to ensure the method below does not attempt to access the course
-    # before the signal emitter has finished all operations. This is also necessary to ensure all tests pass.
-    update_course_structure.apply_async([unicode(course_key)], countdown=0)
+    queue_course_structure_update(course_key)
@@ -5,12 +5,36 @@ import json
 import logging
 
 from celery.task import task
+from django.core.cache import cache
 from opaque_keys.edx.keys import CourseKey
 from xmodule.modulestore.django import modulestore
 
 
 log = logging.getLogger('edx.celery.task')
 
+# Number of seconds after which a queued update of a course structure that
+# hasn't started is assumed lost, so that another one can be queued.
+UPDATE_PENDING_TIMEOUT = 60 * 10
+
+
+def _update_pending_cache_key(course_key):
+    """
+    Returns the cache key marking that an update of the structure of the given course is queued.
+    """
+    return u'course_structures.update_pending.{}'.format(course_key)
+
+
+def queue_course_structure_update(course_key):
+    """
+    Queues an update of the structure of the given course, unless one is already queued and
+    hasn't started yet.  This keeps concurrent requests for a missing course structure, or a
+    burst of publishes, from each generating the same structure.
+    """
+    if cache.add(_update_pending_cache_key(course_key), 'true', UPDATE_PENDING_TIMEOUT):
+        # Note: The countdown=0 kwarg is set to ensure the task does not attempt to access the course
+        # before the caller has finished all operations. This is also necessary to ensure all tests pass.
+        update_course_structure.apply_async([unicode(course_key)], countdown=0)
+
 
 def _generate_course_structure(course_key):
     """
@@ -75,6 +99,10 @@ def update_course_structure(course_key):
 
     course_key = CourseKey.from_string(course_key)
 
+    # Allow another update to be queued from now on, since changes made to the course
+    # after this point may not be included in the structure generated here.
+    cache.delete(_update_pending_cache_key(course_key))
+
     try:
         structure = _generate_course_structure(course_key)
     except Exception as ex:
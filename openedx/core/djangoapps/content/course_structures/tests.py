@@ -3,13 +3,17 @@ Course Structure Content sub-application test cases
 """
 import json
 
+from mock import patch
+
 from xmodule_django.models import UsageKey
 from xmodule.modulestore.django import SignalHandler
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from openedx.core.djangoapps.content.course_structures.models import CourseStructure
 from openedx.core.djangoapps.content.course_structures.signals import listen_for_course_publish
-from openedx.core.djangoapps.content.course_structures.tasks import _generate_course_structure, update_course_structure
+from openedx.core.djangoapps.content.course_structures.tasks import (
+    _generate_course_structure, queue_course_structure_update, update_course_structure
+)
 
 
 class SignalDisconnectTestMixin(object):
@@ -235,3 +239,17 @@ class CourseStructureTaskTests(ModuleStoreTestCase):
             [unicode(value) for value in structure.discussion_id_map.values()],
             expected_structure['discussion_id_map'].values()
         )
+
+    @patch('openedx.core.djangoapps.content.course_structures.tasks.update_course_structure.apply_async')
+    def test_queue_course_structure_update(self, mock_apply_async):
+        """
+        Test that only one update of a course structure is queued until it starts.
+        """
+        queue_course_structure_update(self.course.id)
+        queue_course_structure_update(self.course.id)
+        mock_apply_async.assert_called_once_with([unicode(self.course.id)], countdown=0)
+
+        # Once the queued update starts, another one can be queued
+        update_course_structure(unicode(self.course.id))
+        queue_course_structure_update(self.course.id)
+        self.assertEqual(mock_apply_async.call_count, 2)
@@ -2,6 +2,9 @@
 Top-level module for the Block Cache framework with higher order
 functions for getting and clearing cached blocks.
 """
+# pylint: disable=protected-access
+from openedx.core.lib.cache_utils import get_single_flight
+
 from .block_structure_factory import BlockStructureFactory
 from .exceptions import TransformerException
 from .transformer_registry import TransformerRegistry
@@ -55,6 +58,52 @@ def get_blocks(cache, modulestore, usage_info, root_block_usage_key, transformer
     # Load the cached block structure.
     root_block_structure = BlockStructureFactory.create_from_cache(root_block_usage_key, cache, transformers)
 
+    # On cache miss, or if the cached data of some transformers is
+    # outdated, update the cache.  Only one process at a time does so;
+    # meanwhile, the others use the block structure that was cached
+    # before it was last removed from the cache, if any.
+    if not root_block_structure:
+        root_block_structure = get_single_flight(
+            'block_structure',
+            cache,
+            BlockStructureFactory._encode_lock_cache_key(root_block_usage_key),
+            get_cached=lambda: BlockStructureFactory.create_from_cache(root_block_usage_key, cache, transformers),
+            compute=lambda: _update_cache(cache, modulestore, root_block_usage_key, transformers),
+            get_stale=lambda: BlockStructureFactory.create_from_cache(
+                root_block_usage_key, cache, transformers, stale=True
+            ),
+        )
+
+    # Execute requested transforms on block structure.
+    for transformer in transformers:
+        transformer.transform(usage_info, root_block_structure)
+
+    # Prune the block structure to remove any unreachable blocks.
+    root_block_structure._prune_unreachable()
+
+    return root_block_structure
+
+
+def _update_cache(cache, modulestore, root_block_usage_key, transformers):
+    """
+    Collects the data of the block structure starting at
+    root_block_usage_key that is missing or outdated in the given cache,
+    updates the cache with it, and returns the block structure.
+    """
+    # Load the cached block structure, which may have been updated since
+    # it was last loaded.
+    root_block_structure, outdated_transformers = BlockStructureFactory.load_from_cache(
+        root_block_usage_key, cache, transformers
+    )
+
+    # If only some transformers' cached data is outdated, execute the
+    # collect phase for just those transformers and update their data
+    # in the cache.
+    if root_block_structure and outdated_transformers:
+        root_block_structure = BlockStructureFactory.update_transformers_in_cache(
+            root_block_structure, outdated_transformers, modulestore, cache
+        )
+
     # On cache miss, execute the collect phase and update the cache.
     if not root_block_structure:
 
@@ -63,22 +112,15 @@ def get_blocks(cache, modulestore, usage_info, root_block_usage_key, transformer
 
         # Collect data from each registered transformer.
         for transformer in TransformerRegistry.get_registered_transformers():
-            root_block_structure._add_transformer(transformer)  # pylint: disable=protected-access
+            root_block_structure._add_transformer(transformer)
             transformer.collect(root_block_structure)
 
         # Collect all fields that were requested by the transformers.
-        root_block_structure._collect_requested_xblock_fields()  # pylint: disable=protected-access
+        root_block_structure._collect_requested_xblock_fields()
 
         # Cache this information.
         BlockStructureFactory.serialize_to_cache(root_block_structure, cache)
 
-    # Execute requested transforms on block structure.
-    for transformer in transformers:
-        transformer.transform(usage_info, root_block_structure)
-
-    # Prune the block structure to remove any unreachable blocks.
-    root_block_structure._prune_unreachable()  # pylint: disable=protected-access
-
     return root_block_structure
 
 
@@ -284,6 +284,12 @@ class BlockStructureBlockData(BlockStructure):
         # defaultdict {string: dict}
         self._transformer_data = defaultdict(dict)
 
+        # The serialized block structure this structure was created
+        # from, if any, whose block data is loaded into
+        # _block_data_map as it is first accessed.
+        # SerializedBlockStructure or None
+        self._serialized_block_data = None
+
     def get_xblock_field(self, usage_key, field_name, default=None):
         """
         Returns the collected value of the xBlock field for the
@@ -300,6 +306,7 @@ class BlockStructureBlockData(BlockStructure):
             default (any type) - The value to return if a field value is
                 not found.
         """
+        self._load_xblock_field(field_name)
         block_data = self._block_data_map.get(usage_key)
         return block_data.xblock_fields.get(field_name, default) if block_data else default
 
@@ -373,6 +380,7 @@ class BlockStructureBlockData(BlockStructure):
                 given key for the given transformer's data for the
                 requested block.
         """
+        self._load_transformer_block_data(transformer)
         self._block_data_map[usage_key].transformer_data[transformer.name()][key] = value
 
     def get_transformer_block_data(self, usage_key, transformer):
@@ -392,6 +400,7 @@ class BlockStructureBlockData(BlockStructure):
                 that is requested.
         """
         default = {}
+        self._load_transformer_block_data(transformer)
         block_data = self._block_data_map.get(usage_key)
         if not block_data:
             return default
@@ -513,6 +522,24 @@ class BlockStructureBlockData(BlockStructure):
 
         return self.get_transformer_data(transformer, TRANSFORMER_VERSION_KEY, 0)
 
+    def _load_xblock_field(self, field_name):
+        """
+        Loads the values of the given xBlock field from the serialized
+        block structure, if this structure was created from one and
+        they are not loaded yet.
+        """
+        if self._serialized_block_data is not None:
+            self._serialized_block_data.load_xblock_field(self, field_name)
+
+    def _load_transformer_block_data(self, transformer):
+        """
+        Loads the given transformer's block data from the serialized
+        block structure, if this structure was created from one and
+        it is not loaded yet.
+        """
+        if self._serialized_block_data is not None:
+            self._serialized_block_data.load_transformer_block_data(self, transformer.name())
+
     def _add_transformer(self, transformer):
         """
         Adds the given transformer to the block structure by recording
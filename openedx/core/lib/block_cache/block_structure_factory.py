@@ -3,14 +3,29 @@ Module for factory class for BlockStructure objects.
 """
 # pylint: disable=protected-access
 from logging import getLogger
+import re
+from uuid import uuid4
 
-from openedx.core.lib.cache_utils import zpickle, zunpickle
+from openedx.core.lib.cache_utils import get_process_local_cache
 
-from .block_structure import BlockStructureBlockData, BlockStructureModulestoreData
+from .block_structure import BlockStructureModulestoreData, TRANSFORMER_VERSION_KEY
+from .block_structure_serializer import (
+    BlockStructureSerializationError,
+    SerializedBlockStructure,
+    serialize_block_structure,
+    serialize_transformer_data,
+)
 
 
 logger = getLogger(__name__)  # pylint: disable=C0103
 
+# Name of the process-local cache of serialized block structure entries.
+LOCAL_CACHE_NAME = 'block_structure_cache'
+
+# Format of the value stored under a block structure's root cache key:
+# '<structure_id>.<collection_id>'.
+_ROOT_CACHE_VALUE_RE = re.compile(r'^([0-9a-f]{32})\.([0-9a-f]{32})$')
+
 
 class BlockStructureFactory(object):
     """
@@ -67,12 +82,18 @@ class BlockStructureFactory(object):
     @classmethod
     def serialize_to_cache(cls, block_structure, cache):
         """
-        Store a compressed and pickled serialization of the given
-        block structure into the given cache.
-
-        The key in the cache is 'root.key.<root_block_usage_key>'.
-        The data stored in the cache includes the structure's
-        block relations, transformer data, and block data.
+        Store a compact serialization of the given block structure
+        into the given cache.  See block_structure_serializer for the
+        serialization format.
+
+        The structure's block relations and xBlock fields are stored
+        under the key 'block_structure.<structure_id>', and the data of
+        each of its transformers under the key
+        'transformer.<transformer_name>.v<version>.<collection_id>'.
+        Since the data stored under these keys never changes, it is
+        also kept in a process-local cache.  The only key that is
+        overwritten, 'root.key.<root_block_usage_key>', holds the ids
+        of the current structure entry and collection.
 
         Arguments:
             block_structure (BlockStructure) - The block structure
@@ -82,24 +103,20 @@ class BlockStructureFactory(object):
                 cache into which cacheable data of the block structure
                 is to be serialized.
         """
-        data_to_cache = (
-            block_structure._block_relations,
-            block_structure._transformer_data,
-            block_structure._block_data_map
-        )
-        zp_data_to_cache = zpickle(data_to_cache)
-        cache.set(
-            cls._encode_root_cache_key(block_structure.root_block_usage_key),
-            zp_data_to_cache
+        collection_id = uuid4().hex
+        serialized_data, block_keys = serialize_block_structure(block_structure, collection_id)
+        cls._serialize_transformers_to_cache(
+            block_structure, block_structure._transformer_data.keys(), collection_id, block_keys, cache
         )
+        cls._set_structure_in_cache(block_structure.root_block_usage_key, serialized_data, collection_id, cache)
         logger.debug(
             "Wrote BlockStructure %s to cache, size: %s",
             block_structure.root_block_usage_key,
-            len(zp_data_to_cache),
+            len(serialized_data),
         )
 
     @classmethod
-    def create_from_cache(cls, root_block_usage_key, cache, transformers):
+    def create_from_cache(cls, root_block_usage_key, cache, transformers, stale=False):
         """
         Deserializes and returns the block structure starting at
         root_block_usage_key from the given cache, if it's found in the cache.
@@ -120,54 +137,193 @@ class BlockStructureFactory(object):
                 transformers for which the block structure will be
                 transformed.
 
+            stale (bool) - Whether to deserialize the block structure
+                that was current when it was last removed from the cache
+                by remove_from_cache, instead of the current one.
+
         Returns:
             BlockStructure - The deserialized block structure starting
-            at root_block_usage_key, if found in the cache.
+            at root_block_usage_key, if found in the cache.  Its block
+            data is deserialized as it is first accessed.
 
-            NoneType - If the root_block_usage_key is not found in the cache
-            or if the cached data is outdated for one or more of the
+            NoneType - If the root_block_usage_key is not found in the cache,
+            if the cached data is in an outdated serialization format, or
+            if the cached data is outdated for one or more of the
             given transformers.
         """
+        block_structure, outdated_transformers = cls.load_from_cache(
+            root_block_usage_key, cache, transformers, stale=stale
+        )
+        return None if outdated_transformers else block_structure
+
+    @classmethod
+    def load_from_cache(cls, root_block_usage_key, cache, transformers, stale=False):
+        """
+        Deserializes the block structure starting at root_block_usage_key
+        from the given cache, along with the cached data of the given
+        transformers that is up to date.
+
+        Arguments:
+            See the description in create_from_cache.
 
+        Returns:
+            (BlockStructure, [BlockStructureTransformer]) - The
+            deserialized block structure, or None if it is not found in
+            the cache or is in an outdated serialization format, and
+            the list of the given transformers whose cached data is
+            missing or outdated.
+        """
         # Find root_block_usage_key in the cache.
-        zp_data_from_cache = cache.get(cls._encode_root_cache_key(root_block_usage_key))
-        if not zp_data_from_cache:
+        if stale:
+            root_cache_key = cls._encode_stale_root_cache_key(root_block_usage_key)
+        else:
+            root_cache_key = cls._encode_root_cache_key(root_block_usage_key)
+        root_cache_value = cache.get(root_cache_key)
+        root_cache_match = isinstance(root_cache_value, basestring) and _ROOT_CACHE_VALUE_RE.match(root_cache_value)
+        if not root_cache_match:
             logger.debug(
                 "BlockStructure %r not found in the cache.",
                 root_block_usage_key,
             )
-            return None
+            return None, transformers
+        structure_id, collection_id = root_cache_match.groups()
+
+        # Read the structure entry and the entries of the given
+        # transformers in a single request.
+        structure_cache_key = cls._encode_structure_cache_key(structure_id)
+        transformer_cache_keys = {
+            transformer.name(): cls._encode_transformer_cache_key(
+                collection_id, transformer.name(), transformer.VERSION
+            )
+            for transformer in transformers
+        }
+        cached_entries = cls._get_many_from_cache([structure_cache_key] + transformer_cache_keys.values(), cache)
+
+        serialized_data = cached_entries.get(structure_cache_key)
+        if not serialized_data:
+            logger.debug(
+                "BlockStructure %r not found in the cache.",
+                root_block_usage_key,
+            )
+            return None, transformers
         else:
             logger.debug(
                 "Read BlockStructure %r from cache, size: %s",
                 root_block_usage_key,
-                len(zp_data_from_cache),
+                len(serialized_data),
             )
 
-        # Deserialize and construct the block structure.
-        block_relations, transformer_data, block_data_map = zunpickle(zp_data_from_cache)
-        block_structure = BlockStructureBlockData(root_block_usage_key)
-        block_structure._block_relations = block_relations
-        block_structure._transformer_data = transformer_data
-        block_structure._block_data_map = block_data_map
+        try:
+            serialized_block_structure = SerializedBlockStructure(serialized_data)
+        except BlockStructureSerializationError as error:
+            logger.info(
+                "Cached BlockStructure %r is in an outdated format: %s",
+                root_block_usage_key,
+                error,
+            )
+            return None, transformers
 
-        # Verify that the cached data for all the given transformers are
-        # for their latest versions.
-        outdated_transformers = {}
+        # Verify that the data of the given transformers was collected
+        # for this block structure by their latest versions.
+        transformer_data = {}
+        outdated_transformers = []
+        outdated_transformer_messages = {}
         for transformer in transformers:
-            cached_transformer_version = block_structure._get_transformer_data_version(transformer)
-            if transformer.VERSION != cached_transformer_version:
-                outdated_transformers[transformer.name()] = "version: {}, cached: {}".format(
-                    transformer.VERSION,
-                    cached_transformer_version,
+            serialized_data = cached_entries.get(transformer_cache_keys[transformer.name()])
+            if not serialized_data:
+                outdated_transformers.append(transformer)
+                outdated_transformer_messages[transformer.name()] = "version: {}, not cached".format(
+                    transformer.VERSION
+                )
+                continue
+            try:
+                transformer_data[transformer.name()] = serialized_block_structure.add_transformer_data(
+                    transformer.name(), serialized_data, transformer.VERSION
                 )
+            except BlockStructureSerializationError as error:
+                outdated_transformers.append(transformer)
+                outdated_transformer_messages[transformer.name()] = unicode(error)
         if outdated_transformers:
             logger.info(
                 "Collected data for the following transformers are outdated:\n%s.",
-                '\n'.join([t_name + ": " + t_value for t_name, t_value in outdated_transformers.iteritems()]),
+                '\n'.join([t_name + ": " + t_value for t_name, t_value in outdated_transformer_messages.iteritems()]),
             )
+
+        block_structure = serialized_block_structure.create_block_structure(root_block_usage_key, transformer_data)
+        return block_structure, outdated_transformers
+
+    @classmethod
+    def update_transformers_in_cache(cls, block_structure, transformers, modulestore, cache):
+        """
+        Re-collects the data of the given transformers for the given
+        block structure, which was loaded from the cache by
+        load_from_cache, and stores it in the given cache, leaving the
+        cached data of the other transformers untouched.
+
+        Arguments:
+            block_structure (BlockStructureBlockData) - The block
+                structure returned by load_from_cache.  It is updated
+                with the re-collected data.
+
+            transformers ([BlockStructureTransformer]) - The
+                transformers whose data is to be re-collected.
+
+            modulestore (ModuleStoreRead) - The modulestore that
+                contains the data for the xBlocks within the block
+                structure.
+
+            cache (django.core.cache.backends.base.BaseCache) - The
+                cache that block_structure was loaded from.
+
+        Returns:
+            BlockStructureBlockData - The updated block structure, or
+            None if the blocks in the modulestore no longer match the
+            cached block structure, in which case the data of all
+            transformers needs to be re-collected.
+        """
+        serialized_block_structure = block_structure._serialized_block_data
+        modulestore_block_structure = cls.create_from_modulestore(block_structure.root_block_usage_key, modulestore)
+        if set(modulestore_block_structure.get_block_keys()) != set(serialized_block_structure.block_keys):
             return None
 
+        for transformer in transformers:
+            modulestore_block_structure._add_transformer(transformer)
+            transformer.collect(modulestore_block_structure)
+
+        # Collect any xBlock fields newly requested by the transformers.
+        new_xblock_fields = modulestore_block_structure._requested_xblock_fields.difference(
+            serialized_block_structure.xblock_field_names
+        )
+        modulestore_block_structure._requested_xblock_fields = new_xblock_fields
+        modulestore_block_structure._collect_requested_xblock_fields()
+
+        # Update the cached block structure with the collected data.
+        transformer_names = [transformer.name() for transformer in transformers]
+        for transformer_name in transformer_names:
+            block_structure._transformer_data[transformer_name] = modulestore_block_structure._transformer_data[
+                transformer_name
+            ]
+        for block_key, block_data in modulestore_block_structure._block_data_map.iteritems():
+            updated_block_data = block_structure._block_data_map[block_key]
+            updated_block_data.xblock_fields.update(block_data.xblock_fields)
+            for transformer_name in transformer_names:
+                if transformer_name in block_data.transformer_data:
+                    updated_block_data.transformer_data[transformer_name] = block_data.transformer_data[
+                        transformer_name
+                    ]
+
+        collection_id = serialized_block_structure.collection_id
+        block_keys = serialized_block_structure.block_keys
+        cls._serialize_transformers_to_cache(block_structure, transformer_names, collection_id, block_keys, cache)
+        if new_xblock_fields:
+            # Re-serialize the structure with all its xBlock fields,
+            # keeping its collection_id and block keys so that the
+            # cached data of the other transformers remains valid.
+            for field_name in serialized_block_structure.xblock_field_names:
+                block_structure._load_xblock_field(field_name)
+            serialized_data, _ = serialize_block_structure(block_structure, collection_id, block_keys)
+            cls._set_structure_in_cache(block_structure.root_block_usage_key, serialized_data, collection_id, cache)
+
         return block_structure
 
     @classmethod
@@ -185,13 +341,116 @@ class BlockStructureFactory(object):
                 cache from which the block structure is to be
                 removed.
         """
-        cache.delete(cls._encode_root_cache_key(root_block_usage_key))
-        # TODO also remove all block data?
+        # Keep the ids of the removed block structure's entries, so that
+        # it can be served while the block structure is re-collected.
+        # The entries themselves are left to expire.
+        root_cache_key = cls._encode_root_cache_key(root_block_usage_key)
+        root_cache_value = cache.get(root_cache_key)
+        if root_cache_value is not None:
+            cache.set(cls._encode_stale_root_cache_key(root_block_usage_key), root_cache_value)
+            cache.delete(root_cache_key)
+
+    @classmethod
+    def _set_structure_in_cache(cls, root_block_usage_key, serialized_data, collection_id, cache):
+        """
+        Store the given serialized block structure into the given cache
+        under a new structure entry, and make it the current structure
+        entry for the given root_block_usage_key.
+        """
+        structure_id = uuid4().hex
+        cls._set_many_in_cache({cls._encode_structure_cache_key(structure_id): serialized_data}, cache)
+        cache.set(cls._encode_root_cache_key(root_block_usage_key), '{}.{}'.format(structure_id, collection_id))
+        cache.delete(cls._encode_stale_root_cache_key(root_block_usage_key))
+
+    @classmethod
+    def _serialize_transformers_to_cache(cls, block_structure, transformer_names, collection_id, block_keys, cache):
+        """
+        Store a serialization of the data of the given transformers in
+        the given block structure into the given cache.
+        """
+        cls._set_many_in_cache(
+            {
+                cls._encode_transformer_cache_key(
+                    collection_id,
+                    transformer_name,
+                    block_structure._transformer_data[transformer_name].get(TRANSFORMER_VERSION_KEY, 0),
+                ): serialize_transformer_data(block_structure, transformer_name, collection_id, block_keys)
+                for transformer_name in transformer_names
+            },
+            cache,
+        )
+
+    @classmethod
+    def _get_many_from_cache(cls, cache_keys, cache):
+        """
+        Returns a dictionary of the entries for the given structure and
+        transformer cache keys that are found in the process-local
+        cache or else in the given cache.
+        """
+        local_cache = get_process_local_cache(LOCAL_CACHE_NAME)
+        cached_entries = {}
+        for cache_key in cache_keys:
+            value = local_cache.get(cache_key)
+            if value is not None:
+                cached_entries[cache_key] = value
+
+        missing_cache_keys = [cache_key for cache_key in cache_keys if cache_key not in cached_entries]
+        if missing_cache_keys:
+            for cache_key, value in cache.get_many(missing_cache_keys).iteritems():
+                local_cache.set(cache_key, value)
+                cached_entries[cache_key] = value
+        return cached_entries
+
+    @classmethod
+    def _set_many_in_cache(cls, cache_entries, cache):
+        """
+        Store the given structure and transformer entries into the given
+        cache and the process-local cache.
+        """
+        cache.set_many(cache_entries)
+        local_cache = get_process_local_cache(LOCAL_CACHE_NAME)
+        for cache_key, value in cache_entries.iteritems():
+            local_cache.set(cache_key, value)
 
     @classmethod
     def _encode_root_cache_key(cls, root_block_usage_key):
         """
-        Returns the cache key to use for storing the block structure
-        for the given root_block_usage_key.
+        Returns the cache key to use for storing the ids of the current
+        structure entry and collection of the block structure for the
+        given root_block_usage_key.
         """
         return "root.key." + unicode(root_block_usage_key)
+
+    @classmethod
+    def _encode_stale_root_cache_key(cls, root_block_usage_key):
+        """
+        Returns the cache key to use for storing the ids of the entries
+        of the block structure for the given root_block_usage_key that
+        was last removed from the cache.
+        """
+        return "stale." + cls._encode_root_cache_key(root_block_usage_key)
+
+    @classmethod
+    def _encode_lock_cache_key(cls, root_block_usage_key):
+        """
+        Returns the cache key to use for the lock held while collecting
+        the block structure for the given root_block_usage_key.
+        """
+        return "lock." + cls._encode_root_cache_key(root_block_usage_key)
+
+    @classmethod
+    def _encode_structure_cache_key(cls, structure_id):
+        """
+        Returns the cache key to use for storing the structure entry
+        with the given id.
+        """
+        return "block_structure." + structure_id
+
+    @classmethod
+    def _encode_transformer_cache_key(cls, collection_id, transformer_name, transformer_version):
+        """
+        Returns the cache key to use for storing the data collected by
+        the given version of the given transformer for the given
+        collection of a block structure.
+        """
+        return "transformer.{}.v{}.{}".format(transformer_name, transformer_version, collection_id)
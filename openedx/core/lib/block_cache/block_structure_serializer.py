@@ -0,0 +1,416 @@
+"""
+Module for the compact serialization format of BlockStructure objects
+stored in the cache.
+
+A block structure is serialized into one entry for the structure itself
+and one entry per transformer, so that the data of each transformer can
+be re-collected and stored independently of the others.  All entries of
+a block structure share the id of the collection that produced the
+structure entry, and refer to blocks by their integer index in the
+structure entry's table of block keys.
+
+Each entry consists of a short header followed by independently
+compressed sections.  The structure entry has the following sections:
+
+    * The table of the structure's block keys.
+    * The children of each block, as arrays of block indices.
+    * A column for each collected xBlock field, mapping block indices
+      to the blocks' values.
+
+A transformer entry has the following sections:
+
+    * The transformer's non-block-specific data.
+    * A column of the transformer's block-specific data.
+
+The block relations and the transformers' non-block-specific data are
+deserialized up front.  Each column is deserialized only when its data
+is first accessed, so the cost of reading a block structure from the
+cache depends only on the fields that are actually used.
+"""
+# pylint: disable=protected-access
+from array import array
+from collections import defaultdict
+import json
+import struct
+import sys
+import zlib
+
+from openedx.core.lib.cache_utils import zpickle, zunpickle
+
+from .block_structure import BlockStructureBlockData, TRANSFORMER_VERSION_KEY
+
+
+# Prefix of a serialized cache entry, followed by the version of its
+# serialization format.  Increment the version whenever the format
+# changes; entries in other formats are ignored.
+SERIALIZATION_PREFIX = 'BS'
+SERIALIZATION_VERSION = 2
+
+# Format of the version and header length following the prefix.
+_HEADER_STRUCT = struct.Struct('!BI')
+
+# Type code of the arrays used for block indices.
+_INDEX_TYPECODE = 'I'
+
+# Names of the sections of a serialized structure entry.
+_BLOCK_KEYS_SECTION = 'block_keys'
+_CHILD_OFFSETS_SECTION = 'child_offsets'
+_CHILD_INDICES_SECTION = 'child_indices'
+_XBLOCK_FIELD_SECTION_PREFIX = 'xblock_field:'
+
+# Names of the sections of a serialized transformer entry.
+_TRANSFORMER_DATA_SECTION = 'transformer_data'
+_TRANSFORMER_BLOCK_DATA_SECTION = 'transformer_block_data'
+
+
+class BlockStructureSerializationError(Exception):
+    """
+    Exception raised when serialized data is not in the current
+    serialization format or does not belong to the block structure it
+    is used with.
+    """
+    pass
+
+
+def serialize_block_structure(block_structure, collection_id, block_keys=None):
+    """
+    Returns the serialization of the relations and xBlock fields of the
+    given block structure.
+
+    Arguments:
+        block_structure (BlockStructureBlockData) - The block structure
+            that is to be serialized.
+
+        collection_id (string) - Identifies the collection of the
+            block structure's data.  Transformer data serialized with
+            a different collection_id is not used with this block
+            structure.
+
+        block_keys ([UsageKey]) - The table of block keys to serialize
+            the block structure with.  Must contain exactly the block
+            structure's blocks.  If None, a new table is created.
+
+    Returns:
+        (string, [UsageKey]) - The serialized block structure, and its
+            table of block keys, with which transformer data for this
+            block structure is to be serialized.
+    """
+    if block_keys is None:
+        block_keys = list(block_structure.get_block_keys())
+    block_indices = _get_block_indices(block_keys)
+
+    # Store the children of all blocks in a single array, with the
+    # children of block i at child_indices[child_offsets[i]:child_offsets[i + 1]].
+    child_offsets = array(_INDEX_TYPECODE, [0])
+    child_indices = array(_INDEX_TYPECODE)
+    for block_key in block_keys:
+        child_indices.extend(block_indices[child_key] for child_key in block_structure.get_children(block_key))
+        child_offsets.append(len(child_indices))
+
+    xblock_field_columns = defaultdict(dict)
+    for block_key, block_data in block_structure._block_data_map.iteritems():
+        block_index = block_indices.get(block_key)
+        if block_index is None:
+            # The block has been removed from the structure.
+            continue
+        for field_name, value in block_data.xblock_fields.iteritems():
+            xblock_field_columns[field_name][block_index] = value
+
+    sections = [
+        (_BLOCK_KEYS_SECTION, zpickle(block_keys)),
+        (_CHILD_OFFSETS_SECTION, zlib.compress(child_offsets.tostring())),
+        (_CHILD_INDICES_SECTION, zlib.compress(child_indices.tostring())),
+    ]
+    sections.extend(
+        (_XBLOCK_FIELD_SECTION_PREFIX + field_name, zpickle(column))
+        for field_name, column in xblock_field_columns.iteritems()
+    )
+    return _pack(collection_id, sections), block_keys
+
+
+def serialize_transformer_data(block_structure, transformer_name, collection_id, block_keys):
+    """
+    Returns the serialization of the given transformer's data in the
+    given block structure.
+
+    Arguments:
+        block_structure (BlockStructureBlockData) - The block structure
+            whose transformer data is to be serialized.
+
+        transformer_name (string) - The name of the transformer whose
+            data is to be serialized.
+
+        collection_id (string) - The collection_id that the block
+            structure was serialized with.
+
+        block_keys ([UsageKey]) - The table of block keys that the
+            block structure was serialized with.
+
+    Returns:
+        string - The serialized transformer data.
+    """
+    block_indices = _get_block_indices(block_keys)
+    column = {}
+    for block_key, block_data in block_structure._block_data_map.iteritems():
+        block_index = block_indices.get(block_key)
+        if block_index is not None and transformer_name in block_data.transformer_data:
+            column[block_index] = dict(block_data.transformer_data[transformer_name])
+
+    sections = [
+        (_TRANSFORMER_DATA_SECTION, zpickle(dict(block_structure._transformer_data.get(transformer_name, {})))),
+        (_TRANSFORMER_BLOCK_DATA_SECTION, zpickle(column)),
+    ]
+    return _pack(collection_id, sections)
+
+
+class SerializedBlockStructure(object):
+    """
+    A block structure serialized by serialize_block_structure, together
+    with the transformer data serialized for it, from which a
+    BlockStructureBlockData can be created whose block data is
+    deserialized lazily.
+    """
+    def __init__(self, serialized_data):
+        """
+        Arguments:
+            serialized_data (string) - A block structure serialized by
+                serialize_block_structure.
+
+        Raises:
+            BlockStructureSerializationError - If serialized_data is not
+                in the current serialization format.
+        """
+        self._entry = _SerializedEntry(serialized_data)
+
+        # The id of the collection that produced this block structure.
+        # string
+        self.collection_id = self._entry.collection_id
+
+        # List of the block keys, in block index order.
+        # [UsageKey]
+        self.block_keys = zunpickle(self._entry.get_section(_BLOCK_KEYS_SECTION))
+
+        # Map of a transformer's name to its serialized data.
+        # {string: _SerializedEntry}
+        self._transformer_entries = {}
+
+        # Names of the xBlock fields and transformers whose columns
+        # have been loaded into the block structure.
+        # set((string, string))
+        self._loaded_columns = set()
+
+    @property
+    def xblock_field_names(self):
+        """
+        Returns the names of the serialized xBlock fields.
+        """
+        prefix_length = len(_XBLOCK_FIELD_SECTION_PREFIX)
+        return {
+            section_name[prefix_length:]
+            for section_name in self._entry.section_names
+            if section_name.startswith(_XBLOCK_FIELD_SECTION_PREFIX)
+        }
+
+    def add_transformer_data(self, transformer_name, serialized_data, version):
+        """
+        Adds the given transformer's data, as serialized by
+        serialize_transformer_data, and returns its non-block-specific
+        data.
+
+        Arguments:
+            transformer_name (string) - The name of the transformer.
+
+            serialized_data (string) - The transformer's serialized
+                data.
+
+            version (int) - The transformer's current version.
+
+        Raises:
+            BlockStructureSerializationError - If serialized_data is not
+                in the current serialization format, was serialized for
+                a different collection of the block structure or was
+                collected by a different version of the transformer.
+        """
+        entry = _SerializedEntry(serialized_data)
+        if entry.collection_id != self.collection_id:
+            raise BlockStructureSerializationError(
+                'collection: {}, cached: {}'.format(self.collection_id, entry.collection_id)
+            )
+        transformer_data = zunpickle(entry.get_section(_TRANSFORMER_DATA_SECTION))
+        cached_version = transformer_data.get(TRANSFORMER_VERSION_KEY, 0)
+        if cached_version != version:
+            raise BlockStructureSerializationError('version: {}, cached: {}'.format(version, cached_version))
+
+        self._transformer_entries[transformer_name] = entry
+        return transformer_data
+
+    def create_block_structure(self, root_block_usage_key, transformer_data):
+        """
+        Creates and returns the serialized block structure.  Its block
+        relations are deserialized right away; its block data when
+        first accessed.
+
+        Arguments:
+            root_block_usage_key (UsageKey) - The usage_key for the root
+                of the serialized block structure.
+
+            transformer_data ({string: dict}) - Map of a transformer's
+                name to its non-block-specific data, as returned by
+                add_transformer_data.  Only the block data of these
+                transformers is loaded into the block structure.
+
+        Returns:
+            BlockStructureBlockData - The deserialized block structure.
+        """
+        child_offsets = self._read_index_array(_CHILD_OFFSETS_SECTION)
+        child_indices = self._read_index_array(_CHILD_INDICES_SECTION)
+
+        block_structure = BlockStructureBlockData(root_block_usage_key)
+        block_relations = block_structure._block_relations
+        for block_index, block_key in enumerate(self.block_keys):
+            children = [
+                self.block_keys[child_index]
+                for child_index in child_indices[child_offsets[block_index]:child_offsets[block_index + 1]]
+            ]
+            block_relations[block_key].children = children
+            for child_key in children:
+                block_relations[child_key].parents.append(block_key)
+
+        block_structure._transformer_data.update(transformer_data)
+        block_structure._serialized_block_data = self
+        return block_structure
+
+    def load_xblock_field(self, block_structure, field_name):
+        """
+        Loads the values of the given xBlock field for all blocks into
+        the given block structure, unless they are already loaded.
+
+        Arguments:
+            block_structure (BlockStructureBlockData) - The block
+                structure created by create_block_structure.
+
+            field_name (string) - The name of the xBlock field whose
+                values are to be loaded.
+        """
+        if ('xblock_field', field_name) in self._loaded_columns:
+            return
+        self._loaded_columns.add(('xblock_field', field_name))
+
+        column = self._read_column(self._entry, _XBLOCK_FIELD_SECTION_PREFIX + field_name, block_structure)
+        for block_key, value in column:
+            block_structure._block_data_map[block_key].xblock_fields[field_name] = value
+
+    def load_transformer_block_data(self, block_structure, transformer_name):
+        """
+        Loads the given transformer's block-specific data for all blocks
+        into the given block structure, unless it is already loaded.
+
+        Arguments:
+            block_structure (BlockStructureBlockData) - The block
+                structure created by create_block_structure.
+
+            transformer_name (string) - The name of the transformer
+                whose block data is to be loaded.
+        """
+        entry = self._transformer_entries.get(transformer_name)
+        if entry is None or ('transformer', transformer_name) in self._loaded_columns:
+            return
+        self._loaded_columns.add(('transformer', transformer_name))
+
+        column = self._read_column(entry, _TRANSFORMER_BLOCK_DATA_SECTION, block_structure)
+        for block_key, transformer_block_data in column:
+            block_structure._block_data_map[block_key].transformer_data[transformer_name] = transformer_block_data
+
+    def _read_column(self, entry, section_name, block_structure):
+        """
+        Returns a list of (block key, value) tuples for the blocks of
+        the given block structure that have a value in the given column
+        section of the given entry.  Returns an empty list if the
+        section does not exist.
+        """
+        if section_name not in entry.section_names:
+            return []
+
+        column = zunpickle(entry.get_section(section_name))
+        return [
+            (self.block_keys[block_index], value)
+            for block_index, value in column.iteritems()
+            # Skip blocks that were removed from the structure.
+            if block_structure.has_block(self.block_keys[block_index])
+        ]
+
+    def _read_index_array(self, section_name):
+        """
+        Returns the array of block indices stored in the given section.
+        """
+        index_array = array(_INDEX_TYPECODE)
+        index_array.fromstring(zlib.decompress(self._entry.get_section(section_name)))
+        if self._entry.byteorder != sys.byteorder:
+            index_array.byteswap()
+        return index_array
+
+
+class _SerializedEntry(object):
+    """
+    A cache entry serialized by _pack.
+    """
+    def __init__(self, serialized_data):
+        header_offset = len(SERIALIZATION_PREFIX) + _HEADER_STRUCT.size
+        if not serialized_data.startswith(SERIALIZATION_PREFIX) or len(serialized_data) < header_offset:
+            raise BlockStructureSerializationError('Data is not a serialized block structure.')
+
+        version, header_length = _HEADER_STRUCT.unpack_from(serialized_data, len(SERIALIZATION_PREFIX))
+        if version != SERIALIZATION_VERSION:
+            raise BlockStructureSerializationError(
+                'Serialization version: {}, expected: {}.'.format(version, SERIALIZATION_VERSION)
+            )
+
+        header = json.loads(serialized_data[header_offset:header_offset + header_length])
+        self.collection_id = header['collection_id']
+        self.byteorder = header['byteorder']
+        self._section_offsets = header['sections']
+        self._sections_start = header_offset + header_length
+        self._serialized_data = serialized_data
+
+    @property
+    def section_names(self):
+        """
+        Returns the names of the sections in the entry.
+        """
+        return self._section_offsets.viewkeys()
+
+    def get_section(self, section_name):
+        """
+        Returns a buffer of the (compressed) data of the given section.
+        """
+        offset, length = self._section_offsets[section_name]
+        return buffer(self._serialized_data, self._sections_start + offset, length)
+
+
+def _pack(collection_id, sections):
+    """
+    Returns a cache entry made of the given list of (section name,
+    section data) tuples.
+    """
+    section_offsets = {}
+    offset = 0
+    for section_name, section_data in sections:
+        section_offsets[section_name] = (offset, len(section_data))
+        offset += len(section_data)
+
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'collection_id': collection_id,
+        'sections': section_offsets,
+    })
+    return ''.join(
+        [SERIALIZATION_PREFIX, _HEADER_STRUCT.pack(SERIALIZATION_VERSION, len(header)), header] +
+        [section_data for _, section_data in sections]
+    )
+
+
+def _get_block_indices(block_keys):
+    """
+    Returns a map of each of the given block keys to its index.
+    """
+    return {block_key: index for index, block_key in enumerate(block_keys)}
@@ -1,12 +1,14 @@
 """
 Tests for block_cache.py
 """
+# pylint: disable=protected-access
 
 from django.core.cache import get_cache
 from mock import patch
 from unittest import TestCase
 
-from ..block_cache import get_blocks
+from ..block_cache import get_blocks, clear_block_cache
+from ..block_structure_factory import BlockStructureFactory
 from ..exceptions import TransformerException
 from .test_utils import (
     MockModulestoreFactory, MockCache, MockTransformer, ChildrenMapTestMixin
@@ -111,3 +113,73 @@ class TestBlockCache(TestCase, ChildrenMapTestMixin):
                 self.assertGreater(self.modulestore.get_items_call_count, 0)
             else:
                 self.assertEquals(self.modulestore.get_items_call_count, 0)
+
+    def test_outdated_transformer_data(self, mock_available_transforms):
+        collected_transformers = []
+
+        class CountingTransformer(self.TestTransformer1):
+            """
+            Test Transformer class that records when its data is collected.
+            """
+            @classmethod
+            def collect(cls, block_structure):
+                collected_transformers.append(cls.name())
+                super(CountingTransformer, cls).collect(block_structure)
+
+        class OtherCountingTransformer(CountingTransformer):
+            """
+            Test Transformer class with its own version.
+            """
+            VERSION = 1
+
+        transformers = [CountingTransformer(), OtherCountingTransformer()]
+        mock_available_transforms.return_value = {transformer.name(): transformer for transformer in transformers}
+
+        get_blocks(
+            self.mock_cache, self.modulestore, self.usage_info, root_block_usage_key=0, transformers=transformers
+        )
+        self.assertEquals(sorted(collected_transformers), ['CountingTransformer', 'OtherCountingTransformer'])
+
+        # only the data of the transformer whose version changed is re-collected
+        with patch.object(CountingTransformer, 'VERSION', 2):
+            for expected_collected_transformers in (['CountingTransformer'], []):
+                del collected_transformers[:]
+                block_structure = get_blocks(
+                    self.mock_cache,
+                    self.modulestore,
+                    self.usage_info,
+                    root_block_usage_key=0,
+                    transformers=transformers,
+                )
+                self.assert_block_structure(block_structure, self.children_map)
+                self.assertEquals(collected_transformers, expected_collected_transformers)
+
+    def test_stale_block_structure(self, mock_available_transforms):
+        mock_available_transforms.return_value = {transformer.name(): transformer for transformer in self.transformers}
+        get_blocks(
+            self.mock_cache, self.modulestore, self.usage_info, root_block_usage_key=0, transformers=self.transformers
+        )
+        clear_block_cache(self.mock_cache, root_block_usage_key=0)
+
+        # while another process re-collects the block structure, the
+        # removed block structure is used
+        lock_cache_key = BlockStructureFactory._encode_lock_cache_key(0)
+        self.mock_cache.add(lock_cache_key, 'true')
+        self.modulestore.get_items_call_count = 0
+        block_structure = get_blocks(
+            self.mock_cache, self.modulestore, self.usage_info, root_block_usage_key=0, transformers=self.transformers
+        )
+        self.assert_block_structure(block_structure, self.children_map)
+        self.assertEquals(self.modulestore.get_items_call_count, 0)
+
+        # once the lock is released, the block structure is re-collected,
+        # and the removed block structure is no longer used
+        self.mock_cache.delete(lock_cache_key)
+        get_blocks(
+            self.mock_cache, self.modulestore, self.usage_info, root_block_usage_key=0, transformers=self.transformers
+        )
+        self.assertGreater(self.modulestore.get_items_call_count, 0)
+        self.assertIsNone(
+            BlockStructureFactory.create_from_cache(0, self.mock_cache, self.transformers, stale=True)
+        )
+        self.assertNotIn(lock_cache_key, self.mock_cache.map)
@@ -5,9 +5,11 @@ Tests for block_structure_factory.py
 from mock import patch
 from unittest import TestCase
 
+from openedx.core.lib.cache_utils import ProcessLocalLRUCache, zpickle
+
 from ..block_structure_factory import BlockStructureFactory
 from .test_utils import (
-    MockCache, MockModulestoreFactory, MockTransformer, ChildrenMapTestMixin
+    MockCache, MockModulestoreFactory, MockTransformer, MockXBlock, ChildrenMapTestMixin
 )
 
 
@@ -94,6 +96,87 @@ class TestBlockStructureFactory(TestCase, ChildrenMapTestMixin):
         self.assert_block_structure(from_cache_block_structure, self.children_map)
         self.assertEquals(self.modulestore.get_items_call_count, 0)
 
+    def test_cache_block_data(self):
+        cache = MockCache()
+
+        # collect xblock fields and transformer data, then remove a block
+        self.add_transformers()
+        for block_key in self.block_structure.get_block_keys():
+            self.block_structure._set_xblock_field(block_key, MockXBlock(block_key, {'name': block_key}), 'name')
+        self.block_structure.remove_block(4, keep_descendants=False)
+
+        # serialize to cache and re-create from cache
+        BlockStructureFactory.serialize_to_cache(self.block_structure, cache)
+        from_cache_block_structure = BlockStructureFactory.create_from_cache(
+            root_block_usage_key=0,
+            cache=cache,
+            transformers=self.transformers,
+        )
+        self.assert_block_structure(from_cache_block_structure, [[1, 2], [3], [], [], []], missing_blocks=[4])
+
+        # block data is only deserialized when it's accessed
+        self.assertEquals(len(from_cache_block_structure._block_data_map), 0)
+        for block_key in range(4):
+            self.assertEquals(from_cache_block_structure.get_xblock_field(block_key, 'name'), block_key)
+        self.assertIsNone(from_cache_block_structure.get_xblock_field(4, 'name'))
+        for transformer in self.transformers:
+            self.assertEquals(
+                from_cache_block_structure.get_transformer_block_field(0, transformer, 'test'),
+                '{} val'.format(transformer.name()),
+            )
+
+    def test_outdated_cache_format(self):
+        cache = MockCache()
+
+        # store the structure in the cache in the previous, pickled format
+        self.add_transformers()
+        cache.set(
+            BlockStructureFactory._encode_root_cache_key(0),
+            zpickle((
+                self.block_structure._block_relations,
+                self.block_structure._transformer_data,
+                self.block_structure._block_data_map,
+            )),
+        )
+
+        self.assertIsNone(
+            BlockStructureFactory.create_from_cache(
+                root_block_usage_key=0,
+                cache=cache,
+                transformers=self.transformers,
+            )
+        )
+
+    @patch('openedx.core.lib.block_cache.block_structure_factory.get_process_local_cache')
+    def test_process_local_cache(self, mock_get_process_local_cache):
+        mock_get_process_local_cache.return_value = ProcessLocalLRUCache('block_structure_cache', 1024 * 1024)
+        cache = MockCache()
+
+        # serialize to cache
+        self.add_transformers()
+        BlockStructureFactory.serialize_to_cache(self.block_structure, cache)
+
+        # only the root cache key needs to be read from the shared cache
+        root_cache_key = BlockStructureFactory._encode_root_cache_key(0)
+        cache.map = {root_cache_key: cache.map[root_cache_key]}
+        from_cache_block_structure = BlockStructureFactory.create_from_cache(
+            root_block_usage_key=0,
+            cache=cache,
+            transformers=self.transformers,
+        )
+        self.assert_block_structure(from_cache_block_structure, self.children_map)
+
+        # once removed from the shared cache, the block structure is no
+        # longer found in the process-local cache
+        BlockStructureFactory.remove_from_cache(root_block_usage_key=0, cache=cache)
+        self.assertIsNone(
+            BlockStructureFactory.create_from_cache(
+                root_block_usage_key=0,
+                cache=cache,
+                transformers=self.transformers,
+            )
+        )
+
     def test_remove_from_cache(self):
         cache = MockCache()
 
@@ -20,7 +20,8 @@ class BlockStructureTransformer(object):
     # and cached, it's version number at the time of collection is
     # stored along with the data.  That version number is then checked
     # at the time of accessing the collected data (during the transform
-    # phase).
+    # phase).  Since each transformer's data is cached separately, only
+    # the data of a transformer whose version changed is re-collected.
     #
     # The version number of a Transformer should be incremented each
     # time the implementation of its collect method is updated such that
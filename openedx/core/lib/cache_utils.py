@@ -1,9 +1,14 @@
 """
 Utilities related to caching.
 """
+from collections import OrderedDict
 import cPickle as pickle
 import functools
+import threading
+import time
 import zlib
+
+import dogstats_wrapper as dog_stats_api
 from xblock.core import XBlock
 
 
@@ -58,3 +63,224 @@ def zpickle(data):
 def zunpickle(zdata):
     """Given a zlib compressed pickled serialization, returns the deserialized data."""
     return pickle.loads(zlib.decompress(zdata))
+
+
+class ProcessLocalLRUCache(object):
+    """
+    A thread-safe, in-process least-recently-used cache of string values,
+    bounded by the total size of the values it holds.
+
+    It's meant to sit in front of a shared cache (such as memcached) for
+    values stored under keys that never change meaning, so that hot
+    values need not be fetched over the network on every access.  Since
+    it isn't invalidated across processes, it must not be used for keys
+    whose values can be replaced.
+
+    Hits, misses and evictions are reported to datadog as
+    'process_local_cache.<hit|miss|eviction>', tagged with the cache's name.
+    """
+    def __init__(self, name, max_size):
+        """
+        Arguments:
+            name (string) - The name of the cache, used to tag its metrics.
+
+            max_size (int) - The maximum total length, in bytes, of the
+                values held by the cache.  The cache is disabled if 0.
+        """
+        self.name = name
+        self.max_size = max_size
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Returns the value cached for the given key, or None if it is
+        not in the cache.
+        """
+        if not self.max_size:
+            return None
+
+        with self._lock:
+            value = self._entries.pop(key, None)
+            if value is not None:
+                # Move the entry to the most recently used end.
+                self._entries[key] = value
+
+        self._increment('hit' if value is not None else 'miss')
+        return value
+
+    def set(self, key, value):
+        """
+        Caches the given string value for the given key, evicting the
+        least recently used values as needed to stay within max_size.
+        Values larger than max_size are not cached.
+        """
+        if not self.max_size or len(value) > self.max_size:
+            return
+
+        evictions = 0
+        with self._lock:
+            previous_value = self._entries.pop(key, None)
+            if previous_value is not None:
+                self.size -= len(previous_value)
+            self._entries[key] = value
+            self.size += len(value)
+            while self.size > self.max_size:
+                _, evicted_value = self._entries.popitem(last=False)
+                self.size -= len(evicted_value)
+                evictions += 1
+
+        if evictions:
+            self._increment('eviction', evictions)
+
+    def clear(self):
+        """
+        Removes all values from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _increment(self, metric, value=1):
+        """
+        Reports the given metric of this cache to datadog.
+        """
+        dog_stats_api.increment(
+            'process_local_cache.{}'.format(metric),
+            value,
+            tags=['cache:{}'.format(self.name)],
+        )
+
+
+_process_local_caches = {}
+_process_local_caches_lock = threading.Lock()
+
+
+def get_process_local_cache(name):
+    """
+    Returns the ProcessLocalLRUCache with the given name, shared by all
+    threads of the process.  Its maximum size is read from the
+    PROCESS_LOCAL_CACHE_MAX_SIZES setting; the cache is disabled if the
+    setting has no size for it or if Django isn't configured.
+    """
+    with _process_local_caches_lock:
+        if name not in _process_local_caches:
+            _process_local_caches[name] = ProcessLocalLRUCache(name, _get_process_local_cache_max_size(name))
+        return _process_local_caches[name]
+
+
+def _get_process_local_cache_max_size(name):
+    """
+    Returns the configured maximum size of the process-local cache
+    with the given name, or 0 if there is none.
+    """
+    try:
+        from django.conf import settings
+        from django.core.exceptions import ImproperlyConfigured
+    except ImportError:
+        return 0
+
+    try:
+        return getattr(settings, 'PROCESS_LOCAL_CACHE_MAX_SIZES', {}).get(name, 0)
+    except ImproperlyConfigured:
+        return 0
+
+
+# Default number of seconds after which a single-flight lock expires, in
+# case the process holding it dies before releasing it.
+SINGLE_FLIGHT_LOCK_TIMEOUT = 5 * 60
+
+# Default number of seconds to wait for the value computed by the
+# process holding a single-flight lock.
+SINGLE_FLIGHT_WAIT_TIMEOUT = 10
+
+# Number of seconds between checks for the value computed by the
+# process holding a single-flight lock.
+SINGLE_FLIGHT_POLL_INTERVAL = 0.2
+
+
+def get_single_flight(
+        name,
+        cache,
+        lock_key,
+        get_cached,
+        compute,
+        get_stale=None,
+        lock_timeout=SINGLE_FLIGHT_LOCK_TIMEOUT,
+        wait_timeout=SINGLE_FLIGHT_WAIT_TIMEOUT,
+):
+    """
+    Returns a value that is missing from the cache, making sure that only
+    one process at a time computes it, so that an expensive computation
+    isn't repeated by every concurrent request after a cache miss.
+
+    The process that acquires the lock stored under lock_key in the given
+    cache calls compute.  The others return the previous version of the
+    value, from get_stale, if there is one; otherwise they wait for the
+    computed value to show up in the cache, and fall back to computing it
+    themselves if it doesn't within wait_timeout seconds.
+
+    The outcome is reported to datadog as 'single_flight.<outcome>',
+    tagged with the given name.
+
+    Arguments:
+        name (string) - The name of the computation, used to tag metrics.
+
+        cache (django.core.cache.backends.base.BaseCache) - The cache in
+            which to store the lock.  Must be shared by all processes.
+
+        lock_key (string) - The cache key of the lock.
+
+        get_cached (function) - Returns the value from the cache, or None
+            if it isn't there (yet).
+
+        compute (function) - Computes, caches and returns the value.
+            Should call get_cached first, in case another process just
+            released the lock.
+
+        get_stale (function) - Returns the previous version of the value,
+            or None if there isn't one.
+
+        lock_timeout (int) - Number of seconds after which the lock
+            expires if it isn't released.
+
+        wait_timeout (int) - Maximum number of seconds to wait for the
+            value computed by another process.
+    """
+    if cache.add(lock_key, 'true', lock_timeout):
+        try:
+            _increment_single_flight(name, 'computed')
+            return compute()
+        finally:
+            cache.delete(lock_key)
+
+    if get_stale is not None:
+        value = get_stale()
+        if value is not None:
+            _increment_single_flight(name, 'stale')
+            return value
+
+    deadline = time.time() + wait_timeout
+    while time.time() < deadline:
+        time.sleep(SINGLE_FLIGHT_POLL_INTERVAL)
+        value = get_cached()
+        if value is not None:
+            _increment_single_flight(name, 'waited')
+            return value
+        if cache.get(lock_key) is None:
+            # The process holding the lock failed to cache the value.
+            break
+
+    _increment_single_flight(name, 'timed_out')
+    return compute()
+
+
+def _increment_single_flight(name, outcome):
+    """
+    Reports the given outcome of a single-flight computation to datadog.
+    """
+    dog_stats_api.increment('single_flight.{}'.format(outcome), tags=['name:{}'.format(name)])
@@ -2,10 +2,10 @@
 Tests for cache_utils.py
 """
 import ddt
-from mock import MagicMock
+from mock import MagicMock, patch
 from unittest import TestCase
 
-from openedx.core.lib.cache_utils import memoize_in_request_cache
+from openedx.core.lib.cache_utils import get_single_flight, memoize_in_request_cache, ProcessLocalLRUCache
 
 
 @ddt.ddt
@@ -62,3 +62,142 @@ class TestMemoizeInRequestCache(TestCase):
                 func_to_memoize(*arg_list2)
 
             self.assertEquals(self.func_to_count.call_count, 2)
+
+
+@patch('openedx.core.lib.cache_utils.dog_stats_api')
+class TestProcessLocalLRUCache(TestCase):
+    """
+    Test the ProcessLocalLRUCache class.
+    """
+    def test_get_and_set(self, mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 10)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 'aaa')
+        self.assertEquals(cache.get('a'), 'aaa')
+        self.assertEquals(cache.size, 3)
+
+        mock_dog_stats_api.increment.assert_any_call('process_local_cache.miss', 1, tags=['cache:test'])
+        mock_dog_stats_api.increment.assert_any_call('process_local_cache.hit', 1, tags=['cache:test'])
+
+    def test_replace(self, _mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 10)
+        cache.set('a', 'aaa')
+        cache.set('a', 'aaaaa')
+        self.assertEquals(cache.get('a'), 'aaaaa')
+        self.assertEquals(cache.size, 5)
+        self.assertEquals(len(cache), 1)
+
+    def test_eviction(self, mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 10)
+        cache.set('a', 'aaaa')
+        cache.set('b', 'bbbb')
+
+        # using 'a' makes 'b' the least recently used value
+        cache.get('a')
+        cache.set('c', 'cccc')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEquals(cache.get('a'), 'aaaa')
+        self.assertEquals(cache.get('c'), 'cccc')
+        self.assertEquals(cache.size, 8)
+        mock_dog_stats_api.increment.assert_any_call('process_local_cache.eviction', 1, tags=['cache:test'])
+
+    def test_value_too_large(self, _mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 10)
+        cache.set('a', 'a' * 11)
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(cache.size, 0)
+
+    def test_disabled(self, mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 0)
+        cache.set('a', '')
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(len(cache), 0)
+        self.assertFalse(mock_dog_stats_api.increment.called)
+
+    def test_clear(self, _mock_dog_stats_api):
+        cache = ProcessLocalLRUCache('test', 10)
+        cache.set('a', 'aaa')
+        cache.clear()
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(cache.size, 0)
+
+
+@patch('openedx.core.lib.cache_utils.dog_stats_api')
+@patch('openedx.core.lib.cache_utils.time.sleep')
+class TestGetSingleFlight(TestCase):
+    """
+    Test the get_single_flight helper function.
+    """
+    class TestCache(object):
+        """
+        A test cache that supports the operations used by get_single_flight.
+        """
+        def __init__(self):
+            self.data = {}
+
+        def add(self, key, value, timeout=None):  # pylint: disable=unused-argument
+            """
+            Adds the value unless the key is already in the cache.
+            """
+            if key in self.data:
+                return False
+            self.data[key] = value
+            return True
+
+        def get(self, key):
+            """
+            Returns the value for the key, or None.
+            """
+            return self.data.get(key)
+
+        def delete(self, key):
+            """
+            Removes the key from the cache.
+            """
+            self.data.pop(key, None)
+
+    def setUp(self):
+        super(TestGetSingleFlight, self).setUp()
+        self.cache = self.TestCache()
+        self.compute = MagicMock(return_value='computed')
+        self.get_cached = MagicMock(return_value=None)
+
+    def get_single_flight(self, **kwargs):
+        """
+        Calls get_single_flight with the test cache and functions.
+        """
+        return get_single_flight('test', self.cache, 'lock', self.get_cached, self.compute, **kwargs)
+
+    def test_computed(self, _mock_sleep, _mock_dog_stats_api):
+        self.assertEquals(self.get_single_flight(get_stale=lambda: 'stale'), 'computed')
+        self.assertEquals(self.compute.call_count, 1)
+        self.assertNotIn('lock', self.cache.data)
+
+    def test_lock_released_on_error(self, _mock_sleep, _mock_dog_stats_api):
+        self.compute.side_effect = ValueError
+        with self.assertRaises(ValueError):
+            self.get_single_flight()
+        self.assertNotIn('lock', self.cache.data)
+
+    def test_stale(self, _mock_sleep, _mock_dog_stats_api):
+        self.cache.add('lock', 'true')
+        self.assertEquals(self.get_single_flight(get_stale=lambda: 'stale'), 'stale')
+        self.assertFalse(self.compute.called)
+
+    def test_waited(self, _mock_sleep, _mock_dog_stats_api):
+        self.cache.add('lock', 'true')
+        self.get_cached.side_effect = [None, 'cached']
+        self.assertEquals(self.get_single_flight(get_stale=lambda: None), 'cached')
+        self.assertFalse(self.compute.called)
+
+    def test_lock_holder_failed(self, _mock_sleep, _mock_dog_stats_api):
+        self.cache.add('lock', 'true')
+        self.get_cached.side_effect = lambda: self.cache.delete('lock')
+        self.assertEquals(self.get_single_flight(), 'computed')
+        self.assertEquals(self.compute.call_count, 1)
+
+    def test_timed_out(self, _mock_sleep, _mock_dog_stats_api):
+        self.cache.add('lock', 'true')
+        self.assertEquals(self.get_single_flight(wait_timeout=0), 'computed')
+        self.assertEquals(self.compute.call_count, 1)
@@ -0,0 +1,84 @@
+"""
+Tests for xblock_utils.py
+"""
+from cgi import escape
+from mock import Mock, patch
+from unittest import TestCase
+
+from opaque_keys.edx.locations import SlashSeparatedCourseKey
+import request_cache
+from request_cache.middleware import RequestCache
+from xblock.fragment import Fragment
+
+from openedx.core.lib.xblock_utils import REWRITTEN_CONTENTS_CACHE, replace_urls
+
+
+def _replace_course_urls(text, *args, **kwargs):  # pylint: disable=unused-argument
+    """
+    Stand-in for static_replace.replace_urls, which only replaces /course/ urls.
+    """
+    return text.replace(u'/course/', u'/courses/org/course/run/')
+
+
+@patch('openedx.core.lib.xblock_utils.static_replace.replace_urls', side_effect=_replace_course_urls)
+class TestReplaceUrls(TestCase):
+    """
+    Test the replace_urls fragment wrapper.
+    """
+    def setUp(self):
+        super(TestReplaceUrls, self).setUp()
+        RequestCache.clear_request_cache()
+        self.addCleanup(RequestCache.clear_request_cache)
+        self.course_key = SlashSeparatedCourseKey('org', 'course', 'run')
+
+    def _replace_urls(self, usage_id, content, children=()):
+        """
+        Returns `content` as rewritten by the replace_urls wrapper, for the
+        block `usage_id` with the given children.
+        """
+        block = Mock(scope_ids=Mock(usage_id=usage_id), has_children=bool(children), children=list(children))
+        frag = replace_urls(self.course_key, '/courses/org/course/run/jump_to_id/', 'data_dir', block, None,
+                            Fragment(content), None)
+        return frag.content
+
+    def _render_parent(self):
+        """
+        Rewrites a fragment, and then the fragment of its parent, and returns the latter.
+        """
+        child = self._replace_urls('child', u'<a href="/course/child">Child</a>')
+        return self._replace_urls(
+            'parent', u'<div><a href="/course/parent">Parent</a>' + child + u'</div>', children=['child']
+        )
+
+    @patch('openedx.core.lib.xblock_utils.request_cache.get_request', Mock())
+    def test_children_rewritten_once(self, mock_replace_urls):
+        self.assertEqual(
+            self._render_parent(),
+            u'<div><a href="/courses/org/course/run/parent">Parent</a>'
+            u'<a href="/courses/org/course/run/child">Child</a></div>'
+        )
+        self.assertEqual(
+            [args[0] for args, __ in mock_replace_urls.call_args_list],
+            [u'<a href="/course/child">Child</a>', u'<div><a href="/course/parent">Parent</a>', u'</div>']
+        )
+
+    @patch('openedx.core.lib.xblock_utils.request_cache.get_request', Mock())
+    def test_escaped_children_forgotten(self, mock_replace_urls):
+        # Like sequentials, the parent embeds the content of its children escaped.
+        children = ['child{}'.format(index) for index in range(3)]
+        escaped_children = u''.join(
+            escape(self._replace_urls(child, u'<a href="/course/{}">Child</a>'.format(child)))
+            for child in children
+        )
+        self._replace_urls('parent', u'<div>' + escaped_children + u'</div>', children=children)
+        self.assertEqual(request_cache.get_cache(REWRITTEN_CONTENTS_CACHE).keys(), ['parent'])
+        self.assertEqual(mock_replace_urls.call_args_list[-1][0][0], u'<div>' + escaped_children + u'</div>')
+
+    @patch('openedx.core.lib.xblock_utils.request_cache.get_request', Mock(return_value=None))
+    def test_outside_request(self, mock_replace_urls):
+        self.assertEqual(
+            self._render_parent(),
+            u'<div><a href="/courses/org/course/run/parent">Parent</a>'
+            u'<a href="/courses/org/course/run/child">Child</a></div>'
+        )
+        self.assertEqual(mock_replace_urls.call_count, 2)
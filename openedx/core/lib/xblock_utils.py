@@ -8,6 +8,7 @@ import logging
 import static_replace
 import uuid
 import markupsafe
+import request_cache
 from lxml import html, etree
 from contracts import contract
 
@@ -184,6 +185,76 @@ def replace_static_urls(data_dir, block, view, frag, context, course_id=None, st
     ))
 
 
+# Name of the request cache of the fragment contents rewritten by replace_urls.
+REWRITTEN_CONTENTS_CACHE = 'xblock_utils.rewritten_contents'
+
+
+def replace_urls(
+        course_id,
+        jump_to_id_base_url,
+        data_dir,
+        block,
+        view,                           # pylint: disable=unused-argument
+        frag,
+        context,                        # pylint: disable=unused-argument
+        static_asset_path=''
+):
+    """
+    Replaces the /static/, /course/ and /jump_to_id/ urls of the fragment in a
+    single pass, as replace_static_urls, replace_course_urls and
+    replace_jump_to_id_urls would one after the other.
+
+    Within a request, the rewritten content of each fragment is remembered
+    until the fragment of its parent is rewritten, which then skips it if
+    it embeds it verbatim, so that the urls of nested blocks are only
+    rewritten once. Parents that transform the content of their children,
+    such as sequentials which embed it escaped, rewrite it again.
+    """
+    def rewrite(text):
+        """
+        Returns `text` with its urls replaced.
+        """
+        return static_replace.replace_urls(
+            text, course_id, jump_to_id_base_url, data_directory=data_dir, static_asset_path=static_asset_path
+        )
+
+    if request_cache.get_request() is None:
+        return wrap_fragment(frag, rewrite(frag.content))
+
+    # The rewritten contents of the blocks whose parent hasn't been rewritten
+    # yet, by usage id.
+    rewritten_contents = request_cache.get_cache(REWRITTEN_CONTENTS_CACHE)
+    content = frag.content
+    rewritten_spans = []
+    for rewritten_content in rewritten_contents.itervalues():
+        start = content.find(rewritten_content)
+        if start != -1:
+            rewritten_spans.append((start, start + len(rewritten_content)))
+
+    parts = []
+    position = 0
+    for start, end in sorted(rewritten_spans):
+        if end <= position:
+            continue
+        if start > position:
+            parts.append(rewrite(content[position:start]))
+            position = start
+        parts.append(content[position:end])
+        position = end
+    parts.append(rewrite(content[position:]))
+    new_content = ''.join(parts)
+
+    # Only its parent embeds the content of a block, so the contents of the
+    # children are forgotten once the parent is rewritten, whether it used
+    # them or not.
+    if getattr(block, 'has_children', False):
+        for child_usage_id in block.children:
+            rewritten_contents.pop(child_usage_id, None)
+    if new_content:
+        rewritten_contents[block.scope_ids.usage_id] = new_content
+    return wrap_fragment(frag, new_content)
+
+
 def grade_histogram(module_id):
     '''
     Print out a histogram of grades on a given problem in staff member debug info.